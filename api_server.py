@@ -1,14 +1,32 @@
-from flask import Flask, jsonify, request
+from flask import Flask, jsonify, request, g, Response, has_request_context
 from flask_cors import CORS
-import mysql.connector
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
 import jwt
-import bcrypt
 from functools import wraps
+import hmac
 import os
+import time
 import logging
+import database
+import metrics
+from password_hashing import PasswordHasher, HasherSaturated
+from rate_limiter import TokenBucketLimiter, retry_after_header
+from serialization import FastJSONProvider, columnar
+from http_cache import ConditionalGet, Compressor
+from replica_router import ReplicaRouter, replica_configs
+import schema
+import replication
+import counters
+import archive
+import queries
+import bin_forecast
+import weather_stations
+import plot_weather
+import duty_cycle
+import maintenance_triggers
 
 app = Flask(__name__)
+app.json = FastJSONProvider(app)  # Decimal/datetime rows encoded in one pass
 CORS(app)  # Enable CORS for Flutter Web
 
 # ==================== PRODUCTION CONFIG ====================
@@ -19,49 +37,129 @@ DEBUG_MODE = os.getenv("FLASK_DEBUG", "False").lower() == "true"
 JWT_ACCESS_EXPIRES = timedelta(minutes=30)
 JWT_REFRESH_EXPIRES = timedelta(days=7)
 
+# Settings shared with the other entry points (async_server, prefork_server,
+# the maintenance jobs) are read once, in production_config, which also
+# installs the queued (non-blocking) log handlers on import: request
+# threads only enqueue records, a listener thread does the I/O
+from production_config import (
+    SAMPLED,
+    BCRYPT_ROUNDS, BCRYPT_WORKERS, BCRYPT_QUEUE_LIMIT, BCRYPT_TIMEOUT,
+    RATE_LIMIT_ENABLED, RATE_LIMIT_REQUESTS, RATE_LIMIT_WINDOW,
+    RATE_LIMIT_INGEST_REQUESTS, RATE_LIMIT_INGEST_WINDOW,
+    RATE_LIMIT_AUTH_REQUESTS, RATE_LIMIT_AUTH_WINDOW,
+    RATE_LIMIT_REPLICATION_REQUESTS, RATE_LIMIT_REPLICATION_WINDOW,
+    ENABLE_METRICS, DB_SLOW_QUERY_MS, DB_EXPLAIN_SLOW,
+    HTTP_CACHE_ENABLED, COMPRESS_ENABLED, COMPRESS_MIN_BYTES, COMPRESS_LEVEL,
+    REPLICATION_KEY,
+    ARCHIVE_DIR, ARCHIVE_READ_MAX_DAYS,
+    BIN_FULL_DISTANCE_CM, BIN_EMPTY_JUMP_CM, BIN_FILL_HALF_LIFE_HOURS, BIN_DEPTH_CM,
+    WEATHER_IDW_POWER, WEATHER_IDW_NEIGHBOURS, WEATHER_IDW_RADIUS_KM,
+    WEATHER_STATION_MAX_AGE_HOURS, WEATHER_PLOTS_BUCKET_SECONDS,
+    MAINTENANCE_RUNTIME_HOURS, MAINTENANCE_ERROR_SPIKE, MAINTENANCE_ERROR_HALF_LIFE_HOURS,
+    MAINTENANCE_LEAD_DAYS, DUTY_CYCLE_INTERVAL,
+    DB_BACKEND, SQLITE_PATH,
+    DB_REPLICAS, DB_READ_ROUTE_CLASSES, DB_REPLICA_MAX_LAG, DB_READ_YOUR_WRITES_SECONDS, DB_POOL_SIZE,
+)
+
 # MySQL Configuration - Load from .env or use defaults
-DB_CONFIG = {
-    'host': os.getenv("DB_HOST", "localhost"),
-    'port': int(os.getenv("DB_PORT", 3306)),
-    'user': os.getenv("DB_USER", "root"),
-    'password': os.getenv("DB_PASSWORD", "200413"),
-    'database': os.getenv("DB_NAME", "smart_farm_db")
-}
+if DB_BACKEND == "sqlite":
+    DB_CONFIG = {
+        'backend': 'sqlite',
+        'path': SQLITE_PATH
+    }
+else:
+    DB_CONFIG = {
+        'host': os.getenv("DB_HOST", "localhost"),
+        'port': int(os.getenv("DB_PORT", 3306)),
+        'user': os.getenv("DB_USER", "root"),
+        'password': os.getenv("DB_PASSWORD", "200413"),
+        'database': os.getenv("DB_NAME", "smart_farm_db")
+    }
 
 # ==================== LOGGING SETUP ====================
-os.makedirs("logs", exist_ok=True)
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler("logs/app.log"),
-        logging.StreamHandler()
-    ]
-)
 logger = logging.getLogger(__name__)
 
+database.configure_slow_query_log(DB_SLOW_QUERY_MS, explain=DB_EXPLAIN_SLOW)
+# Statements are timed whenever metrics or the slow query log need them, so
+# DB_SLOW_QUERY_MS keeps working with ENABLE_METRICS off
+DB_INSTRUMENT = ENABLE_METRICS or database.slow_query_log_enabled()
+bin_forecast.configure(BIN_FULL_DISTANCE_CM, BIN_EMPTY_JUMP_CM, BIN_FILL_HALF_LIFE_HOURS, BIN_DEPTH_CM)
+plot_weather.configure(WEATHER_IDW_POWER, WEATHER_IDW_NEIGHBOURS, WEATHER_IDW_RADIUS_KM,
+                       WEATHER_STATION_MAX_AGE_HOURS, WEATHER_PLOTS_BUCKET_SECONDS)
+maintenance_triggers.configure(MAINTENANCE_RUNTIME_HOURS, MAINTENANCE_ERROR_SPIKE,
+                               MAINTENANCE_ERROR_HALF_LIFE_HOURS, MAINTENANCE_LEAD_DAYS)
+
+db_router = ReplicaRouter(
+    DB_CONFIG,
+    replica_configs(DB_CONFIG, DB_REPLICAS) if DB_BACKEND != "sqlite" else [],
+    read_route_classes=DB_READ_ROUTE_CLASSES,
+    max_lag=DB_REPLICA_MAX_LAG,
+    sticky_seconds=DB_READ_YOUR_WRITES_SECONDS,
+    pool_size=DB_POOL_SIZE
+)
+
+# Reads that must see the latest write from any client (device toggles)
+PRIMARY_READ_ENDPOINTS = {'get_device_status', 'api_get_device_status'}
+
+def db_target():
+    """Database target of the current request, chosen once so all its queries see one server"""
+    if not has_request_context():
+        return db_router.primary, 'script'
+    if 'db_target' not in g:
+        route_class = classify_route()
+        read_only = request.method in ('GET', 'HEAD') and request.endpoint not in PRIMARY_READ_ENDPOINTS
+        client = rate_limit_key(route_class) if read_only and db_router.routes(route_class) else None
+        g.db_target = db_router.choose(route_class, read_only, client)
+        g.db_route_class = route_class
+    return g.db_target, g.db_route_class
+
 def get_db_connection():
-    """Create and return a MySQL connection"""
+    """Create and return a database connection (MySQL or SQLite, see DB_BACKEND)"""
     try:
-        conn = mysql.connector.connect(**DB_CONFIG)
+        target, route_class = db_target()
+        conn, used = db_router.connect(target, route_class, instrument=DB_INSTRUMENT)
+        if has_request_context():
+            if used is not target:
+                g.db_target = used
+            g.setdefault('db_connections', []).append(conn)
         return conn
-    except mysql.connector.Error as e:
-        print(f"Error connecting to MySQL: {e}")
+    except database.Error as e:
+        logger.error("db_connect_failed error=%s", e)
         return None
 
+@app.teardown_request
+def close_db_connections(exc):
+    """Close connections a handler left open (it raised before conn.close()), releasing their target slot"""
+    for conn in g.pop('db_connections', ()):
+        if not conn.closed:
+            conn.close()
+
 # JWT HELPERS
 
+password_hasher = PasswordHasher(
+    workers=BCRYPT_WORKERS,
+    queue_limit=BCRYPT_QUEUE_LIMIT,
+    rounds=BCRYPT_ROUNDS,
+    timeout=BCRYPT_TIMEOUT
+)
+
 def hash_password(password):
-    """Hash password using bcrypt"""
-    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+    """Hash password using bcrypt (runs in the hashing process pool)"""
+    return password_hasher.hash(password)
 
 def verify_password(password, hashed):
-    """Verify password against hash"""
-    try:
-        return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
-    except:
-        # Fallback for plaintext passwords (migration support)
-        return password == hashed
+    """Verify password against hash
+
+    Returns (matched, needs_rehash). needs_rehash is set for legacy plaintext
+    passwords (migration support) and for hashes below BCRYPT_ROUNDS.
+    """
+    return password_hasher.verify(password, hashed)
+
+def hasher_busy_response():
+    """503 returned when the hashing pool queue is full"""
+    response = jsonify({'error': 'Authentication service busy, please retry'})
+    response.headers['Retry-After'] = '1'
+    return response, 503
 
 def generate_tokens(user_id, username, user_type):
     """Generate access and refresh tokens"""
@@ -88,33 +186,260 @@ def generate_tokens(user_id, username, user_type):
     
     return access_token, refresh_token
 
+def access_token_payload(auth_header):
+    """
+    Check the access token in an Authorization header
+
+    Returns:
+        (payload, None) if valid, otherwise (None, error message for the 401)
+    """
+    token = None
+    if auth_header and auth_header.startswith('Bearer '):
+        token = auth_header.split(' ')[1]
+    
+    if not token:
+        return None, 'Token is missing'
+    
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=['HS256'])
+    except jwt.ExpiredSignatureError:
+        return None, 'Token has expired'
+    except jwt.InvalidTokenError:
+        return None, 'Invalid token'
+    if payload.get('type') != 'access':
+        return None, 'Invalid token type'
+    return payload, None
+
 def token_required(f):
     """Decorator for protected routes"""
     @wraps(f)
     def decorated(*args, **kwargs):
-        token = None
-        
-        if 'Authorization' in request.headers:
-            auth_header = request.headers['Authorization']
-            if auth_header.startswith('Bearer '):
-                token = auth_header.split(' ')[1]
-        
-        if not token:
-            return jsonify({'error': 'Token is missing'}), 401
-        
-        try:
-            payload = jwt.decode(token, SECRET_KEY, algorithms=['HS256'])
-            if payload.get('type') != 'access':
-                return jsonify({'error': 'Invalid token type'}), 401
-            request.current_user = payload
-        except jwt.ExpiredSignatureError:
-            return jsonify({'error': 'Token has expired'}), 401
-        except jwt.InvalidTokenError:
-            return jsonify({'error': 'Invalid token'}), 401
+        payload, error = access_token_payload(request.headers.get('Authorization'))
+        if error:
+            return jsonify({'error': error}), 401
+        request.current_user = payload
         
         return f(*args, **kwargs)
     return decorated
 
+def admin_required(f):
+    """Decorator for admin-only routes (use below @token_required)"""
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        if request.current_user.get('user_type') != 'admin':
+            return jsonify({'error': 'Admin access required'}), 403
+        return f(*args, **kwargs)
+    return decorated
+
+
+# METRICS
+
+HTTP_REQUESTS = metrics.REGISTRY.counter(
+    'smartfarm_http_requests_total',
+    'HTTP requests by route template, method and status',
+    ('route', 'method', 'status')
+)
+HTTP_REQUEST_SECONDS = metrics.REGISTRY.histogram(
+    'smartfarm_http_request_duration_seconds',
+    'HTTP request latency by route template',
+    ('route', 'method')
+)
+HTTP_RESPONSE_BYTES = metrics.REGISTRY.counter(
+    'smartfarm_http_response_bytes_total',
+    'Response body bytes by route template',
+    ('route',)
+)
+
+@app.before_request
+def start_request_timer():
+    """Record the request start time (registered first so it covers every hook)"""
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request_metrics(response):
+    """Count the request and observe its latency and size"""
+    started = g.get('request_started')
+    if ENABLE_METRICS and started is not None:
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        HTTP_REQUEST_SECONDS.observe(time.perf_counter() - started, (route, request.method))
+        HTTP_REQUESTS.inc((route, request.method, str(response.status_code)))
+        size = response.calculate_content_length()
+        if size:
+            HTTP_RESPONSE_BYTES.inc((route,), size)
+    return response
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    """Prometheus scrape endpoint"""
+    if not ENABLE_METRICS:
+        return jsonify({'error': 'Metrics disabled'}), 404
+    return Response(metrics.REGISTRY.render(), mimetype=metrics.CONTENT_TYPE)
+
+
+@app.route('/api/admin/db/statements', methods=['GET'])
+@token_required
+@admin_required
+def get_db_statements():
+    """Top SQL statements by time spent (this worker process only)"""
+    limit = request.args.get('limit', 20, type=int)
+    order_by = request.args.get('order_by', 'total')
+    return jsonify({
+        'pid': os.getpid(),
+        'slow_query_ms': DB_SLOW_QUERY_MS,
+        'statements': database.top_statements(limit, order_by)
+    })
+
+
+@app.route('/api/admin/db/targets', methods=['GET'])
+@token_required
+@admin_required
+def get_db_targets():
+    """Primary and read replicas: connections in use, pool size, lag (this worker process)"""
+    return jsonify({
+        'pid': os.getpid(),
+        'read_route_classes': sorted(db_router.read_route_classes),
+        'max_lag_seconds': db_router.max_lag,
+        'targets': db_router.stats()
+    })
+
+
+# HTTP CACHING
+
+http_cache = ConditionalGet(get_db_connection, enabled=HTTP_CACHE_ENABLED)
+compressor = Compressor(min_bytes=COMPRESS_MIN_BYTES, level=COMPRESS_LEVEL, enabled=COMPRESS_ENABLED)
+
+@app.after_request
+def compress_response(response):
+    """gzip/brotli large bodies (registered after metrics, so it runs first)"""
+    return compressor(response)
+
+@app.route('/api/cache/init', methods=['POST'])
+def init_table_versions():
+    """Create table_versions and its change triggers (enables ETags on alerts/plots/devices)"""
+    conn = get_db_connection()
+    if not conn:
+        return jsonify({'error': 'Database connection failed'}), 500
+    
+    try:
+        cursor = conn.cursor()
+        installed = schema.create_table_versions(cursor, dialect=DB_BACKEND)
+        conn.commit()
+        cursor.close()
+        conn.close()
+        return jsonify({'message': 'table_versions created successfully', 'tables': installed})
+    except Exception as e:
+        logger.error("request_failed endpoint=%s error=%s", request.endpoint, e)
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/indexes/init', methods=['POST'])
+def init_route_indexes():
+    """Add the secondary indexes route queries rely on (schema.ROUTE_INDEXES)"""
+    conn = get_db_connection()
+    if not conn:
+        return jsonify({'error': 'Database connection failed'}), 500
+    
+    try:
+        cursor = conn.cursor()
+        result = schema.create_route_indexes(cursor, dialect=DB_BACKEND)
+        conn.commit()
+        cursor.close()
+        conn.close()
+        return jsonify({'message': 'indexes checked', **result})
+    except Exception as e:
+        logger.error("request_failed endpoint=%s error=%s", request.endpoint, e)
+        return jsonify({'error': str(e)}), 500
+
+
+# RATE LIMITING
+
+# Device write endpoints, limited per device instead of per user
+INGEST_ENDPOINTS = {
+    'insert_sensor_data',
+    'record_bin_data',
+    'record_weather',
+    'record_device_log',
+    'record_device_history',
+    'record_crop_health',
+}
+
+rate_limiter = TokenBucketLimiter({
+    'ingest': (RATE_LIMIT_INGEST_REQUESTS, RATE_LIMIT_INGEST_WINDOW),
+    'dashboard': (RATE_LIMIT_REQUESTS, RATE_LIMIT_WINDOW),
+    'auth': (RATE_LIMIT_AUTH_REQUESTS, RATE_LIMIT_AUTH_WINDOW),
+    'replication': (RATE_LIMIT_REPLICATION_REQUESTS, RATE_LIMIT_REPLICATION_WINDOW),
+})
+
+def classify_route():
+    """Return the route class of the current request: ingest, auth, replication or dashboard"""
+    if request.path.startswith('/api/auth/'):
+        return 'auth'
+    if request.path.startswith('/api/replication/'):
+        return 'replication'
+    if request.method == 'POST' and request.endpoint in INGEST_ENDPOINTS:
+        return 'ingest'
+    return 'dashboard'
+
+def rate_limit_key(route_class):
+    """Identify the client: device id for ingest, user id for dashboards, else IP"""
+    if route_class == 'replication':
+        gateway = request.headers.get(replication.GATEWAY_HEADER)
+        if gateway:
+            return f"gateway:{gateway}"
+    elif route_class == 'ingest':
+        data = request.get_json(silent=True)
+        if isinstance(data, dict):
+            device = data.get('device_id') or data.get('bin_id') or data.get('location')
+            if device is not None:
+                return f"device:{device}"
+    elif route_class == 'dashboard':
+        auth_header = request.headers.get('Authorization', '')
+        if auth_header.startswith('Bearer '):
+            try:
+                payload = jwt.decode(auth_header[7:], SECRET_KEY, algorithms=['HS256'])
+                return f"user:{payload.get('user_id')}"
+            except jwt.InvalidTokenError:
+                pass
+    return f"ip:{request.remote_addr}"
+
+@app.after_request
+def note_database_write(response):
+    """Read-your-writes: after a successful write the client's reads stay on the primary"""
+    if request.method not in ('GET', 'HEAD', 'OPTIONS') and response.status_code < 400:
+        route_class = classify_route()
+        if db_router.routes(route_class):
+            db_router.note_write(rate_limit_key(route_class))
+    return response
+
+@app.before_request
+def enforce_rate_limit():
+    """Reject clients that exceeded their route-class budget with 429"""
+    if not RATE_LIMIT_ENABLED or request.method == 'OPTIONS':
+        return None
+    
+    route_class = classify_route()
+    allowed, retry_after = rate_limiter.check(route_class, rate_limit_key(route_class))
+    if allowed:
+        return None
+    
+    response = jsonify({'error': 'Rate limit exceeded', 'route_class': route_class})
+    response.status_code = 429
+    response.headers['Retry-After'] = retry_after_header(retry_after)
+    return response
+
+
+# PRE-FORK WORKERS
+
+def configure_for_workers(workers):
+    """Split per-process budgets between pre-forked workers (see prefork_server.py)
+
+    Called in the master before forking: each worker then enforces 1/N of
+    the rate limits and runs a bcrypt pool of cores/N processes.
+    """
+    if workers <= 1:
+        return
+    rate_limiter.scale(1.0 / workers)
+    password_hasher.resize(BCRYPT_WORKERS // workers)
+
 
 # ENVIRONMENT DATA
 @app.route('/api/environment', methods=['GET'])
@@ -126,21 +451,14 @@ def get_environment():
 
     try:
         cursor = conn.cursor(dictionary=True)
-        cursor.execute('''
-            SELECT air_temp, humidity, light_lux as lux, leaf_temp
-            FROM sensor_logs
-            ORDER BY timestamp DESC
-            LIMIT 1
-        ''')
+        cursor.execute(queries.ENVIRONMENT_LATEST)
         result = cursor.fetchone()
         cursor.close()
         conn.close()
 
-        if result:
-            return jsonify(result)
-        return jsonify({'air_temp': 0, 'humidity': 0, 'lux': 0, 'leaf_temp': 0})
+        return jsonify(result or queries.EMPTY_ENVIRONMENT)
     except Exception as e:
-        print(f"Error: {e}")
+        logger.error("request_failed endpoint=%s error=%s", request.endpoint, e)
         return jsonify({'error': str(e)}), 500
 
 # PLOTS 
@@ -161,7 +479,7 @@ def get_plots():
         
         return jsonify(results)
     except Exception as e:
-        print(f"Error: {e}")
+        logger.error("request_failed endpoint=%s error=%s", request.endpoint, e)
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/plots', methods=['POST'])
@@ -176,8 +494,9 @@ def create_plot():
         cursor = conn.cursor()
         cursor.execute('''
             INSERT INTO plots 
-            (user_id, plot_name, image_path, plant_type, planting_date, leaf_temp, water_level, note)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+            (user_id, plot_name, image_path, plant_type, planting_date, leaf_temp, water_level, note,
+             latitude, longitude)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
         ''', (
             data.get('user_id', 1),
             data.get('plot_name', ''),
@@ -186,7 +505,9 @@ def create_plot():
             data.get('planting_date', datetime.now().date()),
             data.get('leaf_temp', 0.0),
             data.get('water_level', 0.0),
-            data.get('note', '')
+            data.get('note', ''),
+            data.get('latitude'),
+            data.get('longitude')
         ))
         conn.commit()
         plot_id = cursor.lastrowid
@@ -195,7 +516,7 @@ def create_plot():
         
         return jsonify({'plot_id': plot_id, 'message': 'Plot created successfully'})
     except Exception as e:
-        print(f"Error: {e}")
+        logger.error("request_failed endpoint=%s error=%s", request.endpoint, e)
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/plots/<int:plot_id>', methods=['PUT'])
@@ -211,7 +532,7 @@ def update_plot(plot_id):
         cursor.execute('''
             UPDATE plots 
             SET plot_name=%s, image_path=%s, plant_type=%s, planting_date=%s,
-                leaf_temp=%s, water_level=%s, note=%s
+                leaf_temp=%s, water_level=%s, note=%s, latitude=%s, longitude=%s
             WHERE plot_id=%s
         ''', (
             data.get('plot_name', ''),
@@ -221,6 +542,8 @@ def update_plot(plot_id):
             data.get('leaf_temp', 0.0),
             data.get('water_level', 0.0),
             data.get('note', ''),
+            data.get('latitude'),
+            data.get('longitude'),
             plot_id
         ))
         conn.commit()
@@ -229,7 +552,7 @@ def update_plot(plot_id):
         
         return jsonify({'message': 'Plot updated successfully'})
     except Exception as e:
-        print(f"Error: {e}")
+        logger.error("request_failed endpoint=%s error=%s", request.endpoint, e)
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/plots/<int:plot_id>', methods=['DELETE'])
@@ -248,7 +571,7 @@ def delete_plot(plot_id):
         
         return jsonify({'message': 'Plot deleted successfully'})
     except Exception as e:
-        print(f"Error: {e}")
+        logger.error("request_failed endpoint=%s error=%s", request.endpoint, e)
         return jsonify({'error': str(e)}), 500
 
 # DEVICES
@@ -262,25 +585,14 @@ def get_device_status(device_name):
     
     try:
         cursor = conn.cursor(dictionary=True)
-        cursor.execute('''
-            SELECT status, mode 
-            FROM devices 
-            WHERE device_name = %s 
-            LIMIT 1
-        ''', (device_name,))
+        cursor.execute(queries.DEVICE_STATUS, (device_name,))
         result = cursor.fetchone()
         cursor.close()
         conn.close()
         
-        if result:
-            return jsonify({
-                'status': result['status'] == 'ON',
-                'online': True,
-                'auto_mode': result['mode'] == 'AUTO'
-            })
-        return jsonify({'status': False, 'online': True, 'auto_mode': False})
+        return jsonify(queries.device_status(result))
     except Exception as e:
-        print(f"Error: {e}")
+        logger.error("request_failed endpoint=%s error=%s", request.endpoint, e)
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/devices/<device_name>', methods=['PUT'])
@@ -313,7 +625,7 @@ def update_device_status(device_name):
         
         return jsonify({'message': 'Device status updated'})
     except Exception as e:
-        print(f"Error: {e}")
+        logger.error("request_failed endpoint=%s error=%s", request.endpoint, e)
         return jsonify({'error': str(e)}), 500
 
 # SENSOR DATA
@@ -323,39 +635,80 @@ def get_latest_sensor():
     """Get latest sensor value"""
     sensor_type = request.args.get('type', 'air_temp')
     
-    column_map = {
-        'air_temp': 'air_temp',
-        'humidity': 'humidity',
-        'lux': 'light_lux',
-        'leaf_temp': 'leaf_temp',
-        'water_level': 'water_level'
-    }
-    
-    column = column_map.get(sensor_type, 'air_temp')
-    
     conn = get_db_connection()
     if not conn:
         return jsonify({'error': 'Database connection failed'}), 500
     
     try:
         cursor = conn.cursor()
-        cursor.execute(f'''
-            SELECT {column} 
-            FROM sensor_logs 
-            ORDER BY timestamp DESC 
-            LIMIT 1
-        ''')
+        cursor.execute(queries.latest_value_sql(sensor_type))
         result = cursor.fetchone()
         cursor.close()
         conn.close()
         
-        if result and result[0] is not None:
-            return jsonify({'value': float(result[0])})
-        return jsonify({'value': 0.0})
+        return jsonify(queries.latest_value(result))
     except Exception as e:
-        print(f"Error: {e}")
+        logger.error("request_failed endpoint=%s error=%s", request.endpoint, e)
         return jsonify({'error': str(e)}), 500
 
+# HISTORY RESPONSES
+# ?fields=a,b selects columns in SQL; ?format=columnar returns {column: [...]}
+# with the time column delta-encoded (serialization.columnar)
+
+SENSOR_HISTORY_FIELDS = ('data_id', 'device_id', 'temperature_air', 'temperature_leaf', 'humidity',
+                         'water_level', 'light_lux', 'soil_moisture', 'created_at')
+DEVICE_HISTORY_FIELDS = ('history_id', 'device_id', 'device_name', 'status', 'mode',
+                         'uptime_seconds', 'error_count', 'created_at')
+HISTORY_FORMATS = ('rows', 'columnar')
+
+def history_projection(allowed, time_column='created_at', args=None):
+    """
+    SELECT list and response format requested by a history call (args
+    defaults to request.args)
+
+    Returns:
+        (select_list, format); select_list is '*' without ?fields=, otherwise
+        the requested columns plus the time column
+
+    Raises:
+        ValueError: Unknown field or format
+    """
+    args = request.args if args is None else args
+    response_format = args.get('format', 'rows')
+    if response_format not in HISTORY_FORMATS:
+        raise ValueError(f"format must be one of: {', '.join(HISTORY_FORMATS)}")
+    requested = args.get('fields')
+    if not requested:
+        return '*', response_format
+    fields = list(dict.fromkeys(f.strip() for f in requested.split(',') if f.strip()))
+    unknown = [f for f in fields if f not in allowed]
+    if unknown or not fields:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)} (allowed: {', '.join(allowed)})")
+    if time_column not in fields:
+        fields.insert(0, time_column)
+    return ', '.join(fields), response_format
+
+def history_payload(cursor, rows, response_format, time_column='created_at'):
+    """Rows as fetched, or their columnar form"""
+    if response_format == 'columnar':
+        return columnar(rows, [d[0] for d in cursor.description], time_column)
+    return rows
+
+def with_archived(rows, table, limit, key=None, columns=None):
+    """
+    Top up a newest-first page from the archive tier
+
+    Only reads the archive when the database ran out of rows before
+    limit; archived rows continue strictly before the oldest row returned,
+    from at most ARCHIVE_READ_MAX_DAYS day partitions.
+    """
+    if len(rows) >= limit or not archive.has_archive(ARCHIVE_DIR, table):
+        return rows
+    time_column = archive.ARCHIVED_TABLES[table][1]
+    until = rows[-1][time_column] if rows else None
+    return rows + archive.read(ARCHIVE_DIR, table, until=until, key=key, columns=columns,
+                               limit=limit - len(rows), max_days=ARCHIVE_READ_MAX_DAYS)
+
 # SENSOR DATA CRUD 
 
 @app.route('/api/sensor/init', methods=['POST'])
@@ -386,13 +739,16 @@ def init_sensor_table():
         conn.close()
         return jsonify({'message': 'sensor_data table created successfully'})
     except Exception as e:
-        print(f"Error: {e}")
+        logger.error("request_failed endpoint=%s error=%s", request.endpoint, e)
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/sensor', methods=['POST'])
 def insert_sensor_data():
     """Create sensor data - for ESP32 to send data"""
-    data = request.json
+    try:
+        params = queries.sensor_data_params(request.get_json(silent=True))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     
     conn = get_db_connection()
     if not conn:
@@ -400,19 +756,7 @@ def insert_sensor_data():
     
     try:
         cursor = conn.cursor()
-        cursor.execute('''
-            INSERT INTO sensor_data
-            (device_id, temperature_air, temperature_leaf, humidity, water_level, light_lux, soil_moisture)
-            VALUES (%s, %s, %s, %s, %s, %s, %s)
-        ''', (
-            data.get('device_id', 1),
-            data.get('temperature_air', 0),
-            data.get('temperature_leaf', 0),
-            data.get('humidity', 0),
-            data.get('water_level', 0),
-            data.get('light_lux', 0),
-            data.get('soil_moisture', 0)
-        ))
+        cursor.execute(queries.INSERT_SENSOR_DATA, params)
         conn.commit()
         data_id = cursor.lastrowid
         cursor.close()
@@ -420,7 +764,7 @@ def insert_sensor_data():
         
         return jsonify({'success': True, 'data_id': data_id, 'message': 'Sensor data inserted'}), 201
     except Exception as e:
-        print(f"Error: {e}")
+        logger.error("request_failed endpoint=%s error=%s", request.endpoint, e)
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/sensor/latest', methods=['GET'])
@@ -446,10 +790,6 @@ def get_latest_sensor_data():
         conn.close()
         
         if result:
-            # Convert Decimal to float for JSON
-            for key in result:
-                if hasattr(result[key], 'is_integer'):
-                    result[key] = float(result[key])
             return jsonify(result)
         return jsonify({
             'temperature_air': 0,
@@ -460,15 +800,19 @@ def get_latest_sensor_data():
             'soil_moisture': 0
         })
     except Exception as e:
-        print(f"Error: {e}")
+        logger.error("request_failed endpoint=%s error=%s", request.endpoint, e)
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/sensor/history', methods=['GET'])
 @token_required
 def get_sensor_history():
-    """Get sensor history for graphs - returns last 50 readings"""
+    """Get sensor history for graphs - returns last 50 readings (?fields=, ?format=columnar)"""
     device_id = request.args.get('device_id', 1, type=int)
     limit = request.args.get('limit', 50, type=int)
+    try:
+        select_list, response_format = history_projection(SENSOR_HISTORY_FIELDS)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     
     conn = get_db_connection()
     if not conn:
@@ -476,25 +820,16 @@ def get_sensor_history():
     
     try:
         cursor = conn.cursor(dictionary=True)
-        cursor.execute('''
-            SELECT * FROM sensor_data
-            WHERE device_id = %s
-            ORDER BY created_at DESC
-            LIMIT %s
-        ''', (device_id, limit))
-        results = cursor.fetchall()
+        cursor.execute(queries.SENSOR_HISTORY.format(select_list=select_list), (device_id, limit))
+        results = with_archived(cursor.fetchall(), 'sensor_data', limit, key=device_id,
+                                columns=[d[0] for d in cursor.description])
+        payload = history_payload(cursor, results, response_format)
         cursor.close()
         conn.close()
         
-        # Convert Decimal to float for JSON
-        for row in results:
-            for key in row:
-                if hasattr(row[key], 'is_integer'):
-                    row[key] = float(row[key])
-        
-        return jsonify(results)
+        return jsonify(payload)
     except Exception as e:
-        print(f"Error: {e}")
+        logger.error("request_failed endpoint=%s error=%s", request.endpoint, e)
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/sensor/<int:data_id>', methods=['PUT'])
@@ -529,7 +864,7 @@ def update_sensor_data(data_id):
         
         return jsonify({'success': True, 'message': 'Sensor data updated'})
     except Exception as e:
-        print(f"Error: {e}")
+        logger.error("request_failed endpoint=%s error=%s", request.endpoint, e)
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/sensor/cleanup', methods=['DELETE'])
@@ -559,7 +894,7 @@ def delete_old_sensor_data():
             'message': f'Deleted {deleted_count} records older than {days} days'
         })
     except Exception as e:
-        print(f"Error: {e}")
+        logger.error("request_failed endpoint=%s error=%s", request.endpoint, e)
         return jsonify({'error': str(e)}), 500
 
 
@@ -574,21 +909,14 @@ def api_get_device_status(device_name):
     
     try:
         cursor = conn.cursor(dictionary=True)
-        cursor.execute('SELECT * FROM devices WHERE device_name = %s', (device_name,))
+        cursor.execute(queries.DEVICE_STATUS, (device_name,))
         result = cursor.fetchone()
         cursor.close()
         conn.close()
         
-        if result:
-            return jsonify({
-                'status': result['status'] == 'ON',
-                'online': True,
-                'auto_mode': result.get('mode', 'MANUAL') == 'AUTO'
-            })
-        else:
-            return jsonify({'status': False, 'online': True, 'auto_mode': False})
+        return jsonify(queries.device_status(result))
     except Exception as e:
-        print(f"Device Status Error: {e}")
+        logger.error("request_failed endpoint=%s error=%s", request.endpoint, e)
         return jsonify({'error': str(e)}), 500
 
 
@@ -622,10 +950,10 @@ def api_update_device_status(device_name):
         cursor.close()
         conn.close()
         
-        print(f"✅ Device '{device_name}' toggled to {new_status}")
+        logger.info("device_toggled device=%s status=%s", device_name, new_status)
         return jsonify({'success': True, 'device': device_name, 'status': new_status})
     except Exception as e:
-        print(f"Device Update Error: {e}")
+        logger.error("request_failed endpoint=%s error=%s", request.endpoint, e)
         return jsonify({'error': str(e)}), 500
 
 
@@ -665,12 +993,13 @@ def get_environment_data():
                 'leaf_temp': 0.0
             })
     except Exception as e:
-        print(f"Environment API Error: {e}")
+        logger.error("request_failed endpoint=%s error=%s", request.endpoint, e)
         return jsonify({'error': str(e)}), 500
 
 # AUTH
 
 @app.route('/api/sensor-logs', methods=['GET'])
+@http_cache.conditional('sensor_logs')
 def get_sensor_logs():
     """Get sensor logs for display and CSV export"""
     limit = request.args.get('limit', 100, type=int)
@@ -682,34 +1011,25 @@ def get_sensor_logs():
     try:
         cursor = conn.cursor(dictionary=True)
         cursor.execute('''
-            SELECT log_id, plot_id, air_temp, humidity, light_lux, leaf_temp, 
-                   water_level, cwsi_value, timestamp
+            SELECT log_id, plot_id,
+                   COALESCE(air_temp, 0) AS air_temp,
+                   COALESCE(humidity, 0) AS humidity,
+                   COALESCE(light_lux, 0) AS lux,
+                   COALESCE(leaf_temp, 0) AS leaf_temp,
+                   COALESCE(water_level, 0) AS water_level,
+                   COALESCE(cwsi_value, 0) AS cwsi_value,
+                   timestamp
             FROM sensor_logs 
             ORDER BY timestamp DESC 
             LIMIT %s
         ''', (limit,))
-        results = cursor.fetchall()
+        logs = cursor.fetchall()
         cursor.close()
         conn.close()
         
-        # Convert datetime to string for JSON
-        logs = []
-        for row in results:
-            logs.append({
-                'log_id': row['log_id'],
-                'plot_id': row['plot_id'],
-                'air_temp': float(row['air_temp'] or 0),
-                'humidity': float(row['humidity'] or 0),
-                'lux': float(row['light_lux'] or 0),
-                'leaf_temp': float(row['leaf_temp'] or 0),
-                'water_level': float(row['water_level'] or 0),
-                'cwsi_value': float(row['cwsi_value'] or 0),
-                'timestamp': str(row['timestamp']) if row['timestamp'] else ''
-            })
-        
         return jsonify({'logs': logs, 'count': len(logs)})
     except Exception as e:
-        print(f"Sensor Logs API Error: {e}")
+        logger.error("request_failed endpoint=%s error=%s", request.endpoint, e)
         return jsonify({'error': str(e)}), 500
 
 
@@ -717,7 +1037,7 @@ def get_sensor_logs():
 
 @app.route('/api/bin-data/init', methods=['POST'])
 def init_bin_table():
-    """Create trash_bin_logs table if not exists"""
+    """Create trash_bin_logs and bin_fill_state tables if not exists"""
     conn = get_db_connection()
     if not conn:
         return jsonify({'error': 'Database connection failed'}), 500
@@ -733,12 +1053,13 @@ def init_bin_table():
                 INDEX idx_bin_created (bin_id, created_at)
             )
         ''')
+        schema.create_bin_fill_state(cursor)
         conn.commit()
         cursor.close()
         conn.close()
-        return jsonify({'message': 'trash_bin_logs table created successfully'})
+        return jsonify({'message': 'trash_bin_logs and bin_fill_state tables created successfully'})
     except Exception as e:
-        print(f"Error: {e}")
+        logger.error("request_failed endpoint=%s error=%s", request.endpoint, e)
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/bin-data', methods=['POST'])
@@ -759,18 +1080,13 @@ def record_bin_data():
         "log_id": 123
     }
     """
-    data = request.json
-    
-    if not data:
-        return jsonify({'error': 'No data provided'}), 400
+    data = request.get_json(silent=True)
     
-    bin_id = data.get('bin_id')
-    distance_cm = data.get('distance_cm')
-    timestamp = data.get('timestamp')
-    
-    # Validate required fields
-    if not bin_id or distance_cm is None:
-        return jsonify({'error': 'Missing required fields: bin_id, distance_cm'}), 400
+    try:
+        insert_sql, params = queries.bin_reading(data)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    bin_id, distance_cm = params[0], params[1]
     
     conn = get_db_connection()
     if not conn:
@@ -779,41 +1095,27 @@ def record_bin_data():
     try:
         # Ensure table exists
         cursor = conn.cursor()
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS trash_bin_logs (
-                log_id BIGINT AUTO_INCREMENT PRIMARY KEY,
-                bin_id VARCHAR(50) NOT NULL,
-                distance_cm DECIMAL(6,2) NOT NULL,
-                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                INDEX idx_bin_created (bin_id, created_at)
-            )
-        ''')
+        cursor.execute(queries.CREATE_TRASH_BIN_LOGS)
         
         # Insert data
-        if timestamp:
-            cursor.execute('''
-                INSERT INTO trash_bin_logs (bin_id, distance_cm, created_at)
-                VALUES (%s, %s, %s)
-            ''', (bin_id, distance_cm, timestamp))
-        else:
-            cursor.execute('''
-                INSERT INTO trash_bin_logs (bin_id, distance_cm)
-                VALUES (%s, %s)
-            ''', (bin_id, distance_cm))
+        cursor.execute(insert_sql, params)
+        log_id = cursor.lastrowid
+        
+        # Fold into the fill-rate estimate in the same transaction
+        bin_forecast.observe_or_warn(cursor, [(bin_id, bin_forecast.reading_time(data.get('timestamp')), distance_cm)])
         
         conn.commit()
-        log_id = cursor.lastrowid
         cursor.close()
         conn.close()
         
-        print(f"✅ Bin data recorded: {bin_id} - {distance_cm}cm")
+        logger.info("bin_data_recorded bin_id=%s distance_cm=%s log_id=%s", bin_id, distance_cm, log_id, extra=SAMPLED)
         return jsonify({
             'status': 'success',
             'message': 'Data recorded',
             'log_id': log_id
         }), 201
     except Exception as e:
-        print(f"Error recording bin data: {e}")
+        logger.error("request_failed endpoint=%s error=%s", request.endpoint, e)
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/bin-data', methods=['GET'])
@@ -844,22 +1146,103 @@ def get_bin_data():
                 LIMIT %s
             ''', (limit,))
         
-        results = cursor.fetchall()
+        logs = with_archived(cursor.fetchall(), 'trash_bin_logs', limit, key=bin_id,
+                             columns=['log_id', 'bin_id', 'distance_cm', 'created_at'])
         cursor.close()
         conn.close()
         
-        logs = []
-        for row in results:
-            logs.append({
-                'log_id': row['log_id'],
-                'bin_id': row['bin_id'],
-                'distance_cm': float(row['distance_cm']),
-                'created_at': str(row['created_at']) if row['created_at'] else ''
-            })
-        
         return jsonify({'logs': logs, 'count': len(logs)})
     except Exception as e:
-        print(f"Bin Data Retrieval Error: {e}")
+        logger.error("request_failed endpoint=%s error=%s", request.endpoint, e)
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/bin-data/forecast', methods=['GET'])
+def get_bin_forecast():
+    """Bins by predicted time to full, soonest first (see bin_forecast.py)
+    
+    Query: limit (default 100), within_hours (only bins full within N hours)
+    """
+    limit = request.args.get('limit', 100, type=int)
+    within_hours = request.args.get('within_hours', type=float)
+    
+    conn = get_db_connection()
+    if not conn:
+        return jsonify({'error': 'Database connection failed'}), 500
+    
+    try:
+        cursor = conn.cursor(dictionary=True)
+        bins = bin_forecast.ranked(cursor, limit, within_hours)
+        cursor.close()
+        conn.close()
+        
+        return jsonify({'bins': bins, 'count': len(bins), 'full_distance_cm': BIN_FULL_DISTANCE_CM})
+    except Exception as e:
+        logger.error("request_failed endpoint=%s error=%s", request.endpoint, e)
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/bin-data/latest', methods=['GET'])
+@http_cache.conditional('trash_bin_logs')
+def get_bin_fleet():
+    """Latest distance, fill percentage and last-seen time of every bin
+    
+    One scan of bin_fill_state (no trash_bin_logs sort per bin); answered
+    with 304 until a bin reports again. Query: format=rows|columnar
+    """
+    response_format = request.args.get('format', 'rows')
+    if response_format not in HISTORY_FORMATS:
+        return jsonify({'error': f"format must be one of: {', '.join(HISTORY_FORMATS)}"}), 400
+    
+    conn = get_db_connection()
+    if not conn:
+        return jsonify({'error': 'Database connection failed'}), 500
+    
+    try:
+        cursor = conn.cursor()
+        bins = bin_forecast.fleet(cursor)
+        cursor.close()
+        conn.close()
+        
+        if response_format == 'columnar':
+            columns = ['bin_id', 'distance_cm', 'fill_percent', 'last_seen', 'fill_rate_cm_per_hour',
+                       'predicted_full_at']
+            return jsonify({'bins': columnar(bins, columns), 'count': len(bins)})
+        return jsonify({'bins': bins, 'count': len(bins)})
+    except Exception as e:
+        logger.error("request_failed endpoint=%s error=%s", request.endpoint, e)
+        return jsonify({'error': str(e)}), 500
+
+
+# ==================== ARCHIVE ====================
+
+@app.route('/api/archive/<table>', methods=['GET'])
+@token_required
+def get_archived_rows(table):
+    """Read archived rows of a time range (Parquet files written by archive.py)
+
+    Without since, at most ARCHIVE_READ_MAX_DAYS day partitions are read.
+    """
+    if table not in archive.ARCHIVED_TABLES:
+        return jsonify({'error': f"table must be one of: {', '.join(archive.ARCHIVED_TABLES)}"}), 400
+    limit = request.args.get('limit', 1000, type=int)
+    key = request.args.get('key')
+    if key is not None and table != 'trash_bin_logs':
+        key = request.args.get('key', type=int)
+    try:
+        since = request.args.get('since')
+        since = datetime.fromisoformat(since) if since else None
+        until = request.args.get('until')
+        until = datetime.fromisoformat(until) if until else None
+    except ValueError:
+        return jsonify({'error': 'since/until must be ISO dates (YYYY-MM-DD[ HH:MM:SS])'}), 400
+    
+    try:
+        rows = archive.read(ARCHIVE_DIR, table, since=since, until=until, key=key, limit=limit,
+                            max_days=ARCHIVE_READ_MAX_DAYS if since is None else None)
+        return jsonify({'rows': rows, 'count': len(rows)})
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error("request_failed endpoint=%s error=%s", request.endpoint, e)
         return jsonify({'error': str(e)}), 500
 
 
@@ -892,7 +1275,7 @@ def init_device_logs_table():
         conn.close()
         return jsonify({'message': 'device_logs table created successfully'})
     except Exception as e:
-        print(f"Error: {e}")
+        logger.error("request_failed endpoint=%s error=%s", request.endpoint, e)
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/device-logs', methods=['POST'])
@@ -951,7 +1334,7 @@ def record_device_log():
         
         return jsonify({'success': True, 'log_id': log_id, 'message': 'Device log recorded'}), 201
     except Exception as e:
-        print(f"Error: {e}")
+        logger.error("request_failed endpoint=%s error=%s", request.endpoint, e)
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/device-logs', methods=['GET'])
@@ -980,18 +1363,13 @@ def get_device_logs():
                 LIMIT %s
             ''', (limit,))
         
-        results = cursor.fetchall()
+        logs = cursor.fetchall()
         cursor.close()
         conn.close()
         
-        logs = [dict(row) for row in results]
-        for log in logs:
-            if 'created_at' in log:
-                log['created_at'] = str(log['created_at'])
-        
         return jsonify({'logs': logs, 'count': len(logs)})
     except Exception as e:
-        print(f"Error: {e}")
+        logger.error("request_failed endpoint=%s error=%s", request.endpoint, e)
         return jsonify({'error': str(e)}), 500
 
 
@@ -999,7 +1377,7 @@ def get_device_logs():
 
 @app.route('/api/weather/init', methods=['POST'])
 def init_weather_table():
-    """Initialize weather_logs table"""
+    """Initialize weather_logs and weather_stations (rebuilt from weather_logs)"""
     conn = get_db_connection()
     if not conn:
         return jsonify({'error': 'Database connection failed'}), 500
@@ -1021,12 +1399,15 @@ def init_weather_table():
                 INDEX idx_location_created (location, created_at)
             )
         ''')
+        schema.create_weather_stations(cursor)
         conn.commit()
         cursor.close()
+        stations = weather_stations.rebuild(conn)
         conn.close()
-        return jsonify({'message': 'weather_logs table created successfully'})
+        return jsonify({'message': 'weather_logs and weather_stations tables created successfully',
+                        'stations': stations})
     except Exception as e:
-        print(f"Error: {e}")
+        logger.error("request_failed endpoint=%s error=%s", request.endpoint, e)
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/weather', methods=['POST'])
@@ -1069,6 +1450,7 @@ def record_weather():
                 INDEX idx_location_created (location, created_at)
             )
         ''')
+        schema.create_weather_stations(cursor)
         
         cursor.execute('''
             INSERT INTO weather_logs 
@@ -1084,15 +1466,20 @@ def record_weather():
             data.get('rainfall', 0),
             data.get('weather_condition', '')
         ))
+        weather_id = cursor.lastrowid
+        
+        # Station index (readings without a position keep the last known one)
+        if data.get('latitude') is not None and data.get('longitude') is not None:
+            weather_stations.upsert(cursor, data['location'], data['latitude'], data['longitude'],
+                                    weather_id, datetime.now())
         
         conn.commit()
-        weather_id = cursor.lastrowid
         cursor.close()
         conn.close()
         
         return jsonify({'success': True, 'weather_id': weather_id}), 201
     except Exception as e:
-        print(f"Error: {e}")
+        logger.error("request_failed endpoint=%s error=%s", request.endpoint, e)
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/weather', methods=['GET'])
@@ -1121,16 +1508,133 @@ def get_weather():
                 LIMIT %s
             ''', (limit,))
         
-        results = cursor.fetchall()
+        logs = cursor.fetchall()
         cursor.close()
         conn.close()
         
-        logs = [dict(row) for row in results]
         return jsonify({'weather': logs, 'count': len(logs)})
     except Exception as e:
-        print(f"Error: {e}")
+        logger.error("request_failed endpoint=%s error=%s", request.endpoint, e)
         return jsonify({'error': str(e)}), 500
 
+def coordinate_arg(name, limit):
+    """Float query argument within [-limit, limit]; raises ValueError"""
+    value = request.args.get(name, type=float)
+    if value is None or not -limit <= value <= limit:
+        raise ValueError(f"{name} must be a number between -{limit} and {limit}")
+    return value
+
+@app.route('/api/weather/stations', methods=['GET'])
+def get_weather_stations():
+    """Weather stations in a radius or a bounding box, with their latest reading
+    
+    Query: lat, lon, radius_km (nearest first, with distance_km)
+       or: min_lat, max_lat, min_lon, max_lon (min_lon > max_lon crosses 180)
+    """
+    try:
+        if 'radius_km' in request.args:
+            lat, lon = coordinate_arg('lat', 90), coordinate_arg('lon', 180)
+            radius_km = request.args.get('radius_km', type=float)
+            if radius_km is None or radius_km <= 0:
+                raise ValueError('radius_km must be a positive number')
+            box = None
+        else:
+            box = (coordinate_arg('min_lat', 90), coordinate_arg('max_lat', 90),
+                   coordinate_arg('min_lon', 180), coordinate_arg('max_lon', 180))
+            if box[0] > box[1]:
+                raise ValueError('min_lat must not exceed max_lat')
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    conn = get_db_connection()
+    if not conn:
+        return jsonify({'error': 'Database connection failed'}), 500
+    
+    try:
+        cursor = conn.cursor(dictionary=True)
+        if box is None:
+            stations = weather_stations.within_radius(cursor, lat, lon, radius_km)
+        else:
+            stations = weather_stations.within_box(cursor, *box)
+        cursor.close()
+        conn.close()
+        
+        return jsonify({'stations': stations, 'count': len(stations)})
+    except Exception as e:
+        logger.error("request_failed endpoint=%s error=%s", request.endpoint, e)
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/weather/nearest', methods=['GET'])
+def get_nearest_weather():
+    """Nearest weather stations to a position or a plot, with their latest reading
+    
+    Query: lat & lon, or plot_id (the plot's latitude/longitude); k (default 1, max 50)
+    """
+    k = request.args.get('k', 1, type=int)
+    plot_id = request.args.get('plot_id', type=int)
+    try:
+        if not 1 <= k <= 50:
+            raise ValueError('k must be between 1 and 50')
+        if plot_id is None:
+            lat, lon = coordinate_arg('lat', 90), coordinate_arg('lon', 180)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    conn = get_db_connection()
+    if not conn:
+        return jsonify({'error': 'Database connection failed'}), 500
+    
+    try:
+        cursor = conn.cursor(dictionary=True)
+        if plot_id is not None:
+            cursor.execute('SELECT latitude, longitude FROM plots WHERE plot_id = %s', (plot_id,))
+            plot = cursor.fetchone()
+            if not plot:
+                cursor.close()
+                conn.close()
+                return jsonify({'error': 'Plot not found'}), 404
+            if plot['latitude'] is None or plot['longitude'] is None:
+                cursor.close()
+                conn.close()
+                return jsonify({'error': 'Plot has no latitude/longitude'}), 400
+            lat, lon = float(plot['latitude']), float(plot['longitude'])
+        stations = weather_stations.nearest(cursor, lat, lon, k)
+        cursor.close()
+        conn.close()
+        
+        return jsonify({'latitude': lat, 'longitude': lon, 'stations': stations, 'count': len(stations)})
+    except Exception as e:
+        logger.error("request_failed endpoint=%s error=%s", request.endpoint, e)
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/weather/plots', methods=['GET'])
+def get_plot_weather():
+    """Weather of every plot interpolated from nearby stations (see plot_weather.py)
+    
+    Recomputed at most once per WEATHER_PLOTS_BUCKET_SECONDS per worker.
+    Query: plot_id (one plot), format=rows|columnar
+    """
+    plot_id = request.args.get('plot_id', type=int)
+    response_format = request.args.get('format', 'rows')
+    if response_format not in HISTORY_FORMATS:
+        return jsonify({'error': f"format must be one of: {', '.join(HISTORY_FORMATS)}"}), 400
+    
+    try:
+        result = plot_weather.current(get_db_connection)
+    except RuntimeError as e:
+        return jsonify({'error': str(e)}), 503
+    except Exception as e:
+        logger.error("request_failed endpoint=%s error=%s", request.endpoint, e)
+        return jsonify({'error': str(e)}), 500
+    
+    plots = result['plots']
+    if plot_id is not None:
+        plots = [p for p in plots if p['plot_id'] == plot_id]
+    count = len(plots)
+    if response_format == 'columnar':
+        plots = columnar(plots, ['plot_id', *plot_weather.VARIABLES, 'stations', 'nearest_station_km'])
+    return jsonify({'as_of': result['as_of'], 'stations': result['stations'], 'plots': plots, 'count': count})
+
 
 # ==================== ALERTS API ====================
 
@@ -1161,7 +1665,7 @@ def init_alerts_table():
         conn.close()
         return jsonify({'message': 'alerts table created successfully'})
     except Exception as e:
-        print(f"Error: {e}")
+        logger.error("request_failed endpoint=%s error=%s", request.endpoint, e)
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/alerts', methods=['POST'])
@@ -1216,10 +1720,11 @@ def create_alert():
         
         return jsonify({'success': True, 'alert_id': alert_id}), 201
     except Exception as e:
-        print(f"Error: {e}")
+        logger.error("request_failed endpoint=%s error=%s", request.endpoint, e)
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/alerts', methods=['GET'])
+@http_cache.conditional('alerts')
 def get_alerts():
     """Get alerts, optionally filtered by plot_id and resolution status"""
     plot_id = request.args.get('plot_id', type=int)
@@ -1247,14 +1752,13 @@ def get_alerts():
                 LIMIT %s
             ''', (is_resolved, limit))
         
-        results = cursor.fetchall()
+        alerts = cursor.fetchall()
         cursor.close()
         conn.close()
         
-        alerts = [dict(row) for row in results]
         return jsonify({'alerts': alerts, 'count': len(alerts)})
     except Exception as e:
-        print(f"Error: {e}")
+        logger.error("request_failed endpoint=%s error=%s", request.endpoint, e)
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/alerts/<int:alert_id>/resolve', methods=['PUT'])
@@ -1278,7 +1782,7 @@ def resolve_alert(alert_id):
         
         return jsonify({'success': True, 'message': 'Alert resolved'})
     except Exception as e:
-        print(f"Error: {e}")
+        logger.error("request_failed endpoint=%s error=%s", request.endpoint, e)
         return jsonify({'error': str(e)}), 500
 
 
@@ -1286,33 +1790,20 @@ def resolve_alert(alert_id):
 
 @app.route('/api/maintenance/init', methods=['POST'])
 def init_maintenance_table():
-    """Initialize maintenance table"""
+    """Initialize maintenance table (and the usage tables of maintenance_triggers.py)"""
     conn = get_db_connection()
     if not conn:
         return jsonify({'error': 'Database connection failed'}), 500
     
     try:
         cursor = conn.cursor()
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS maintenance_schedules (
-                maintenance_id INT AUTO_INCREMENT PRIMARY KEY,
-                device_id INT NOT NULL,
-                device_name VARCHAR(100),
-                maintenance_type VARCHAR(100),
-                scheduled_date DATE,
-                last_maintenance_date DATE,
-                status VARCHAR(50),
-                notes TEXT,
-                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                INDEX idx_device_date (device_id, scheduled_date)
-            )
-        ''')
+        schema.create_device_usage(cursor)
         conn.commit()
         cursor.close()
         conn.close()
         return jsonify({'message': 'maintenance_schedules table created successfully'})
     except Exception as e:
-        print(f"Error: {e}")
+        logger.error("request_failed endpoint=%s error=%s", request.endpoint, e)
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/maintenance', methods=['POST'])
@@ -1337,20 +1828,7 @@ def schedule_maintenance():
     
     try:
         cursor = conn.cursor()
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS maintenance_schedules (
-                maintenance_id INT AUTO_INCREMENT PRIMARY KEY,
-                device_id INT NOT NULL,
-                device_name VARCHAR(100),
-                maintenance_type VARCHAR(100),
-                scheduled_date DATE,
-                last_maintenance_date DATE,
-                status VARCHAR(50),
-                notes TEXT,
-                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                INDEX idx_device_date (device_id, scheduled_date)
-            )
-        ''')
+        cursor.execute(schema.MAINTENANCE_SCHEDULES_DDL)
         
         cursor.execute('''
             INSERT INTO maintenance_schedules 
@@ -1372,7 +1850,7 @@ def schedule_maintenance():
         
         return jsonify({'success': True, 'maintenance_id': maintenance_id}), 201
     except Exception as e:
-        print(f"Error: {e}")
+        logger.error("request_failed endpoint=%s error=%s", request.endpoint, e)
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/maintenance', methods=['GET'])
@@ -1403,14 +1881,74 @@ def get_maintenance():
                 LIMIT %s
             ''', (status, limit))
         
-        results = cursor.fetchall()
+        schedules = cursor.fetchall()
         cursor.close()
         conn.close()
         
-        schedules = [dict(row) for row in results]
         return jsonify({'schedules': schedules, 'count': len(schedules)})
     except Exception as e:
-        print(f"Error: {e}")
+        logger.error("request_failed endpoint=%s error=%s", request.endpoint, e)
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/maintenance/evaluate', methods=['POST'])
+def evaluate_maintenance():
+    """Fold new device status history into usage and schedule the maintenance due
+    
+    maintenance_triggers.py --every does the same outside the API.
+    """
+    conn = get_db_connection()
+    if not conn:
+        return jsonify({'error': 'Database connection failed'}), 500
+    
+    try:
+        stats = maintenance_triggers.process(conn)
+        conn.close()
+        return jsonify(stats)
+    except Exception as e:
+        logger.error("request_failed endpoint=%s error=%s", request.endpoint, e)
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/maintenance/<int:maintenance_id>/complete', methods=['PUT'])
+def complete_maintenance(maintenance_id):
+    """Mark maintenance as completed (a runtime service or error inspection restarts its count)"""
+    conn = get_db_connection()
+    if not conn:
+        return jsonify({'error': 'Database connection failed'}), 500
+    
+    try:
+        entry = maintenance_triggers.complete(conn, maintenance_id)
+        conn.close()
+        if entry is None:
+            return jsonify({'error': 'Maintenance entry not found'}), 404
+        
+        return jsonify({'success': True, 'message': 'Maintenance completed', **entry})
+    except Exception as e:
+        logger.error("request_failed endpoint=%s error=%s", request.endpoint, e)
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/maintenance/usage', methods=['GET'])
+def get_maintenance_usage():
+    """Runtime and errors per device since the last evaluation, with hours until a service is due"""
+    device_id = request.args.get('device_id', type=int)
+    
+    conn = get_db_connection()
+    if not conn:
+        return jsonify({'error': 'Database connection failed'}), 500
+    
+    try:
+        cursor = conn.cursor()
+        devices = maintenance_triggers.usage(cursor, device_id)
+        cursor.close()
+        conn.close()
+        
+        return jsonify({
+            'devices': devices,
+            'count': len(devices),
+            'runtime_hours': maintenance_triggers.RUNTIME_HOURS,
+            'error_spike': maintenance_triggers.ERROR_SPIKE
+        })
+    except Exception as e:
+        logger.error("request_failed endpoint=%s error=%s", request.endpoint, e)
         return jsonify({'error': str(e)}), 500
 
 
@@ -1444,7 +1982,7 @@ def init_crop_health_table():
         conn.close()
         return jsonify({'message': 'crop_health_metrics table created successfully'})
     except Exception as e:
-        print(f"Error: {e}")
+        logger.error("request_failed endpoint=%s error=%s", request.endpoint, e)
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/crop-health', methods=['POST'])
@@ -1509,7 +2047,7 @@ def record_crop_health():
         
         return jsonify({'success': True, 'metric_id': metric_id, 'health_status': health_status}), 201
     except Exception as e:
-        print(f"Error: {e}")
+        logger.error("request_failed endpoint=%s error=%s", request.endpoint, e)
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/crop-health', methods=['GET'])
@@ -1534,20 +2072,62 @@ def get_crop_health():
             LIMIT %s
         ''', (plot_id, limit))
         
-        results = cursor.fetchall()
+        metrics = cursor.fetchall()
         cursor.close()
         conn.close()
         
-        metrics = [dict(row) for row in results]
         return jsonify({'metrics': metrics, 'count': len(metrics)})
     except Exception as e:
-        print(f"Error: {e}")
+        logger.error("request_failed endpoint=%s error=%s", request.endpoint, e)
         return jsonify({'error': str(e)}), 500
 
 
 # ==================== FARM STATISTICS API ====================
 
+@app.route('/api/statistics/counters/init', methods=['POST'])
+def init_farm_counters():
+    """Install the farm_counters triggers and seed them from the existing rows"""
+    conn = get_db_connection()
+    if not conn:
+        return jsonify({'error': 'Database connection failed'}), 500
+    
+    try:
+        cursor = conn.cursor()
+        installed = schema.create_farm_counters(cursor, dialect=DB_BACKEND)
+        conn.commit()
+        cursor.close()
+        # Triggers are live now: the reconcile adds rows that predate them
+        report = counters.reconcile(conn, fix=True, names=installed)
+        conn.close()
+        return jsonify({'message': 'farm_counters created successfully', 'counters': installed,
+                        'seeded': report})
+    except Exception as e:
+        logger.error("request_failed endpoint=%s error=%s", request.endpoint, e)
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/admin/counters/reconcile', methods=['GET', 'POST'])
+@token_required
+@admin_required
+def reconcile_farm_counters():
+    """Compare farm_counters with COUNT(*); POST also corrects the drift"""
+    conn = get_db_connection()
+    if not conn:
+        return jsonify({'error': 'Database connection failed'}), 500
+    
+    try:
+        report = counters.reconcile(conn, fix=request.method == 'POST')
+        conn.close()
+        return jsonify({
+            'drift': any(row['drift'] for row in report.values()),
+            'fixed': request.method == 'POST',
+            'counters': report
+        })
+    except Exception as e:
+        logger.error("request_failed endpoint=%s error=%s", request.endpoint, e)
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/api/statistics/overview', methods=['GET'])
+@http_cache.conditional('plots', 'devices', 'sensor_logs', 'alerts', bucket_seconds=60)
 def get_farm_statistics():
     """Get farm overview statistics"""
     conn = get_db_connection()
@@ -1555,21 +2135,29 @@ def get_farm_statistics():
         return jsonify({'error': 'Database connection failed'}), 500
     
     try:
-        cursor = conn.cursor(dictionary=True)
-        
         stats = {}
         
-        # Total plots
-        cursor.execute('SELECT COUNT(*) as count FROM plots')
-        stats['total_plots'] = cursor.fetchone()['count'] or 0
-        
-        # Active devices
-        cursor.execute("SELECT COUNT(*) as count FROM devices WHERE status = 'ON'")
-        stats['active_devices'] = cursor.fetchone()['count'] or 0
-        
-        # Total sensors
-        cursor.execute('SELECT COUNT(*) as count FROM sensor_logs')
-        stats['total_sensor_readings'] = cursor.fetchone()['count'] or 0
+        # Maintained by triggers (counters.py): O(1) regardless of history size
+        counts = counters.read_or_none(conn)
+        cursor = conn.cursor(dictionary=True)
+        if counts is not None:
+            stats.update(counts)
+        else:
+            # Total plots
+            cursor.execute('SELECT COUNT(*) as count FROM plots')
+            stats['total_plots'] = cursor.fetchone()['count'] or 0
+            
+            # Active devices
+            cursor.execute("SELECT COUNT(*) as count FROM devices WHERE status = 'ON'")
+            stats['active_devices'] = cursor.fetchone()['count'] or 0
+            
+            # Total sensors
+            cursor.execute('SELECT COUNT(*) as count FROM sensor_logs')
+            stats['total_sensor_readings'] = cursor.fetchone()['count'] or 0
+            
+            # Unresolved alerts
+            cursor.execute("SELECT COUNT(*) as count FROM alerts WHERE is_resolved = FALSE")
+            stats['pending_alerts'] = cursor.fetchone()['count'] or 0
         
         # Latest sensor data
         cursor.execute('''
@@ -1581,16 +2169,12 @@ def get_farm_statistics():
         stats['avg_temperature'] = float(latest['avg_temp']) if latest['avg_temp'] else 0
         stats['avg_humidity'] = float(latest['avg_humidity']) if latest['avg_humidity'] else 0
         
-        # Unresolved alerts
-        cursor.execute("SELECT COUNT(*) as count FROM alerts WHERE is_resolved = FALSE")
-        stats['pending_alerts'] = cursor.fetchone()['count'] or 0
-        
         cursor.close()
         conn.close()
         
         return jsonify(stats)
     except Exception as e:
-        print(f"Error: {e}")
+        logger.error("request_failed endpoint=%s error=%s", request.endpoint, e)
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/statistics/plot/<int:plot_id>', methods=['GET'])
@@ -1644,7 +2228,7 @@ def get_plot_statistics(plot_id):
         
         return jsonify(stats)
     except Exception as e:
-        print(f"Error: {e}")
+        logger.error("request_failed endpoint=%s error=%s", request.endpoint, e)
         return jsonify({'error': str(e)}), 500
 
 
@@ -1677,7 +2261,7 @@ def init_device_history_table():
         conn.close()
         return jsonify({'message': 'device_status_history table created successfully'})
     except Exception as e:
-        print(f"Error: {e}")
+        logger.error("request_failed endpoint=%s error=%s", request.endpoint, e)
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/device-history', methods=['POST'])
@@ -1737,17 +2321,21 @@ def record_device_history():
         
         return jsonify({'success': True, 'history_id': history_id}), 201
     except Exception as e:
-        print(f"Error: {e}")
+        logger.error("request_failed endpoint=%s error=%s", request.endpoint, e)
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/device-history', methods=['GET'])
 def get_device_history():
-    """Get device status history"""
+    """Get device status history (?fields=, ?format=columnar)"""
     device_id = request.args.get('device_id', type=int)
     limit = request.args.get('limit', 100, type=int)
     
     if not device_id:
         return jsonify({'error': 'device_id required'}), 400
+    try:
+        select_list, response_format = history_projection(DEVICE_HISTORY_FIELDS)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     
     conn = get_db_connection()
     if not conn:
@@ -1755,25 +2343,208 @@ def get_device_history():
     
     try:
         cursor = conn.cursor(dictionary=True)
-        cursor.execute('''
-            SELECT * FROM device_status_history
+        cursor.execute(f'''
+            SELECT {select_list} FROM device_status_history
             WHERE device_id = %s
             ORDER BY created_at DESC
             LIMIT %s
         ''', (device_id, limit))
         
-        results = cursor.fetchall()
+        history = cursor.fetchall()
+        payload = history_payload(cursor, history, response_format)
         cursor.close()
         conn.close()
         
-        history = [dict(row) for row in results]
-        for h in history:
-            if 'created_at' in h:
-                h['created_at'] = str(h['created_at'])
+        return jsonify({'history': payload, 'count': len(history)})
+    except Exception as e:
+        logger.error("request_failed endpoint=%s error=%s", request.endpoint, e)
+        return jsonify({'error': str(e)}), 500
+
+
+# DEVICE RUNTIME (duty_cycle.py folds ON/OFF logs into daily totals)
+
+@app.before_request
+def schedule_duty_cycle():
+    """Start this worker's duty_cycle fold thread (once per process)"""
+    duty_cycle.schedule(DB_CONFIG, DUTY_CYCLE_INTERVAL)
+
+@app.route('/api/device-runtime/init', methods=['POST'])
+def init_device_runtime():
+    """Create the device runtime tables and fold in the logs recorded so far"""
+    conn = get_db_connection()
+    if not conn:
+        return jsonify({'error': 'Database connection failed'}), 500
+    
+    try:
+        stats = duty_cycle.process(conn)
+        conn.close()
+        return jsonify({'message': 'device runtime tables created successfully', 'rows': stats})
+    except Exception as e:
+        logger.error("request_failed endpoint=%s error=%s", request.endpoint, e)
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/device-runtime', methods=['GET'])
+def get_device_runtime():
+    """Daily runtime and duty cycle per device, with per-device and per-plot totals
+    
+    Query: from, to (YYYY-MM-DD, default the last 7 days), device_id or plot_id
+    Current to the last fold (every DUTY_CYCLE_INTERVAL seconds); devices
+    still on count up to now.
+    """
+    device_id = request.args.get('device_id', type=int)
+    plot_id = request.args.get('plot_id', type=int)
+    try:
+        until = date.fromisoformat(request.args['to']) if 'to' in request.args else date.today()
+        since = date.fromisoformat(request.args['from']) if 'from' in request.args else until - timedelta(days=6)
+    except ValueError:
+        return jsonify({'error': 'from/to must be dates (YYYY-MM-DD)'}), 400
+    if since > until or (until - since).days >= duty_cycle.MAX_RANGE_DAYS:
+        return jsonify({'error': f"from must not be after to, at most {duty_cycle.MAX_RANGE_DAYS} days"}), 400
+    
+    conn = get_db_connection()
+    if not conn:
+        return jsonify({'error': 'Database connection failed'}), 500
+    
+    try:
+        cursor = conn.cursor()
+        device_ids = [device_id] if device_id is not None else None
+        if plot_id is not None:
+            cursor.execute('SHOW TABLES LIKE %s', ('devices',))
+            has_plots = bool(cursor.fetchall())
+            if has_plots:
+                cursor.execute('SHOW COLUMNS FROM devices')
+                has_plots = 'plot_id' in {row[0] for row in cursor.fetchall()}
+            if not has_plots:
+                cursor.close()
+                conn.close()
+                return jsonify({'error': 'plot_id needs devices.plot_id (not in the init-db devices table)'}), 400
+            cursor.execute('SELECT device_id FROM devices WHERE plot_id = %s', (plot_id,))
+            device_ids = [row[0] for row in cursor.fetchall()]
+        days = duty_cycle.runtime(cursor, since, until, device_ids)
+        
+        # Per-plot totals need devices.plot_id (missing from the init-db devices table)
+        plots = None
+        ids = sorted({item['device_id'] for item in days})
+        try:
+            plot_of = {}
+            if ids:
+                placeholders = ', '.join(['%s'] * len(ids))
+                cursor.execute(f'SELECT device_id, plot_id FROM devices WHERE device_id IN ({placeholders})', ids)
+                plot_of = dict(cursor.fetchall())
+            for item in days:
+                item['plot_id'] = plot_of.get(item['device_id'])
+            plots = duty_cycle.totals(days, 'plot_id')
+        except database.Error as e:
+            logger.warning("device_runtime_plots_unavailable error=%s", e)
+        devices = duty_cycle.totals(days)
+        cursor.close()
+        conn.close()
         
-        return jsonify({'history': history, 'count': len(history)})
+        for item in days:
+            item['day'] = item['day'].isoformat()
+        return jsonify({
+            'from': since.isoformat(),
+            'to': until.isoformat(),
+            'days': days,
+            'devices': devices,
+            'plots': plots
+        })
+    except Exception as e:
+        logger.error("request_failed endpoint=%s error=%s", request.endpoint, e)
+        return jsonify({'error': str(e)}), 500
+
+
+# REPLICATION
+
+def replication_key_required(f):
+    """Gateways authenticate with REPLICATION_KEY; without one configured replication is refused"""
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        if not REPLICATION_KEY:
+            return jsonify({'error': 'Replication is disabled: set REPLICATION_KEY on the central server'}), 503
+        if not hmac.compare_digest(
+                request.headers.get(replication.KEY_HEADER, ''), REPLICATION_KEY):
+            return jsonify({'error': 'Invalid replication key'}), 401
+        if not request.headers.get(replication.GATEWAY_HEADER):
+            return jsonify({'error': f'{replication.GATEWAY_HEADER} header required'}), 400
+        return f(*args, **kwargs)
+    return decorated
+
+@app.route('/api/replication/init', methods=['POST'])
+def init_replication():
+    """Create replication_watermarks (central server)"""
+    conn = get_db_connection()
+    if not conn:
+        return jsonify({'error': 'Database connection failed'}), 500
+    
+    try:
+        cursor = conn.cursor()
+        schema.create_replication_watermarks(cursor)
+        conn.commit()
+        cursor.close()
+        conn.close()
+        return jsonify({'message': 'replication_watermarks table created successfully'})
     except Exception as e:
-        print(f"Error: {e}")
+        logger.error("request_failed endpoint=%s error=%s", request.endpoint, e)
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/replication/watermarks', methods=['GET'])
+@replication_key_required
+def get_replication_watermarks():
+    """Last gateway row id applied per table - where the gateway resumes from"""
+    gateway_id = request.headers[replication.GATEWAY_HEADER]
+    conn = get_db_connection()
+    if not conn:
+        return jsonify({'error': 'Database connection failed'}), 500
+    
+    try:
+        cursor = conn.cursor()
+        marks = replication.watermarks(cursor, gateway_id)
+        cursor.close()
+        conn.close()
+        return jsonify({'gateway_id': gateway_id, 'watermarks': marks})
+    except Exception as e:
+        logger.error("request_failed endpoint=%s error=%s", request.endpoint, e)
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/replication/batch', methods=['POST'])
+@replication_key_required
+def apply_replication_batch():
+    """Apply one gzip batch of gateway rows (idempotent, see replication.py)
+    
+    Headers: X-Gateway-Id, X-Batch-SHA256 (of the uncompressed JSON)
+    Body: gzip JSON {gateway_id, table, after_id, last_id, columns, rows}
+    
+    Response: {"table": ..., "applied": n, "skipped": n, "last_id": n}
+    409 {"last_id": n} when the batch starts after the watermark
+    """
+    gateway_id = request.headers[replication.GATEWAY_HEADER]
+    try:
+        batch = replication.decode_batch(request.get_data(cache=False),
+                                         request.headers.get(replication.CHECKSUM_HEADER, ''))
+    except replication.BatchError as e:
+        logger.warning("replication_rejected gateway=%s error=%s", gateway_id, e)
+        return jsonify({'error': str(e)}), 400
+    
+    conn = get_db_connection()
+    if not conn:
+        return jsonify({'error': 'Database connection failed'}), 500
+    
+    try:
+        result = replication.apply_batch(conn, gateway_id, batch)
+        conn.close()
+        logger.info("replication_applied gateway=%s table=%s rows=%d last_id=%d",
+                    gateway_id, result['table'], result['applied'], result['last_id'],
+                    extra=SAMPLED)
+        return jsonify(result)
+    except replication.WatermarkGap as e:
+        conn.close()
+        return jsonify({'error': str(e), 'last_id': e.last_id}), 409
+    except replication.BatchError as e:
+        conn.close()
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error("request_failed endpoint=%s error=%s", request.endpoint, e)
         return jsonify({'error': str(e)}), 500
 
 
@@ -1798,7 +2569,7 @@ def check_user():
         
         return jsonify({'exists': result is not None})
     except Exception as e:
-        print(f"Error: {e}")
+        logger.error("request_failed endpoint=%s error=%s", request.endpoint, e)
         return jsonify({'error': str(e)}), 500
 
 
@@ -1843,7 +2614,7 @@ def update_user_profile():
         conn.close()
         
         if affected > 0:
-            print(f"✅ Profile updated for {username}: name='{display_name}', email='{email}'")
+            logger.info("profile_updated username=%s", username)
             return jsonify({
                 'success': True,
                 'message': 'Profile updated',
@@ -1854,7 +2625,7 @@ def update_user_profile():
         else:
             return jsonify({'error': 'User not found'}), 404
     except Exception as e:
-        print(f"Profile Update Error: {e}")
+        logger.error("request_failed endpoint=%s error=%s", request.endpoint, e)
         return jsonify({'error': str(e)}), 500
 
 
@@ -1904,6 +2675,8 @@ def init_all_tables():
                 leaf_temp DECIMAL(5,2) DEFAULT 0,
                 water_level DECIMAL(5,2) DEFAULT 0,
                 note TEXT,
+                latitude DECIMAL(10,8),
+                longitude DECIMAL(11,8),
                 created_at DATETIME DEFAULT CURRENT_TIMESTAMP
             )
         ''')
@@ -1915,7 +2688,9 @@ def init_all_tables():
             "ALTER TABLE plots ADD COLUMN water_level DECIMAL(5,2) DEFAULT 0",
             "ALTER TABLE plots ADD COLUMN image_path VARCHAR(255) DEFAULT ''",
             "ALTER TABLE plots ADD COLUMN plant_type VARCHAR(100) DEFAULT ''",
-            "ALTER TABLE plots ADD COLUMN note TEXT"
+            "ALTER TABLE plots ADD COLUMN note TEXT",
+            "ALTER TABLE plots ADD COLUMN latitude DECIMAL(10,8)",
+            "ALTER TABLE plots ADD COLUMN longitude DECIMAL(11,8)"
         ]
         for col_sql in plot_columns:
             try:
@@ -2004,10 +2779,39 @@ def init_all_tables():
             'details': messages
         })
     except Exception as e:
-        print(f"Error: {e}")
+        logger.error("request_failed endpoint=%s error=%s", request.endpoint, e)
         return jsonify({'error': str(e)}), 500
 
 
+def upgrade_password_hash(user_id, password):
+    """Rehash a legacy plaintext / weak password after a successful login
+
+    The hash runs in the pool after the response; a saturated pool skips it
+    (the next login tries again).
+    """
+    password_hasher.hash_later(password, lambda hashed: store_password_hash(user_id, hashed))
+
+
+def store_password_hash(user_id, hashed_password):
+    """Save an upgraded hash (runs on a hashing pool thread, outside any request)"""
+    conn = get_db_connection()
+    if not conn:
+        return
+    
+    try:
+        cursor = conn.cursor()
+        cursor.execute(
+            'UPDATE users SET password = %s WHERE user_id = %s',
+            (hashed_password, user_id)
+        )
+        conn.commit()
+        cursor.close()
+        conn.close()
+        logger.info("password_rehashed user=%s", user_id)
+    except Exception as e:
+        logger.warning("password_rehash_failed user=%s error=%s", user_id, e)
+
+
 @app.route('/api/auth/login', methods=['POST'])
 def login():
     """Verify user credentials and return JWT tokens"""
@@ -2029,7 +2833,12 @@ def login():
         cursor.close()
         conn.close()
         
-        if result and verify_password(password, result['password']):
+        # Connection is released before bcrypt runs so it is not held for the hash
+        matched, needs_rehash = verify_password(password, result['password']) if result else (False, False)
+        if matched and needs_rehash:
+            upgrade_password_hash(result['user_id'], password)
+        
+        if matched:
             access_token, refresh_token = generate_tokens(
                 result['user_id'],
                 result['username'],
@@ -2046,8 +2855,10 @@ def login():
                 }
             })
         return jsonify({'success': False, 'message': 'Invalid credentials'}), 401
+    except HasherSaturated:
+        return hasher_busy_response()
     except Exception as e:
-        print(f"Error: {e}")
+        logger.error("request_failed endpoint=%s error=%s", request.endpoint, e)
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/auth/register', methods=['POST'])
@@ -2073,7 +2884,12 @@ def register():
             return jsonify({'success': False, 'message': 'Username already exists'}), 409
         
         # Hash password and insert new user
-        hashed_password = hash_password(password)
+        try:
+            hashed_password = hash_password(password)
+        except HasherSaturated:
+            cursor.close()
+            conn.close()
+            return hasher_busy_response()
         cursor.execute(
             'INSERT INTO users (username, password, user_type, created_at) VALUES (%s, %s, %s, NOW())',
             (username, hashed_password, user_type)
@@ -2098,7 +2914,7 @@ def register():
             'message': 'User registered successfully'
         })
     except Exception as e:
-        print(f"Error: {e}")
+        logger.error("request_failed endpoint=%s error=%s", request.endpoint, e)
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/auth/refresh', methods=['POST'])
@@ -2175,6 +2991,8 @@ if __name__ == '__main__':
     print("\n🗑️  TRASH BIN MONITORING:")
     print("  POST /api/bin-data")
     print("  GET  /api/bin-data?bin_id=<id>&limit=<n>")
+    print("  GET  /api/bin-data/forecast?within_hours=<h>")
+    print("  GET  /api/bin-data/latest")
     print("  POST /api/bin-data/init")
     
     print("\n📝 DEVICE LOGS:")
@@ -2185,6 +3003,9 @@ if __name__ == '__main__':
     print("\n🌤️  WEATHER:")
     print("  POST /api/weather")
     print("  GET  /api/weather?location=<name>&limit=<n>")
+    print("  GET  /api/weather/nearest?lat=<lat>&lon=<lon>&k=<n>")
+    print("  GET  /api/weather/stations?lat=<lat>&lon=<lon>&radius_km=<km>")
+    print("  GET  /api/weather/plots")
     print("  POST /api/weather/init")
     
     print("\n⚠️  ALERTS:")
@@ -2196,6 +3017,9 @@ if __name__ == '__main__':
     print("\n🔧 MAINTENANCE SCHEDULE:")
     print("  POST /api/maintenance")
     print("  GET  /api/maintenance?device_id=<id>&status=<status>")
+    print("  PUT  /api/maintenance/<id>/complete")
+    print("  POST /api/maintenance/evaluate")
+    print("  GET  /api/maintenance/usage?device_id=<id>")
     print("  POST /api/maintenance/init")
     
     print("\n🌱 CROP HEALTH:")
@@ -2211,6 +3035,8 @@ if __name__ == '__main__':
     print("  POST /api/device-history")
     print("  GET  /api/device-history?device_id=<id>&limit=<n>")
     print("  POST /api/device-history/init")
+    print("  GET  /api/device-runtime?from=<date>&to=<date>&device_id=<id>")
+    print("  POST /api/device-runtime/init")
     
     print("\n🔐 AUTHENTICATION:")
     print("  POST /api/auth/check")
@@ -2223,7 +3049,10 @@ if __name__ == '__main__':
     
     logger.info(f"[PRODUCTION MODE] Starting Smart Farm API Server")
     logger.info(f"Environment: {'DEBUG' if DEBUG_MODE else 'PRODUCTION'}")
-    logger.info(f"Database: {DB_CONFIG['host']}:{DB_CONFIG['database']}")
+    if DB_BACKEND == "sqlite":
+        logger.info(f"Database: sqlite:{DB_CONFIG['path']}")
+    else:
+        logger.info(f"Database: {DB_CONFIG['host']}:{DB_CONFIG['database']}")
     logger.info(f"Server: http://0.0.0.0:5000")
     
     # Use production-safe settings
@@ -0,0 +1,300 @@
+"""
+Columnar Archive Tier for Smart Farm
+Moves rows older than ARCHIVE_AFTER_DAYS from the high-volume log tables
+into date-partitioned, zstd-compressed Parquet files on local disk and
+reads them back for the history endpoints
+
+Layout: ARCHIVE_DIR/<table>/date=YYYY-MM-DD/part-<first id>-<last id>.parquet
+Rows inside a file are sorted by the table's key column (plot, device or
+bin) and time, so row-group statistics let a key/time filter skip most of
+a day; the date directories let a time range skip whole days.
+
+A day is archived in full before any of its rows are deleted, and the
+delete removes exactly the archived ids in chunks (short transactions,
+small undo). Re-running after a crash skips ids a day's files already
+hold, so rows are never lost or archived twice.
+
+Requires pyarrow (optional: without it the job refuses to run and the
+read path reports no archived rows).
+
+Usage:
+    python archive.py                        # archive everything past ARCHIVE_AFTER_DAYS
+    python archive.py --days 30 --tables sensor_data
+    python archive.py --every 86400
+"""
+
+import argparse
+import logging
+import os
+import time
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from typing import Dict, List, Optional
+
+import database
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+logger = logging.getLogger(__name__)
+
+# table: (id column, time column, key column used for filtering)
+ARCHIVED_TABLES = {
+    'sensor_logs': ('log_id', 'timestamp', 'plot_id'),
+    'sensor_data': ('data_id', 'created_at', 'device_id'),
+    'trash_bin_logs': ('log_id', 'created_at', 'bin_id'),
+}
+
+ROW_GROUP_ROWS = 16384
+COMPRESSION = 'zstd'
+
+
+def _require_pyarrow():
+    if pa is None:
+        raise RuntimeError('pyarrow is required for the archive tier (pip install pyarrow)')
+
+
+def _arrow_type(column_type: str):
+    column_type = column_type.lower()
+    if column_type.startswith(('tinyint', 'smallint', 'mediumint', 'int', 'bigint', 'integer')):
+        return pa.int64()
+    if column_type.startswith(('decimal', 'numeric', 'float', 'double', 'real')):
+        # Decimals become float64: one schema for every file, and what the API emits anyway
+        return pa.float64()
+    if column_type.startswith(('datetime', 'timestamp')):
+        return pa.timestamp('us')
+    if column_type.startswith('date'):
+        return pa.date32()
+    return pa.string()
+
+
+def table_schema(cursor, table: str):
+    """Arrow schema derived from the column types (identical for every file of a table)"""
+    cursor.execute(f'SHOW COLUMNS FROM {table}')
+    return pa.schema([(row[0], _arrow_type(row[1])) for row in cursor.fetchall()])
+
+
+def _to_arrow(rows: List[tuple], schema, sort_keys):
+    columns = list(zip(*rows)) if rows else [[] for _ in schema.names]
+    arrays = []
+    for values, field in zip(columns, schema):
+        if pa.types.is_floating(field.type):
+            values = [float(v) if isinstance(v, Decimal) else v for v in values]
+        elif pa.types.is_string(field.type):
+            values = [v if v is None or isinstance(v, str) else str(v) for v in values]
+        arrays.append(pa.array(values, type=field.type))
+    return pa.Table.from_arrays(arrays, schema=schema).sort_by(sort_keys)
+
+
+def _partition(archive_dir: str, table: str, day: date) -> str:
+    return os.path.join(archive_dir, table, f'date={day.isoformat()}')
+
+
+def _archived_ids(directory: str, id_column: str):
+    if not os.path.isdir(directory) or not any(n.endswith('.parquet') for n in os.listdir(directory)):
+        return set()
+    return set(ds.dataset(directory, format='parquet').to_table(columns=[id_column])[id_column].to_pylist())
+
+
+def _write_file(directory: str, table_data, id_column: str) -> str:
+    """Write atomically (temp file, fsync, rename): a file is complete or absent"""
+    os.makedirs(directory, exist_ok=True)
+    ids = table_data[id_column]
+    name = f'part-{pc.min(ids).as_py()}-{pc.max(ids).as_py()}.parquet'
+    path = os.path.join(directory, name)
+    temp = path + '.tmp'
+    pq.write_table(table_data, temp, compression=COMPRESSION, row_group_size=ROW_GROUP_ROWS)
+    with open(temp, 'rb') as f:
+        os.fsync(f.fileno())
+    os.replace(temp, path)
+    return path
+
+
+def archive_day(conn, archive_dir: str, table: str, day: date, chunk_rows: int = 1000) -> int:
+    """
+    Archive and delete one day of table
+
+    Returns:
+        Rows moved
+    """
+    _require_pyarrow()
+    id_column, time_column, key_column = ARCHIVED_TABLES[table]
+    cursor = conn.cursor()
+    try:
+        schema = table_schema(cursor, table)
+        start = datetime.combine(day, datetime.min.time())
+        cursor.execute(f'''
+            SELECT {', '.join(schema.names)} FROM {table}
+            WHERE {time_column} >= %s AND {time_column} < %s
+            ORDER BY {id_column}
+        ''', (start, start + timedelta(days=1)))
+        rows = cursor.fetchall()
+        conn.commit()
+
+        directory = _partition(archive_dir, table, day)
+        id_index = schema.names.index(id_column)
+        done = _archived_ids(directory, id_column)
+        fresh = [row for row in rows if row[id_index] not in done]
+        if fresh:
+            sort_keys = [(c, 'ascending') for c in (key_column, time_column) if c in schema.names]
+            _write_file(directory, _to_arrow(fresh, schema, sort_keys), id_column)
+
+        ids = [row[id_index] for row in rows]
+        for offset in range(0, len(ids), chunk_rows):
+            chunk = ids[offset:offset + chunk_rows]
+            cursor.execute(f"DELETE FROM {table} WHERE {id_column} IN ({', '.join(['%s'] * len(chunk))})",
+                           tuple(chunk))
+            conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+    logger.info("archive_day table=%s day=%s rows=%d written=%d", table, day, len(rows), len(fresh))
+    return len(rows)
+
+
+def archive_expired(conn, archive_dir: str, table: str, after_days: int, chunk_rows: int = 1000) -> Dict:
+    """
+    Archive every whole day of table older than after_days
+
+    Returns:
+        {'days': n, 'rows': n}
+    """
+    _require_pyarrow()
+    _, time_column, _ = ARCHIVED_TABLES[table]
+    cutoff = datetime.combine(date.today() - timedelta(days=after_days), datetime.min.time())
+    stats = {'days': 0, 'rows': 0}
+    cursor = conn.cursor()
+    try:
+        after = datetime.min
+        while True:
+            # Next non-empty day (index seek on the time column, gaps cost nothing)
+            cursor.execute(f'''
+                SELECT MIN({time_column}) FROM {table} WHERE {time_column} >= %s AND {time_column} < %s
+            ''', (after, cutoff))
+            first = cursor.fetchone()[0]
+            conn.commit()
+            if first is None:
+                return stats
+            if isinstance(first, str):
+                first = datetime.fromisoformat(first)
+            day = first.date()
+            stats['rows'] += archive_day(conn, archive_dir, table, day, chunk_rows)
+            stats['days'] += 1
+            after = datetime.combine(day + timedelta(days=1), datetime.min.time())
+    finally:
+        cursor.close()
+
+
+# READ PATH
+
+def has_archive(archive_dir: str, table: str) -> bool:
+    return pa is not None and os.path.isdir(os.path.join(archive_dir, table))
+
+
+def _days(archive_dir: str, table: str) -> List[str]:
+    root = os.path.join(archive_dir, table)
+    return sorted((name[len('date='):] for name in os.listdir(root) if name.startswith('date=')), reverse=True)
+
+
+def read(archive_dir: str, table: str, since: Optional[datetime] = None, until: Optional[datetime] = None,
+         key=None, columns: Optional[List[str]] = None, limit: Optional[int] = None,
+         max_days: Optional[int] = None) -> List[Dict]:
+    """
+    Archived rows of table, newest first
+
+    Days outside [since, until) are never opened; the time and key
+    filters are pushed down to the Parquet row groups. Reading stops at
+    the first day that completes limit, or after max_days day partitions
+    (bounds the work for a key with few or no archived rows).
+
+    Args:
+        since: Inclusive lower time bound
+        until: Exclusive upper time bound
+        key: Value of the table's key column (plot_id, device_id, bin_id)
+        columns: Columns to return (default: all)
+        limit: Maximum rows
+        max_days: Maximum day partitions opened, newest first
+
+    Returns:
+        Row dicts in the same shape as cursor(dictionary=True) rows
+    """
+    if not has_archive(archive_dir, table):
+        return []
+    _, time_column, key_column = ARCHIVED_TABLES[table]
+    expression = None
+    if since is not None:
+        expression = ds.field(time_column) >= pa.scalar(since, pa.timestamp('us'))
+    if until is not None:
+        bound = ds.field(time_column) < pa.scalar(until, pa.timestamp('us'))
+        expression = bound if expression is None else expression & bound
+    if key is not None:
+        bound = ds.field(key_column) == key
+        expression = bound if expression is None else expression & bound
+    wanted = list(dict.fromkeys((columns or []) + [time_column])) if columns else None
+
+    rows = []
+    opened = 0
+    for day in _days(archive_dir, table):
+        if until is not None and day > until.date().isoformat():
+            continue
+        if since is not None and day < since.date().isoformat():
+            break
+        if max_days is not None and opened >= max_days:
+            break
+        opened += 1
+        dataset = ds.dataset(_partition(archive_dir, table, date.fromisoformat(day)), format='parquet')
+        if key is not None and key_column not in dataset.schema.names:
+            raise ValueError(f"{table} archive has no {key_column} column")
+        part = dataset.to_table(columns=wanted, filter=expression)
+        part = part.sort_by([(time_column, 'descending')])
+        rows.extend(part.to_pylist())
+        if limit is not None and len(rows) >= limit:
+            break
+    if columns:
+        rows = [{c: row[c] for c in columns} for row in rows]
+    return rows[:limit] if limit is not None else rows
+
+
+def main():
+    import production_config as config
+
+    parser = argparse.ArgumentParser(description='Move expired rows to the Parquet archive')
+    parser.add_argument('--days', type=int, default=config.ARCHIVE_AFTER_DAYS, help='archive rows older than this')
+    parser.add_argument('--dir', default=config.ARCHIVE_DIR)
+    parser.add_argument('--tables', nargs='+', default=list(ARCHIVED_TABLES), choices=list(ARCHIVED_TABLES))
+    parser.add_argument('--chunk-rows', type=int, default=config.ARCHIVE_CHUNK_ROWS, help='rows per DELETE')
+    parser.add_argument('--every', type=float, default=0, help='repeat every N seconds')
+    args = parser.parse_args()
+    _require_pyarrow()
+
+    import api_server  # DB_CONFIG for the configured backend
+
+    while True:
+        conn = database.connect(api_server.DB_CONFIG, instrument=False)
+        try:
+            cursor = conn.cursor()
+            for table in args.tables:
+                cursor.execute('SHOW TABLES LIKE %s', (table,))
+                if not cursor.fetchall():
+                    continue
+                start = time.perf_counter()
+                stats = archive_expired(conn, args.dir, table, args.days, args.chunk_rows)
+                print(f"{table:<16}{stats['days']:>6} days{stats['rows']:>12} rows"
+                      f"{time.perf_counter() - start:>8.1f}s")
+            cursor.close()
+        finally:
+            conn.close()
+        if not args.every:
+            return
+        time.sleep(args.every)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,500 @@
+"""
+Asyncio Server for the Smart Farm Hot Paths
+Serves the endpoints ESP32 boards and dashboards poll most (sensor and bin
+ingest, device status, environment, sensor latest/history) on aiohttp with
+an aiomysql connection pool
+
+The threaded server ties up one OS thread per in-flight request, including
+the time a slow ESP32 link takes to send its body; here a waiting client
+costs a socket and a coroutine, so one process holds thousands of them
+and only ASYNC_DB_POOL_SIZE connections reach MySQL.
+
+SQL, validation and response shapes come from queries.py, and the JWT
+check, rate limits, history projection, archive top-up and metrics from
+api_server, so both servers answer the same requests identically. Route
+the paths below to this server at the proxy; everything else stays on
+api_server. All statements go to the primary (no replica routing).
+
+With DB_BACKEND=sqlite statements run on ASYNC_SQLITE_THREADS threads
+through the synchronous database layer (edge gateways have few clients).
+
+Requires aiohttp, and aiomysql for MySQL (both optional for api_server).
+
+Usage:
+    python async_server.py                       # ASYNC_HOST:ASYNC_PORT
+    python async_server.py --port 5001 --pool-size 40
+"""
+
+import argparse
+import asyncio
+import logging
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import wraps
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from aiohttp import web
+
+try:
+    import aiomysql
+except ImportError:
+    aiomysql = None
+
+import production_config as config
+import api_server
+import bin_forecast
+import database
+import metrics
+import queries
+import schema
+import serialization
+from rate_limiter import retry_after_header
+
+logger = logging.getLogger(__name__)
+
+# Device write endpoints, limited per device (api_server.INGEST_ENDPOINTS)
+INGEST_PATHS = {'/api/sensor', '/api/bin-data'}
+
+
+class DatabaseUnavailable(Exception):
+    """No connection could be acquired (answered like api_server: 500)"""
+
+
+class AsyncDatabase:
+    """Statements on an aiomysql pool, or on worker threads for SQLite"""
+
+    def __init__(self, db_config: Dict, pool_size: int = 20, sqlite_threads: int = 4):
+        """
+        Args:
+            db_config: api_server.DB_CONFIG
+            pool_size: Maximum MySQL connections
+            sqlite_threads: Threads running SQLite statements
+        """
+        self.config = db_config
+        self.pool_size = pool_size
+        self.sqlite_threads = sqlite_threads
+        self.sqlite = db_config.get('backend') == 'sqlite'
+        self._pool = None
+        self._executor = None
+
+    async def start(self):
+        if self.sqlite:
+            self._executor = ThreadPoolExecutor(self.sqlite_threads, thread_name_prefix='sqlite')
+            return
+        if aiomysql is None:
+            raise RuntimeError('aiomysql is required for the async server on MySQL (pip install aiomysql)')
+        self._pool = await aiomysql.create_pool(
+            host=self.config.get('host', 'localhost'), port=self.config.get('port', 3306),
+            user=self.config.get('user'), password=self.config.get('password', ''),
+            db=self.config.get('database'), minsize=1, maxsize=self.pool_size, autocommit=False,
+            pool_recycle=3600)
+        metrics.REGISTRY.gauge('smartfarm_async_db_pool_connections', 'aiomysql pool connections by state',
+                               lambda: {('in_use',): self._pool.size - self._pool.freesize,
+                                        ('free',): self._pool.freesize}, ('state',))
+
+    async def close(self):
+        if self._pool is not None:
+            self._pool.close()
+            await self._pool.wait_closed()
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+
+    async def _acquire(self):
+        start = time.perf_counter()
+        try:
+            conn = await self._pool.acquire()
+        except Exception as e:
+            raise DatabaseUnavailable(str(e)) from e
+        database.DB_CONNECT_SECONDS.observe(time.perf_counter() - start)
+        return conn
+
+    async def _execute(self, cursor, sql: str, params) -> database.StatementStats:
+        """Run one statement with the same metrics and slow log as database.InstrumentedCursor"""
+        entry = database.statement(sql)
+        start = time.perf_counter()
+        try:
+            await cursor.execute(sql, params)
+        except Exception:
+            database.observe_statement(entry, time.perf_counter() - start, failed=True)
+            raise
+        elapsed = time.perf_counter() - start
+        if database.observe_statement(entry, elapsed):
+            database.log_slow(entry, elapsed, params, self.config)
+        if entry.labels[0] == 'INSERT' and cursor.rowcount > 0:
+            database.INGEST_ROWS.inc((entry.labels[1],), cursor.rowcount)
+        return entry
+
+    async def fetch(self, sql: str, params: Sequence = (), dictionary: bool = True) -> Tuple[List, List[str]]:
+        """
+        Rows of a SELECT
+
+        Returns:
+            (rows, column names)
+        """
+        if self.sqlite:
+            return await asyncio.get_running_loop().run_in_executor(
+                self._executor, self._fetch_sqlite, sql, params, dictionary)
+        conn = await self._acquire()
+        try:
+            async with conn.cursor(aiomysql.DictCursor if dictionary else aiomysql.Cursor) as cursor:
+                entry = await self._execute(cursor, sql, params)
+                rows = await cursor.fetchall()
+                columns = [d[0] for d in cursor.description or ()]
+            await conn.commit()  # end the read snapshot before the connection is reused
+        except BaseException:
+            conn.close()  # unknown state (cancelled mid-query): do not return it to the pool
+            raise
+        finally:
+            self._pool.release(conn)
+        if rows:
+            database.observe_rows(entry, len(rows))
+        return list(rows), columns
+
+    async def write(self, statements: Sequence) -> Optional[int]:
+        """
+        Run statements in one transaction
+
+        Args:
+            statements: (sql, params) pairs; a callable in their place is
+                given the rows of the statement before it and returns more
+                pairs to run (e.g. an update of the rows a SELECT ... FOR UPDATE locked)
+
+        Returns:
+            lastrowid of the first statement
+        """
+        if self.sqlite:
+            return await asyncio.get_running_loop().run_in_executor(
+                self._executor, self._write_sqlite, statements)
+        conn = await self._acquire()
+        try:
+            first_id = None
+            pending = list(statements)
+            async with conn.cursor() as cursor:
+                rows = None
+                for i, step in enumerate(pending):
+                    if callable(step):
+                        pending[i + 1:i + 1] = step(rows)
+                        continue
+                    await self._execute(cursor, *step)
+                    rows = await cursor.fetchall() if cursor.description else None
+                    if i == 0:
+                        first_id = cursor.lastrowid
+            await conn.commit()
+            return first_id
+        except BaseException:
+            conn.close()
+            raise
+        finally:
+            self._pool.release(conn)
+
+    def _connect_sqlite(self):
+        try:
+            return database.connect(self.config, instrument=api_server.DB_INSTRUMENT)
+        except database.Error as e:
+            raise DatabaseUnavailable(str(e)) from e
+
+    def _fetch_sqlite(self, sql, params, dictionary):
+        conn = self._connect_sqlite()
+        try:
+            cursor = conn.cursor(dictionary=dictionary)
+            cursor.execute(sql, params)
+            rows = cursor.fetchall()
+            columns = [d[0] for d in cursor.description or ()]
+            cursor.close()
+            return rows, columns
+        finally:
+            conn.close()
+
+    def _write_sqlite(self, statements):
+        conn = self._connect_sqlite()
+        try:
+            cursor = conn.cursor()
+            first_id = None
+            pending = list(statements)
+            rows = None
+            for i, step in enumerate(pending):
+                if callable(step):
+                    pending[i + 1:i + 1] = step(rows)
+                    continue
+                cursor.execute(*step)
+                rows = cursor.fetchall() if cursor.description else None
+                if i == 0:
+                    first_id = cursor.lastrowid
+            conn.commit()
+            cursor.close()
+            return first_id
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+
+DB = web.AppKey('db', AsyncDatabase)
+routes = web.RouteTableDef()
+
+
+def json_response(payload, status: int = 200):
+    """JSON with the threaded server's encoding (serialization.dumps_bytes)"""
+    return web.Response(body=serialization.dumps_bytes(payload), status=status,
+                        content_type='application/json')
+
+
+def int_arg(request, name: str, default: int) -> int:
+    """Query parameter as int, default when missing or malformed (Flask's type=int)"""
+    try:
+        return int(request.query[name])
+    except (KeyError, ValueError):
+        return default
+
+
+async def json_body(request):
+    """Request JSON (None for an empty body)"""
+    body = await request.read()
+    if not body:
+        return None
+    try:
+        return serialization.loads(body)
+    except ValueError:
+        raise web.HTTPBadRequest(body=serialization.dumps_bytes({'error': 'Invalid JSON body'}),
+                                 content_type='application/json')
+
+
+def token_required(handler):
+    """Access token check of api_server.token_required"""
+    @wraps(handler)
+    async def decorated(request):
+        payload, error = api_server.access_token_payload(request.headers.get('Authorization'))
+        if error:
+            return json_response({'error': error}, 401)
+        request['current_user'] = payload
+        return await handler(request)
+    return decorated
+
+
+# MIDDLEWARE (outermost first)
+
+_ROUTE_PARAMETER = re.compile(r'\{(\w+)\}')
+
+
+def route_template(request) -> str:
+    """Route label in Flask syntax, so both servers share metric series"""
+    resource = request.match_info.route.resource
+    if resource is None:
+        return 'unmatched'
+    return _ROUTE_PARAMETER.sub(r'<\1>', resource.canonical)
+
+
+@web.middleware
+async def record_request_metrics(request, handler):
+    """Count the request and observe its latency and size (api_server.record_request_metrics)"""
+    started = time.perf_counter()
+    status, size = 500, None
+    try:
+        response = await handler(request)
+        status, size = response.status, response.content_length
+        return response
+    except web.HTTPException as e:
+        status = e.status
+        raise
+    finally:
+        if api_server.ENABLE_METRICS:
+            route = route_template(request)
+            api_server.HTTP_REQUEST_SECONDS.observe(time.perf_counter() - started, (route, request.method))
+            api_server.HTTP_REQUESTS.inc((route, request.method, str(status)))
+            if size:
+                api_server.HTTP_RESPONSE_BYTES.inc((route,), size)
+
+
+@web.middleware
+async def handle_errors(request, handler):
+    """Unhandled errors become {'error': ...} 500s, as in every api_server handler"""
+    try:
+        return await handler(request)
+    except web.HTTPException:
+        raise
+    except DatabaseUnavailable as e:
+        logger.error("db_connect_failed error=%s", e)
+        return json_response({'error': 'Database connection failed'}, 500)
+    except Exception as e:
+        logger.error("request_failed endpoint=%s error=%s", getattr(request.match_info.handler, '__name__', None), e)
+        return json_response({'error': str(e)}, 500)
+
+
+@web.middleware
+async def enforce_rate_limit(request, handler):
+    """Per device (ingest) or per user (dashboard) budgets of api_server.rate_limiter"""
+    if not api_server.RATE_LIMIT_ENABLED or request.method == 'OPTIONS':
+        return await handler(request)
+    if request.method == 'POST' and request.path in INGEST_PATHS:
+        route_class, key = 'ingest', None
+        data = await json_body(request)
+        if isinstance(data, dict):
+            device = data.get('device_id') or data.get('bin_id')
+            if device is not None:
+                key = f"device:{device}"
+    else:
+        route_class = 'dashboard'
+        payload, _ = api_server.access_token_payload(request.headers.get('Authorization'))
+        key = f"user:{payload.get('user_id')}" if payload else None
+    allowed, retry_after = api_server.rate_limiter.check(route_class, key or f"ip:{request.remote}")
+    if allowed:
+        return await handler(request)
+    response = json_response({'error': 'Rate limit exceeded', 'route_class': route_class}, 429)
+    response.headers['Retry-After'] = retry_after_header(retry_after)
+    return response
+
+
+@web.middleware
+async def compress_response(request, handler):
+    """gzip/deflate bodies of at least COMPRESS_MIN_BYTES (history pages)"""
+    response = await handler(request)
+    if (api_server.COMPRESS_ENABLED and isinstance(response, web.Response) and response.body is not None
+            and len(response.body) >= api_server.COMPRESS_MIN_BYTES):
+        response.enable_compression()
+    return response
+
+
+# ENDPOINTS (same paths and payloads as api_server)
+
+
+@routes.get('/api/environment')
+async def get_environment(request):
+    """Get latest environment data (air temp, humidity, lux, leaf temp)"""
+    rows, _ = await request.app[DB].fetch(queries.ENVIRONMENT_LATEST)
+    return json_response(rows[0] if rows else queries.EMPTY_ENVIRONMENT)
+
+
+@routes.get('/api/devices/{device_name}')
+@routes.get('/api/device/{device_name}')
+async def get_device_status(request):
+    """Get device status"""
+    rows, _ = await request.app[DB].fetch(queries.DEVICE_STATUS, (request.match_info['device_name'],))
+    return json_response(queries.device_status(rows[0] if rows else None))
+
+
+@routes.get('/api/sensor/latest')
+async def get_latest_sensor(request):
+    """Get latest sensor value"""
+    rows, _ = await request.app[DB].fetch(queries.latest_value_sql(request.query.get('type', 'air_temp')),
+                                          dictionary=False)
+    return json_response(queries.latest_value(rows[0] if rows else None))
+
+
+@routes.post('/api/sensor')
+async def insert_sensor_data(request):
+    """Create sensor data - for ESP32 to send data"""
+    data = await json_body(request)
+    try:
+        params = queries.sensor_data_params(data)
+    except ValueError as e:
+        return json_response({'error': str(e)}, 400)
+    data_id = await request.app[DB].write([(queries.INSERT_SENSOR_DATA, params)])
+    return json_response({'success': True, 'data_id': data_id, 'message': 'Sensor data inserted'}, 201)
+
+
+@routes.post('/api/bin-data')
+async def record_bin_data(request):
+    """
+    Record trash bin distance data from ESP32 sensor (trash_bin_logs and
+    bin_fill_state are created at startup)
+
+    The fill state is read and updated under its row lock in the insert's
+    transaction, as in api_server.record_bin_data.
+    """
+    data = await json_body(request)
+    try:
+        insert_sql, params = queries.bin_reading(data)
+    except ValueError as e:
+        return json_response({'error': str(e)}, 400)
+    db = request.app[DB]
+    statements = [(insert_sql, params)]
+    observe = bin_forecast.update_statements(params[0], bin_forecast.reading_time(data.get('timestamp')), params[1])
+    try:
+        log_id = await db.write(statements + observe)
+    except DatabaseUnavailable:
+        raise
+    except Exception as e:
+        # bin_fill_state dropped since startup: store the reading alone
+        bin_forecast.skip_missing_state(e)
+        log_id = await db.write(statements)
+    logger.info("bin_data_recorded bin_id=%s distance_cm=%s log_id=%s", params[0], params[1], log_id,
+                extra=config.SAMPLED)
+    return json_response({'status': 'success', 'message': 'Data recorded', 'log_id': log_id}, 201)
+
+
+@routes.get('/api/sensor/history')
+@token_required
+async def get_sensor_history(request):
+    """Get sensor history for graphs - returns last 50 readings (?fields=, ?format=columnar)"""
+    device_id = int_arg(request, 'device_id', 1)
+    limit = int_arg(request, 'limit', 50)
+    try:
+        select_list, response_format = api_server.history_projection(api_server.SENSOR_HISTORY_FIELDS,
+                                                                      args=request.query)
+    except ValueError as e:
+        return json_response({'error': str(e)}, 400)
+
+    rows, columns = await request.app[DB].fetch(queries.SENSOR_HISTORY.format(select_list=select_list),
+                                                (device_id, limit))
+    if len(rows) < limit:
+        # Parquet reads block: keep them off the event loop
+        rows = await asyncio.get_running_loop().run_in_executor(
+            None, api_server.with_archived, rows, 'sensor_data', limit, device_id, columns)
+    if response_format == 'columnar':
+        return json_response(serialization.columnar(rows, columns, 'created_at'))
+    return json_response(rows)
+
+
+@routes.get('/metrics')
+async def get_metrics(request):
+    """Prometheus scrape endpoint (this process)"""
+    if not api_server.ENABLE_METRICS:
+        return json_response({'error': 'Metrics disabled'}, 404)
+    return web.Response(body=metrics.REGISTRY.render().encode('utf-8'),
+                        headers={'Content-Type': metrics.CONTENT_TYPE})
+
+
+async def _start_database(app):
+    db = app[DB]
+    await db.start()
+    try:
+        await db.write([(queries.CREATE_TRASH_BIN_LOGS, ()), (schema.BIN_FILL_STATE_DDL, ())])
+    except Exception as e:
+        logger.warning("trash_bin_logs_check_failed error=%s", e)
+
+
+async def _close_database(app):
+    await app[DB].close()
+
+
+def create_app(db_config: Dict = None, pool_size: int = None, sqlite_threads: int = None):
+    """aiohttp application for the hot endpoints"""
+    app = web.Application(middlewares=[record_request_metrics, handle_errors, enforce_rate_limit,
+                                       compress_response])
+    app[DB] = AsyncDatabase(db_config or api_server.DB_CONFIG,
+                            pool_size=pool_size or config.ASYNC_DB_POOL_SIZE,
+                            sqlite_threads=sqlite_threads or config.ASYNC_SQLITE_THREADS)
+    app.add_routes(routes)
+    app.on_startup.append(_start_database)
+    app.on_cleanup.append(_close_database)
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Smart Farm asyncio server (hot endpoints)')
+    parser.add_argument('--host', default=config.ASYNC_HOST)
+    parser.add_argument('--port', type=int, default=config.ASYNC_PORT)
+    parser.add_argument('--pool-size', type=int, default=config.ASYNC_DB_POOL_SIZE, help='MySQL connections')
+    args = parser.parse_args()
+
+    app = create_app(pool_size=args.pool_size)
+    logger.info(f"Starting async server on {args.host}:{args.port}: {len(app.router.routes())} routes, "
+                f"database pool {args.pool_size}")
+    web.run_app(app, host=args.host, port=args.port, keepalive_timeout=config.ASYNC_KEEPALIVE,
+                backlog=1024, access_log=None, print=None)
+
+
+if __name__ == '__main__':
+    main()
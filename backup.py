@@ -0,0 +1,431 @@
+"""
+Database Backups for Smart Farm
+Full and incremental backups of the configured database into BACKUP_DIR,
+and a verified restore
+
+A backup is a directory of gzip JSON-lines files (one per table, first
+line the column names) and a manifest.json with, per table, the row
+count, id range, SHA-256 of the uncompressed stream and CREATE TABLE
+statement. All tables are read in one consistent snapshot, page by page,
+and written through gzip as they are read, so memory stays flat whatever
+the table size.
+
+- Full: every row of every table
+- Incremental: for the append-only time-series tables
+  (replication.REPLICATED_TABLES) only the rows above the previous
+  backup's last id; the small tables (plots, devices, users, ...) are
+  copied in full every time
+
+Restore replays the chain full -> incrementals up to the chosen backup.
+Deletes in append-only tables (archive.py, /api/sensor/cleanup) are only
+picked up by the next full backup. Triggers and extra indexes are not
+part of a backup: on a new server run the /api/*/init routes first;
+tables that are still missing are created from the saved statements.
+
+Usage:
+    python backup.py                     # full or incremental, whichever is due
+    python backup.py --full
+    python backup.py --every             # every BACKUP_INTERVAL seconds while BACKUP_ENABLED
+    python backup.py --list
+    python backup.py --verify 20260301T020000-incr
+    python backup.py --restore 20260301T020000-incr --replace
+"""
+
+import argparse
+import gzip
+import hashlib
+import json
+import logging
+import os
+import shutil
+import sys
+import time
+from datetime import datetime
+from typing import Dict, List
+
+import database
+import replication
+import serialization
+
+logger = logging.getLogger(__name__)
+
+# Append-only tables: table -> id column (the replication streams)
+APPEND_ONLY = replication.REPLICATED_TABLES
+
+# Maintained by triggers on the other tables: restored last so the
+# triggers fired by the restore itself are overwritten with the backup
+TRIGGER_MAINTAINED = ('farm_counters', 'table_versions')
+
+PAGE_ROWS = 5000
+MANIFEST = 'manifest.json'
+
+
+class BackupError(Exception):
+    """Backup missing, incomplete or corrupt, or restore target not empty"""
+
+
+# BACKUP
+
+def _tables(cursor) -> List[str]:
+    cursor.execute('SHOW TABLES')
+    return sorted(row[0] for row in cursor.fetchall())
+
+
+def _create_statement(cursor, table: str, dialect: str) -> str:
+    if dialect == 'sqlite':
+        cursor.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = %s", (table,))
+        return cursor.fetchall()[0][0]
+    cursor.execute(f'SHOW CREATE TABLE {table}')
+    return cursor.fetchall()[0][1]
+
+
+def _begin_snapshot(cursor, dialect: str):
+    # InnoDB: every following read sees the same snapshot (REPEATABLE READ);
+    # SQLite: a deferred read transaction pins the WAL snapshot
+    cursor.execute('BEGIN' if dialect == 'sqlite' else 'START TRANSACTION WITH CONSISTENT SNAPSHOT')
+
+
+def _dump_table(cursor, table: str, path: str, id_column: str = None,
+                after_id: int = 0, last_id: int = 0, page_rows: int = PAGE_ROWS) -> Dict:
+    """
+    Stream rows into path (gzip JSON lines)
+
+    Append-only tables are paged by id (after_id, last_id]; other tables
+    are read with fetchmany.
+    """
+    digest = hashlib.sha256()
+    rows = 0
+    with gzip.open(path, 'wb', compresslevel=6) as out:
+        def write(line: bytes):
+            digest.update(line)
+            out.write(line)
+
+        if id_column:
+            cursor.execute(f'SELECT * FROM {table} WHERE 1 = 0')
+            cursor.fetchall()
+            columns = [d[0] for d in cursor.description]
+            write(serialization.dumps_bytes({'columns': columns}) + b'\n')
+            id_index = columns.index(id_column)
+            position = after_id
+            while position < last_id:
+                cursor.execute(f'''
+                    SELECT * FROM {table} WHERE {id_column} > %s AND {id_column} <= %s
+                    ORDER BY {id_column} LIMIT %s
+                ''', (position, last_id, page_rows))
+                page = cursor.fetchall()
+                if not page:
+                    break
+                for row in page:
+                    write(serialization.dumps_bytes(list(row)) + b'\n')
+                rows += len(page)
+                position = page[-1][id_index]
+        else:
+            cursor.execute(f'SELECT * FROM {table}')
+            write(serialization.dumps_bytes({'columns': [d[0] for d in cursor.description]}) + b'\n')
+            while True:
+                page = cursor.fetchmany(page_rows)
+                if not page:
+                    break
+                for row in page:
+                    write(serialization.dumps_bytes(list(row)) + b'\n')
+                rows += len(page)
+    return {'rows': rows, 'sha256': digest.hexdigest(), 'bytes': os.path.getsize(path)}
+
+
+def list_backups(backup_dir: str) -> List[Dict]:
+    """Manifests of the complete backups, oldest first"""
+    if not os.path.isdir(backup_dir):
+        return []
+    manifests = []
+    for name in sorted(os.listdir(backup_dir)):
+        path = os.path.join(backup_dir, name, MANIFEST)
+        if not name.startswith('.') and os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                manifests.append(json.load(f))
+    return manifests
+
+
+def full_due(backup_dir: str, full_interval: float) -> bool:
+    fulls = [m for m in list_backups(backup_dir) if m['kind'] == 'full']
+    if not fulls:
+        return True
+    last = datetime.fromisoformat(fulls[-1]['created_at'])
+    return (datetime.now() - last).total_seconds() >= full_interval
+
+
+def create_backup(conn, backup_dir: str, dialect: str = 'mysql', full: bool = False,
+                  page_rows: int = PAGE_ROWS) -> Dict:
+    """
+    Take a full backup, or an incremental one on top of the latest backup
+
+    The backup is written to a hidden directory and renamed into place
+    once its manifest is complete, so a crash never leaves a backup that
+    looks usable.
+
+    Returns:
+        The manifest
+    """
+    previous = list_backups(backup_dir)
+    full = full or not previous
+    created = datetime.now()
+    name = f"{created.strftime('%Y%m%dT%H%M%S')}-{'full' if full else 'incr'}"
+    if os.path.exists(os.path.join(backup_dir, name)):
+        raise BackupError(f"{name} already exists")
+    staging = os.path.join(backup_dir, f'.{name}')
+    shutil.rmtree(staging, ignore_errors=True)
+    os.makedirs(staging)
+
+    manifest = {'name': name, 'kind': 'full' if full else 'incremental', 'backend': dialect,
+                'base': None if full else previous[-1]['name'],
+                'created_at': created.isoformat(timespec='seconds'), 'tables': {}}
+    marks = {} if full else {table: entry.get('last_id', 0)
+                             for table, entry in previous[-1]['tables'].items() if 'last_id' in entry}
+    start = time.perf_counter()
+    cursor = conn.cursor()
+    try:
+        _begin_snapshot(cursor, dialect)
+        for table in _tables(cursor):
+            path = os.path.join(staging, f'{table}.jsonl.gz')
+            id_column = APPEND_ONLY.get(table)
+            entry = {'create': _create_statement(cursor, table, dialect)}
+            if id_column:
+                cursor.execute(f'SELECT MAX({id_column}) FROM {table}')
+                last_id = cursor.fetchall()[0][0] or 0
+                after_id = marks.get(table, 0)
+                if last_id < after_id:
+                    # Ids went backwards (table emptied or restored): copy it whole
+                    after_id = 0
+                entry.update(mode='full' if full or after_id == 0 else 'incremental',
+                             after_id=after_id, last_id=last_id)
+                entry.update(_dump_table(cursor, table, path, id_column, after_id, last_id, page_rows))
+            else:
+                entry['mode'] = 'full'
+                entry.update(_dump_table(cursor, table, path, page_rows=page_rows))
+            manifest['tables'][table] = entry
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+    finally:
+        cursor.close()
+
+    manifest['seconds'] = round(time.perf_counter() - start, 3)
+    with open(os.path.join(staging, MANIFEST), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.rename(staging, os.path.join(backup_dir, name))
+    rows = sum(entry['rows'] for entry in manifest['tables'].values())
+    logger.info("backup_created name=%s rows=%d bytes=%d seconds=%.1f", name, rows,
+                sum(entry['bytes'] for entry in manifest['tables'].values()), manifest['seconds'])
+    return manifest
+
+
+def prune(backup_dir: str, keep_full: int) -> List[str]:
+    """Delete backups older than the keep_full most recent full backups"""
+    backups = list_backups(backup_dir)
+    fulls = [i for i, m in enumerate(backups) if m['kind'] == 'full']
+    if len(fulls) <= keep_full:
+        return []
+    removed = [m['name'] for m in backups[:fulls[-keep_full]]]
+    for name in removed:
+        shutil.rmtree(os.path.join(backup_dir, name))
+    return removed
+
+
+# VERIFY / RESTORE
+
+def chain(backup_dir: str, name: str) -> List[Dict]:
+    """Manifests from the full backup up to name"""
+    by_name = {m['name']: m for m in list_backups(backup_dir)}
+    if name not in by_name:
+        raise BackupError(f"No complete backup named {name}")
+    links = [by_name[name]]
+    while links[0]['base']:
+        if links[0]['base'] not in by_name:
+            raise BackupError(f"{links[0]['name']} needs {links[0]['base']}, which is missing")
+        links.insert(0, by_name[links[0]['base']])
+    return links
+
+
+def _read_rows(path: str):
+    """(columns, row iterator); the iterator checks nothing, see verify()"""
+    stream = gzip.open(path, 'rb')
+    columns = serialization.loads(stream.readline())['columns']
+    return columns, (serialization.loads(line) for line in stream), stream
+
+
+def verify(backup_dir: str, name: str) -> Dict:
+    """
+    Check every file of the chain against its manifest (row count, SHA-256)
+
+    Returns:
+        {'backups': n, 'rows': n, 'bytes': n}
+    """
+    totals = {'backups': 0, 'rows': 0, 'bytes': 0}
+    for manifest in chain(backup_dir, name):
+        for table, entry in manifest['tables'].items():
+            path = os.path.join(backup_dir, manifest['name'], f'{table}.jsonl.gz')
+            digest = hashlib.sha256()
+            lines = 0
+            try:
+                with gzip.open(path, 'rb') as stream:
+                    for line in stream:
+                        digest.update(line)
+                        lines += 1
+            except (OSError, EOFError) as e:
+                raise BackupError(f"{manifest['name']}/{table}: {e}")
+            if digest.hexdigest() != entry['sha256'] or lines - 1 != entry['rows']:
+                raise BackupError(f"{manifest['name']}/{table}: checksum or row count mismatch")
+            totals['rows'] += entry['rows']
+            totals['bytes'] += entry['bytes']
+        totals['backups'] += 1
+    return totals
+
+
+def _restore_plan(links: List[Dict]) -> Dict[str, List[Dict]]:
+    """table -> manifests to load: its latest full copy, then later incrementals"""
+    plan = {}
+    for table in links[-1]['tables']:
+        base = max(i for i, m in enumerate(links)
+                   if table in m['tables'] and m['tables'][table]['mode'] == 'full')
+        plan[table] = [m for m in links[base:] if table in m['tables']]
+    return plan
+
+
+def restore(conn, backup_dir: str, name: str, dialect: str = 'mysql', replace: bool = False,
+            batch_rows: int = 1000) -> Dict:
+    """
+    Restore the database to backup name (verified before and after)
+
+    Args:
+        replace: Delete the rows already in the target tables; without it
+            the restore refuses to touch a table that has rows
+
+    Returns:
+        {'rows': n, 'bytes': n, 'seconds': s}
+    """
+    verify(backup_dir, name)
+    links = chain(backup_dir, name)
+    plan = _restore_plan(links)
+    order = sorted(plan, key=lambda t: (t in TRIGGER_MAINTAINED, t not in APPEND_ONLY, t))
+    creates = {table: entry['create'] for table, entry in links[-1]['tables'].items()}
+    stats = {'rows': 0, 'bytes': 0}
+    start = time.perf_counter()
+    cursor = conn.cursor()
+    cursor.execute('PRAGMA foreign_keys = OFF' if dialect == 'sqlite' else 'SET FOREIGN_KEY_CHECKS = 0')
+    try:
+        existing = set(_tables(cursor))
+        for table in order:
+            if table not in existing:
+                cursor.execute(creates[table])
+                continue
+            cursor.execute(f'SELECT COUNT(*) FROM {table}')
+            if cursor.fetchall()[0][0] and not replace:
+                raise BackupError(f"{table} is not empty (use --replace)")
+        conn.commit()
+
+        for table in order:
+            cursor.execute(f'DELETE FROM {table}')
+            for manifest in plan[table]:
+                path = os.path.join(backup_dir, manifest['name'], f'{table}.jsonl.gz')
+                columns, rows, stream = _read_rows(path)
+                statement = (f"INSERT INTO {table} ({', '.join(columns)}) "
+                             f"VALUES ({', '.join(['%s'] * len(columns))})")
+                with stream:
+                    batch = []
+                    for row in rows:
+                        batch.append(tuple(row))
+                        if len(batch) >= batch_rows:
+                            cursor.executemany(statement, batch)
+                            conn.commit()
+                            batch = []
+                    if batch:
+                        cursor.executemany(statement, batch)
+                conn.commit()
+                stats['rows'] += manifest['tables'][table]['rows']
+                stats['bytes'] += manifest['tables'][table]['bytes']
+
+        for table in order:
+            expected = sum(m['tables'][table]['rows'] for m in plan[table])
+            cursor.execute(f'SELECT COUNT(*) FROM {table}')
+            actual = cursor.fetchall()[0][0]
+            if actual != expected:
+                raise BackupError(f"{table}: restored {actual} rows, backup holds {expected}")
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.execute('PRAGMA foreign_keys = ON' if dialect == 'sqlite' else 'SET FOREIGN_KEY_CHECKS = 1')
+        cursor.close()
+    stats['seconds'] = round(time.perf_counter() - start, 3)
+    logger.info("backup_restored name=%s rows=%d seconds=%.1f", name, stats['rows'], stats['seconds'])
+    return stats
+
+
+def main():
+    import production_config as config
+
+    parser = argparse.ArgumentParser(description='Smart Farm database backups')
+    parser.add_argument('--dir', default=config.BACKUP_DIR)
+    parser.add_argument('--full', action='store_true', help='force a full backup')
+    parser.add_argument('--every', action='store_true', help='repeat every BACKUP_INTERVAL seconds')
+    parser.add_argument('--list', action='store_true', help='list backups')
+    parser.add_argument('--verify', metavar='NAME', help='check a backup chain')
+    parser.add_argument('--restore', metavar='NAME', help='restore the configured database')
+    parser.add_argument('--replace', action='store_true', help='restore over existing rows')
+    args = parser.parse_args()
+
+    if args.list:
+        for m in list_backups(args.dir):
+            rows = sum(e['rows'] for e in m['tables'].values())
+            size = sum(e['bytes'] for e in m['tables'].values())
+            print(f"{m['name']:<28}{m['kind']:<13}{rows:>12} rows{size / 1e6:>10.1f} MB")
+        return
+    if args.verify:
+        try:
+            totals = verify(args.dir, args.verify)
+        except BackupError as e:
+            sys.exit(f"FAILED: {e}")
+        print(f"OK: {totals['backups']} backups, {totals['rows']} rows, {totals['bytes'] / 1e6:.1f} MB")
+        return
+
+    import api_server  # DB_CONFIG for the configured backend
+
+    if args.restore:
+        conn = database.connect(api_server.DB_CONFIG, instrument=False)
+        try:
+            stats = restore(conn, args.dir, args.restore, config.DB_BACKEND, replace=args.replace)
+        except BackupError as e:
+            sys.exit(f"FAILED: {e}")
+        finally:
+            conn.close()
+        print(f"restored {stats['rows']} rows in {stats['seconds']:.1f}s "
+              f"({stats['rows'] / max(stats['seconds'], 1e-9):,.0f} rows/s, "
+              f"{stats['bytes'] / 1e6 / max(stats['seconds'], 1e-9):.1f} MB/s compressed)")
+        return
+
+    if args.every and not config.BACKUP_ENABLED:
+        sys.exit('BACKUP_ENABLED is off')
+    os.makedirs(args.dir, exist_ok=True)
+    while True:
+        conn = database.connect(api_server.DB_CONFIG, instrument=False)
+        try:
+            full = args.full or full_due(args.dir, config.BACKUP_FULL_INTERVAL)
+            manifest = create_backup(conn, args.dir, config.DB_BACKEND, full=full)
+        finally:
+            conn.close()
+        rows = sum(e['rows'] for e in manifest['tables'].values())
+        print(f"{manifest['name']}: {rows} rows in {manifest['seconds']:.1f}s")
+        pruned = prune(args.dir, config.BACKUP_KEEP_FULL)
+        if pruned:
+            print(f"pruned: {', '.join(pruned)}")
+        if not args.every:
+            return
+        time.sleep(config.BACKUP_INTERVAL)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,209 @@
+"""
+Threaded vs Asyncio Server Benchmark
+Starts prefork_server.py (gthread) and async_server.py in turn and
+compares how they cope with many slow ESP32 clients
+
+- slow ingest: --clients boards, arriving over --ramp seconds, each send
+  half of a POST /api/bin-data body, stall for --slow seconds (a weak
+  Wi-Fi link), then send the rest. Reports how many finished within
+  --timeout and the latency of a fast GET /api/environment probe polled
+  meanwhile: on the threaded server a stalled body holds a thread, so
+  fast requests queue behind the slow ones; the event loop keeps serving.
+- held connections: --hold clients open a connection and send an
+  incomplete request. Reports how many the server accepted and its RSS
+  (all processes) per held connection.
+
+MySQL comes from the DB_* environment variables with --backend mysql;
+the default is a scratch SQLite file.
+
+Usage:
+    python benchmarks/bench_async_server.py
+    python benchmarks/bench_async_server.py --clients 1000 --slow 2 --hold 5000 --threads 8
+    python benchmarks/bench_async_server.py --backend mysql --servers async
+"""
+
+import argparse
+import asyncio
+import glob
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+INIT_URLS = ('/api/auth/init-db', '/api/sensor/init', '/api/bin-data/init')
+
+
+def init_store(env):
+    """Create the tables through the Flask app in a child process"""
+    code = ('import api_server\nc = api_server.app.test_client()\n'
+            f'for u in {INIT_URLS!r}:\n    c.post(u)\n')
+    subprocess.run([sys.executable, '-c', code], cwd=ROOT, env=env, check=True, capture_output=True)
+
+
+def server_command(name, port, args):
+    if name == 'threaded':
+        return [sys.executable, 'prefork_server.py', '--workers', str(args.workers),
+                '--threads', str(args.threads), '--bind', f"127.0.0.1:{port}"]
+    return [sys.executable, 'async_server.py', '--host', '127.0.0.1', '--port', str(port)]
+
+
+def wait_ready(base_url, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            urllib.request.urlopen(f"{base_url}/api/environment", timeout=1).read()
+            return True
+        except (urllib.error.URLError, ConnectionError):
+            time.sleep(0.25)
+    return False
+
+
+def tree_rss_kb(pid):
+    """Resident memory of pid and all its descendants"""
+    total, pending = 0, [pid]
+    while pending:
+        current = pending.pop()
+        try:
+            with open(f'/proc/{current}/status') as f:
+                total += next(int(line.split()[1]) for line in f if line.startswith('VmRSS:'))
+            for children in glob.glob(f'/proc/{current}/task/*/children'):
+                with open(children) as f:
+                    pending.extend(int(p) for p in f.read().split())
+        except (FileNotFoundError, ProcessLookupError, StopIteration):
+            continue
+    return total
+
+
+async def slow_post(port, i, delay, slow, timeout):
+    """One board with a stalling link; returns (HTTP status or None, seconds)"""
+    body = json.dumps({'bin_id': f"SLOW{i:05d}", 'distance_cm': 42.0}).encode()
+    head = (f"POST /api/bin-data HTTP/1.1\r\nHost: 127.0.0.1\r\nContent-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n").encode()
+
+    async def exchange():
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        try:
+            writer.write(head + body[:len(body) // 2])
+            await writer.drain()
+            await asyncio.sleep(slow)
+            writer.write(body[len(body) // 2:])
+            await writer.drain()
+            status_line = await reader.readline()
+            return int(status_line.split()[1])
+        finally:
+            writer.close()
+
+    await asyncio.sleep(delay)
+    started = time.perf_counter()
+    try:
+        status = await asyncio.wait_for(exchange(), timeout)
+    except (asyncio.TimeoutError, OSError, IndexError, ValueError):
+        status = None
+    return status, time.perf_counter() - started
+
+
+async def probe(port, stop, latencies):
+    """Fast dashboard poll every 100 ms while the slow clients run"""
+    request = b"GET /api/environment HTTP/1.1\r\nHost: 127.0.0.1\r\nConnection: close\r\n\r\n"
+    while not stop.is_set():
+        started = time.perf_counter()
+        try:
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            writer.write(request)
+            await reader.read()
+            writer.close()
+            latencies.append(time.perf_counter() - started)
+        except OSError:
+            pass
+        await asyncio.sleep(0.1)
+
+
+async def slow_ingest(port, clients, ramp, slow, timeout):
+    stop = asyncio.Event()
+    latencies = []
+    probe_task = asyncio.create_task(probe(port, stop, latencies))
+    results = await asyncio.gather(*(slow_post(port, i, ramp * i / clients, slow, timeout)
+                                     for i in range(clients)))
+    stop.set()
+    await probe_task
+    done = [seconds for status, seconds in results if status == 201]
+    return {
+        'completed': len(done),
+        'failed': clients - len(done),
+        'slow_p50_s': statistics.median(done) if done else float('nan'),
+        'probe_p50_ms': statistics.median(latencies) * 1e3 if latencies else float('nan'),
+        'probe_max_ms': max(latencies) * 1e3 if latencies else float('nan'),
+    }
+
+
+async def held_connections(port, pid, count):
+    """RSS per connection holding an incomplete request"""
+    before = tree_rss_kb(pid)
+    writers = []
+    for _ in range(count):
+        try:
+            _, writer = await asyncio.open_connection('127.0.0.1', port)
+        except OSError:
+            break
+        writer.write(b"GET /api/environment HTTP/1.1\r\nHost: 127.0.0.1\r\n")
+        writers.append(writer)
+    await asyncio.sleep(1.0)
+    after = tree_rss_kb(pid)
+    for writer in writers:
+        writer.close()
+    return {'held': len(writers), 'rss_before_mb': before / 1024, 'rss_after_mb': after / 1024,
+            'kb_per_connection': (after - before) / max(len(writers), 1)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Threaded vs asyncio server with slow clients')
+    parser.add_argument('--servers', nargs='+', default=['threaded', 'async'], choices=['threaded', 'async'])
+    parser.add_argument('--backend', default='sqlite', choices=['sqlite', 'mysql'])
+    parser.add_argument('--workers', type=int, default=1, help='threaded server processes')
+    parser.add_argument('--threads', type=int, default=8, help='threads per threaded worker')
+    parser.add_argument('--clients', type=int, default=200, help='slow ingest clients')
+    parser.add_argument('--slow', type=float, default=2.0, help='stall per slow client (s)')
+    parser.add_argument('--ramp', type=float, default=5.0, help='spread client arrivals over (s)')
+    parser.add_argument('--timeout', type=float, default=20.0, help='give up on a slow client after (s)')
+    parser.add_argument('--hold', type=int, default=2000, help='held connections')
+    parser.add_argument('--port', type=int, default=5098)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='bench_async_')
+    env = dict(os.environ, RATE_LIMIT_ENABLED='False', LOG_LEVEL='WARNING', DB_BACKEND=args.backend,
+               SQLITE_PATH=os.path.join(workdir, 'bench.db'), METRICS_MULTIPROC_DIR=os.path.join(workdir, 'metrics'))
+    try:
+        init_store(env)
+        print(f"{args.clients} slow clients over {args.ramp:g}s stalling {args.slow:g}s (timeout {args.timeout:g}s), "
+              f"{args.hold} held connections, {args.backend}; threaded = {args.workers} x {args.threads} threads")
+        print(f"{'server':<10}{'done':>7}{'failed':>8}{'slow p50 s':>12}{'probe p50 ms':>14}{'probe max ms':>14}"
+              f"{'held':>7}{'RSS MB':>9}{'KB/conn':>9}")
+        for name in args.servers:
+            server = subprocess.Popen(server_command(name, args.port, args), cwd=ROOT, env=env,
+                                      stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            try:
+                if not wait_ready(f"http://127.0.0.1:{args.port}"):
+                    print(f"{name:<10}  server did not start")
+                    continue
+                ingest = asyncio.run(slow_ingest(args.port, args.clients, args.ramp, args.slow, args.timeout))
+                held = asyncio.run(held_connections(args.port, server.pid, args.hold))
+                print(f"{name:<10}{ingest['completed']:>7}{ingest['failed']:>8}{ingest['slow_p50_s']:>12.2f}"
+                      f"{ingest['probe_p50_ms']:>14.1f}{ingest['probe_max_ms']:>14.1f}"
+                      f"{held['held']:>7}{held['rss_after_mb']:>9.1f}{held['kb_per_connection']:>9.1f}")
+            finally:
+                server.terminate()
+                server.wait(timeout=30)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
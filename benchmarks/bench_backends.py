@@ -0,0 +1,156 @@
+"""
+Storage Backend Benchmark (MySQL vs embedded SQLite)
+Runs the same ingest and read requests through the Flask app once per
+backend (DB_BACKEND=mysql / sqlite) and prints latency side by side
+
+MySQL comes from the DB_* environment variables and is skipped when it is
+not reachable; SQLite uses a scratch file (--sqlite-path).
+
+Usage:
+    python benchmarks/bench_backends.py
+    python benchmarks/bench_backends.py --requests 5000 --threads 4
+    python benchmarks/bench_backends.py --backends sqlite --sqlite-path /var/lib/smartfarm/bench.db
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import threading
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+INIT_URLS = ('/api/auth/init-db', '/api/sensor/init', '/api/bin-data/init')
+
+# (name, method, url, body) - the ESP32 writes and the dashboard reads
+OPERATIONS = (
+    ('ingest sensor', 'POST', '/api/sensor',
+     {'device_id': 1, 'temperature_air': 29.5, 'temperature_leaf': 27.1, 'humidity': 64.0,
+      'water_level': 12.0, 'light_lux': 18000, 'soil_moisture': 41.0}),
+    ('ingest bin', 'POST', '/api/bin-data', {'bin_id': 'BENCH', 'distance_cm': 42.0}),
+    ('read latest', 'GET', '/api/environment', None),
+    ('read history', 'GET', '/api/bin-data?bin_id=BENCH&limit=100', None),
+)
+
+
+def percentile(samples, q):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def run_backend(args):
+    """Child process: the backend is chosen by DB_BACKEND before api_server is imported"""
+    sys.path.insert(0, ROOT)
+    import api_server
+
+    client = api_server.app.test_client()
+    for url in INIT_URLS:
+        response = client.post(url)
+        if response.status_code != 200:
+            print(json.dumps({'error': f"{url}: {response.get_json()}"}))
+            return
+
+    results = {}
+    for name, method, url, body in OPERATIONS:
+        for _ in range(min(50, args.requests)):  # warm caches and compiled statements
+            client.open(url, method=method, json=body)
+
+        latencies = []
+        errors = []
+        lock = threading.Lock()
+        per_thread = max(1, args.requests // args.threads)
+
+        def worker():
+            local_client = api_server.app.test_client()
+            samples, failed = [], 0
+            for _ in range(per_thread):
+                start = time.perf_counter()
+                response = local_client.open(url, method=method, json=body)
+                samples.append(time.perf_counter() - start)
+                failed += response.status_code >= 400
+            with lock:
+                latencies.extend(samples)
+                errors.append(failed)
+
+        threads = [threading.Thread(target=worker) for _ in range(args.threads)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+
+        results[name] = {
+            'p50_ms': percentile(latencies, 0.50) * 1e3,
+            'p99_ms': percentile(latencies, 0.99) * 1e3,
+            'mean_ms': statistics.fmean(latencies) * 1e3,
+            'per_sec': len(latencies) / elapsed,
+            'errors': sum(errors),
+        }
+    print(json.dumps(results))
+
+
+def spawn(backend, args):
+    env = dict(os.environ, DB_BACKEND=backend, SQLITE_PATH=args.sqlite_path,
+               RATE_LIMIT_ENABLED='False', LOG_LEVEL='WARNING')
+    command = [sys.executable, os.path.abspath(__file__), '--child',
+               '--requests', str(args.requests), '--threads', str(args.threads)]
+    output = subprocess.run(command, env=env, capture_output=True, text=True, check=False)
+    lines = [line for line in output.stdout.splitlines() if line.startswith('{')]
+    if not lines:
+        return {'error': (output.stderr.strip().splitlines() or ['no output'])[-1]}
+    return json.loads(lines[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='MySQL vs SQLite backend benchmark')
+    parser.add_argument('--backends', nargs='+', default=['mysql', 'sqlite'], choices=['mysql', 'sqlite'])
+    parser.add_argument('--requests', type=int, default=2000, help='requests per operation')
+    parser.add_argument('--threads', type=int, default=1, help='concurrent clients per operation')
+    parser.add_argument('--sqlite-path', default=os.path.join(ROOT, 'bench_backends.db'))
+    parser.add_argument('--keep', action='store_true', help='keep the SQLite file afterwards')
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_backend(args)
+        return
+
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(args.sqlite_path + suffix):
+            os.remove(args.sqlite_path + suffix)
+
+    results = {}
+    for backend in args.backends:
+        results[backend] = spawn(backend, args)
+        if 'error' in results[backend]:
+            print(f"{backend}: skipped ({results[backend]['error']})")
+
+    print(f"{args.requests} requests per operation, {args.threads} client thread(s)")
+    header = f"{'operation':<16}"
+    for backend in args.backends:
+        header += f"{backend + ' p50':>14}{'p99':>10}{'req/s':>10}"
+    print(header)
+    for name, *_ in OPERATIONS:
+        line = f"{name:<16}"
+        for backend in args.backends:
+            row = results[backend].get(name)
+            if row is None:
+                line += f"{'-':>14}{'-':>10}{'-':>10}"
+                continue
+            line += f"{row['p50_ms']:>12.2f}ms{row['p99_ms']:>8.2f}ms{row['per_sec']:>10.0f}"
+            if row['errors']:
+                line += f" ({row['errors']} errors)"
+        print(line)
+
+    if not args.keep:
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(args.sqlite_path + suffix):
+                os.remove(args.sqlite_path + suffix)
+
+
+if __name__ == '__main__':
+    main()
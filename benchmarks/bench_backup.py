@@ -0,0 +1,131 @@
+"""
+Backup and Restore Benchmark
+Fills a scratch SQLite store with simulated history, takes a full backup,
+adds a day of new rows, takes an incremental backup, then verifies the
+chain and restores it into an empty store, comparing row counts
+
+Prints throughput and the peak RSS after each step. Backups stream page
+by page, so their RSS stays flat as --days grows; RSS during fill and
+restore also counts the SQLite pages mapped by mmap_size.
+
+Usage:
+    python benchmarks/bench_backup.py
+    python benchmarks/bench_backup.py --days 30 --sensors 50
+"""
+
+import argparse
+import os
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+os.environ.setdefault('LOG_LEVEL', 'WARNING')
+
+import backup  # noqa: E402
+import database  # noqa: E402
+
+INIT_URLS = ('/api/auth/init-db', '/api/sensor/init', '/api/bin-data/init', '/api/alerts/init',
+             '/api/device-history/init', '/api/statistics/counters/init')
+
+
+def init_store(path):
+    """Create the schema (with triggers) in a child process bound to path"""
+    code = ('import api_server\nc = api_server.app.test_client()\n'
+            f'for u in {INIT_URLS!r}:\n    c.post(u)\n')
+    subprocess.run([sys.executable, '-c', code], cwd=ROOT, check=True, capture_output=True,
+                   env=dict(os.environ, DB_BACKEND='sqlite', SQLITE_PATH=path, RATE_LIMIT_ENABLED='False'))
+
+
+def fill(config, start, days, sensors, seed):
+    """ESP32 readings every minute and bin readings every 5 minutes"""
+    conn = database.connect(config, instrument=False)
+    cursor = conn.cursor()
+    rng = random.Random(seed)
+    for day in range(days):
+        base = start + timedelta(days=day)
+        cursor.executemany('''
+            INSERT INTO sensor_data
+            (device_id, temperature_air, temperature_leaf, humidity, water_level, light_lux, soil_moisture, created_at)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+        ''', [(sensor, round(rng.uniform(24, 34), 2), round(rng.uniform(22, 33), 2), round(rng.uniform(50, 80), 2),
+               round(rng.uniform(5, 15), 2), round(rng.uniform(0, 40000), 2), round(rng.uniform(20, 60), 2),
+               base + timedelta(minutes=m)) for m in range(1440) for sensor in range(1, sensors + 1)])
+        cursor.executemany('INSERT INTO trash_bin_logs (bin_id, distance_cm, created_at) VALUES (%s, %s, %s)',
+                           [(f'BIN{b:02d}', round(rng.uniform(2, 60), 1), base + timedelta(minutes=m))
+                            for m in range(0, 1440, 5) for b in range(10)])
+        conn.commit()
+    cursor.close()
+    conn.close()
+
+
+def counts(config):
+    conn = database.connect(config, instrument=False)
+    cursor = conn.cursor()
+    result = {}
+    for table in backup._tables(cursor):
+        cursor.execute(f'SELECT COUNT(*) FROM {table}')
+        result[table] = cursor.fetchall()[0][0]
+    cursor.close()
+    conn.close()
+    return result
+
+
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Backup and restore benchmark')
+    parser.add_argument('--days', type=int, default=7, help='history in the full backup')
+    parser.add_argument('--sensors', type=int, default=20)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='bench_backup_')
+    source = {'backend': 'sqlite', 'path': os.path.join(workdir, 'source.db')}
+    target = {'backend': 'sqlite', 'path': os.path.join(workdir, 'target.db')}
+    backup_dir = os.path.join(workdir, 'backups')
+    try:
+        init_store(source['path'])
+        init_store(target['path'])
+        start = datetime.now() - timedelta(days=args.days + 1)
+        fill(source, start, args.days, args.sensors, seed=1)
+        print(f"source: {sum(counts(source).values())} rows, "
+              f"{os.path.getsize(source['path']) / 1e6:.1f} MB (peak RSS {peak_rss_mb():.0f} MB)")
+
+        conn = database.connect(source, instrument=False)
+        full = backup.create_backup(conn, backup_dir, 'sqlite', full=True)
+        fill(source, start + timedelta(days=args.days), 1, args.sensors, seed=2)
+        incremental = backup.create_backup(conn, backup_dir, 'sqlite')
+        conn.close()
+        for manifest in (full, incremental):
+            rows = sum(e['rows'] for e in manifest['tables'].values())
+            size = sum(e['bytes'] for e in manifest['tables'].values())
+            print(f"{manifest['kind']:<12}{rows:>10} rows {size / 1e6:>7.1f} MB {manifest['seconds']:>6.1f}s "
+                  f"{rows / manifest['seconds']:>10,.0f} rows/s (peak RSS {peak_rss_mb():.0f} MB)")
+
+        started = time.perf_counter()
+        totals = backup.verify(backup_dir, incremental['name'])
+        print(f"verify      {totals['rows']:>10} rows {time.perf_counter() - started:>15.1f}s")
+
+        conn = database.connect(target, instrument=False)
+        stats = backup.restore(conn, backup_dir, incremental['name'], 'sqlite', replace=True)
+        conn.close()
+        print(f"restore     {stats['rows']:>10} rows {stats['seconds']:>15.1f}s "
+              f"{stats['rows'] / stats['seconds']:>10,.0f} rows/s (peak RSS {peak_rss_mb():.0f} MB)")
+        expected, actual = counts(source), counts(target)
+        mismatched = {t: (expected[t], actual.get(t)) for t in expected if expected[t] != actual.get(t)}
+        print(f"row counts: {'OK' if not mismatched else f'MISMATCH {mismatched}'}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+"""
+History Response Format Benchmark
+Calls /api/sensor/history through the Flask test client on a scratch SQLite
+store and compares full rows with ?fields= projection and the columnar
+format (delta-encoded timestamps): response time and body size
+
+Usage:
+    python benchmarks/bench_history_formats.py
+    python benchmarks/bench_history_formats.py --limit 50000 --repeat 10
+"""
+
+import argparse
+import atexit
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+WORKDIR = tempfile.mkdtemp(prefix='bench_history_')
+atexit.register(shutil.rmtree, WORKDIR, ignore_errors=True)
+os.environ.update(DB_BACKEND='sqlite', SQLITE_PATH=os.path.join(WORKDIR, 'history.db'),
+                  RATE_LIMIT_ENABLED='False', ENABLE_METRICS='False', LOG_LEVEL='WARNING')
+
+import api_server  # noqa: E402
+import database  # noqa: E402
+
+VARIANTS = (
+    ('rows, all columns', ''),
+    ('rows, fields=temperature_air', '&fields=temperature_air'),
+    ('columnar, all columns', '&format=columnar'),
+    ('columnar, fields=temperature_air', '&format=columnar&fields=temperature_air'),
+    ('columnar, 2 fields', '&format=columnar&fields=temperature_air,humidity'),
+)
+
+
+def fill(rows):
+    """One ESP32 reporting every 20 s"""
+    conn = database.connect(api_server.DB_CONFIG, instrument=False)
+    cursor = conn.cursor()
+    rng = random.Random(3)
+    start = datetime.now() - timedelta(seconds=20 * rows)
+    cursor.executemany('''
+        INSERT INTO sensor_data
+        (device_id, temperature_air, temperature_leaf, humidity, water_level, light_lux, soil_moisture, created_at)
+        VALUES (1, %s, %s, %s, %s, %s, %s, %s)
+    ''', [(round(rng.uniform(24, 34), 2), round(rng.uniform(22, 33), 2), round(rng.uniform(50, 80), 2),
+           round(rng.uniform(5, 15), 2), round(rng.uniform(0, 40000), 2), round(rng.uniform(20, 60), 2),
+           start + timedelta(seconds=20 * i)) for i in range(rows)])
+    conn.commit()
+    cursor.close()
+    conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='History response format benchmark')
+    parser.add_argument('--limit', type=int, default=10000, help='readings per request')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    client = api_server.app.test_client()
+    client.post('/api/sensor/init')
+    fill(args.limit)
+    token, _ = api_server.generate_tokens(1, 'bench', 'admin')
+    headers = {'Authorization': f'Bearer {token}'}
+
+    print(f"{args.limit} readings per request, best of {args.repeat}")
+    print(f"{'format':<36}{'time ms':>10}{'bytes':>12}{'vs rows':>10}")
+    baseline = None
+    for name, query in VARIANTS:
+        best = float('inf')
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            response = client.get(f'/api/sensor/history?device_id=1&limit={args.limit}{query}', headers=headers)
+            body = response.get_data()
+            best = min(best, time.perf_counter() - start)
+        if response.status_code != 200:
+            sys.exit(f"{name}: {response.status_code} {body[:200]!r}")
+        baseline = baseline or (best, len(body))
+        print(f"{name:<36}{best * 1e3:>10.1f}{len(body):>12}"
+              f"{baseline[1] / len(body):>9.1f}x")
+
+
+if __name__ == '__main__':
+    main()
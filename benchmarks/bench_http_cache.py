@@ -0,0 +1,110 @@
+"""
+Dashboard Polling Benchmark (conditional GET + compression)
+Replays a dashboard polling /api/sensor-logs, /api/alerts and
+/api/statistics/overview while a device ingests sensor_logs rows, and
+reports bytes on the wire and server CPU per poll for each mode
+
+Needs the MySQL database from DB_* environment variables (with at least one
+plot) and POST /api/cache/init run once for the alerts counters.
+
+Usage:
+    python benchmarks/bench_http_cache.py
+    python benchmarks/bench_http_cache.py --polls 360 --poll-interval 5 --ingest-interval 20
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+os.environ.setdefault('RATE_LIMIT_ENABLED', 'False')
+
+import api_server  # noqa: E402
+import database  # noqa: E402
+
+DASHBOARD_URLS = (
+    '/api/sensor-logs?limit=100',
+    '/api/alerts?limit=50',
+    '/api/statistics/overview',
+)
+
+MODES = (
+    ('plain', False, False),
+    ('compression', False, True),
+    ('conditional + compression', True, True),
+)
+
+
+def ingest(plot_id):
+    """One device reading, written the way api.py imports them"""
+    conn = database.connect(api_server.DB_CONFIG, instrument=False)
+    cursor = conn.cursor()
+    cursor.execute('''
+        INSERT INTO sensor_logs
+        (plot_id, timestamp, air_temp, humidity, leaf_temp, light_lux, water_level, cwsi_value)
+        VALUES (%s, NOW(), %s, %s, %s, %s, %s, %s)
+    ''', (plot_id, round(random.uniform(24, 34), 2), round(random.uniform(50, 80), 2),
+          round(random.uniform(22, 33), 2), round(random.uniform(0, 40000), 2), 10.0, 0.3))
+    conn.commit()
+    cursor.close()
+    conn.close()
+
+
+def run_mode(client, polls, ticks_per_ingest, plot_id):
+    """Poll every dashboard URL `polls` times, ingesting every ticks_per_ingest polls"""
+    etags = {}
+    wire_bytes = 0
+    body_bytes = 0
+    not_modified = 0
+    cpu = 0.0
+    for tick in range(polls):
+        if tick and tick % ticks_per_ingest == 0:
+            ingest(plot_id)
+        for url in DASHBOARD_URLS:
+            headers = {'Accept-Encoding': 'br, gzip'}
+            if url in etags:
+                headers['If-None-Match'] = etags[url]
+            start = time.process_time()
+            response = client.get(url, headers=headers)
+            wire = len(response.get_data())
+            cpu += time.process_time() - start
+            wire_bytes += wire
+            if response.status_code == 304:
+                not_modified += 1
+            else:
+                body_bytes += wire
+                if response.headers.get('ETag'):
+                    etags[url] = response.headers['ETag']
+    requests = polls * len(DASHBOARD_URLS)
+    return wire_bytes / requests, cpu / requests * 1e3, not_modified / requests
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Dashboard polling benchmark')
+    parser.add_argument('--polls', type=int, default=120)
+    parser.add_argument('--poll-interval', type=float, default=5.0, help='dashboard poll period (s)')
+    parser.add_argument('--ingest-interval', type=float, default=20.0, help='device send period (s)')
+    parser.add_argument('--plot-id', type=int, default=1)
+    args = parser.parse_args()
+
+    ticks_per_ingest = max(1, round(args.ingest_interval / args.poll_interval))
+    client = api_server.app.test_client()
+
+    print(f"{args.polls} polls of {len(DASHBOARD_URLS)} URLs, one new reading every "
+          f"{ticks_per_ingest} polls")
+    print(f"{'mode':<28}{'bytes/req':>12}{'cpu ms/req':>12}{'304 rate':>10}")
+    baseline = None
+    for name, conditional, compress in MODES:
+        api_server.http_cache.enabled = conditional
+        api_server.compressor.enabled = compress
+        per_request, cpu_ms, rate_304 = run_mode(client, args.polls, ticks_per_ingest, args.plot_id)
+        baseline = baseline or per_request
+        print(f"{name:<28}{per_request:>12.0f}{cpu_ms:>12.3f}{rate_304:>10.1%}"
+              f"   ({1 - per_request / baseline:.1%} bytes saved)")
+
+
+if __name__ == '__main__':
+    main()
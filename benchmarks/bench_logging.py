@@ -0,0 +1,131 @@
+"""
+Logging Pipeline Latency Benchmark
+Compares per-request latency of an ingest-style handler that logs each
+success through print(), a synchronous FileHandler, and the queued
+pipeline installed by production_config.setup_logging
+
+Usage:
+    python benchmarks/bench_logging.py
+    python benchmarks/bench_logging.py --disk-latency-ms 2   # simulate a slow disk
+"""
+
+import argparse
+import contextlib
+import io
+import logging
+import os
+import queue
+import statistics
+import sys
+import tempfile
+import time
+from logging.handlers import QueueListener
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+
+class SlowFileHandler(logging.FileHandler):
+    """FileHandler whose flush costs a fixed latency (stands in for a busy disk)"""
+
+    def __init__(self, filename, latency):
+        super().__init__(filename)
+        self.latency = latency
+
+    def flush(self):
+        super().flush()
+        if self.latency:
+            time.sleep(self.latency)
+
+
+def ingest_request(log, i):
+    """Work roughly shaped like record_bin_data plus its success log"""
+    payload = {'bin_id': f"BIN{i % 500:03d}", 'distance_cm': 4.5 + (i % 40)}
+    log(payload['bin_id'], payload['distance_cm'], i)
+
+
+def measure(log, requests):
+    """Return per-request latencies in microseconds"""
+    latencies = []
+    for i in range(requests):
+        start = time.perf_counter()
+        ingest_request(log, i)
+        latencies.append((time.perf_counter() - start) * 1e6)
+    return latencies
+
+
+def report(name, latencies):
+    latencies = sorted(latencies)
+    p99 = latencies[int(len(latencies) * 0.99) - 1]
+    print(f"{name:<28}{statistics.mean(latencies):>10.2f}{latencies[len(latencies) // 2]:>10.2f}{p99:>10.2f}")
+
+
+def make_logger(name, handler):
+    logger = logging.getLogger(name)
+    logger.propagate = False
+    logger.handlers[:] = [handler]
+    logger.setLevel(logging.INFO)
+    return logger
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Logging latency benchmark')
+    parser.add_argument('--requests', type=int, default=20000)
+    parser.add_argument('--disk-latency-ms', type=float, default=0.0)
+    parser.add_argument('--sample-rate', type=float, default=0.1,
+                        help='LOG_SAMPLE_RATE used for the sampled run')
+    args = parser.parse_args()
+
+    latency = args.disk_latency_ms / 1000.0
+    formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    tmp = tempfile.mkdtemp(prefix='smartfarm-log-bench-')
+
+    print(f"{args.requests} ingest requests, simulated disk latency {args.disk_latency_ms} ms")
+    print(f"{'pipeline':<28}{'mean us':>10}{'p50 us':>10}{'p99 us':>10}")
+
+    # print() to a file-backed stdout, as the handlers used to do
+    with open(os.path.join(tmp, 'stdout.log'), 'w') as out, contextlib.redirect_stdout(out):
+        lat = measure(lambda b, d, i: print(f"✅ Bin data recorded: {b} - {d}cm"), args.requests)
+    report('print()', lat)
+
+    # Synchronous FileHandler on the request thread (old logging setup)
+    handler = SlowFileHandler(os.path.join(tmp, 'sync.log'), latency)
+    handler.setFormatter(formatter)
+    sync_logger = make_logger('bench.sync', handler)
+    lat = measure(lambda b, d, i: sync_logger.info(
+        "bin_data_recorded bin_id=%s distance_cm=%s log_id=%s", b, d, i), args.requests)
+    handler.close()
+    report('sync FileHandler', lat)
+
+    # Queue pipeline, same file handler moved to the listener thread
+    import production_config
+
+    def queued(sample_rate):
+        file_handler = SlowFileHandler(os.path.join(tmp, f'queued-{sample_rate}.log'), latency)
+        file_handler.setFormatter(formatter)
+        queue_handler = production_config.NonBlockingQueueHandler(queue.Queue(production_config.LOG_QUEUE_SIZE))
+        queue_handler.addFilter(production_config.SamplingFilter(sample_rate))
+        listener = QueueListener(queue_handler.queue, file_handler)
+        listener.start()
+        queued_logger = make_logger(f'bench.queued.{sample_rate}', queue_handler)
+        lat = measure(lambda b, d, i: queued_logger.info(
+            "bin_data_recorded bin_id=%s distance_cm=%s log_id=%s", b, d, i,
+            extra=production_config.SAMPLED), args.requests)
+        listener.stop()
+        file_handler.close()
+        return lat
+
+    report('QueueHandler', queued(1.0))
+    report(f'QueueHandler sampled {args.sample_rate:g}', queued(args.sample_rate))
+
+    # Level-gated call below the configured level costs almost nothing
+    gated = make_logger('bench.gated', logging.NullHandler())
+    gated.setLevel(logging.WARNING)
+    report('gated (below level)', measure(lambda b, d, i: gated.info(
+        "bin_data_recorded bin_id=%s distance_cm=%s log_id=%s", b, d, i), args.requests))
+
+    print(f"dropped records (queue full): {production_config.NonBlockingQueueHandler.dropped}")
+
+
+if __name__ == '__main__':
+    sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8', line_buffering=True)
+    main()
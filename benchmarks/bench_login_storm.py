@@ -0,0 +1,125 @@
+"""
+Login Storm Benchmark
+Measures bcrypt verification throughput as the hashing pool grows
+
+Usage:
+    python benchmarks/bench_login_storm.py                 # pool scaling, in-process
+    python benchmarks/bench_login_storm.py --rounds 10     # faster run
+    python benchmarks/bench_login_storm.py --url http://localhost:5000 \\
+        --username admin --password admin123              # against a running server
+"""
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+
+import bcrypt
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from password_hashing import PasswordHasher, HasherSaturated  # noqa: E402
+
+
+def run_storm(verify, clients, logins_per_client):
+    """Fire `clients` threads each doing `logins_per_client` verifications"""
+    ok = rejected = 0
+    counter_lock = threading.Lock()
+
+    def client():
+        nonlocal ok, rejected
+        for _ in range(logins_per_client):
+            try:
+                verify()
+                result = 'ok'
+            except HasherSaturated:
+                result = 'rejected'
+            with counter_lock:
+                if result == 'ok':
+                    ok += 1
+                else:
+                    rejected += 1
+
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+    return ok, rejected, elapsed
+
+
+def bench_pool(args):
+    """Compare inline bcrypt against pools of 1..N processes"""
+    password = 'storm-password'
+    hashed = bcrypt.hashpw(password.encode(), bcrypt.gensalt(rounds=args.rounds)).decode()
+    total = args.clients * args.logins
+
+    print(f"bcrypt cost={args.rounds}, {args.clients} clients x {args.logins} logins")
+    print(f"{'mode':<18}{'logins/s':>10}{'elapsed s':>11}{'503s':>7}")
+
+    ok, rejected, elapsed = run_storm(
+        lambda: bcrypt.checkpw(password.encode(), hashed.encode()),
+        args.clients, args.logins
+    )
+    print(f"{'inline (threads)':<18}{ok / elapsed:>10.1f}{elapsed:>11.2f}{rejected:>7}")
+
+    cores = os.cpu_count() or 1
+    sizes = sorted({n for n in (1, 2, 4, 8, 16, cores) if n <= cores})
+    for workers in sizes:
+        hasher = PasswordHasher(workers=workers, queue_limit=total, rounds=args.rounds)
+        hasher.verify(password, hashed)  # warm up the pool processes
+        ok, rejected, elapsed = run_storm(
+            lambda: hasher.verify(password, hashed), args.clients, args.logins
+        )
+        hasher.shutdown()
+        print(f"{f'pool x{workers}':<18}{ok / elapsed:>10.1f}{elapsed:>11.2f}{rejected:>7}")
+
+
+def bench_http(args):
+    """Hammer POST /api/auth/login on a running server"""
+    body = json.dumps({'username': args.username, 'password': args.password}).encode()
+    statuses = {}
+    status_lock = threading.Lock()
+
+    def login():
+        req = urllib.request.Request(
+            f"{args.url.rstrip('/')}/api/auth/login", data=body,
+            headers={'Content-Type': 'application/json'}, method='POST'
+        )
+        try:
+            with urllib.request.urlopen(req, timeout=30) as resp:
+                code = resp.status
+        except urllib.error.HTTPError as e:
+            code = e.code
+        with status_lock:
+            statuses[code] = statuses.get(code, 0) + 1
+
+    _, _, elapsed = run_storm(login, args.clients, args.logins)
+    total = sum(statuses.values())
+    print(f"{total} logins in {elapsed:.2f}s = {total / elapsed:.1f}/s, status counts: {statuses}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Login storm benchmark')
+    parser.add_argument('--clients', type=int, default=32)
+    parser.add_argument('--logins', type=int, default=4, help='logins per client')
+    parser.add_argument('--rounds', type=int, default=12, help='bcrypt cost factor')
+    parser.add_argument('--url', help='benchmark a running server instead')
+    parser.add_argument('--username', default='admin')
+    parser.add_argument('--password', default='admin123')
+    args = parser.parse_args()
+
+    if args.url:
+        bench_http(args)
+    else:
+        bench_pool(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+"""
+Metrics Instrumentation Overhead Benchmark
+Measures the per-request cost of the /metrics instrumentation and compares
+it with real request latency
+
+Usage:
+    python benchmarks/bench_metrics.py
+    python benchmarks/bench_metrics.py --url http://localhost:5000/api/environment
+"""
+
+import argparse
+import os
+import sys
+import threading
+import time
+import urllib.request
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from metrics import Registry  # noqa: E402
+
+
+def per_call(fn, calls):
+    """Average microseconds per call of fn()"""
+    start = time.perf_counter()
+    for _ in range(calls):
+        fn()
+    return (time.perf_counter() - start) / calls * 1e6
+
+
+def bench_primitives(calls):
+    registry = Registry()
+    counter = registry.counter('bench_total', 'bench', ('route', 'method', 'status'))
+    histogram = registry.histogram('bench_seconds', 'bench', ('route', 'method'))
+    labels3 = ('/api/sensor', 'POST', '201')
+    labels2 = ('/api/sensor', 'POST')
+
+    print(f"Counter.inc:       {per_call(lambda: counter.inc(labels3), calls):.3f} us")
+    print(f"Histogram.observe: {per_call(lambda: histogram.observe(0.0042, labels2), calls):.3f} us")
+
+    # Thread-per-request servers create a shard per thread; check scrape cost
+    def request_thread():
+        counter.inc(labels3)
+        histogram.observe(0.0042, labels2)
+
+    for _ in range(2000):
+        t = threading.Thread(target=request_thread)
+        t.start()
+        t.join()
+    start = time.perf_counter()
+    text = registry.render()
+    print(f"render after 2000 short-lived threads: {(time.perf_counter() - start) * 1e3:.2f} ms, "
+          f"{len(text)} bytes")
+
+
+def bench_hooks(calls):
+    """Cost of the before/after request hooks plus one instrumented query (below the slow threshold)"""
+    import api_server
+    import database
+    from flask import Response
+
+    app = api_server.app
+    response = Response(b'{"air_temp": 25.0}', mimetype='application/json')
+    sql = 'SELECT air_temp, humidity FROM sensor_logs ORDER BY timestamp DESC LIMIT 1'
+
+    def one_request():
+        api_server.start_request_timer()
+        entry = database.statement(sql)
+        database.observe_statement(entry, 0.0007)
+        database.DB_ROWS_RETURNED.inc(entry.labels)
+        database.DB_CONNECT_SECONDS.observe(0.0012)
+        api_server.record_request_metrics(response)
+
+    with app.test_request_context('/api/environment'):
+        one_request()
+        return per_call(one_request, calls)
+
+
+def bench_url(url, calls):
+    """Average latency of a real request (milliseconds)"""
+    start = time.perf_counter()
+    for _ in range(calls):
+        with urllib.request.urlopen(url, timeout=10) as resp:
+            resp.read()
+    return (time.perf_counter() - start) / calls * 1e3
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Metrics overhead benchmark')
+    parser.add_argument('--calls', type=int, default=200000)
+    parser.add_argument('--url', help='running endpoint to compare against')
+    parser.add_argument('--url-calls', type=int, default=500)
+    args = parser.parse_args()
+
+    bench_primitives(args.calls)
+    hook_us = bench_hooks(args.calls // 10)
+    print(f"instrumentation per request (hooks + 1 query): {hook_us:.2f} us")
+
+    if args.url:
+        request_ms = bench_url(args.url, args.url_calls)
+        print(f"request latency: {request_ms:.3f} ms -> instrumentation = "
+              f"{hook_us / (request_ms * 1e3) * 100:.3f}% of request time")
+
+
+if __name__ == '__main__':
+    main()
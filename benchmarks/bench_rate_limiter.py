@@ -0,0 +1,102 @@
+"""
+Rate Limiter Overhead Benchmark
+Reports the cost of one token-bucket check in microseconds
+
+Usage:
+    python benchmarks/bench_rate_limiter.py
+    python benchmarks/bench_rate_limiter.py --keys 50000 --threads 8
+"""
+
+import argparse
+import os
+import random
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from rate_limiter import TokenBucketLimiter  # noqa: E402
+
+LIMITS = {
+    'ingest': (720, 3600),
+    'dashboard': (7200, 3600),
+    'auth': (20, 300),
+}
+
+
+def bench_check(limiter, keys, calls, threads):
+    """Run `calls` checks spread over `threads` threads, return us/check"""
+    classes = list(LIMITS)
+    per_thread = calls // threads
+
+    def worker(seed):
+        rng = random.Random(seed)
+        plan = [(rng.choice(classes), rng.choice(keys)) for _ in range(per_thread)]
+        check = limiter.check
+        barrier.wait()
+        for route_class, key in plan:
+            check(route_class, key)
+
+    barrier = threading.Barrier(threads + 1)
+    workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    for t in workers:
+        t.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for t in workers:
+        t.join()
+    elapsed = time.perf_counter() - start
+    return elapsed / (per_thread * threads) * 1e6
+
+
+def bench_request_hook(calls, capacity):
+    """Overhead of the Flask before_request hook (classification + key + check)"""
+    import api_server
+
+    app = api_server.app
+    api_server.rate_limiter = TokenBucketLimiter({name: (capacity, 3600) for name in LIMITS})
+    body = b'{"bin_id": "BIN001", "distance_cm": 42.0}'
+    with app.test_request_context('/api/bin-data', method='POST', data=body,
+                                  content_type='application/json'):
+        api_server.enforce_rate_limit()  # warm up (parses the JSON body once)
+        start = time.perf_counter()
+        for _ in range(calls):
+            api_server.enforce_rate_limit()
+        elapsed = time.perf_counter() - start
+    return elapsed / calls * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Rate limiter overhead benchmark')
+    parser.add_argument('--keys', type=int, default=10000, help='distinct clients')
+    parser.add_argument('--calls', type=int, default=400000)
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--shards', type=int, default=16)
+    parser.add_argument('--hook', action='store_true',
+                        help='also time the Flask hook (needs api_server deps)')
+    args = parser.parse_args()
+
+    keys = [f"device:{i}" for i in range(args.keys)]
+
+    for threads in sorted({1, args.threads}):
+        limiter = TokenBucketLimiter(LIMITS, shards=args.shards)
+        us = bench_check(limiter, keys, args.calls, threads)
+        print(f"check(): {us:.3f} us/call with {threads} thread(s), "
+              f"{limiter.bucket_count()} live buckets")
+
+    # Idle eviction keeps memory bounded: old buckets go once they refill
+    limiter = TokenBucketLimiter(LIMITS, shards=args.shards)
+    for i, key in enumerate(keys):
+        limiter.check('auth', key, now=float(i))
+    print(f"eviction: {len(keys)} auth clients over {len(keys)}s -> "
+          f"{limiter.bucket_count()} live buckets (window 300s)")
+
+    if args.hook:
+        calls = args.calls // 4
+        print(f"before_request hook (allowed): {bench_request_hook(calls, calls * 2):.3f} us/request")
+        print(f"before_request hook (429):     {bench_request_hook(calls, 1):.3f} us/request")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,228 @@
+"""
+Gateway Replication Benchmark
+Fills a gateway SQLite store with a simulated offline period (default 24 h
+of a small greenhouse fleet), starts a stand-in central api_server on a
+local port (SQLite-backed) and measures how long replication_agent takes
+to catch up
+
+Also checks the two guarantees the agent relies on:
+- resume: the central server is restarted in the middle of the catch-up
+  and the agent continues from the central watermarks
+- idempotence: an already applied batch is delivered again and must not
+  insert anything
+
+Usage:
+    python benchmarks/bench_replication.py
+    python benchmarks/bench_replication.py --hours 72 --sensors 50 --batch-rows 5000
+"""
+
+import argparse
+import os
+import random
+import shutil
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+from datetime import datetime, timedelta
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+os.environ.setdefault('LOG_LEVEL', 'WARNING')
+
+import database  # noqa: E402
+import replication  # noqa: E402
+from replication_agent import CentralError, ReplicationAgent  # noqa: E402
+
+INIT_URLS = ('/api/auth/init-db', '/api/sensor/init', '/api/bin-data/init', '/api/weather/init',
+             '/api/device-history/init', '/api/replication/init')
+
+
+def serve(args):
+    """Child process: api_server on args.port with DB_BACKEND/SQLITE_PATH from the environment"""
+    from werkzeug.serving import make_server
+    import api_server
+
+    client = api_server.app.test_client()
+    for url in INIT_URLS:
+        client.post(url)
+    if args.init_only:
+        return
+    make_server('127.0.0.1', args.port, api_server.app, threaded=True).serve_forever()
+
+
+def child_env(path):
+    return dict(os.environ, DB_BACKEND='sqlite', SQLITE_PATH=path, RATE_LIMIT_ENABLED='False',
+                ENABLE_METRICS='False', LOG_LEVEL='WARNING')
+
+
+def init_store(path):
+    subprocess.run([sys.executable, os.path.abspath(__file__), '--serve', '--init-only'],
+                   env=child_env(path), check=True, capture_output=True)
+
+
+def start_central(path, port):
+    process = subprocess.Popen([sys.executable, os.path.abspath(__file__), '--serve', '--port', str(port)],
+                               env=child_env(path), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            urllib.request.urlopen(f'http://127.0.0.1:{port}/api/environment', timeout=1)
+            return process
+        except OSError:
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError('central server did not start')
+
+
+def fill_gateway(path, args):
+    """Rows an offline gateway accumulates: ESP32 every 20 s, bins every minute"""
+    conn = database.connect({'backend': 'sqlite', 'path': path}, instrument=False)
+    cursor = conn.cursor()
+    rng = random.Random(7)
+    start = datetime.now() - timedelta(hours=args.hours)
+    steps = int(args.hours * 180)
+    sensor_rows = [(sensor, round(rng.uniform(24, 34), 2), round(rng.uniform(22, 33), 2),
+                    round(rng.uniform(50, 80), 2), round(rng.uniform(5, 15), 2),
+                    round(rng.uniform(0, 40000), 2), round(rng.uniform(20, 60), 2),
+                    start + timedelta(seconds=20 * step))
+                   for step in range(steps) for sensor in range(1, args.sensors + 1)]
+    cursor.executemany('''
+        INSERT INTO sensor_data
+        (device_id, temperature_air, temperature_leaf, humidity, water_level, light_lux, soil_moisture, created_at)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+    ''', sensor_rows)
+    cursor.executemany('''
+        INSERT INTO trash_bin_logs (bin_id, distance_cm, created_at) VALUES (%s, %s, %s)
+    ''', [(f'BIN{b:03d}', round(rng.uniform(2, 60), 1), start + timedelta(minutes=m))
+          for m in range(int(args.hours * 60)) for b in range(args.bins)])
+    cursor.executemany('''
+        INSERT INTO device_status_history (device_id, device_name, status, mode, uptime_seconds, error_count)
+        VALUES (%s, %s, %s, %s, %s, %s)
+    ''', [(d, name, rng.choice(('ON', 'OFF')), 'AUTO', m * 60, 0)
+          for m in range(int(args.hours * 60)) for d, name in ((1, 'Water Pump'), (2, 'Grow Light'))])
+    cursor.executemany('''
+        INSERT INTO weather_logs
+        (location, latitude, longitude, temperature, humidity, wind_speed, rainfall, weather_condition)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+    ''', [('Farm A', 13.75, 100.5, round(rng.uniform(24, 36), 1), round(rng.uniform(40, 90), 1),
+           round(rng.uniform(0, 8), 1), 0.0, 'Clear') for _ in range(int(args.hours * 12))])
+    conn.commit()
+    cursor.execute('SELECT COUNT(*) FROM sensor_data')
+    total = cursor.fetchone()[0]
+    for table in ('trash_bin_logs', 'device_status_history', 'weather_logs'):
+        cursor.execute(f'SELECT COUNT(*) FROM {table}')
+        total += cursor.fetchone()[0]
+    cursor.close()
+    conn.close()
+    return total
+
+
+def central_applied(path, gateway_id):
+    """rows_applied per table on the central store (read directly, read-only)"""
+    conn = sqlite3.connect(f'file:{path}?mode=ro', uri=True)
+    try:
+        return dict(conn.execute('SELECT table_name, rows_applied FROM replication_watermarks '
+                                 'WHERE gateway_id = ?', (gateway_id,)).fetchall())
+    finally:
+        conn.close()
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Gateway replication catch-up benchmark')
+    parser.add_argument('--hours', type=float, default=24.0, help='offline period to catch up')
+    parser.add_argument('--sensors', type=int, default=20, help='ESP32 sensor nodes (one row / 20 s)')
+    parser.add_argument('--bins', type=int, default=10, help='bin sensors (one row / min)')
+    parser.add_argument('--batch-rows', type=int, default=2000)
+    parser.add_argument('--serve', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--init-only', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--port', type=int, default=0, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args)
+        return
+
+    workdir = tempfile.mkdtemp(prefix='bench_replication_')
+    gateway_db = os.path.join(workdir, 'gateway.db')
+    central_db = os.path.join(workdir, 'central.db')
+    port = free_port()
+    url = f'http://127.0.0.1:{port}'
+    central = None
+    try:
+        init_store(gateway_db)
+        init_store(central_db)
+        start = time.perf_counter()
+        total = fill_gateway(gateway_db, args)
+        print(f"gateway: {total} rows for {args.hours:g} h offline "
+              f"({time.perf_counter() - start:.1f}s to generate)")
+        gateway_config = {'backend': 'sqlite', 'path': gateway_db}
+
+        # 1. Catch-up
+        central = start_central(central_db, port)
+        agent = ReplicationAgent(url, 'gw-catchup', gateway_config, batch_rows=args.batch_rows)
+        start = time.perf_counter()
+        stats = agent.sync_once()
+        elapsed = time.perf_counter() - start
+        agent.close()
+        print(f"catch-up: {stats['rows']} rows in {elapsed:.1f}s ({stats['rows'] / elapsed:,.0f} rows/s), "
+              f"{stats['batches']} batches, {stats['bytes'] / 1e6:.2f} MB sent "
+              f"({stats['bytes'] / max(stats['rows'], 1):.1f} B/row)")
+
+        # 2. Resume after the central server goes away mid-sync
+        agent = ReplicationAgent(url, 'gw-resume', gateway_config, batch_rows=args.batch_rows)
+        failure = []
+        worker = threading.Thread(target=lambda: failure.append(_sync_expecting_failure(agent)))
+        worker.start()
+        time.sleep(elapsed / 3)
+        central.kill()
+        central.wait()
+        worker.join()
+        shipped_before = agent.stats['rows']
+        central = start_central(central_db, port)
+        agent.sync_once()
+        agent.close()
+        applied = sum(central_applied(central_db, 'gw-resume').values())
+        print(f"resume: interrupted after {shipped_before} rows ({failure[0]}), "
+              f"central holds {applied}/{total} rows -> {'OK' if applied == total else 'MISMATCH'}")
+
+        # 3. Duplicate delivery of an applied batch
+        conn = database.connect(gateway_config, instrument=False)
+        cursor = conn.cursor()
+        columns, rows = agent._read_batch(cursor, 'sensor_data', 0)
+        cursor.close()
+        conn.close()
+        body, checksum = replication.encode_batch('gw-resume', 'sensor_data', 0, columns, rows)
+        agent = ReplicationAgent(url, 'gw-resume', gateway_config)
+        result = agent._send('sensor_data', 0, body, checksum)
+        agent.close()
+        print(f"duplicate batch: applied={result['applied']} skipped={result['skipped']} -> "
+              f"{'OK' if result['applied'] == 0 else 'DUPLICATED'}")
+    finally:
+        if central is not None:
+            central.kill()
+            central.wait()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def _sync_expecting_failure(agent):
+    try:
+        agent.sync_once()
+        return 'finished before the restart'
+    except CentralError as e:
+        return f"CentralError: {str(e)[:60]}"
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+"""
+JSON Serialization Benchmark
+Compares the old per-row conversion loop + stdlib jsonify with the shared
+serializer (serialization.FastJSONProvider) on large row results
+
+Usage:
+    python benchmarks/bench_serialization.py
+    python benchmarks/bench_serialization.py --rows 50000 --repeat 10
+"""
+
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from flask import Flask, jsonify  # noqa: E402
+
+import serialization  # noqa: E402
+
+
+def make_rows(count):
+    """Rows shaped like cursor(dictionary=True) results from sensor_data"""
+    start = datetime(2026, 1, 1)
+    return [{
+        'id': i,
+        'device_id': 1,
+        'temperature_air': Decimal('27.35') + Decimal(i % 50) / 10,
+        'temperature_leaf': Decimal('25.10') + Decimal(i % 30) / 10,
+        'humidity': Decimal('61.20'),
+        'water_level': Decimal('12.00'),
+        'light_lux': Decimal('15200.50'),
+        'soil_moisture': Decimal('40.75'),
+        'created_at': start + timedelta(seconds=20 * i),
+    } for i in range(count)]
+
+
+def old_handler(rows):
+    """get_sensor_history before the shared serializer"""
+    for row in rows:
+        for key in row:
+            if hasattr(row[key], 'is_integer'):
+                row[key] = float(row[key])
+    return jsonify(rows)
+
+
+def new_handler(rows):
+    return jsonify(rows)
+
+
+def measure(app, handler, rows_count, repeat):
+    """Best wall time (ms), peak traced memory (MB) and body size"""
+    best = float('inf')
+    with app.app_context():
+        for _ in range(repeat):
+            rows = make_rows(rows_count)
+            start = time.perf_counter()
+            body = handler(rows).get_data()
+            best = min(best, time.perf_counter() - start)
+
+        rows = make_rows(rows_count)
+        tracemalloc.start()
+        handler(rows).get_data()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return best * 1e3, peak / 1e6, len(body)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='JSON serialization benchmark')
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    old_app = Flask('bench_old')
+    new_app = Flask('bench_new')
+    new_app.json = serialization.FastJSONProvider(new_app)
+
+    print(f"{args.rows} rows, best of {args.repeat}, backend: {serialization.backend_name()}")
+    print(f"{'serializer':<28}{'time ms':>10}{'peak MB':>10}{'bytes':>12}")
+    for name, app, handler in (('loop + stdlib jsonify', old_app, old_handler),
+                               ('FastJSONProvider', new_app, new_handler)):
+        ms, peak, size = measure(app, handler, args.rows, args.repeat)
+        print(f"{name:<28}{ms:>10.2f}{peak:>10.2f}{size:>12}")
+
+
+if __name__ == '__main__':
+    main()
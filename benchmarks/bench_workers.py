@@ -0,0 +1,112 @@
+"""
+Pre-fork Worker Scaling Benchmark
+Starts prefork_server.py with 1, 2, 4 and 8 workers and measures read and
+ingest throughput against a local MySQL (DB_* environment variables)
+
+Usage:
+    python benchmarks/bench_workers.py
+    python benchmarks/bench_workers.py --workers 1 2 4 --duration 15 --clients 64
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+ENDPOINTS = {
+    'read': ('GET', '/api/environment', None),
+    'ingest': ('POST', '/api/bin-data', {'bin_id': 'BENCH', 'distance_cm': 42.0}),
+}
+
+
+def wait_ready(base_url, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            urllib.request.urlopen(f"{base_url}/metrics", timeout=1).read()
+            return True
+        except (urllib.error.URLError, ConnectionError):
+            time.sleep(0.25)
+    return False
+
+
+def load(base_url, method, path, body, clients, duration):
+    """Closed-loop load: each client sends the next request when the last returns"""
+    data = json.dumps(body).encode() if body is not None else None
+    counts = {'ok': 0, 'error': 0}
+    lock = threading.Lock()
+    stop_at = time.perf_counter() + duration
+
+    def client(i):
+        ok = error = 0
+        while time.perf_counter() < stop_at:
+            payload = data
+            if body is not None:
+                payload = json.dumps(dict(body, bin_id=f"BENCH{i:04d}")).encode()
+            req = urllib.request.Request(f"{base_url}{path}", data=payload, method=method,
+                                         headers={'Content-Type': 'application/json'})
+            try:
+                with urllib.request.urlopen(req, timeout=30) as resp:
+                    resp.read()
+                ok += 1
+            except (urllib.error.URLError, ConnectionError):
+                error += 1
+        with lock:
+            counts['ok'] += ok
+            counts['error'] += error
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(clients)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+    return counts['ok'] / elapsed, counts['error']
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Pre-fork worker scaling benchmark')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--threads', type=int, default=4, help='threads per worker')
+    parser.add_argument('--clients', type=int, default=32)
+    parser.add_argument('--duration', type=float, default=10.0)
+    parser.add_argument('--port', type=int, default=5099)
+    args = parser.parse_args()
+
+    base_url = f"http://127.0.0.1:{args.port}"
+    env = dict(os.environ, RATE_LIMIT_ENABLED='False', LOG_LEVEL='WARNING')
+
+    print(f"{args.clients} clients, {args.duration:g}s per run, {args.threads} threads/worker")
+    print(f"{'workers':>8}{'read req/s':>14}{'ingest req/s':>14}{'errors':>8}")
+    for workers in args.workers:
+        server = subprocess.Popen(
+            [sys.executable, 'prefork_server.py', '--workers', str(workers),
+             '--threads', str(args.threads), '--bind', f"127.0.0.1:{args.port}"],
+            cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+        try:
+            if not wait_ready(base_url):
+                print(f"{workers:>8}  server did not start")
+                continue
+            results = {}
+            errors = 0
+            for name, (method, path, body) in ENDPOINTS.items():
+                rps, err = load(base_url, method, path, body, args.clients, args.duration)
+                results[name] = rps
+                errors += err
+            print(f"{workers:>8}{results['read']:>14.1f}{results['ingest']:>14.1f}{errors:>8}")
+        finally:
+            server.terminate()
+            server.wait(timeout=30)
+
+
+if __name__ == '__main__':
+    main()
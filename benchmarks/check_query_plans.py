@@ -0,0 +1,301 @@
+"""
+Query Plan Regression Check
+Runs EXPLAIN for every SELECT/UPDATE/DELETE statement in api_server.py
+and the shared SQL modules (queries.py, bin_forecast.py,
+weather_stations.py, plot_weather.py, duty_cycle.py,
+maintenance_triggers.py) against a seeded database and fails when a
+route query does a full table scan or a filesort on a large table
+
+Uses the configured backend (DB_BACKEND with DB_* or SQLITE_PATH). Tables
+come from the /api/*/init routes and schema.ROUTE_INDEXES from
+/api/indexes/init; every table is then filled up to --rows rows of
+synthetic values and analyzed, so the planner sees realistic sizes. Run it
+against a scratch database: seeding writes rows.
+
+Statements whose EXPLAIN fails (columns that only exist in another variant
+of a table) are reported but do not fail the check.
+
+Usage:
+    DB_BACKEND=sqlite SQLITE_PATH=/tmp/plans.db python benchmarks/check_query_plans.py
+    python benchmarks/check_query_plans.py --rows 100000
+    python benchmarks/check_query_plans.py --skip-indexes      # fresh database: show what needs them
+"""
+
+import argparse
+import ast
+import os
+import random
+import re
+import sys
+from datetime import date, datetime, timedelta
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+os.environ.setdefault('RATE_LIMIT_ENABLED', 'False')
+os.environ.setdefault('LOG_LEVEL', 'WARNING')
+
+import api_server  # noqa: E402
+import database  # noqa: E402
+import sqlite_backend  # noqa: E402
+
+SOURCE = os.path.join(ROOT, 'api_server.py')
+SHARED_SOURCES = ('queries.py', 'bin_forecast.py', 'weather_stations.py', 'plot_weather.py', 'duty_cycle.py',
+                  'maintenance_triggers.py')
+
+INIT_URLS = (
+    '/api/auth/init-db', '/api/sensor/init', '/api/bin-data/init', '/api/device-logs/init',
+    '/api/weather/init', '/api/alerts/init', '/api/maintenance/init', '/api/crop-health/init',
+    '/api/device-history/init', '/api/device-runtime/init',
+)
+
+# Values for names interpolated into f-string SQL
+FORMAT_SAMPLES = {'column': 'air_temp', 'select_list': '*', 'cells': 's.cell BETWEEN %s AND %s'}
+
+# Statements allowed to scan, with the reason (normalized SQL -> reason)
+ALLOWED = {
+    'SELECT * FROM plots ORDER BY plot_id ASC': 'lists every plot by design',
+    'SELECT bin_id, last_at, last_distance_cm, pending_at, pending_distance_cm, fill_rate_cm_per_hour, '
+    'predicted_full_at FROM bin_fill_state ORDER BY bin_id': 'fleet map lists every bin by design',
+    'SELECT plot_id, latitude, longitude FROM plots WHERE latitude IS NOT NULL AND longitude IS NOT NULL':
+        'plot weather interpolates every plot, once per bucket',
+    'SELECT s.latitude, s.longitude, w.temperature, w.humidity, w.wind_speed, w.rainfall FROM weather_stations s '
+    'JOIN weather_logs w ON w.weather_id = s.last_weather_id WHERE s.last_seen >= %s':
+        'plot weather reads every fresh station, once per bucket',
+    'SELECT device_id, on_since FROM device_runtime_state WHERE is_on = 1':
+        'one row per device, read once per runtime request',
+    'SELECT COUNT(*) FROM devices': 'init-db only',
+    'SELECT COUNT(*) as count FROM plots': 'overview fallback when farm_counters is not installed',
+    "SELECT COUNT(*) as count FROM devices WHERE status = 'ON'":
+        'overview fallback when farm_counters is not installed',
+    'SELECT COUNT(*) as count FROM sensor_logs': 'overview fallback when farm_counters is not installed',
+    'SELECT COUNT(*) as count FROM alerts WHERE is_resolved = FALSE':
+        'overview fallback when farm_counters is not installed',
+}
+
+# Rows share one of CARDINALITY values in int columns and in string columns
+# named like an enum; other strings are unique (UNIQUE keys such as usernames)
+CARDINALITY = 50
+ENUM_LIKE = ('status', 'mode', 'severity', 'type', 'condition', 'role', 'priority', 'level')
+
+
+def normalize(sql):
+    return ' '.join(sql.split())
+
+
+def route_statements():
+    """(file, line, function or constant, sql) for every SELECT/UPDATE/DELETE passed to execute()"""
+    tree = ast.parse(open(SOURCE, encoding='utf-8').read())
+    statements = []
+    for function in ast.walk(tree):
+        if not isinstance(function, ast.FunctionDef):
+            continue
+        for node in ast.walk(function):
+            if not (isinstance(node, ast.Call) and getattr(node.func, 'attr', None) == 'execute' and node.args):
+                continue
+            sql = _literal(node.args[0])
+            if sql and normalize(sql).split(' ', 1)[0].upper() in ('SELECT', 'UPDATE', 'DELETE'):
+                statements.append(('api_server.py', node.lineno, function.name, normalize(sql)))
+    # Module-level statements shared with async_server.py
+    for source in SHARED_SOURCES:
+        for node in ast.parse(open(os.path.join(ROOT, source), encoding='utf-8').read()).body:
+            if isinstance(node, ast.Assign) and isinstance(node.targets[0], ast.Name):
+                sql = _literal(node.value)
+                if sql and normalize(sql).split(' ', 1)[0].upper() in ('SELECT', 'UPDATE', 'DELETE'):
+                    sql = sql.format(**FORMAT_SAMPLES)
+                    statements.append((source, node.lineno, node.targets[0].id, normalize(sql)))
+    return sorted(set(statements))
+
+
+def _literal(node):
+    if isinstance(node, ast.Constant) and isinstance(node.value, str):
+        return node.value
+    if isinstance(node, ast.JoinedStr):
+        parts = []
+        for value in node.values:
+            if isinstance(value, ast.Constant):
+                parts.append(value.value)
+            elif isinstance(value.value, ast.Name) and value.value.id in FORMAT_SAMPLES:
+                parts.append(FORMAT_SAMPLES[value.value.id])
+            else:
+                return None
+        return ''.join(parts)
+    return None
+
+
+# SEEDING
+
+def _columns(cursor, table):
+    cursor.execute(f'SHOW COLUMNS FROM {table}')
+    return [(row[0], row[1].lower(), row[3], (row[5] or '').lower()) for row in cursor.fetchall()]
+
+
+def _value(name, column_type, key, i, rng, now):
+    unique = key in ('PRI', 'UNI')
+    if column_type.startswith(('tinyint(1)', 'boolean', 'bool')):
+        return i % 2
+    if re.match(r'(big|small|tiny|medium)?int', column_type) or column_type.startswith('integer'):
+        return i if unique else i % CARDINALITY
+    if column_type.startswith(('decimal', 'float', 'double', 'real', 'numeric')):
+        return round(rng.uniform(0, 99), 2)
+    if column_type.startswith(('datetime', 'timestamp')):
+        return now - timedelta(seconds=20 * i)
+    if column_type.startswith('date'):
+        return date.today() + timedelta(days=i % 365)
+    if column_type.startswith('time'):
+        return '08:00:00'
+    if column_type.startswith('enum'):
+        return re.findall(r"'([^']*)'", column_type)[0]
+    return f"{name}_{i % CARDINALITY if name.endswith(ENUM_LIKE) else i}"
+
+
+def seed(conn, rows):
+    """Fill every table up to rows rows; returns {table: row count}"""
+    cursor = conn.cursor()
+    cursor.execute('SHOW TABLES')
+    tables = [row[0] for row in cursor.fetchall()]
+    counts = {}
+    rng = random.Random(11)
+    now = datetime.now()
+    for table in tables:
+        cursor.execute(f'SELECT COUNT(*) FROM {table}')
+        existing = cursor.fetchone()[0]
+        columns = [(name, column_type, key) for name, column_type, key, extra in _columns(cursor, table)
+                   if 'auto_increment' not in extra and not (key == 'PRI' and column_type == 'integer')]
+        for start in range(existing, rows, 5000):
+            batch = [tuple(_value(name, column_type, key, i, rng, now) for name, column_type, key in columns)
+                     for i in range(start, min(rows, start + 5000))]
+            cursor.executemany(
+                f"INSERT INTO {table} ({', '.join(c[0] for c in columns)}) "
+                f"VALUES ({', '.join(['%s'] * len(columns))})", batch)
+            conn.commit()
+        cursor.execute(f'SELECT COUNT(*) FROM {table}')
+        counts[table] = cursor.fetchone()[0]
+
+    if api_server.DB_BACKEND == 'sqlite':
+        cursor.execute('ANALYZE')
+    else:
+        for table in tables:
+            cursor.execute(f'ANALYZE TABLE {table}')
+            cursor.fetchall()
+    conn.commit()
+    cursor.close()
+    return counts
+
+
+# EXPLAIN
+
+_samples = {}
+
+
+def _sample(cursor, table, column):
+    key = (table, column)
+    if key not in _samples:
+        try:
+            cursor.execute(f'SELECT {column} FROM {table} WHERE {column} IS NOT NULL LIMIT 1')
+            row = cursor.fetchone()
+            _samples[key] = row[0] if row else 1
+        except database.Error:
+            _samples[key] = 1
+    return _samples[key]
+
+
+def parameters(cursor, sql, table):
+    """Plausible values for each %s, typed like the column they are compared with"""
+    params = []
+    for match in re.finditer(r'%s', sql):
+        before = sql[:match.start()]
+        if re.search(r'LIMIT\s*$', before, re.IGNORECASE):
+            params.append(50)
+        elif re.search(r'INTERVAL\s*$', before, re.IGNORECASE):
+            params.append(7)
+        else:
+            column = re.search(r'(\w+)\s*(?:=|<|>|<=|>=|<>|!=)\s*$', before)
+            params.append(_sample(cursor, table, column.group(1)) if column else 1)
+    return tuple(params)
+
+
+def explain(conn, sql, params, counts, large):
+    """Problems in the plan of one statement: list of strings"""
+    has_limit = re.search(r'\bLIMIT\b', sql, re.IGNORECASE) is not None
+    problems = []
+    if api_server.DB_BACKEND == 'sqlite':
+        for row in sqlite_backend.explain(api_server.DB_CONFIG['path'], sql, params):
+            detail = row['detail']
+            scan = re.match(r'SCAN (\w+)(?: AS \w+)?( USING (?:COVERING )?INDEX \w+)?', detail)
+            if scan and counts.get(scan.group(1), 0) >= large and (not scan.group(2) or not has_limit):
+                problems.append(f"full scan of {scan.group(1)} ({detail})")
+            if 'TEMP B-TREE' in detail:
+                problems.append(f"filesort ({detail})")
+        return problems
+
+    cursor = conn.cursor(dictionary=True)
+    cursor.execute('EXPLAIN ' + sql, params)
+    for row in cursor.fetchall():
+        table = row.get('table')
+        if counts.get(table, 0) < large:
+            continue
+        if row.get('type') == 'ALL' or (row.get('type') == 'index' and not has_limit):
+            problems.append(f"full scan of {table} (type={row['type']}, rows={row.get('rows')})")
+        if 'Using filesort' in (row.get('Extra') or ''):
+            problems.append(f"filesort on {table} ({row['Extra']})")
+    cursor.close()
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description='EXPLAIN every api_server.py query against a seeded database')
+    parser.add_argument('--rows', type=int, default=20000, help='seed every table up to this many rows')
+    parser.add_argument('--large', type=int, default=1000, help='tables with at least this many rows are large')
+    parser.add_argument('--no-seed', action='store_true', help='use the existing data as-is')
+    parser.add_argument('--skip-indexes', action='store_true', help='do not apply schema.ROUTE_INDEXES')
+    parser.add_argument('-v', '--verbose', action='store_true', help='print passing statements too')
+    args = parser.parse_args()
+
+    client = api_server.app.test_client()
+    for url in INIT_URLS + (() if args.skip_indexes else ('/api/indexes/init',)):
+        response = client.post(url)
+        if response.status_code != 200:
+            sys.exit(f"{url} failed: {response.get_json()}")
+
+    conn = database.connect(api_server.DB_CONFIG, instrument=False)
+    if args.no_seed:
+        cursor = conn.cursor()
+        cursor.execute('SHOW TABLES')
+        counts = {}
+        for (table,) in cursor.fetchall():
+            cursor.execute(f'SELECT COUNT(*) FROM {table}')
+            counts[table] = cursor.fetchone()[0]
+        cursor.close()
+    else:
+        counts = seed(conn, args.rows)
+
+    failures = errors = 0
+    cursor = conn.cursor()
+    statements = route_statements()
+    for source, line, function, sql in statements:
+        table = database.statement_labels(sql)[1]
+        try:
+            problems = explain(conn, sql, parameters(cursor, sql, table), counts, args.large)
+        except database.Error as e:
+            errors += 1
+            print(f"ERROR  {source}:{line} {function}: {str(e).splitlines()[0]}")
+            continue
+        if problems and sql in ALLOWED:
+            if args.verbose:
+                print(f"ALLOW  {source}:{line} {function}: {ALLOWED[sql]}")
+        elif problems:
+            failures += 1
+            print(f"FAIL   {source}:{line} {function}: {'; '.join(problems)}\n       {sql}")
+        elif args.verbose:
+            print(f"ok     {source}:{line} {function}")
+    cursor.close()
+    conn.close()
+
+    print(f"{len(statements)} statements, {failures} failing, {errors} not explainable "
+          f"({api_server.DB_BACKEND}, large = {args.large}+ rows)")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
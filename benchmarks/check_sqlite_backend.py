@@ -0,0 +1,224 @@
+"""
+SQLite Backend Smoke Check
+Verifies that the embedded backend (sqlite_backend.py) runs what the
+MySQL server runs:
+
+1. Every SQL literal passed to execute()/executemany() in api_server.py,
+   and every SQL constant in the shared modules, is translated and
+   compiled by SQLite (EXPLAIN, nothing is executed). Statements that
+   name a column only another variant of a table has (init-db vs the
+   /api/*/init DDL) are reported but do not fail; syntax errors, unknown
+   functions and leftover MySQL placeholders do.
+2. The main routes are called through the Flask test client (init, ingest,
+   reads, auth, maintenance, runtime) and must answer with the expected
+   status.
+
+Creates its own scratch database (DB_BACKEND and SQLITE_PATH are set here).
+
+Usage:
+    python benchmarks/check_sqlite_backend.py
+    python benchmarks/check_sqlite_backend.py -v        # print every statement
+"""
+
+import argparse
+import ast
+import os
+import re
+import sys
+import tempfile
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+SCRATCH = tempfile.mkdtemp(prefix='smartfarm_sqlite_')
+os.environ['DB_BACKEND'] = 'sqlite'
+os.environ['SQLITE_PATH'] = os.path.join(SCRATCH, 'smart_farm.db')
+os.environ['ARCHIVE_DIR'] = os.path.join(SCRATCH, 'archive')
+os.environ['RATE_LIMIT_ENABLED'] = 'False'
+os.environ['DUTY_CYCLE_INTERVAL'] = '0'
+os.environ.setdefault('LOG_LEVEL', 'ERROR')
+
+import api_server  # noqa: E402
+import sqlite_backend  # noqa: E402
+
+SOURCES = ('api_server.py', 'queries.py', 'bin_forecast.py', 'weather_stations.py', 'plot_weather.py',
+           'duty_cycle.py', 'maintenance_triggers.py', 'counters.py', 'schema.py')
+
+STATEMENT_WORDS = ('SELECT', 'INSERT', 'REPLACE', 'UPDATE', 'DELETE', 'CREATE', 'WITH')
+
+# Values for names interpolated into f-string SQL
+FORMAT_SAMPLES = {'column': 'air_temp', 'select_list': '*', 'cells': 's.cell BETWEEN %s AND %s',
+                  'placeholders': '%s, %s', 'table': 'sensor_logs'}
+
+# Errors of statements written for another variant of a table
+VARIANT_ERRORS = ('no such column', 'no such table', 'has no column named')
+
+# Feature tables first: /api/auth/init-db creates older variants of
+# device_logs and devices only where they do not exist yet
+INIT_URLS = (
+    '/api/sensor/init', '/api/bin-data/init', '/api/device-logs/init',
+    '/api/weather/init', '/api/alerts/init', '/api/maintenance/init', '/api/crop-health/init',
+    '/api/device-history/init', '/api/device-runtime/init', '/api/indexes/init',
+    '/api/statistics/counters/init', '/api/auth/init-db',
+)
+
+
+def _literal(node):
+    if isinstance(node, ast.Constant) and isinstance(node.value, str):
+        return node.value
+    if isinstance(node, ast.JoinedStr):
+        parts = []
+        for value in node.values:
+            if isinstance(value, ast.Constant):
+                parts.append(value.value)
+            elif isinstance(value.value, ast.Name) and value.value.id in FORMAT_SAMPLES:
+                parts.append(FORMAT_SAMPLES[value.value.id])
+            else:
+                return None
+        return ''.join(parts)
+    return None
+
+
+def _is_statement(sql):
+    words = sql.split(None, 1)
+    return bool(words) and words[0].upper() in STATEMENT_WORDS
+
+
+def statements():
+    """(file, line, sql) for execute() literals and module-level SQL constants"""
+    found = set()
+    for source in SOURCES:
+        tree = ast.parse(open(os.path.join(ROOT, source), encoding='utf-8').read())
+        for node in ast.walk(tree):
+            sql = None
+            if (isinstance(node, ast.Call) and getattr(node.func, 'attr', None) in ('execute', 'executemany')
+                    and node.args):
+                sql = _literal(node.args[0])
+            elif isinstance(node, ast.Assign) and node in tree.body:
+                sql = _literal(node.value)
+                if sql and isinstance(node.value, ast.Constant) and '{' in sql:
+                    sql = sql.format(**FORMAT_SAMPLES)  # str.format templates
+            if sql and _is_statement(sql.strip()):
+                found.add((source, node.lineno, ' '.join(sql.split())))
+    return sorted(found)
+
+
+def compile_statement(conn, sql):
+    """Translate and compile one statement; returns the translated SQL"""
+    translated, extra = sqlite_backend.translate(sql, '%s' in sql)
+    for statement in [translated] + extra:
+        if re.search(r'%s|\bON DUPLICATE KEY\b|\bINSERT IGNORE\b|\bAUTO_INCREMENT\b|\bNOW\(\)', statement,
+                     re.IGNORECASE):
+            raise ValueError(f"untranslated MySQL in: {statement}")
+        conn.execute('EXPLAIN ' + statement, [None] * statement.count('?'))
+    return translated
+
+
+def check_translations(verbose):
+    failures = skipped = 0
+    found = statements()
+    conn = sqlite_backend.connect(api_server.DB_CONFIG['path'])
+    try:
+        for source, line, sql in found:
+            try:
+                compile_statement(conn._conn, sql)
+            except Exception as e:
+                message = str(e).splitlines()[0]
+                if any(error in message for error in VARIANT_ERRORS):
+                    skipped += 1
+                    if verbose:
+                        print(f"SKIP   {source}:{line}: {message}")
+                    continue
+                failures += 1
+                print(f"FAIL   {source}:{line}: {message}\n       {sql}")
+                continue
+            if verbose:
+                print(f"ok     {source}:{line}")
+    finally:
+        conn.close()
+    print(f"{len(found)} statements translated, {failures} failing, {skipped} for another table variant")
+    return failures
+
+
+def check_routes(verbose):
+    client = api_server.app.test_client()
+    failures = 0
+
+    def call(method, url, expected, **kwargs):
+        nonlocal failures
+        response = client.open(url, method=method, **kwargs)
+        if response.status_code != expected:
+            failures += 1
+            print(f"FAIL   {method} {url}: {response.status_code} (expected {expected}) "
+                  f"{response.get_data(as_text=True)[:200]}")
+        elif verbose:
+            print(f"ok     {method} {url}: {response.status_code}")
+        return response.get_json(silent=True) or {}
+
+    for url in INIT_URLS:
+        call('POST', url, 200)
+
+    call('POST', '/api/auth/register', 200, json={'username': 'smoke', 'password': 'smoke-password-1'})
+    login = call('POST', '/api/auth/login', 200, json={'username': 'smoke', 'password': 'smoke-password-1'})
+    auth = {'Authorization': f"Bearer {login.get('access_token')}"}
+    call('POST', '/api/auth/login', 401, json={'username': 'smoke', 'password': 'wrong'})
+
+    call('POST', '/api/sensor', 201, json={'device_id': 1, 'air_temp': 28.5, 'air_humidity': 70})
+    call('POST', '/api/sensor', 400, data='[]', content_type='application/json')
+    call('GET', '/api/sensor/latest', 200)
+    call('GET', '/api/sensor/history?device_id=1', 200, headers=auth)
+    call('GET', '/api/sensor/history?device_id=1', 401)
+
+    for hour, distance in enumerate((80, 74, 68, 62)):
+        call('POST', '/api/bin-data', 201,
+             json={'bin_id': 'BIN001', 'distance_cm': distance, 'timestamp': f'2026-02-15T0{hour}:00:00'})
+    call('POST', '/api/bin-data', 400, json={'bin_id': 'BIN001'})
+    call('GET', '/api/bin-data?bin_id=BIN001', 200)
+    call('GET', '/api/bin-data/forecast', 200)
+    call('GET', '/api/bin-data/latest', 200)
+
+    call('POST', '/api/device-logs', 201, json={'device_id': 1, 'device_name': 'Pump001', 'action': 'ON',
+                                                'old_value': 'OFF', 'new_value': 'ON'})
+    call('GET', '/api/device-logs?device_id=1', 200)
+    call('POST', '/api/device-history', 201, json={'device_id': 1, 'device_name': 'Pump001', 'status': 'ON',
+                                                   'uptime_seconds': 3600, 'error_count': 0})
+    call('GET', '/api/device-history?device_id=1', 200)
+    call('GET', '/api/device-runtime', 200)
+
+    call('POST', '/api/weather', 201, json={'location': 'Farm A', 'latitude': 13.75, 'longitude': 100.5,
+                                            'temperature': 28.5, 'humidity': 75.0})
+    call('GET', '/api/weather', 200)
+    call('GET', '/api/weather/stations?min_lat=13&max_lat=14&min_lon=100&max_lon=101', 200)
+
+    alert = call('POST', '/api/alerts', 201, json={'plot_id': 1, 'alert_type': 'HIGH_TEMP', 'severity': 'HIGH'})
+    call('GET', '/api/alerts', 200)
+    call('PUT', f"/api/alerts/{alert.get('alert_id', 1)}/resolve", 200)
+
+    entry = call('POST', '/api/maintenance', 201, json={'device_id': 1, 'device_name': 'Pump001',
+                                                        'maintenance_type': 'Filter', 'scheduled_date': '2026-03-15'})
+    call('GET', '/api/maintenance', 200)
+    call('POST', '/api/maintenance/evaluate', 200)
+    call('GET', '/api/maintenance/usage', 200)
+    call('PUT', f"/api/maintenance/{entry.get('maintenance_id', 1)}/complete", 200)
+    call('PUT', '/api/maintenance/999999/complete', 404)
+
+    call('POST', '/api/crop-health', 201, json={'plot_id': 1, 'cwsi_value': 0.4})
+    call('GET', '/api/crop-health?plot_id=1', 200)
+    call('GET', '/api/statistics/overview', 200)
+
+    print(f"routes: {failures} failing")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Translate api_server SQL for SQLite and smoke-test the routes')
+    parser.add_argument('-v', '--verbose', action='store_true', help='print passing checks too')
+    args = parser.parse_args()
+
+    failures = check_routes(args.verbose)  # the init routes create the tables the statements need
+    failures += check_translations(args.verbose)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
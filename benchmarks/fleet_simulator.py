@@ -0,0 +1,413 @@
+"""
+ESP32 Fleet Load Simulator
+Simulates sensor nodes, trash bins, weather stations, actuator controllers
+and dashboard users against a running api_server, and reports throughput,
+error rates and p50/p95/p99 latency per route
+
+Traffic is open-loop: every simulated device fires on its own fixed period
+(with a seeded random phase), whether or not the server keeps up. Latency is
+measured from the scheduled send time, so server stalls show up in the
+percentiles instead of silently lowering the request rate.
+
+Usage:
+    RATE_LIMIT_ENABLED=False python api_server.py       # or prefork_server.py
+    python benchmarks/fleet_simulator.py --sensors 1000 --bins 500 --duration 120
+    python benchmarks/fleet_simulator.py --speedup 10 --output run1.json
+    python benchmarks/fleet_simulator.py --output run2.json --compare run1.json
+
+Same --seed and arguments give the same request schedule and payloads, so
+results of two runs (or two server builds) are directly comparable.
+"""
+
+import argparse
+import heapq
+import http.client
+import json
+import os
+import platform
+import queue
+import random
+import subprocess
+import sys
+import threading
+import time
+from urllib.parse import quote, urlsplit
+
+DEVICE_NAMES = ('Water Pump', 'Grow Light')
+BIN_CAPACITY_CM = 60.0
+
+
+# ==================== RECORDING ====================
+
+def percentile(sorted_values, q):
+    """Nearest-rank percentile of an ascending list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, int(round(q / 100.0 * len(sorted_values))) - 1))
+    return sorted_values[rank]
+
+
+class Recorder:
+    """Latency samples and status counts per route"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.routes = {}
+        self.late = 0
+        self.recording = False
+
+    def record(self, route, latency, service, status, late):
+        if not self.recording:
+            return
+        with self._lock:
+            entry = self.routes.setdefault(route, {'latency': [], 'service': [], 'status': {}})
+            entry['latency'].append(latency)
+            entry['service'].append(service)
+            entry['status'][status] = entry['status'].get(status, 0) + 1
+            self.late += late
+
+    def summary(self, elapsed):
+        result = {}
+        for route, entry in sorted(self.routes.items()):
+            latency = sorted(entry['latency'])
+            service = sorted(entry['service'])
+            count = len(latency)
+            statuses = entry['status']
+            limited = statuses.get(429, 0) + statuses.get(503, 0)
+            errors = sum(n for status, n in statuses.items()
+                         if status == 0 or (status >= 500 and status != 503))
+            result[route] = {
+                'requests': count,
+                'rate': count / elapsed,
+                'errors': errors,
+                'error_pct': errors / count * 100 if count else 0.0,
+                'limited': limited,
+                'p50_ms': percentile(latency, 50) * 1e3,
+                'p95_ms': percentile(latency, 95) * 1e3,
+                'p99_ms': percentile(latency, 99) * 1e3,
+                'max_ms': latency[-1] * 1e3 if latency else 0.0,
+                'service_p99_ms': percentile(service, 99) * 1e3,
+                'status': {str(k): v for k, v in sorted(statuses.items())},
+            }
+        return result
+
+
+# ==================== HTTP ====================
+
+class Client:
+    """Keep-alive connection owned by one worker thread"""
+
+    def __init__(self, host, port, timeout):
+        self.host, self.port, self.timeout = host, port, timeout
+        self.conn = None
+
+    def request(self, method, path, body=None, token=None):
+        headers = {'Content-Type': 'application/json', 'Connection': 'keep-alive'}
+        if token:
+            headers['Authorization'] = f"Bearer {token}"
+        payload = json.dumps(body) if body is not None else None
+        for attempt in range(2):
+            if self.conn is None:
+                self.conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+            try:
+                self.conn.request(method, path, body=payload, headers=headers)
+                response = self.conn.getresponse()
+                data = response.read()
+                if response.getheader('Connection', '').lower() == 'close':
+                    self.close()
+                return response.status, data
+            except (http.client.HTTPException, OSError):
+                self.close()
+                if attempt:
+                    return 0, b''
+        return 0, b''
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+
+# ==================== SIMULATED DEVICES ====================
+
+class Fleet:
+    """Builds the request for each event; all randomness derives from the seed"""
+
+    def __init__(self, args):
+        self.seed = args.seed
+        self.users = args.users
+        self.password = args.password
+        self.tokens = {}  # dashboard index -> [access, refresh]
+        self._tokens_lock = threading.Lock()
+
+    def rng(self, kind, index, tick):
+        return random.Random(f"{self.seed}:{kind}:{index}:{tick}")
+
+    def username(self, index):
+        return f"fleet_sim_{index % self.users:03d}"
+
+    def sensor(self, index, tick):
+        r = self.rng('sensor', index, tick)
+        return 'POST /api/sensor', 'POST', '/api/sensor', {
+            'device_id': index + 1,
+            'temperature_air': round(r.uniform(24, 36), 2),
+            'temperature_leaf': round(r.uniform(22, 35), 2),
+            'humidity': round(r.uniform(45, 90), 2),
+            'water_level': round(r.uniform(5, 30), 2),
+            'light_lux': round(r.uniform(0, 60000), 2),
+            'soil_moisture': round(r.uniform(20, 70), 2),
+        }, None
+
+    def bin(self, index, tick):
+        r = self.rng('bin', index, tick)
+        # Bins fill up over time, then get emptied
+        fill = (tick * r.uniform(0.5, 1.5)) % BIN_CAPACITY_CM
+        return 'POST /api/bin-data', 'POST', '/api/bin-data', {
+            'bin_id': f"BIN{index:04d}",
+            'distance_cm': round(BIN_CAPACITY_CM - fill, 1),
+        }, None
+
+    def weather(self, index, tick):
+        r = self.rng('weather', index, tick)
+        return 'POST /api/weather', 'POST', '/api/weather', {
+            'location': f"Station {index:03d}",
+            'latitude': round(13.0 + (index % 50) * 0.02, 4),
+            'longitude': round(100.0 + (index // 50) * 0.02, 4),
+            'temperature': round(r.uniform(22, 38), 1),
+            'humidity': round(r.uniform(40, 95), 1),
+            'wind_speed': round(r.uniform(0, 12), 1),
+            'rainfall': round(max(0.0, r.gauss(0, 2)), 1),
+            'weather_condition': r.choice(('Clear', 'Partly Cloudy', 'Cloudy', 'Rain')),
+        }, None
+
+    def actuator(self, index, tick):
+        name = DEVICE_NAMES[index % len(DEVICE_NAMES)]
+        return 'GET /api/device/<name>', 'GET', f"/api/device/{quote(name)}", None, None
+
+    def dashboard(self, index, tick):
+        with self._tokens_lock:
+            tokens = self.tokens.get(index)
+        if tokens is None:
+            return 'POST /api/auth/login', 'POST', '/api/auth/login', {
+                'username': self.username(index), 'password': self.password
+            }, None
+        return 'GET /api/environment', 'GET', '/api/environment', None, tokens[0]
+
+    def refresh(self, index, tick):
+        with self._tokens_lock:
+            tokens = self.tokens.get(index)
+        if tokens is None:
+            return None
+        return 'POST /api/auth/refresh', 'POST', '/api/auth/refresh', {'refresh_token': tokens[1]}, None
+
+    def handle_response(self, kind, index, route, status, data):
+        """Keep dashboard sessions alive from login/refresh responses"""
+        if status != 200 or kind not in ('dashboard', 'refresh') or 'auth' not in route:
+            return
+        try:
+            body = json.loads(data)
+        except ValueError:
+            return
+        with self._tokens_lock:
+            if route == 'POST /api/auth/login' and body.get('access_token'):
+                self.tokens[index] = [body['access_token'], body.get('refresh_token')]
+            elif route == 'POST /api/auth/refresh' and index in self.tokens and body.get('access_token'):
+                self.tokens[index][0] = body['access_token']
+
+
+def fleet_mix(args):
+    """kind -> (count, period seconds)"""
+    mix = {
+        'sensor': (args.sensors, args.sensor_period),
+        'bin': (args.bins, args.bin_period),
+        'weather': (args.weather_stations, args.weather_period),
+        'actuator': (args.actuators, args.actuator_period),
+        'dashboard': (args.dashboards, args.dashboard_period),
+        'refresh': (args.dashboards, args.refresh_period),
+    }
+    return {kind: (count, period / args.speedup) for kind, (count, period) in mix.items() if count}
+
+
+def initial_schedule(mix, seed, start):
+    """Heap of (due time, seq, kind, index, tick) with seeded random phases"""
+    rng = random.Random(seed)
+    heap = []
+    seq = 0
+    for kind, (count, period) in sorted(mix.items()):
+        for index in range(count):
+            # Refresh fires one period after login, never before it
+            phase = period if kind == 'refresh' else rng.uniform(0, period)
+            heap.append((start + phase, seq, kind, index, 0))
+            seq += 1
+    heapq.heapify(heap)
+    return heap, seq
+
+
+# ==================== RUN ====================
+
+def ensure_users(base, fleet, count, timeout):
+    """Register the dashboard accounts (existing ones are fine)"""
+    client = Client(base.hostname, base.port or 80, timeout)
+    for index in range(min(count, fleet.users)):
+        client.request('POST', '/api/auth/register', {
+            'username': fleet.username(index), 'password': fleet.password
+        })
+    client.close()
+
+
+def run(args):
+    base = urlsplit(args.url)
+    fleet = Fleet(args)
+    mix = fleet_mix(args)
+    recorder = Recorder()
+
+    if args.dashboards:
+        ensure_users(base, fleet, args.dashboards, args.timeout)
+
+    work = queue.Queue()
+    stop = threading.Event()
+
+    def worker():
+        client = Client(base.hostname, base.port or 80, args.timeout)
+        while True:
+            item = work.get()
+            if item is None:
+                break
+            due, kind, index, tick = item
+            built = getattr(fleet, kind)(index, tick)
+            if built is None:
+                continue
+            route, method, path, body, token = built
+            sent = time.perf_counter()
+            status, data = client.request(method, path, body, token)
+            done = time.perf_counter()
+            fleet.handle_response(kind, index, route, status, data)
+            recorder.record(route, done - due, done - sent, status, sent - due > 0.1)
+        client.close()
+
+    workers = [threading.Thread(target=worker, daemon=True) for _ in range(args.concurrency)]
+    for t in workers:
+        t.start()
+
+    start = time.perf_counter()
+    heap, seq = initial_schedule(mix, args.seed, start)
+    measure_from = start + args.warmup
+    end = measure_from + args.duration
+
+    # Fixed-rate dispatch: the next send is due one period after the last
+    # scheduled one, not after the response, so slow responses do not
+    # reduce the offered load
+    while heap and not stop.is_set():
+        due, _, kind, index, tick = heap[0]
+        if due >= end:
+            break
+        now = time.perf_counter()
+        if due > now:
+            time.sleep(min(due - now, 0.05))
+            continue
+        heapq.heappop(heap)
+        if not recorder.recording and due >= measure_from:
+            recorder.recording = True
+        work.put((due, kind, index, tick))
+        seq += 1
+        heapq.heappush(heap, (due + mix[kind][1], seq, kind, index, tick + 1))
+
+    backlog = work.qsize()
+    for _ in workers:
+        work.put(None)
+    for t in workers:
+        t.join(timeout=args.timeout + 5)
+    recorder.recording = False
+    elapsed = time.perf_counter() - measure_from
+
+    offered = sum(count / period for kind, (count, period) in mix.items() if kind != 'refresh')
+    return {
+        'config': {k: v for k, v in vars(args).items() if k not in ('output', 'compare', 'password')},
+        'environment': environment_info(),
+        'offered_rps': offered,
+        'elapsed_s': elapsed,
+        'late_sends': recorder.late,
+        'backlog_at_end': backlog,
+        'routes': recorder.summary(elapsed),
+    }
+
+
+def environment_info():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                                text=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        commit = ''
+    return {
+        'commit': commit,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+    }
+
+
+def print_report(result, baseline=None):
+    config = result['config']
+    print(f"seed {config['seed']}, {config['duration']:g}s measured after {config['warmup']:g}s warmup, "
+          f"speedup x{config['speedup']:g}, {config['concurrency']} client threads")
+    print(f"offered load {result['offered_rps']:.1f} req/s, commit {result['environment']['commit'] or '-'}")
+    header = f"{'route':<28}{'req/s':>9}{'err %':>8}{'429/503':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'max ms':>9}"
+    if baseline:
+        header += f"{'p99 vs base':>13}"
+    print(header)
+    for route, r in result['routes'].items():
+        line = (f"{route:<28}{r['rate']:>9.1f}{r['error_pct']:>8.2f}{r['limited']:>9}"
+                f"{r['p50_ms']:>9.1f}{r['p95_ms']:>9.1f}{r['p99_ms']:>9.1f}{r['max_ms']:>9.1f}")
+        base = (baseline or {}).get('routes', {}).get(route)
+        if base and base['p99_ms']:
+            line += f"{(r['p99_ms'] / base['p99_ms'] - 1) * 100:>+12.1f}%"
+        print(line)
+    sent = sum(r['requests'] for r in result['routes'].values())
+    if result['late_sends'] > sent * 0.01 or result['backlog_at_end'] > config['concurrency']:
+        print(f"WARNING: {result['late_sends']} sends left >100 ms late and {result['backlog_at_end']} "
+              f"were still queued - raise --concurrency (the generator, not only the server, saturated)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='ESP32 fleet load simulator')
+    parser.add_argument('--url', default='http://127.0.0.1:5000')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--duration', type=float, default=60.0, help='measured seconds')
+    parser.add_argument('--warmup', type=float, default=10.0, help='unmeasured seconds before')
+    parser.add_argument('--speedup', type=float, default=1.0, help='divide every period by this')
+    parser.add_argument('--concurrency', type=int, default=64, help='client threads')
+    parser.add_argument('--timeout', type=float, default=30.0)
+
+    parser.add_argument('--sensors', type=int, default=200)
+    parser.add_argument('--sensor-period', type=float, default=20.0)
+    parser.add_argument('--bins', type=int, default=100)
+    parser.add_argument('--bin-period', type=float, default=60.0)
+    parser.add_argument('--weather-stations', type=int, default=10)
+    parser.add_argument('--weather-period', type=float, default=300.0)
+    parser.add_argument('--actuators', type=int, default=200, help='controllers polling relay state')
+    parser.add_argument('--actuator-period', type=float, default=5.0)
+    parser.add_argument('--dashboards', type=int, default=20)
+    parser.add_argument('--dashboard-period', type=float, default=5.0)
+    parser.add_argument('--refresh-period', type=float, default=1500.0, help='access token refresh')
+    parser.add_argument('--users', type=int, default=10, help='distinct dashboard accounts')
+    parser.add_argument('--password', default='fleet-sim-password')
+
+    parser.add_argument('--output', help='write results as JSON')
+    parser.add_argument('--compare', help='baseline JSON from an earlier run')
+    args = parser.parse_args()
+
+    result = run(args)
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if baseline.get('config', {}).get('seed') != args.seed:
+            print("note: baseline used a different seed", file=sys.stderr)
+    print_report(result, baseline)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
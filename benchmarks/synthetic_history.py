@@ -0,0 +1,564 @@
+"""
+Synthetic History Generator
+Learns per-field levels, diurnal cycles and noise from a ThingSpeak
+feeds.csv export and bulk-loads months of synthetic sensor_logs,
+sensor_data, trash_bin_logs, device_logs and weather_logs rows
+
+Feed fields: field1 air_temp, field2 humidity, field3 leaf_temp,
+field5 light_lux, field6/field7 pump/light relay state. A field the feed
+does not cover (or that is constant, e.g. an unplugged leaf probe) falls
+back to a physical prior. Hourly diurnal profiles are learned only when the
+feed spans at least a day; shorter feeds anchor the prior cycle on the
+observed level at the observed time of day.
+
+Work is split into one-day time slices processed by parallel worker
+processes, each writing multi-row INSERTs or LOAD DATA LOCAL INFILE batches.
+Only columns that exist in the target table are written, so the
+/api/*/init and api.py variants of a table both load.
+
+Usage:
+    python benchmarks/synthetic_history.py --fit feeds.csv --save-model model.json
+    python benchmarks/synthetic_history.py --plots 100 --months 12 --workers 8 --method load
+    python benchmarks/synthetic_history.py --plots 10 --months 1 --out-dir /tmp/history
+"""
+
+import argparse
+import csv
+import json
+import math
+import multiprocessing
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from operator import itemgetter
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+FEED_FIELDS = {
+    'field1': 'air_temp',
+    'field2': 'humidity',
+    'field3': 'leaf_temp',
+    'field5': 'light_lux',
+}
+FEED_SWITCHES = {
+    'field6': 'pump',
+    'field7': 'light',
+}
+
+# level, diurnal amplitude and peak hour, residual std and lag-1
+# autocorrelation at 20 s, hard bounds, decimals
+PRIORS = {
+    'air_temp': {'level': 29.0, 'amp': 5.0, 'peak': 14.0, 'std': 0.3, 'phi': 0.98,
+                 'bounds': [-10, 60], 'decimals': 1},
+    'humidity': {'level': 70.0, 'amp': -15.0, 'peak': 14.0, 'std': 1.0, 'phi': 0.95,
+                 'bounds': [5, 100], 'decimals': 1},
+    # Offset from air_temp: leaves run cooler than air unless water stressed
+    'leaf_temp': {'level': -1.0, 'amp': 1.5, 'peak': 13.0, 'std': 0.3, 'phi': 0.97,
+                  'bounds': [-10, 60], 'decimals': 1},
+    # Daylight bell between 06:00 and 18:00 on top of a night floor
+    'light_lux': {'level': 100.0, 'amp': 45000.0, 'peak': 12.0, 'std': 0.25, 'phi': 0.99,
+                  'bounds': [0, 120000], 'decimals': 0},
+    'water_level': {'level': 15.0, 'amp': 0.0, 'peak': 0.0, 'std': 0.2, 'phi': 0.999,
+                    'bounds': [0, 100], 'decimals': 2},
+    'soil_moisture': {'level': 45.0, 'amp': -5.0, 'peak': 15.0, 'std': 0.5, 'phi': 0.999,
+                      'bounds': [0, 100], 'decimals': 2},
+}
+SWITCH_PRIORS = {
+    'pump': {'duty': 0.2, 'mean_run_s': 900.0},
+    'light': {'duty': 0.35, 'mean_run_s': 14400.0},
+}
+
+DEFAULT_INTERVAL = 20.0
+SWITCH_DEVICES = (('pump', 'Water Pump'), ('light', 'Grow Light'))
+WEATHER_CONDITIONS = ('Clear', 'Partly Cloudy', 'Cloudy', 'Rain')
+
+
+# ==================== MODEL ====================
+
+def _decimals(text):
+    return len(text.split('.', 1)[1]) if '.' in text else 0
+
+
+def _lag1(values):
+    """Lag-1 autocorrelation"""
+    if len(values) < 3:
+        return 0.0
+    mean = statistics.fmean(values)
+    num = sum((a - mean) * (b - mean) for a, b in zip(values, values[1:]))
+    den = sum((v - mean) ** 2 for v in values)
+    return num / den if den else 0.0
+
+
+def diurnal(channel, name, hour):
+    """Deterministic part of a channel at local hour of day"""
+    profile = channel.get('profile')
+    if profile:
+        i = int(hour) % 24
+        frac = hour - int(hour)
+        return profile[i] * (1 - frac) + profile[(i + 1) % 24] * frac
+    if name == 'light_lux':
+        sun = math.sin(math.pi * (hour - 6.0) / 12.0)
+        return channel['level'] + (channel['amp'] * sun ** 1.5 if sun > 0 else 0.0)
+    return channel['level'] + channel['amp'] * math.cos(2 * math.pi * (hour - channel['peak']) / 24.0)
+
+
+def fit(path):
+    """Learn a model from a feeds.csv export"""
+    with open(path, newline='') as f:
+        rows = list(csv.DictReader(f))
+    times = [datetime.fromisoformat(r['created_at']) for r in rows]
+    gaps = [(b - a).total_seconds() for a, b in zip(times, times[1:]) if b > a]
+    interval = statistics.median(gaps) if gaps else DEFAULT_INTERVAL
+    span_hours = (times[-1] - times[0]).total_seconds() / 3600 if times else 0.0
+
+    model = {'source': os.path.basename(path), 'interval': interval, 'rows': len(rows),
+             'span_hours': round(span_hours, 2), 'channels': {}, 'switches': {}}
+
+    for field, name in FEED_FIELDS.items():
+        channel = dict(PRIORS[name], source='prior')
+        samples = []
+        for r, t in zip(rows, times):
+            text = (r.get(field) or '').strip()
+            if text and text.lower() != 'nan':
+                value = float(text)
+                if name == 'leaf_temp':
+                    # Modelled as an offset from air temperature
+                    air = (r.get('field1') or '').strip()
+                    if not air or air.lower() == 'nan' or value == 0:
+                        continue
+                    value -= float(air)
+                samples.append((t.hour + t.minute / 60 + t.second / 3600, value, text))
+        values = [v for _, v, _ in samples]
+        if len(values) < 10 or statistics.pstdev(values) == 0:
+            model['channels'][name] = channel
+            continue
+
+        channel['source'] = 'fit'
+        channel['decimals'] = max(_decimals(t) for _, _, t in samples)
+        if span_hours >= 24:
+            buckets = [[] for _ in range(24)]
+            for hour, v, _ in samples:
+                buckets[int(hour)].append(v)
+            overall = statistics.fmean(values)
+            channel['profile'] = [statistics.fmean(b) if b else overall for b in buckets]
+        elif name == 'light_lux':
+            # Floor from the typical (night/indoor) reading, peak at least the observed max
+            channel['level'] = statistics.median(values)
+            channel['amp'] = max(PRIORS[name]['amp'], max(values) - channel['level'])
+        else:
+            # Anchor the prior cycle so it passes through the observed mean
+            # at the observed time of day
+            mean_hour = statistics.fmean(h for h, _, _ in samples)
+            offset = channel['amp'] * math.cos(2 * math.pi * (mean_hour - channel['peak']) / 24.0)
+            channel['level'] = statistics.fmean(values) - offset
+
+        residuals = [v - diurnal(channel, name, h) for h, v, _ in samples]
+        if name == 'light_lux':
+            # Clouds scale daylight: keep noise multiplicative, prior std
+            channel['phi'] = PRIORS[name]['phi']
+        else:
+            channel['std'] = max(statistics.pstdev(residuals), 10 ** -channel['decimals'])
+            phi = max(0.0, min(0.999, _lag1(residuals)))
+            # Normalize to the 20 s reference step
+            channel['phi'] = phi ** (DEFAULT_INTERVAL / interval) if phi else 0.0
+        model['channels'][name] = channel
+
+    for name in PRIORS:
+        model['channels'].setdefault(name, dict(PRIORS[name], source='prior'))
+
+    for field, name in FEED_SWITCHES.items():
+        states = [r.get(field, '').strip() for r in rows]
+        states = [int(float(s)) for s in states if s and s.lower() != 'nan']
+        switch = dict(SWITCH_PRIORS[name], source='prior')
+        transitions = sum(1 for a, b in zip(states, states[1:]) if a != b)
+        if len(states) >= 10 and transitions:
+            switch = {'duty': statistics.fmean(states),
+                      'mean_run_s': len(states) * interval / (transitions + 1),
+                      'source': 'fit'}
+        model['switches'][name] = switch
+    return model
+
+
+# ==================== STREAMS ====================
+
+class ChannelStream:
+    """AR(1) residual around a diurnal base for one sensor on one plot"""
+
+    def __init__(self, name, channel, step, rng, plot_offset=0.0):
+        self.gauss = rng.gauss
+        self.phi = channel['phi'] ** (step / DEFAULT_INTERVAL) if channel['phi'] else 0.0
+        self.sigma = channel['std'] * math.sqrt(max(0.0, 1 - self.phi ** 2))
+        self.state = rng.gauss(0, channel['std'])
+        self.offset = plot_offset
+        self.lo, self.hi = channel['bounds']
+        self.decimals = channel['decimals']
+        if name == 'light_lux':
+            self.next = self._next_scaled
+
+    def next(self, base):
+        """Next reading given the diurnal base (plus e.g. air temp for leaf offsets)"""
+        state = self.state = self.phi * self.state + self.gauss(0, self.sigma)
+        value = base + self.offset + state
+        return round(self.lo if value < self.lo else self.hi if value > self.hi else value, self.decimals)
+
+    def _next_scaled(self, base):
+        # Cloud cover scales daylight instead of adding to it
+        state = self.state = self.phi * self.state + self.gauss(0, self.sigma)
+        value = base * (1.0 + state if state > -0.95 else 0.05)
+        return round(self.lo if value < self.lo else self.hi if value > self.hi else value, self.decimals)
+
+
+def diurnal_table(model, names, hours):
+    """Diurnal base of each channel at each step of a slice (same for every plot)"""
+    return {name: [diurnal(model['channels'][name], name, h) for h in hours] for name in names}
+
+
+class SwitchStream:
+    """Two-state Markov chain with learned duty cycle and mean ON run"""
+
+    def __init__(self, switch, step, rng):
+        self.rng = rng
+        mean_on = max(step, switch['mean_run_s'])
+        duty = min(0.95, max(0.05, switch['duty']))
+        mean_off = mean_on * (1 - duty) / duty
+        self.p_off = min(1.0, step / mean_on)
+        self.p_on = min(1.0, step / mean_off)
+        self.on = rng.random() < duty
+
+    def next(self):
+        """Return the new state if it changed, else None"""
+        if self.rng.random() < (self.p_off if self.on else self.p_on):
+            self.on = not self.on
+            return self.on
+        return None
+
+
+def cwsi(air, leaf):
+    """Crop water stress index from the canopy-air temperature difference"""
+    return round(min(1.0, max(0.0, ((leaf - air) + 2.0) / 7.0)), 3)
+
+
+def _hour(ts):
+    return ts.hour + ts.minute / 60.0 + ts.second / 3600.0
+
+
+def _fmt(ts):
+    return ts.strftime('%Y-%m-%d %H:%M:%S')
+
+
+# Logical columns per table; '@time' maps to created_at or timestamp
+TABLE_COLUMNS = {
+    'sensor_logs': ('plot_id', '@time', 'air_temp', 'humidity', 'light_lux', 'leaf_temp',
+                    'water_level', 'cwsi_value', 'soil_moisture'),
+    'sensor_data': ('device_id', 'temperature_air', 'temperature_leaf', 'humidity', 'water_level',
+                    'light_lux', 'soil_moisture', '@time'),
+    'trash_bin_logs': ('bin_id', 'distance_cm', '@time'),
+    'device_logs': ('device_id', 'device_name', 'action', 'source', 'old_value', 'new_value', '@time'),
+    'weather_logs': ('location', 'latitude', 'longitude', 'temperature', 'humidity', 'wind_speed',
+                     'rainfall', 'weather_condition', '@time'),
+}
+
+
+def _plot_rng(seed, table, plot, day):
+    return random.Random(f"{seed}:{table}:{plot}:{day}")
+
+
+def _plot_offsets(seed, plot, model):
+    """Stable per-plot microclimate shift (same on every day slice)"""
+    rng = random.Random(f"{seed}:plot:{plot}")
+    return {name: rng.gauss(0, ch['std'] * 2) if name != 'light_lux' else 0.0
+            for name, ch in model['channels'].items()}
+
+
+def _time_steps(day_start, step):
+    for i in range(int(86400 // step)):
+        yield day_start + timedelta(seconds=i * step)
+
+
+def gen_climate_rows(model, args, table, plots, day_start, day):
+    """sensor_logs / sensor_data: all plots, time-major within the slice"""
+    step = args.sensor_interval if table == 'sensor_logs' else args.sensor_data_interval
+    streams = []
+    for plot in plots:
+        rng = _plot_rng(args.seed, table, plot, day)
+        offsets = _plot_offsets(args.seed, plot, model)
+        streams.append((plot, {name: ChannelStream(name, ch, step, rng, offsets[name])
+                               for name, ch in model['channels'].items()}))
+    steps = list(_time_steps(day_start, step))
+    stamps = [_fmt(ts) for ts in steps]
+    base = diurnal_table(model, model['channels'], [_hour(ts) for ts in steps])
+    air_b, leaf_b, hum_b = base['air_temp'], base['leaf_temp'], base['humidity']
+    lux_b, water_b, soil_b = base['light_lux'], base['water_level'], base['soil_moisture']
+    streams = [(plot, s['air_temp'].next, s['leaf_temp'].next, s['humidity'].next,
+                s['light_lux'].next, s['water_level'].next, s['soil_moisture'].next)
+               for plot, s in streams]
+    sensor_logs = table == 'sensor_logs'
+    for i, stamp in enumerate(stamps):
+        for plot, air_n, leaf_n, hum_n, lux_n, water_n, soil_n in streams:
+            air = air_n(air_b[i])
+            leaf = leaf_n(leaf_b[i] + air)
+            humidity = hum_n(hum_b[i])
+            lux = lux_n(lux_b[i])
+            water = water_n(water_b[i])
+            soil = soil_n(soil_b[i])
+            if sensor_logs:
+                yield (plot, stamp, air, humidity, lux, leaf, water, cwsi(air, leaf), soil)
+            else:
+                yield (plot, air, leaf, humidity, water, lux, soil, stamp)
+
+
+def gen_bin_rows(model, args, table, plots, day_start, day):
+    """Distance to garbage falls as the bin fills, jumps back when emptied"""
+    bins = []
+    for plot in plots:
+        for b in range(args.bins_per_plot):
+            rng = _plot_rng(args.seed, table, (plot, b), day)
+            bins.append((f"BIN{plot:04d}{b:02d}", rng, rng.uniform(5, 60),
+                         rng.uniform(0.2, 1.5) / 3600 * args.bin_interval))
+    state = [b[2] for b in bins]
+    for ts in _time_steps(day_start, args.bin_interval):
+        stamp = _fmt(ts)
+        for i, (bin_id, rng, _, fill_per_step) in enumerate(bins):
+            state[i] -= fill_per_step * rng.uniform(0.5, 1.5)
+            if state[i] < 5:
+                state[i] = rng.uniform(55, 60)
+            yield (bin_id, round(state[i] + rng.gauss(0, 0.3), 1), stamp)
+
+
+def gen_device_rows(model, args, table, plots, day_start, day):
+    """One row per relay state change"""
+    step = model['interval']
+    switches = []
+    for plot in plots:
+        rng = _plot_rng(args.seed, table, plot, day)
+        for k, (kind, device_name) in enumerate(SWITCH_DEVICES):
+            switches.append((plot * len(SWITCH_DEVICES) + k + 1, device_name,
+                             SwitchStream(model['switches'][kind], step, rng), rng))
+    for ts in _time_steps(day_start, step):
+        for device_id, device_name, stream, rng in switches:
+            changed = stream.next()
+            if changed is not None:
+                new, old = ('ON', 'OFF') if changed else ('OFF', 'ON')
+                source = 'AUTO' if rng.random() < 0.8 else 'APP'
+                yield (device_id, device_name, new, source, old, new, _fmt(ts))
+
+
+def gen_weather_rows(model, args, table, plots, day_start, day):
+    """One station per --plots-per-station plots, smoother than the plot sensors"""
+    stations = sorted({plot // args.plots_per_station for plot in plots})
+    streams = []
+    for station in stations:
+        rng = _plot_rng(args.seed, table, station, day)
+        offsets = _plot_offsets(args.seed, -1 - station, model)
+        streams.append((station, rng,
+                        ChannelStream('air_temp', model['channels']['air_temp'], args.weather_interval,
+                                      rng, offsets['air_temp']),
+                        ChannelStream('humidity', model['channels']['humidity'], args.weather_interval,
+                                      rng, offsets['humidity']),
+                        [rng.random() < 0.2]))
+    steps = list(_time_steps(day_start, args.weather_interval))
+    base = diurnal_table(model, ('air_temp', 'humidity'), [_hour(ts) for ts in steps])
+    for i, ts in enumerate(steps):
+        for station, rng, temp, hum, raining in streams:
+            if rng.random() < 0.02:
+                raining[0] = not raining[0]
+            rain = round(rng.expovariate(1 / 2.0), 1) if raining[0] else 0.0
+            condition = 'Rain' if rain else WEATHER_CONDITIONS[min(2, int(rng.random() * 3))]
+            yield (f"Station {station:03d}", round(13.0 + (station % 50) * 0.02, 8),
+                   round(100.0 + (station // 50) * 0.02, 8), temp.next(base['air_temp'][i]),
+                   hum.next(base['humidity'][i]),
+                   round(abs(rng.gauss(3, 2)), 2), rain, condition, _fmt(ts))
+
+
+GENERATORS = {
+    'sensor_logs': gen_climate_rows,
+    'sensor_data': gen_climate_rows,
+    'trash_bin_logs': gen_bin_rows,
+    'device_logs': gen_device_rows,
+    'weather_logs': gen_weather_rows,
+}
+
+
+def rows_per_day(args, table, model):
+    """Estimate (exact except device_logs, which depends on the switch rates)"""
+    if table == 'sensor_logs':
+        return args.plots * 86400 / args.sensor_interval
+    if table == 'sensor_data':
+        return args.plots * 86400 / args.sensor_data_interval
+    if table == 'trash_bin_logs':
+        return args.plots * args.bins_per_plot * 86400 / args.bin_interval
+    if table == 'weather_logs':
+        return math.ceil(args.plots / args.plots_per_station) * 86400 / args.weather_interval
+    runs = sum(86400 / max(model['interval'], model['switches'][kind]['mean_run_s'])
+               / model['switches'][kind]['duty'] for kind, _ in SWITCH_DEVICES)
+    return args.plots * runs
+
+
+# ==================== WRITERS ====================
+
+def db_config(load):
+    import production_config
+    config = {k: v for k, v in production_config.DB_CONFIG.items() if k not in ('pool_size', 'pool_name')}
+    config['autocommit'] = False
+    if load:
+        config['allow_local_infile'] = True
+    return config
+
+
+def target_columns(cursor, table):
+    """Logical column positions and real names present in the table"""
+    cursor.execute(f"SHOW COLUMNS FROM {table}")
+    existing = {row[0] for row in cursor.fetchall()}
+    time_column = 'created_at' if 'created_at' in existing else 'timestamp'
+    positions, names = [], []
+    for i, column in enumerate(TABLE_COLUMNS[table]):
+        real = time_column if column == '@time' else column
+        if real in existing:
+            positions.append(i)
+            names.append(real)
+    return positions, names
+
+
+def run_slice(task):
+    """Worker: generate and write one (table, day) slice"""
+    table, day, args_dict, model, columns = task
+    args = argparse.Namespace(**args_dict)
+    day_start = datetime.fromisoformat(args.start) + timedelta(days=day)
+    rows = GENERATORS[table](model, args, table, range(args.plots), day_start, day)
+    positions, names = columns
+    pick = itemgetter(*positions)
+
+    written = 0
+    if args.out_dir:
+        path = os.path.join(args.out_dir, f"{table}.{day:05d}.tsv")
+        with open(path, 'w') as f:
+            for row in rows:
+                f.write('\t'.join(map(str, pick(row))) + '\n')
+                written += 1
+        return table, written
+
+    import mysql.connector
+    conn = mysql.connector.connect(**db_config(args.method == 'load'))
+    cursor = conn.cursor()
+    cursor.execute("SET SESSION unique_checks = 0, foreign_key_checks = 0")
+    column_list = ', '.join(f"`{n}`" for n in names)
+
+    def batches():
+        batch = []
+        for row in rows:
+            batch.append(pick(row))
+            if len(batch) >= args.batch:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    for batch in batches():
+        if args.method == 'load':
+            with tempfile.NamedTemporaryFile('w', suffix='.tsv', delete=False) as f:
+                for row in batch:
+                    f.write('\t'.join(map(str, row)) + '\n')
+            try:
+                cursor.execute(f"LOAD DATA LOCAL INFILE %s INTO TABLE {table} ({column_list})",
+                               (f.name,))
+            finally:
+                os.unlink(f.name)
+        else:
+            # mysql.connector rewrites executemany INSERTs into one multi-row statement
+            placeholders = ', '.join(['%s'] * len(names))
+            cursor.executemany(f"INSERT INTO {table} ({column_list}) VALUES ({placeholders})", batch)
+        conn.commit()
+        written += len(batch)
+    cursor.close()
+    conn.close()
+    return table, written
+
+
+# ==================== MAIN ====================
+
+def main():
+    parser = argparse.ArgumentParser(description='Synthetic sensor history generator')
+    parser.add_argument('--fit', default=os.path.join(ROOT, 'feeds.csv'), help='feeds.csv to learn from')
+    parser.add_argument('--model', help='load a saved model instead of fitting')
+    parser.add_argument('--save-model', help='write the fitted model as JSON and exit')
+    parser.add_argument('--tables', nargs='+', default=list(TABLE_COLUMNS), choices=list(TABLE_COLUMNS))
+    parser.add_argument('--plots', type=int, default=10)
+    parser.add_argument('--months', type=float, default=1.0)
+    parser.add_argument('--start', help='first day (YYYY-MM-DD), default: ends today')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--sensor-interval', type=float, help='sensor_logs step (default: feed interval)')
+    parser.add_argument('--sensor-data-interval', type=float, default=60.0)
+    parser.add_argument('--bins-per-plot', type=int, default=1)
+    parser.add_argument('--bin-interval', type=float, default=60.0)
+    parser.add_argument('--plots-per-station', type=int, default=10)
+    parser.add_argument('--weather-interval', type=float, default=600.0)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--method', choices=('insert', 'load'), default='insert')
+    parser.add_argument('--batch', type=int, default=5000, help='rows per statement / file')
+    parser.add_argument('--out-dir', help='write TSV files instead of loading the database')
+    args = parser.parse_args()
+
+    if args.model:
+        with open(args.model) as f:
+            model = json.load(f)
+    else:
+        model = fit(args.fit)
+    if args.save_model:
+        with open(args.save_model, 'w') as f:
+            json.dump(model, f, indent=2)
+        print(f"model written to {args.save_model}")
+        return
+
+    days = max(1, int(round(args.months * 30)))
+    if args.start is None:
+        args.start = (datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+                      - timedelta(days=days)).isoformat()
+    args.sensor_interval = args.sensor_interval or model['interval']
+
+    fitted = [n for n, ch in model['channels'].items() if ch['source'] == 'fit']
+    print(f"model: {model.get('source', '-')} ({model.get('span_hours', 0)} h, {model['interval']:g} s step), "
+          f"fitted {', '.join(fitted) or 'nothing'}, priors for the rest")
+    estimate = {t: int(rows_per_day(args, t, model) * days) for t in args.tables}
+    for table in args.tables:
+        print(f"  {table:<16}~{estimate[table]:>14,} rows")
+    print(f"{args.plots} plots x {days} days from {args.start[:10]}, {args.workers} workers, "
+          f"{'TSV to ' + args.out_dir if args.out_dir else args.method}")
+
+    if args.out_dir:
+        os.makedirs(args.out_dir, exist_ok=True)
+        columns = {t: (list(range(len(TABLE_COLUMNS[t]))), None) for t in args.tables}
+    else:
+        import mysql.connector
+        conn = mysql.connector.connect(**db_config(False))
+        cursor = conn.cursor()
+        columns = {t: target_columns(cursor, t) for t in args.tables}
+        cursor.close()
+        conn.close()
+
+    # Day-major order keeps auto-increment ids close to time order
+    tasks = [(table, day, vars(args), model, columns[table])
+             for day in range(days) for table in args.tables]
+    totals = {t: 0 for t in args.tables}
+    start = time.perf_counter()
+    with multiprocessing.Pool(args.workers) as pool:
+        for done, (table, written) in enumerate(pool.imap_unordered(run_slice, tasks), 1):
+            totals[table] += written
+            if done % max(1, len(tasks) // 20) == 0 or done == len(tasks):
+                rows = sum(totals.values())
+                elapsed = time.perf_counter() - start
+                print(f"  {done}/{len(tasks)} slices, {rows:,} rows, {rows / elapsed:,.0f} rows/s", flush=True)
+
+    elapsed = time.perf_counter() - start
+    for table, written in totals.items():
+        print(f"  {table:<16}{written:>14,} rows")
+    print(f"{sum(totals.values()):,} rows in {elapsed:.1f}s ({sum(totals.values()) / elapsed:,.0f} rows/s)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,451 @@
+"""
+Trash Bin Fill Forecast for Smart Farm
+Keeps an online estimate of each bin's fill rate in bin_fill_state and
+predicts when it reaches full, so /api/bin-data/forecast ranks thousands
+of bins with one index range scan instead of re-reading trash_bin_logs
+
+Per bin the state is O(1): the sums of an exponentially weighted linear
+regression of distance_cm on time (half-life HALF_LIFE_HOURS), kept with
+the time axis centred on the latest reading so the sums stay small. Every
+reading updates them in the ingest transaction (the same for replicated
+batches); the sensor measures the gap to the lid, so a filling bin has a
+negative slope and is full at FULL_DISTANCE_CM.
+
+The state is written on every reading rather than buffered and flushed
+periodically: readings of one bin reach several API worker processes and
+the async server, and a per-process buffer would split its regression
+between them (and lose it on restart). The cost is one primary-key row
+lock and two small statements per reading.
+
+A reading at least EMPTY_JUMP_CM above the previous one is held as a
+candidate empty event; the next reading confirms it (the regression
+restarts from the candidate) or discards it as an ultrasonic glitch.
+Readings older than the state are ignored (late replays).
+
+The state also holds each bin's latest reading, so the fleet map
+(/api/bin-data/latest) is one scan of bin_fill_state. Bins with history
+from before the table existed appear after --rebuild.
+
+Usage:
+    python bin_forecast.py                  # bins closest to full
+    python bin_forecast.py --within 24      # full within a day
+    python bin_forecast.py --rebuild        # recompute the state from trash_bin_logs
+"""
+
+import argparse
+import logging
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import database
+import schema
+
+logger = logging.getLogger(__name__)
+
+FULL_DISTANCE_CM = 5.0
+EMPTY_JUMP_CM = 15.0
+DEPTH_CM = 100.0
+HALF_LIFE_HOURS = 24.0
+
+# Fewer readings since the last empty event give no prediction
+MIN_READINGS = 3
+# Nor do readings whose times spread (weighted standard deviation) less
+# than this: a few centimetres of sensor noise over seconds is a huge slope
+MIN_SPREAD_HOURS = 0.25
+# Predictions further out than this are reported as not filling
+MAX_HORIZON_HOURS = 24 * 365
+
+STATE_COLUMNS = ('bin_id', 'last_at', 'last_distance_cm', 'readings', 'sum_w', 'sum_x', 'sum_y',
+                 'sum_xx', 'sum_xy', 'pending_at', 'pending_distance_cm', 'emptied_at',
+                 'fill_rate_cm_per_hour', 'predicted_full_at')
+
+SELECT_STATE = f"SELECT {', '.join(STATE_COLUMNS)} FROM bin_fill_state WHERE bin_id = %s"
+
+# Creates a new bin's row (readings = 0 marks it unset) or locks the
+# existing one: a locking read of a missing row would take a gap lock on
+# MySQL, and two batches inserting into the same gap deadlock
+SEED_STATE = '''
+    INSERT INTO bin_fill_state (bin_id, last_at, last_distance_cm, readings) VALUES (%s, %s, %s, 0)
+    ON DUPLICATE KEY UPDATE bin_id = bin_id
+'''
+
+UPSERT_STATE = f'''
+    INSERT INTO bin_fill_state ({', '.join(STATE_COLUMNS)}, updated_at)
+    VALUES ({', '.join(['%s'] * len(STATE_COLUMNS))}, NOW())
+    ON DUPLICATE KEY UPDATE
+    {', '.join(f'{c} = VALUES({c})' for c in STATE_COLUMNS[1:])}, updated_at = VALUES(updated_at)
+'''
+
+RANKED = '''
+    SELECT bin_id, last_at, last_distance_cm, readings, emptied_at,
+           fill_rate_cm_per_hour, predicted_full_at
+    FROM bin_fill_state
+    WHERE predicted_full_at IS NOT NULL AND predicted_full_at < %s
+    ORDER BY predicted_full_at ASC
+    LIMIT %s
+'''
+
+FLEET = '''
+    SELECT bin_id, last_at, last_distance_cm, pending_at, pending_distance_cm,
+           fill_rate_cm_per_hour, predicted_full_at
+    FROM bin_fill_state
+    ORDER BY bin_id
+'''
+
+_SUMS = ('sum_w', 'sum_x', 'sum_y', 'sum_xx', 'sum_xy')
+
+
+def configure(full_distance_cm: float = 5.0, empty_jump_cm: float = 15.0, half_life_hours: float = 24.0,
+              depth_cm: float = 100.0):
+    """Set the full threshold, the empty-event jump, the regression half-life and the empty-bin distance"""
+    global FULL_DISTANCE_CM, EMPTY_JUMP_CM, HALF_LIFE_HOURS, DEPTH_CM
+    FULL_DISTANCE_CM = full_distance_cm
+    EMPTY_JUMP_CM = empty_jump_cm
+    HALF_LIFE_HOURS = half_life_hours
+    DEPTH_CM = depth_cm
+
+
+def reading_time(timestamp) -> datetime:
+    """Time of a reading: the device timestamp if it parses, otherwise now"""
+    if isinstance(timestamp, datetime):
+        return timestamp
+    if timestamp:
+        try:
+            return datetime.fromisoformat(str(timestamp)).replace(tzinfo=None)
+        except ValueError:
+            pass
+    return datetime.now()
+
+
+def _hours(delta: timedelta) -> float:
+    return delta.total_seconds() / 3600.0
+
+
+def _as_datetime(value):
+    # SQLite returns DATETIME columns as text
+    return datetime.fromisoformat(value) if isinstance(value, str) else value
+
+
+def _add(state: Dict, x: float, y: float, weight: float = 1.0):
+    state['sum_w'] += weight
+    state['sum_x'] += weight * x
+    state['sum_y'] += weight * y
+    state['sum_xx'] += weight * x * x
+    state['sum_xy'] += weight * x * y
+
+
+def _restart(state: Dict):
+    for name in _SUMS:
+        state[name] = 0.0
+    state['readings'] = 0
+
+
+def _predict(state: Dict):
+    """Fill rate and predicted full time from the regression (origin = last_at)"""
+    state['fill_rate_cm_per_hour'] = None
+    state['predicted_full_at'] = None
+    if float(state['last_distance_cm']) <= FULL_DISTANCE_CM:
+        state['predicted_full_at'] = state['last_at']
+    w, sx, sy, sxx, sxy = (state[name] for name in _SUMS)
+    denominator = w * sxx - sx * sx
+    if state['readings'] < MIN_READINGS or w <= 0 or denominator <= 1e-9 * max(w * sxx, 1.0):
+        return
+    if denominator < (MIN_SPREAD_HOURS * w) ** 2:
+        return
+    slope = (w * sxy - sx * sy) / denominator
+    now_cm = (sy - slope * sx) / w
+    state['fill_rate_cm_per_hour'] = round(-slope, 4)
+    if state['predicted_full_at'] is not None:
+        return
+    if now_cm <= FULL_DISTANCE_CM:
+        state['predicted_full_at'] = state['last_at']
+    elif slope < 0:
+        hours = (FULL_DISTANCE_CM - now_cm) / slope
+        if hours <= MAX_HORIZON_HOURS:
+            state['predicted_full_at'] = state['last_at'] + timedelta(hours=hours)
+
+
+def advance(state: Optional[Dict], bin_id: str, at: datetime, distance_cm) -> Optional[Dict]:
+    """
+    State after one reading (the input is not modified)
+
+    Returns:
+        New state, or None when the reading is not newer than the state
+    """
+    y = float(distance_cm)
+    if state is None:
+        state = {'bin_id': bin_id, 'pending_at': None, 'pending_distance_cm': None, 'emptied_at': None}
+        _restart(state)
+    else:
+        state = dict(state)
+        for name in ('last_at', 'pending_at', 'emptied_at'):
+            state[name] = _as_datetime(state[name])
+        latest = max(t for t in (state['last_at'], state['pending_at']) if t is not None)
+        if at <= latest:
+            return None
+        for name in _SUMS:
+            state[name] = float(state[name] or 0.0)
+
+        last_cm = float(state['last_distance_cm'])
+        pending_at, pending_cm = state['pending_at'], state['pending_distance_cm']
+        if pending_at is None and y - last_cm >= EMPTY_JUMP_CM:
+            # Candidate empty event: hold it until the next reading
+            state['pending_at'], state['pending_distance_cm'] = at, y
+            return state
+
+        # Move the origin from last_at to at, then decay every earlier reading
+        dt = _hours(at - state['last_at'])
+        w, sx, sy = state['sum_w'], state['sum_x'], state['sum_y']
+        state['sum_xx'] += -2 * dt * sx + dt * dt * w
+        state['sum_xy'] -= dt * sy
+        state['sum_x'] -= dt * w
+        decay = 0.5 ** (dt / HALF_LIFE_HOURS)
+        for name in _SUMS:
+            state[name] *= decay
+
+        if pending_at is not None:
+            state['pending_at'] = state['pending_distance_cm'] = None
+            if y - last_cm >= EMPTY_JUMP_CM:
+                # Confirmed: the bin was emptied at pending_at (otherwise a glitch, dropped)
+                _restart(state)
+                age = _hours(at - pending_at)
+                _add(state, -age, float(pending_cm), 0.5 ** (age / HALF_LIFE_HOURS))
+                state['readings'] = 1
+                state['emptied_at'] = pending_at
+
+    _add(state, 0.0, y)
+    state['readings'] += 1
+    state['last_at'] = at
+    state['last_distance_cm'] = y
+    _predict(state)
+    return state
+
+
+# STORAGE
+
+def state_params(state: Dict) -> Tuple:
+    """UPSERT_STATE parameters"""
+    return tuple(state[c] for c in STATE_COLUMNS)
+
+
+def _row_dict(row, columns) -> Dict:
+    return dict(row) if isinstance(row, dict) else dict(zip(columns, row))
+
+
+def _stored_state(row) -> Optional[Dict]:
+    # SEED_STATE rows (readings = 0) hold no state yet
+    state = _row_dict(row, STATE_COLUMNS) if row else None
+    return state if state and state['readings'] else None
+
+
+def observe(cursor, readings: Iterable[Tuple]) -> int:
+    """
+    Fold readings into bin_fill_state (caller commits, in the transaction
+    that stores the readings)
+
+    Bins are locked in bin_id order, so batches covering many bins cannot
+    deadlock each other; rows are created before they are read (SEED_STATE).
+
+    Args:
+        readings: (bin_id, time, distance_cm), in time order per bin
+
+    Returns:
+        Bins whose state changed
+    """
+    by_bin: Dict[str, List] = {}
+    for bin_id, at, distance_cm in readings:
+        by_bin.setdefault(bin_id, []).append((_as_datetime(at), distance_cm))
+    updated = 0
+    for bin_id in sorted(by_bin):
+        first_at, first_cm = by_bin[bin_id][0]
+        cursor.execute(SEED_STATE, (bin_id, first_at, first_cm))
+        cursor.execute(SELECT_STATE + ' FOR UPDATE', (bin_id,))
+        rows = cursor.fetchall()
+        state = original = _stored_state(rows[0] if rows else None)
+        for at, distance_cm in by_bin[bin_id]:
+            state = advance(state, bin_id, at, distance_cm) or state
+        if state is not original:
+            cursor.execute(UPSERT_STATE, state_params(state))
+            updated += 1
+    return updated
+
+
+def update_statement(row, bin_id: str, at, distance_cm) -> Optional[Tuple[str, Tuple]]:
+    """
+    UPSERT_STATE and its parameters for one reading, given the bin's
+    SELECT_STATE row (None for a new bin); None when the reading is older
+    """
+    state = advance(_stored_state(row), bin_id, _as_datetime(at), distance_cm)
+    return (UPSERT_STATE, state_params(state)) if state else None
+
+
+def update_statements(bin_id: str, at, distance_cm) -> List:
+    """
+    observe() for one reading as statements to append to the ingest
+    transaction (async_server has no blocking cursor to pass): seed and
+    lock the row, then a callable building the UPSERT from the locked
+    row's SELECT_STATE result
+    """
+    at = _as_datetime(at)
+
+    def build(rows) -> List[Tuple[str, Tuple]]:
+        update = update_statement(rows[0] if rows else None, bin_id, at, distance_cm)
+        return [update] if update else []
+
+    return [(SEED_STATE, (bin_id, at, distance_cm)), (SELECT_STATE + ' FOR UPDATE', (bin_id,)), build]
+
+
+_warned = False
+
+
+def skip_missing_state(error: Exception):
+    """
+    Warn (once) that bin_fill_state is not installed; re-raise any other
+    error (a deadlock rolls back the whole transaction, so the ingest must
+    fail rather than commit nothing)
+    """
+    global _warned
+    code = getattr(error, 'errno', None) or (error.args[0] if error.args else None)
+    if code != 1146 and 'no such table' not in str(error):
+        raise error
+    if not _warned:
+        logger.warning("bin_fill_state_unavailable error=%s", error)
+        _warned = True
+
+
+def observe_or_warn(cursor, readings: Iterable[Tuple]) -> int:
+    """observe(), skipped with a warning (once) while bin_fill_state is not installed"""
+    try:
+        return observe(cursor, readings)
+    except database.Error as e:
+        skip_missing_state(e)
+        return 0
+
+
+def ranked(cursor, limit: int = 100, within_hours: Optional[float] = None) -> List[Dict]:
+    """
+    Bins by predicted time to full, soonest first (index range scan on
+    predicted_full_at; bins without a prediction are left out)
+
+    Args:
+        within_hours: Only bins predicted full within this many hours
+    """
+    now = datetime.now()
+    until = now + timedelta(hours=within_hours) if within_hours is not None else datetime(9999, 12, 31)
+    cursor.execute(RANKED, (until, limit))
+    columns = [d[0] for d in cursor.description]
+    bins = []
+    for row in cursor.fetchall():
+        row = _row_dict(row, columns)
+        predicted = _as_datetime(row['predicted_full_at'])
+        row['hours_to_full'] = round(max(0.0, _hours(predicted - now)), 2)
+        bins.append(row)
+    return bins
+
+
+def fill_percent(distance_cm) -> float:
+    """Fill level from the lid distance: 0 at DEPTH_CM, 100 at FULL_DISTANCE_CM"""
+    span = max(DEPTH_CM - FULL_DISTANCE_CM, 1e-9)
+    return round(min(100.0, max(0.0, 100.0 * (DEPTH_CM - float(distance_cm)) / span)), 1)
+
+
+def fleet(cursor) -> List[Dict]:
+    """
+    Latest reading of every bin, by bin_id (tuple cursor)
+
+    A held empty-event candidate counts as the latest reading: the map
+    shows what the sensor last reported, the forecast waits for the next.
+    """
+    cursor.execute(FLEET)
+    bins = []
+    for bin_id, last_at, distance_cm, pending_at, pending_cm, rate, predicted in cursor.fetchall():
+        if pending_at is not None:
+            last_at, distance_cm = pending_at, pending_cm
+        bins.append({
+            'bin_id': bin_id,
+            'distance_cm': float(distance_cm),
+            'fill_percent': fill_percent(distance_cm),
+            'last_seen': _as_datetime(last_at),
+            'fill_rate_cm_per_hour': rate,
+            'predicted_full_at': _as_datetime(predicted),
+        })
+    return bins
+
+
+def rebuild(conn, chunk_rows: int = 10000) -> Dict:
+    """
+    Recompute bin_fill_state from trash_bin_logs (one pass in bin and time
+    order, then one transaction replacing the table; commits)
+
+    Readings ingested while it runs may be missing from the result until
+    the bin's next reading.
+
+    Returns:
+        {'bins': n, 'rows': n}
+    """
+    states: Dict[str, Dict] = {}
+    rows = 0
+    cursor = conn.cursor()
+    try:
+        cursor.execute('SELECT bin_id, created_at, distance_cm FROM trash_bin_logs ORDER BY bin_id, created_at')
+        while True:
+            chunk = cursor.fetchmany(chunk_rows)
+            if not chunk:
+                break
+            rows += len(chunk)
+            for bin_id, at, distance_cm in chunk:
+                if distance_cm is not None:
+                    state = states.get(bin_id)
+                    states[bin_id] = advance(state, bin_id, _as_datetime(at), distance_cm) or state
+        cursor.close()
+        conn.commit()
+
+        cursor = conn.cursor()
+        cursor.execute('DELETE FROM bin_fill_state')
+        if states:
+            cursor.executemany(UPSERT_STATE, [state_params(s) for s in states.values()])
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+    return {'bins': len(states), 'rows': rows}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Trash bins by predicted time to full')
+    parser.add_argument('--within', type=float, default=None, help='only bins full within N hours')
+    parser.add_argument('--limit', type=int, default=50)
+    parser.add_argument('--rebuild', action='store_true', help='recompute bin_fill_state from trash_bin_logs')
+    args = parser.parse_args()
+
+    import api_server  # DB_CONFIG and the BIN_* settings
+
+    conn = database.connect(api_server.DB_CONFIG, instrument=False)
+    try:
+        cursor = conn.cursor()
+        schema.create_bin_fill_state(cursor)
+        conn.commit()
+        cursor.close()
+        if args.rebuild:
+            started = time.perf_counter()
+            stats = rebuild(conn)
+            print(f"rebuilt {stats['bins']} bins from {stats['rows']} readings "
+                  f"in {time.perf_counter() - started:.1f}s")
+        cursor = conn.cursor(dictionary=True)
+        bins = ranked(cursor, args.limit, args.within)
+        cursor.close()
+    finally:
+        conn.close()
+    print(f"{'bin':<16}{'distance cm':>12}{'cm/hour':>10}{'full at':>22}{'hours':>9}")
+    for row in bins:
+        rate = row['fill_rate_cm_per_hour']
+        print(f"{row['bin_id']:<16}{float(row['last_distance_cm']):>12.1f}"
+              f"{'' if rate is None else f'{rate:.2f}':>10}{str(row['predicted_full_at'])[:19]:>22}"
+              f"{row['hours_to_full']:>9.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,133 @@
+"""
+Maintained Counters for Smart Farm
+Reads the trigger-maintained row counts in farm_counters (schema.py) and
+reconciles them against COUNT(*) to detect and repair drift
+
+Drift means a write bypassed the triggers (TRUNCATE, triggers dropped,
+restoring a dump without triggers) or the counters were installed on a
+table that already had rows.
+
+Usage:
+    python counters.py                  # report drift, exit 1 if any
+    python counters.py --fix            # add the drift to the counters
+    python counters.py --fix --every 3600
+"""
+
+import argparse
+import logging
+import sys
+import time
+from typing import Dict, Iterable
+
+import database
+import schema
+
+logger = logging.getLogger(__name__)
+
+
+def _predicate_sql(predicate):
+    return predicate.format(row='counted') if predicate else '1 = 1'
+
+
+def read(cursor) -> Dict[str, int]:
+    """
+    Current counter values (one indexed scan of at most counters x shards rows)
+
+    Returns:
+        {counter: value}, missing counters as 0
+    """
+    cursor.execute('SELECT name, SUM(value) FROM farm_counters GROUP BY name')
+    found = {name: int(value or 0) for name, value in cursor.fetchall()}
+    return {name: found.get(name, 0) for name in schema.FARM_COUNTERS}
+
+
+_warned = False
+
+
+def read_or_none(conn):
+    """Counter values, or None when farm_counters is not installed (warns once)"""
+    global _warned
+    cursor = conn.cursor()
+    try:
+        return read(cursor)
+    except database.Error as e:
+        if not _warned:
+            logger.warning("farm_counters_unavailable error=%s", e)
+            _warned = True
+        return None
+    finally:
+        cursor.close()
+
+
+def reconcile(conn, fix: bool = False, names: Iterable[str] = None) -> Dict[str, Dict]:
+    """
+    Compare counters with COUNT(*) in one consistent snapshot
+
+    Counters and rows are read in the same transaction, so writes that
+    commit meanwhile cannot show up as drift. The fix adds the drift as a
+    delta instead of overwriting the value: concurrent trigger updates made
+    after the snapshot stay counted.
+
+    Args:
+        conn: Open connection (committed on return)
+        fix: Correct counters that drifted
+        names: Counters to check (default all; schema.create_farm_counters
+            returns the ones whose table exists)
+
+    Returns:
+        {counter: {'counter': n, 'actual': n, 'drift': actual - counter}}
+    """
+    cursor = conn.cursor()
+    try:
+        cursor.execute('BEGIN')
+        counters = read(cursor)
+        report = {}
+        for name in schema.FARM_COUNTERS if names is None else names:
+            table, _, predicate = schema.FARM_COUNTERS[name]
+            cursor.execute(f'SELECT COUNT(*) FROM {table} AS counted WHERE {_predicate_sql(predicate)}')
+            actual = int(cursor.fetchone()[0])
+            report[name] = {'counter': counters[name], 'actual': actual, 'drift': actual - counters[name]}
+
+        for name, row in report.items():
+            if not row['drift']:
+                continue
+            logger.warning("counter_drift name=%s counter=%d actual=%d fixed=%s",
+                           name, row['counter'], row['actual'], fix)
+            if fix:
+                cursor.execute('''
+                    INSERT INTO farm_counters (name, shard, value) VALUES (%s, 0, %s)
+                    ON DUPLICATE KEY UPDATE value = value + VALUES(value)
+                ''', (name, row['drift']))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Reconcile farm_counters with COUNT(*)')
+    parser.add_argument('--fix', action='store_true', help='correct drifted counters')
+    parser.add_argument('--every', type=float, default=0, help='repeat every N seconds')
+    args = parser.parse_args()
+
+    import api_server  # DB_CONFIG for the configured backend
+
+    while True:
+        conn = database.connect(api_server.DB_CONFIG, instrument=False)
+        try:
+            report = reconcile(conn, fix=args.fix)
+        finally:
+            conn.close()
+        drifted = {name: row for name, row in report.items() if row['drift']}
+        for name, row in report.items():
+            print(f"{name:<24}{row['counter']:>14}{row['actual']:>14}{row['drift']:>+10}")
+        if not args.every:
+            sys.exit(1 if drifted and not args.fix else 0)
+        time.sleep(args.every)
+
+
+if __name__ == '__main__':
+    main()
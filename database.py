@@ -0,0 +1,355 @@
+"""
+Database Access Layer for Smart Farm
+Opens MySQL (or embedded SQLite) connections and instruments every statement
+(query time, rows returned, connection acquisition time, ingest rows per table),
+keeps per-statement totals and logs slow statements with their EXPLAIN plan
+"""
+
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Dict, List
+
+import mysql.connector
+
+import sqlite_backend
+from metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+DB_CONNECT_SECONDS = REGISTRY.histogram(
+    'smartfarm_db_connect_duration_seconds',
+    'Time to acquire a database connection'
+)
+DB_QUERY_SECONDS = REGISTRY.histogram(
+    'smartfarm_db_query_duration_seconds',
+    'Database statement execution time',
+    ('operation', 'table')
+)
+DB_ROWS_RETURNED = REGISTRY.counter(
+    'smartfarm_db_rows_returned_total',
+    'Rows fetched from the database',
+    ('operation', 'table')
+)
+DB_ERRORS = REGISTRY.counter(
+    'smartfarm_db_errors_total',
+    'Database statements that raised',
+    ('operation', 'table')
+)
+INGEST_ROWS = REGISTRY.counter(
+    'smartfarm_ingest_rows_total',
+    'Rows inserted per table (use rate() for rows/sec)',
+    ('table',)
+)
+
+_TABLE_PATTERN = re.compile(r'\b(?:FROM|INTO|UPDATE|TABLE(?:\s+IF\s+NOT\s+EXISTS)?)\s+`?(\w+)', re.IGNORECASE)
+
+# Statements MySQL can EXPLAIN without executing them
+_EXPLAINABLE = {'SELECT', 'INSERT', 'REPLACE', 'UPDATE', 'DELETE', 'WITH'}
+
+MAX_STATEMENTS = 10000
+
+# Raised by connect() and by statements, whichever backend is configured
+Error = (mysql.connector.Error, sqlite3.Error)
+
+# Statements slower than this are logged (None disables the slow query log)
+_slow_query_seconds = 0.2
+_explain_slow = True
+
+
+class StatementStats:
+    """Running totals for one statement shape (whitespace-normalized SQL)"""
+
+    __slots__ = ('sql', 'labels', 'calls', 'total', 'max', 'rows', 'errors', 'slow', 'plan', 'explained')
+
+    def __init__(self, sql: str, labels: tuple):
+        self.sql = sql
+        self.labels = labels
+        self.calls = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.rows = 0
+        self.errors = 0
+        self.slow = 0
+        self.plan = None
+        self.explained = False
+
+    def as_dict(self) -> Dict:
+        return {
+            'sql': self.sql,
+            'operation': self.labels[0],
+            'table': self.labels[1],
+            'calls': self.calls,
+            'total_ms': round(self.total * 1e3, 3),
+            'mean_ms': round(self.total / self.calls * 1e3, 3) if self.calls else 0.0,
+            'max_ms': round(self.max * 1e3, 3),
+            'rows': self.rows,
+            'errors': self.errors,
+            'slow': self.slow,
+            'plan': self.plan,
+        }
+
+
+# SQL text -> StatementStats; statements are literals, so this stays small
+_statements: Dict[str, StatementStats] = {}
+_shapes: Dict[str, StatementStats] = {}
+_stats_lock = threading.Lock()
+
+
+def statement(sql: str) -> StatementStats:
+    """Stats entry for a statement (cached by SQL text, shared per shape)"""
+    entry = _statements.get(sql)
+    if entry is None:
+        shape = ' '.join(sql.split())
+        with _stats_lock:
+            entry = _shapes.get(shape)
+            if entry is None:
+                words = shape.split(None, 1)
+                operation = words[0].upper() if words else 'UNKNOWN'
+                match = _TABLE_PATTERN.search(shape)
+                entry = StatementStats(shape, (operation, match.group(1) if match else ''))
+                if len(_shapes) < MAX_STATEMENTS:
+                    _shapes[shape] = entry
+            if len(_statements) < MAX_STATEMENTS:
+                _statements[sql] = entry
+    return entry
+
+
+def statement_labels(sql: str) -> tuple:
+    """Classify a statement as (operation, table) for metric labels"""
+    return statement(sql).labels
+
+
+def configure_slow_query_log(threshold_ms: float = 200, explain: bool = True):
+    """
+    Set the slow query threshold
+
+    Args:
+        threshold_ms: Log statements slower than this (None or <= 0 disables)
+        explain: Capture the EXPLAIN plan the first time a statement shape is slow
+    """
+    global _slow_query_seconds, _explain_slow
+    _slow_query_seconds = threshold_ms / 1000.0 if threshold_ms and threshold_ms > 0 else None
+    _explain_slow = explain
+
+
+def slow_query_log_enabled() -> bool:
+    """True if statements need timing for the slow query log"""
+    return _slow_query_seconds is not None
+
+
+def observe_statement(entry: StatementStats, seconds: float, failed: bool = False):
+    """Record one execution; returns True if it crossed the slow threshold"""
+    DB_QUERY_SECONDS.observe(seconds, entry.labels)
+    slow = _slow_query_seconds is not None and seconds >= _slow_query_seconds
+    with _stats_lock:
+        entry.calls += 1
+        entry.total += seconds
+        if seconds > entry.max:
+            entry.max = seconds
+        if failed:
+            entry.errors += 1
+        if slow:
+            entry.slow += 1
+    if failed:
+        DB_ERRORS.inc(entry.labels)
+    return slow
+
+
+def observe_rows(entry: StatementStats, count: int):
+    """Record rows fetched by one execution"""
+    DB_ROWS_RETURNED.inc(entry.labels, count)
+    with _stats_lock:
+        entry.rows += count
+
+
+def redact_params(params) -> str:
+    """Parameter types only - values may be passwords, tokens or personal data"""
+    if params is None:
+        return '()'
+    if isinstance(params, dict):
+        return '{' + ', '.join(f"{k}: {type(v).__name__}" for k, v in params.items()) + '}'
+    return '(' + ', '.join(type(v).__name__ for v in params) + ')'
+
+
+def log_slow(entry: StatementStats, seconds: float, params, config: Dict):
+    """Log a slow statement; the first time its shape is slow, EXPLAIN it in the background"""
+    logger.warning("slow_query duration_ms=%.1f operation=%s table=%s params=%s sql=%s",
+                   seconds * 1e3, entry.labels[0], entry.labels[1], redact_params(params), entry.sql)
+
+    if not _explain_slow or config is None or entry.labels[0] not in _EXPLAINABLE:
+        return
+    with _stats_lock:
+        if entry.explained:
+            return
+        entry.explained = True
+    # Separate connection and thread: the caller's cursor may still hold
+    # unread rows, and the plan is not worth adding to request latency
+    threading.Thread(target=_explain, args=(entry, params, config),
+                     name='explain-slow-query', daemon=True).start()
+
+
+def _explain(entry: StatementStats, params, config: Dict):
+    try:
+        if config.get('backend') == 'sqlite':
+            entry.plan = sqlite_backend.explain(config['path'], entry.sql, params)
+            logger.warning("slow_query_plan sql=%s plan=%s", entry.sql, entry.plan)
+            return
+        conn = mysql.connector.connect(**config)
+        try:
+            cursor = conn.cursor(dictionary=True)
+            cursor.execute('EXPLAIN ' + entry.sql, params)
+            entry.plan = cursor.fetchall()
+            cursor.close()
+        finally:
+            conn.close()
+        logger.warning("slow_query_plan sql=%s plan=%s", entry.sql, entry.plan)
+    except Exception as e:
+        entry.plan = {'error': str(e)}
+        logger.warning("slow_query_explain_failed sql=%s error=%s", entry.sql, e)
+
+
+def top_statements(limit: int = 20, order_by: str = 'total') -> List[Dict]:
+    """
+    Statements with the most time spent in this process
+
+    Args:
+        limit: Number of statements
+        order_by: 'total', 'mean', 'max', 'calls' or 'slow'
+    """
+    keys = {
+        'total': lambda e: e.total,
+        'mean': lambda e: e.total / e.calls if e.calls else 0.0,
+        'max': lambda e: e.max,
+        'calls': lambda e: e.calls,
+        'slow': lambda e: e.slow,
+    }
+    with _stats_lock:
+        entries = [e for e in _shapes.values() if e.calls]
+    entries.sort(key=keys.get(order_by, keys['total']), reverse=True)
+    return [e.as_dict() for e in entries[:limit]]
+
+
+def reset_statements():
+    """Forget statement totals (plans are captured again)"""
+    with _stats_lock:
+        _statements.clear()
+        _shapes.clear()
+
+
+def _reset_after_fork():
+    # Totals are per process; a lock held by another thread at fork time
+    # would never be released in the child
+    global _stats_lock
+    _stats_lock = threading.Lock()
+    _statements.clear()
+    _shapes.clear()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+class InstrumentedCursor:
+    """Cursor wrapper that times execute() and counts fetched rows"""
+
+    def __init__(self, cursor, config: Dict = None):
+        self._cursor = cursor
+        self._config = config
+        self._statement = None
+
+    def _run(self, method, operation, params, sample_params, args, kwargs):
+        entry = self._statement = statement(operation)
+        start = time.perf_counter()
+        try:
+            result = method(operation, params, *args, **kwargs)
+        except Exception:
+            observe_statement(entry, time.perf_counter() - start, failed=True)
+            raise
+        elapsed = time.perf_counter() - start
+        if observe_statement(entry, elapsed):
+            log_slow(entry, elapsed, sample_params, self._config)
+
+        if entry.labels[0] == 'INSERT' and self._cursor.rowcount > 0:
+            INGEST_ROWS.inc((entry.labels[1],), self._cursor.rowcount)
+        return result
+
+    def execute(self, operation, params=None, *args, **kwargs):
+        return self._run(self._cursor.execute, operation, params, params, args, kwargs)
+
+    def executemany(self, operation, seq_params, *args, **kwargs):
+        # The first row stands in for the batch in the slow log / EXPLAIN
+        sample = seq_params[0] if isinstance(seq_params, (list, tuple)) and seq_params else None
+        return self._run(self._cursor.executemany, operation, seq_params, sample, args, kwargs)
+
+    def _count_rows(self, count: int):
+        if self._statement is not None:
+            observe_rows(self._statement, count)
+
+    def fetchone(self):
+        row = self._cursor.fetchone()
+        if row is not None:
+            self._count_rows(1)
+        return row
+
+    def fetchall(self):
+        rows = self._cursor.fetchall()
+        if rows:
+            self._count_rows(len(rows))
+        return rows
+
+    def fetchmany(self, size=1):
+        rows = self._cursor.fetchmany(size)
+        if rows:
+            self._count_rows(len(rows))
+        return rows
+
+    def __iter__(self):
+        return iter(self.fetchone, None)
+
+    def __getattr__(self, name):
+        # lastrowid, rowcount, close, description, ...
+        return getattr(self._cursor, name)
+
+
+class InstrumentedConnection:
+    """Connection wrapper handing out instrumented cursors"""
+
+    def __init__(self, conn, config: Dict = None):
+        self._conn = conn
+        self._config = config
+
+    def cursor(self, *args, **kwargs):
+        return InstrumentedCursor(self._conn.cursor(*args, **kwargs), self._config)
+
+    def __getattr__(self, name):
+        # commit, rollback, close, ...
+        return getattr(self._conn, name)
+
+
+def connect(config: Dict, instrument: bool = True):
+    """
+    Open a database connection
+
+    Args:
+        config: mysql.connector connection arguments, or
+            {'backend': 'sqlite', 'path': ...} for the embedded backend
+        instrument: Wrap the connection so statements are recorded in metrics
+            and the slow query log
+
+    Returns:
+        Connection (raises one of database.Error on failure)
+    """
+    start = time.perf_counter()
+    if config.get('backend') == 'sqlite':
+        conn = sqlite_backend.connect(config['path'])
+    else:
+        conn = mysql.connector.connect(**config)
+    if not instrument:
+        return conn
+    DB_CONNECT_SECONDS.observe(time.perf_counter() - start)
+    return InstrumentedConnection(conn, config)
+
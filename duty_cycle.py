@@ -0,0 +1,437 @@
+"""
+Device Duty-Cycle Analytics for Smart Farm
+Daily runtime (seconds ON) and switch-on counts per device, maintained
+incrementally from the ON/OFF transitions in device_logs and
+device_status_history
+
+Each run reads the rows past a per-source watermark in id order, CHUNK
+rows at a time from every source, merges the sources by created_at
+(heapq.merge, up to the time all of them have been read to), feeds the
+events through a per-device state machine (on or off, and since when:
+O(1) per device) and adds closed on-intervals, split at midnight, to
+device_runtime_daily. Aggregates, device states and the watermarks are
+committed together per chunk, under a lock on the watermark rows, so a
+row is never counted twice. The interval a device is
+still on for is added when reading (runtime()), so totals are current
+without waiting for the OFF (up to the last run: an OFF not processed
+yet still counts as on).
+
+Events older than the device's latest are ignored (late or replayed
+rows); a device logging to both sources is merged by time. The
+device_logs variant without device_id (init-db) is not read.
+
+Nothing folds on ingest: api_server runs process() every
+DUTY_CYCLE_INTERVAL seconds in a background thread of each worker
+(schedule(); the watermark lock lets one of them do the work), or run
+this module with --every where the API server does not.
+
+Usage:
+    python duty_cycle.py                    # process new logs once
+    python duty_cycle.py --every 60
+    python duty_cycle.py --rebuild          # recompute from all logs
+"""
+
+import argparse
+import heapq
+import logging
+import os
+import threading
+import time
+from datetime import date, datetime, time as day_start, timedelta
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import database
+import schema
+
+logger = logging.getLogger(__name__)
+
+# source table: (id column, columns read for the state, first parseable wins)
+SOURCES = {
+    'device_logs': ('log_id', ('new_value', 'action')),
+    'device_status_history': ('history_id', ('status',)),
+}
+
+ON_VALUES = ('ON', '1', 'TRUE')
+OFF_VALUES = ('OFF', '0', 'FALSE')
+
+CHUNK_ROWS = 5000
+MAX_RANGE_DAYS = 366
+
+UPSERT_DAILY = '''
+    INSERT INTO device_runtime_daily (device_id, day, on_seconds, switch_ons)
+    VALUES (%s, %s, %s, %s)
+    ON DUPLICATE KEY UPDATE
+    on_seconds = on_seconds + VALUES(on_seconds), switch_ons = switch_ons + VALUES(switch_ons)
+'''
+
+UPSERT_STATE = '''
+    INSERT INTO device_runtime_state (device_id, is_on, on_since, last_at)
+    VALUES (%s, %s, %s, %s)
+    ON DUPLICATE KEY UPDATE
+    is_on = VALUES(is_on), on_since = VALUES(on_since), last_at = VALUES(last_at)
+'''
+
+DAILY = '''
+    SELECT device_id, day, on_seconds, switch_ons
+    FROM device_runtime_daily
+    WHERE day BETWEEN %s AND %s
+'''
+
+DAILY_FOR_DEVICE = '''
+    SELECT device_id, day, on_seconds, switch_ons
+    FROM device_runtime_daily
+    WHERE device_id = %s AND day BETWEEN %s AND %s
+'''
+
+RUNNING = '''
+    SELECT device_id, on_since
+    FROM device_runtime_state
+    WHERE is_on = 1
+'''
+
+
+def parse_state(*values) -> Optional[bool]:
+    """True for ON, False for OFF, None when no value is a state (e.g. MODE_CHANGE)"""
+    for value in values:
+        text = str(value).strip().upper() if value is not None else ''
+        if text in ON_VALUES:
+            return True
+        if text in OFF_VALUES:
+            return False
+    return None
+
+
+def _as_datetime(value):
+    # SQLite returns DATETIME columns as text
+    return datetime.fromisoformat(value) if isinstance(value, str) else value
+
+
+def split_by_day(start: datetime, end: datetime) -> Iterator[Tuple[date, int]]:
+    """(day, seconds) of an interval, cut at midnight"""
+    while start < end:
+        midnight = datetime.combine(start.date() + timedelta(days=1), day_start())
+        cut = min(end, midnight)
+        yield start.date(), int(round((cut - start).total_seconds()))
+        start = cut
+
+
+def advance(state: Optional[Dict], at: datetime, on: bool) -> Tuple[Dict, Optional[Tuple[datetime, datetime]], bool]:
+    """
+    One transition
+
+    Returns:
+        (new state, closed on-interval or None, whether it switched on);
+        an event older than the state returns the state unchanged
+    """
+    if state is None:
+        state = {'is_on': False, 'on_since': None, 'last_at': None}
+    elif state['last_at'] is not None and at < state['last_at']:
+        return state, None, False
+    state = dict(state)
+    interval, switched_on = None, False
+    if on and not state['is_on']:
+        state['is_on'], state['on_since'] = True, at
+        switched_on = True
+    elif not on and state['is_on']:
+        interval = (state['on_since'], at)
+        state['is_on'], state['on_since'] = False, None
+    state['last_at'] = at
+    return state, interval, switched_on
+
+
+# PROCESSING
+
+def _source_columns(cursor, table) -> Optional[List[str]]:
+    """Columns to select from a source, or None when it is missing or the device_id-less variant"""
+    cursor.execute('SHOW TABLES LIKE %s', (table,))
+    if not cursor.fetchall():
+        return None
+    cursor.execute(f'SHOW COLUMNS FROM {table}')
+    available = {row[0] for row in cursor.fetchall()}
+    id_column, state_columns = SOURCES[table]
+    state_columns = [c for c in state_columns if c in available]
+    if not {id_column, 'device_id', 'created_at'} <= available or not state_columns:
+        return None
+    return [id_column, 'device_id', 'created_at', *state_columns]
+
+
+def _load_states(cursor, device_ids) -> Dict[int, Dict]:
+    placeholders = ', '.join(['%s'] * len(device_ids))
+    cursor.execute(f'''
+        SELECT device_id, is_on, on_since, last_at FROM device_runtime_state
+        WHERE device_id IN ({placeholders})
+    ''', list(device_ids))
+    return {
+        device_id: {'is_on': bool(is_on), 'on_since': _as_datetime(on_since), 'last_at': _as_datetime(last_at)}
+        for device_id, is_on, on_since, last_at in cursor.fetchall()
+    }
+
+
+def _fetch_chunk(cursor, table: str, columns: List[str], chunk_rows: int) -> List[Tuple]:
+    """Next rows of a source past its watermark, in id order (watermark row locked)"""
+    cursor.execute('INSERT IGNORE INTO device_runtime_watermarks (source, last_id) VALUES (%s, 0)', (table,))
+    cursor.execute('SELECT last_id FROM device_runtime_watermarks WHERE source = %s FOR UPDATE', (table,))
+    last_id = int(cursor.fetchall()[0][0])
+    cursor.execute(f'''
+        SELECT {', '.join(columns)} FROM {table}
+        WHERE {columns[0]} > %s
+        ORDER BY {columns[0]}
+        LIMIT %s
+    ''', (last_id, chunk_rows))
+    return [(row[0], row[1], _as_datetime(row[2]), *row[3:]) for row in cursor.fetchall()]
+
+
+def _foldable(chunks: Dict[str, List[Tuple]], chunk_rows: int) -> Dict[str, List[Tuple]]:
+    """
+    The id-order prefix of each chunk that is not newer than what every
+    other source has been read up to
+
+    A full chunk may have more rows behind it, so only events up to its
+    newest are certain to be complete across sources; the source with the
+    lowest such bound folds its whole chunk, so every call makes progress.
+    """
+    bounds = [max(row[2] for row in rows if row[2] is not None) for rows in chunks.values()
+              if len(rows) >= chunk_rows and any(row[2] is not None for row in rows)]
+    if not bounds:
+        return chunks
+    bound = min(bounds)
+    foldable = {}
+    for table, rows in chunks.items():
+        end = next((i for i, row in enumerate(rows) if row[2] is not None and row[2] > bound), len(rows))
+        foldable[table] = rows[:end]
+    return foldable
+
+
+def process_chunk(conn, sources: Dict[str, List[str]], chunk_rows: int = CHUNK_ROWS) -> Tuple[Dict[str, int], bool]:
+    """
+    Fold the next chunk of every source into the aggregates, merged by
+    created_at (one transaction; commits)
+
+    Returns:
+        (rows folded per source, whether any source may have more rows)
+    """
+    cursor = conn.cursor()
+    try:
+        # Watermarks are locked in table order
+        chunks = {table: _fetch_chunk(cursor, table, sources[table], chunk_rows) for table in sorted(sources)}
+        more = any(len(rows) >= chunk_rows for rows in chunks.values())
+        chunks = _foldable(chunks, chunk_rows)
+        if not any(chunks.values()):
+            conn.commit()
+            return {table: 0 for table in chunks}, more
+
+        events = [
+            sorted(((row[2], row[1], on) for row in rows
+                    if row[1] is not None and row[2] is not None
+                    for on in [parse_state(*row[3:])] if on is not None),
+                   key=lambda event: event[0])
+            for rows in chunks.values()
+        ]
+        states = _load_states(cursor, {row[1] for rows in chunks.values() for row in rows})
+        changed = set()
+        daily: Dict[Tuple[int, date], List[int]] = {}
+        for at, device_id, on in heapq.merge(*events, key=lambda event: event[0]):
+            state, interval, switched_on = advance(states.get(device_id), at, on)
+            if state is states.get(device_id):
+                continue
+            states[device_id] = state
+            changed.add(device_id)
+            if switched_on:
+                daily.setdefault((device_id, state['on_since'].date()), [0, 0])[1] += 1
+            if interval:
+                for day, seconds in split_by_day(*interval):
+                    daily.setdefault((device_id, day), [0, 0])[0] += seconds
+
+        if daily:
+            cursor.executemany(UPSERT_DAILY, [(d, day, s, n) for (d, day), (s, n) in sorted(daily.items())])
+        if changed:
+            cursor.executemany(UPSERT_STATE, [
+                (d, states[d]['is_on'], states[d]['on_since'], states[d]['last_at']) for d in sorted(changed)
+            ])
+        for table, rows in chunks.items():
+            if rows:
+                cursor.execute('''
+                    UPDATE device_runtime_watermarks SET last_id = %s, updated_at = NOW()
+                    WHERE source = %s
+                ''', (rows[-1][0], table))
+        conn.commit()
+        return {table: len(rows) for table, rows in chunks.items()}, more
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+def process(conn, chunk_rows: int = CHUNK_ROWS) -> Dict[str, int]:
+    """Process every source up to its newest row; returns rows read per source"""
+    cursor = conn.cursor()
+    schema.create_device_runtime(cursor)
+    conn.commit()
+    sources = {table: _source_columns(cursor, table) for table in SOURCES}
+    cursor.close()
+    sources = {table: columns for table, columns in sources.items() if columns is not None}
+    stats = {table: 0 for table in sources}
+    more = bool(sources)
+    while more:
+        read, more = process_chunk(conn, sources, chunk_rows)
+        for table, rows in read.items():
+            stats[table] += rows
+    return stats
+
+
+_scheduled_pid = None
+_schedule_lock = threading.Lock()
+
+
+def _schedule_loop(db_config: Dict, interval: float):
+    while True:
+        time.sleep(interval)
+        try:
+            conn = database.connect(db_config, instrument=False)
+            try:
+                process(conn)
+            finally:
+                conn.close()
+        except Exception as e:
+            logger.warning("duty_cycle_run_failed error=%s", e)
+
+
+def schedule(db_config: Dict, interval: float):
+    """
+    Run process() every interval seconds in a daemon thread (one per
+    process: threads do not survive a pre-fork, so each worker starts its
+    own on first call; interval <= 0 does nothing)
+    """
+    global _scheduled_pid
+    if interval <= 0 or _scheduled_pid == os.getpid():
+        return
+    with _schedule_lock:
+        if _scheduled_pid != os.getpid():
+            _scheduled_pid = os.getpid()
+            threading.Thread(target=_schedule_loop, args=(db_config, interval), name='duty-cycle',
+                             daemon=True).start()
+
+
+def rebuild(conn, chunk_rows: int = CHUNK_ROWS) -> Dict[str, int]:
+    """Drop the aggregates and process all logs again (readers see partial totals meanwhile)"""
+    cursor = conn.cursor()
+    schema.create_device_runtime(cursor)
+    for table in ('device_runtime_daily', 'device_runtime_state', 'device_runtime_watermarks'):
+        cursor.execute(f'DELETE FROM {table}')
+    conn.commit()
+    cursor.close()
+    return process(conn, chunk_rows)
+
+
+# READING
+
+def _observed_seconds(day: date, now: datetime) -> int:
+    """Seconds of a day that have passed"""
+    start = datetime.combine(day, day_start())
+    return int(max(0.0, min((now - start).total_seconds(), 86400.0)))
+
+
+def runtime(cursor, since: date, until: date, device_ids: Optional[List[int]] = None,
+            now: Optional[datetime] = None) -> List[Dict]:
+    """
+    Daily runtime per device, including the interval devices are still on for
+
+    Returns:
+        [{device_id, day, on_seconds, switch_ons, duty_cycle}, ...] by device and day
+        (duty_cycle: share of the day's elapsed time spent on)
+    """
+    now = now or datetime.now()
+    days: Dict[Tuple[int, date], Dict] = {}
+
+    def entry(device_id, day):
+        if (device_id, day) not in days:
+            days[(device_id, day)] = {'device_id': device_id, 'day': day, 'on_seconds': 0, 'switch_ons': 0}
+        return days[(device_id, day)]
+
+    if device_ids is None:
+        cursor.execute(DAILY, (since, until))
+        rows = cursor.fetchall()
+    else:
+        rows = []
+        for device_id in device_ids:
+            cursor.execute(DAILY_FOR_DEVICE, (device_id, since, until))
+            rows.extend(cursor.fetchall())
+    for device_id, day, on_seconds, switch_ons in rows:
+        day = date.fromisoformat(day) if isinstance(day, str) else day
+        item = entry(device_id, day)
+        item['on_seconds'] += int(on_seconds)
+        item['switch_ons'] += int(switch_ons)
+
+    cursor.execute(RUNNING)
+    range_start = datetime.combine(since, day_start())
+    range_end = min(now, datetime.combine(until + timedelta(days=1), day_start()))
+    for device_id, on_since in cursor.fetchall():
+        if device_ids is not None and device_id not in device_ids:
+            continue
+        on_since = _as_datetime(on_since)
+        for day, seconds in split_by_day(max(on_since, range_start), range_end):
+            entry(device_id, day)['on_seconds'] += seconds
+
+    result = []
+    for key in sorted(days):
+        item = days[key]
+        observed = _observed_seconds(item['day'], now)
+        item['duty_cycle'] = round(item['on_seconds'] / observed, 4) if observed else None
+        result.append(item)
+    return result
+
+
+def totals(days: List[Dict], key: str = 'device_id', now: Optional[datetime] = None) -> List[Dict]:
+    """
+    Sum runtime() rows by key (rows need that key); duty_cycle over the days
+    with data, devices counted when grouping by anything but device_id
+    """
+    now = now or datetime.now()
+    groups: Dict = {}
+    for item in days:
+        group = groups.setdefault(item[key], {key: item[key], 'on_seconds': 0, 'switch_ons': 0,
+                                              'observed': 0, 'devices': set()})
+        group['on_seconds'] += item['on_seconds']
+        group['switch_ons'] += item['switch_ons']
+        group['devices'].add(item['device_id'])
+        group['observed'] += _observed_seconds(item['day'], now)
+    result = []
+    for k in sorted(groups, key=lambda v: (v is None, v)):
+        group = groups[k]
+        observed = group.pop('observed')
+        devices = group.pop('devices')
+        if key != 'device_id':
+            group['devices'] = len(devices)
+        group['duty_cycle'] = round(group['on_seconds'] / observed, 4) if observed else None
+        result.append(group)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Fold new device ON/OFF logs into daily runtime')
+    parser.add_argument('--every', type=float, default=0, help='repeat every N seconds')
+    parser.add_argument('--rebuild', action='store_true', help='recompute from all logs')
+    parser.add_argument('--chunk-rows', type=int, default=CHUNK_ROWS)
+    args = parser.parse_args()
+
+    import api_server  # DB_CONFIG for the configured backend
+
+    rebuild_first = args.rebuild
+    while True:
+        conn = database.connect(api_server.DB_CONFIG, instrument=False)
+        try:
+            start = time.perf_counter()
+            stats = (rebuild if rebuild_first else process)(conn, args.chunk_rows)
+            rebuild_first = False
+            for table, rows in stats.items():
+                print(f"{table:<24}{rows:>12} rows{time.perf_counter() - start:>8.1f}s")
+        finally:
+            conn.close()
+        if not args.every:
+            return
+        time.sleep(args.every)
+
+
+if __name__ == '__main__':
+    main()
@@ -8,12 +8,30 @@ import firebase_admin
 from firebase_admin import credentials, firestore
 import logging
 import os
+import threading
 from datetime import datetime
+from functools import wraps
 from typing import Dict, List, Optional
 
+from metrics import REGISTRY
+
 logger = logging.getLogger(__name__)
 
 
+def tracked_write(method):
+    """Count a Firebase write as queued/in flight until it returns"""
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self._pending_lock:
+            self._pending_writes += 1
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            with self._pending_lock:
+                self._pending_writes -= 1
+    return wrapper
+
+
 class FirebaseService:
     """
     Firebase service for real-time data synchronization
@@ -35,6 +53,8 @@ class FirebaseService:
 
         self.db = None
         self._initialized = True
+        self._pending_writes = 0
+        self._pending_lock = threading.Lock()
         self._init_firebase()
 
     def _init_firebase(self):
@@ -63,6 +83,11 @@ class FirebaseService:
         """Check if Firebase is connected"""
         return self.db is not None
 
+    def queue_depth(self) -> int:
+        """Number of Firebase writes currently queued or in flight"""
+        return self._pending_writes
+
+    @tracked_write
     def save_sensor_data(self, data: Dict) -> bool:
         """
         Save sensor data to Firebase with error handling
@@ -98,6 +123,7 @@ class FirebaseService:
             logger.error(f"❌ Firebase write error: {e}")
             return False
 
+    @tracked_write
     def save_device_log(self, data: Dict) -> bool:
         """
         Save device control log to Firebase
@@ -131,6 +157,7 @@ class FirebaseService:
             logger.error(f"❌ Firebase device log error: {e}")
             return False
 
+    @tracked_write
     def create_alert(self, alert_data: Dict) -> bool:
         """
         Create alert in Firebase when thresholds exceeded
@@ -229,6 +256,7 @@ class FirebaseService:
             logger.error(f"❌ Firebase alert retrieval error: {e}")
             return []
 
+    @tracked_write
     def update_device_status(self, device_id: int, status: str) -> bool:
         """
         Update device status in Firebase
@@ -281,6 +309,7 @@ class FirebaseService:
             logger.error(f"❌ Firebase delete error: {e}")
             return False
 
+    @tracked_write
     def batch_write(self, operations: List[Dict]) -> bool:
         """
         Perform batch write operations for improved performance
@@ -321,3 +350,9 @@ class FirebaseService:
 
 # Global Firebase service instance
 firebase_service = FirebaseService()
+
+REGISTRY.gauge(
+    'smartfarm_firebase_sync_queue_depth',
+    'Firebase writes queued or in flight',
+    firebase_service.queue_depth
+)
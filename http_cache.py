@@ -0,0 +1,200 @@
+"""
+HTTP Caching for Smart Farm API
+Conditional GET (ETag / Last-Modified) validated against cheap table
+fingerprints, and gzip/brotli compression of large responses
+"""
+
+import gzip
+import hashlib
+import logging
+import time
+from functools import wraps
+
+from flask import Response, make_response, request
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+# Append-only tables are versioned by their newest row: (id column, time column)
+APPEND_ONLY_TABLES = {
+    'sensor_logs': ('log_id', 'timestamp'),
+    'trash_bin_logs': ('log_id', 'created_at'),
+}
+
+COMPRESSIBLE_TYPES = ('application/json', 'text/')
+BROTLI_QUALITY = 4  # Dynamic content: fast setting, still smaller than gzip -6
+
+
+class ConditionalGet:
+    """
+    ETag / Last-Modified support for read endpoints
+
+    Before a decorated handler runs, one UNION query reads the fingerprint
+    of the tables the response depends on: MAX(id) of append-only tables
+    and the trigger-maintained counters in table_versions (schema.py) for
+    the rest. A matching If-None-Match / If-Modified-Since is answered with
+    304 without running the handler's queries or serializing anything.
+
+    If the fingerprint cannot be read (counters not installed, DB error)
+    the handler runs normally and no validators are sent.
+    """
+
+    def __init__(self, connect, enabled: bool = True):
+        """
+        Args:
+            connect: Callable returning a DB connection (or None)
+            enabled: Turn conditional handling on/off
+        """
+        self.connect = connect
+        self.enabled = enabled
+        self._warned = False
+
+    def fingerprint(self, tables):
+        """
+        Read current versions of tables
+
+        Returns:
+            (versions tuple, last modified epoch seconds) or None
+        """
+        parts = []
+        versioned = [t for t in tables if t not in APPEND_ONLY_TABLES]
+        for table in tables:
+            if table in APPEND_ONLY_TABLES:
+                id_column, time_column = APPEND_ONLY_TABLES[table]
+                # Derived table: SQLite rejects ORDER BY/LIMIT on a bare UNION member
+                parts.append(f'''
+                    SELECT name, version, modified FROM (
+                        SELECT '{table}' AS name, {id_column} AS version,
+                               UNIX_TIMESTAMP({time_column}) AS modified
+                        FROM {table} ORDER BY {id_column} DESC LIMIT 1
+                    ) AS latest_{table}
+                ''')
+        if versioned:
+            placeholders = ', '.join(['%s'] * len(versioned))
+            parts.append(f'''
+                SELECT table_name AS name, version, UNIX_TIMESTAMP(updated_at) AS modified
+                FROM table_versions WHERE table_name IN ({placeholders})
+            ''')
+
+        conn = self.connect()
+        if not conn:
+            return None
+        try:
+            cursor = conn.cursor()
+            cursor.execute(' UNION ALL '.join(parts), versioned)
+            rows = {name: (version, modified) for name, version, modified in cursor.fetchall()}
+            cursor.close()
+        except Exception as e:
+            if not self._warned:
+                logger.warning("conditional_get_disabled error=%s", e)
+                self._warned = True
+            return None
+        finally:
+            conn.close()
+
+        # A versioned table without a counter row has no triggers: never cache it
+        if any(table not in rows for table in versioned):
+            return None
+        versions = tuple(rows.get(table, (0, None))[0] for table in tables)
+        modified = [float(m) for _, m in rows.values() if m is not None]
+        return versions, max(modified) if modified else None
+
+    def conditional(self, *tables, bucket_seconds: int = None):
+        """
+        Decorator for GET handlers whose output depends only on tables
+
+        Args:
+            tables: Tables read by the handler
+            bucket_seconds: Also expire the ETag every bucket_seconds
+                (for responses over a sliding time window, e.g. last 24h)
+        """
+        def decorator(f):
+            @wraps(f)
+            def wrapper(*args, **kwargs):
+                if not self.enabled or request.method != 'GET':
+                    return f(*args, **kwargs)
+
+                current = self.fingerprint(tables)
+                if current is None:
+                    return f(*args, **kwargs)
+                versions, last_modified = current
+
+                bucket = None
+                if bucket_seconds:
+                    bucket = int(time.time() // bucket_seconds)
+                    last_modified = max(last_modified or 0, bucket * bucket_seconds)
+
+                etag = hashlib.sha1(
+                    f"{request.full_path}|{versions}|{bucket}".encode()
+                ).hexdigest()[:20]
+
+                if request.if_none_match:
+                    if request.if_none_match.contains_weak(etag):
+                        return self._validators(Response(status=304), etag, last_modified)
+                elif request.if_modified_since and last_modified:
+                    if int(last_modified) <= request.if_modified_since.timestamp():
+                        return self._validators(Response(status=304), etag, last_modified)
+
+                response = make_response(f(*args, **kwargs))
+                if response.status_code == 200:
+                    self._validators(response, etag, last_modified)
+                return response
+            return wrapper
+        return decorator
+
+    @staticmethod
+    def _validators(response, etag, last_modified):
+        # Weak: the body differs per Content-Encoding but is semantically equal
+        response.set_etag(etag, weak=True)
+        if last_modified:
+            response.last_modified = int(last_modified)
+        response.headers['Cache-Control'] = 'no-cache'
+        response.vary.add('Accept-Encoding')
+        return response
+
+
+class Compressor:
+    """
+    after_request hook compressing JSON/text bodies above min_bytes
+
+    Uses brotli when the client accepts it and the package is installed,
+    gzip otherwise.
+    """
+
+    def __init__(self, min_bytes: int = 1024, level: int = 6, enabled: bool = True):
+        """
+        Args:
+            min_bytes: Smaller bodies are sent as-is (not worth the CPU)
+            level: gzip compression level (1-9)
+            enabled: Turn compression on/off
+        """
+        self.min_bytes = min_bytes
+        self.level = level
+        self.enabled = enabled
+
+    def __call__(self, response):
+        if (not self.enabled or response.status_code != 200 or response.direct_passthrough
+                or 'Content-Encoding' in response.headers
+                or not (response.mimetype or '').startswith(COMPRESSIBLE_TYPES)):
+            return response
+
+        response.vary.add('Accept-Encoding')
+        data = response.get_data()
+        if len(data) < self.min_bytes:
+            return response
+
+        accept = request.accept_encodings
+        if brotli is not None and accept['br']:
+            encoding, data = 'br', brotli.compress(data, quality=BROTLI_QUALITY)
+        elif accept['gzip']:
+            encoding, data = 'gzip', gzip.compress(data, compresslevel=self.level, mtime=0)
+        else:
+            return response
+
+        response.set_data(data)
+        response.headers['Content-Encoding'] = encoding
+        return response
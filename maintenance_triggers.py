@@ -0,0 +1,398 @@
+"""
+Usage-Based Maintenance Triggers for Smart Farm
+Cumulative runtime and recent error counts per device, maintained
+incrementally from device_status_history, with maintenance_schedules
+entries created when a device crosses a threshold
+
+Each run reads the history rows past a watermark in id order, CHUNK rows
+at a time (replicated rows included), and folds them into
+device_usage_state (O(1) per device). uptime_seconds and error_count are
+counters that reset when the device restarts: a value below the previous
+one is counted from zero, and the first row of a device is its baseline.
+Runtime growth is capped at the time between rows, so a bogus uptime
+does not schedule a service. Errors are also kept as a count decayed
+with a half-life of ERROR_HALF_LIFE_HOURS.
+
+A device due for a service (RUNTIME_HOURS run since the last completed
+one) or with ERROR_SPIKE recent errors gets a PENDING entry, unless an
+entry of that type is still open (PENDING or IN_PROGRESS) for it; the
+entries of a chunk are inserted with one executemany, in the transaction
+that saves the states and the watermark, so a row never triggers twice.
+Completing an entry (complete()) restarts the count it was created for:
+runtime since the service, or recent errors for an inspection. Rows older
+than the device's latest are ignored (late replays).
+
+Usage:
+    python maintenance_triggers.py                  # process new history once
+    python maintenance_triggers.py --every 300
+    python maintenance_triggers.py --rebuild        # recompute the counters (creates no entries)
+"""
+
+import argparse
+import logging
+import time
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional, Set, Tuple
+
+import database
+import schema
+
+logger = logging.getLogger(__name__)
+
+SOURCE = 'device_status_history'
+
+RUNTIME_HOURS = 500.0
+ERROR_SPIKE = 10.0
+ERROR_HALF_LIFE_HOURS = 12.0
+LEAD_DAYS = 7
+
+CHUNK_ROWS = 5000
+
+RUNTIME_SERVICE = 'Runtime service'
+ERROR_INSPECTION = 'Error inspection'
+OPEN_STATUSES = ('PENDING', 'IN_PROGRESS')
+
+STATE_COLUMNS = ('device_id', 'device_name', 'last_at', 'last_uptime_seconds', 'last_error_count',
+                 'runtime_seconds', 'runtime_at_service', 'error_total', 'recent_errors')
+
+UPSERT_STATE = f'''
+    INSERT INTO device_usage_state ({', '.join(STATE_COLUMNS)})
+    VALUES ({', '.join(['%s'] * len(STATE_COLUMNS))})
+    ON DUPLICATE KEY UPDATE
+    {', '.join(f'{c} = VALUES({c})' for c in STATE_COLUMNS[1:])}
+'''
+
+INSERT_MAINTENANCE = '''
+    INSERT INTO maintenance_schedules
+    (device_id, device_name, maintenance_type, scheduled_date, status, notes)
+    VALUES (%s, %s, %s, %s, %s, %s)
+'''
+
+ENTRY = 'SELECT device_id, maintenance_type, status FROM maintenance_schedules WHERE maintenance_id = %s'
+
+HISTORY = '''
+    SELECT history_id, device_id, device_name, created_at, uptime_seconds, error_count
+    FROM device_status_history
+    WHERE history_id > %s
+    ORDER BY history_id
+    LIMIT %s
+'''
+
+USAGE = f"SELECT {', '.join(STATE_COLUMNS)} FROM device_usage_state ORDER BY device_id"
+
+USAGE_FOR_DEVICE = f"SELECT {', '.join(STATE_COLUMNS)} FROM device_usage_state WHERE device_id = %s"
+
+
+def configure(runtime_hours: float = 500.0, error_spike: float = 10.0, error_half_life_hours: float = 12.0,
+              lead_days: int = 7):
+    """Set the service interval, the error spike threshold and half-life, and the service lead time"""
+    global RUNTIME_HOURS, ERROR_SPIKE, ERROR_HALF_LIFE_HOURS, LEAD_DAYS
+    RUNTIME_HOURS = runtime_hours
+    ERROR_SPIKE = error_spike
+    ERROR_HALF_LIFE_HOURS = error_half_life_hours
+    LEAD_DAYS = lead_days
+
+
+def _as_datetime(value):
+    # SQLite returns DATETIME columns as text
+    return datetime.fromisoformat(value) if isinstance(value, str) else value
+
+
+def _decayed(count: float, hours: float) -> float:
+    return count * 0.5 ** (max(hours, 0.0) / ERROR_HALF_LIFE_HOURS)
+
+
+def _counter_delta(last, value) -> int:
+    """Growth of a counter that restarts from zero"""
+    if last is None or value is None:
+        return 0
+    return value - last if value >= last else value
+
+
+def advance(state: Optional[Dict], device_id: int, at: datetime, device_name, uptime_seconds,
+            error_count, open_types: Set[str] = frozenset()) -> Tuple[Dict, List[Tuple]]:
+    """
+    One history row
+
+    Args:
+        open_types: maintenance_type of the device's open entries (not repeated)
+
+    Returns:
+        (new state, maintenance_schedules rows to insert); a row older than
+        the state returns the state unchanged
+    """
+    uptime_seconds = None if uptime_seconds is None else int(uptime_seconds)
+    error_count = None if error_count is None else int(error_count)
+    if state is None:
+        state = {'device_id': device_id, 'device_name': device_name, 'last_at': at,
+                 'last_uptime_seconds': uptime_seconds, 'last_error_count': error_count,
+                 'runtime_seconds': 0, 'runtime_at_service': 0, 'error_total': 0, 'recent_errors': 0.0}
+        return state, []
+    if state['last_at'] is not None and at < state['last_at']:
+        return state, []
+
+    state = dict(state)
+    elapsed = (at - state['last_at']).total_seconds() if state['last_at'] is not None else 0.0
+    # A counter cannot run faster than the clock
+    state['runtime_seconds'] += min(_counter_delta(state['last_uptime_seconds'], uptime_seconds), int(elapsed))
+    errors = _counter_delta(state['last_error_count'], error_count)
+    state['error_total'] += errors
+    state['recent_errors'] = _decayed(state['recent_errors'], elapsed / 3600) + errors
+    if uptime_seconds is not None:
+        state['last_uptime_seconds'] = uptime_seconds
+    if error_count is not None:
+        state['last_error_count'] = error_count
+    state['device_name'] = device_name or state['device_name']
+    state['last_at'] = at
+
+    entries = []
+    hours_since_service = (state['runtime_seconds'] - state['runtime_at_service']) / 3600
+    if hours_since_service >= RUNTIME_HOURS and RUNTIME_SERVICE not in open_types:
+        entries.append((device_id, state['device_name'], RUNTIME_SERVICE, at.date() + timedelta(days=LEAD_DAYS),
+                        'PENDING', f"Auto: {hours_since_service:.1f} h run since the last service "
+                                   f"(threshold {RUNTIME_HOURS:g} h)"))
+    if state['recent_errors'] >= ERROR_SPIKE and ERROR_INSPECTION not in open_types:
+        entries.append((device_id, state['device_name'], ERROR_INSPECTION, at.date(), 'PENDING',
+                        f"Auto: {state['recent_errors']:.1f} recent errors "
+                        f"(threshold {ERROR_SPIKE:g}, half-life {ERROR_HALF_LIFE_HOURS:g} h)"))
+    return state, entries
+
+
+# PROCESSING
+
+def _row_dict(row) -> Dict:
+    state = dict(zip(STATE_COLUMNS, row))
+    state['last_at'] = _as_datetime(state['last_at'])
+    state['recent_errors'] = float(state['recent_errors'])
+    return state
+
+
+def _load_states(cursor, device_ids) -> Dict[int, Dict]:
+    placeholders = ', '.join(['%s'] * len(device_ids))
+    cursor.execute(f'''
+        SELECT {', '.join(STATE_COLUMNS)} FROM device_usage_state
+        WHERE device_id IN ({placeholders})
+    ''', list(device_ids))
+    return {row[0]: _row_dict(row) for row in cursor.fetchall()}
+
+
+def _open_types(cursor, device_ids) -> Dict[int, Set[str]]:
+    """Types of the open automatic entries per device"""
+    placeholders = ', '.join(['%s'] * len(device_ids))
+    cursor.execute(f'''
+        SELECT device_id, maintenance_type FROM maintenance_schedules
+        WHERE device_id IN ({placeholders}) AND status IN (%s, %s) AND maintenance_type IN (%s, %s)
+    ''', [*device_ids, *OPEN_STATUSES, RUNTIME_SERVICE, ERROR_INSPECTION])
+    open_types: Dict[int, Set[str]] = {}
+    for device_id, maintenance_type in cursor.fetchall():
+        open_types.setdefault(device_id, set()).add(maintenance_type)
+    return open_types
+
+
+def _lock_watermark(cursor) -> int:
+    """Lock the watermark row (serializes chunks and completions); returns the last id"""
+    cursor.execute('INSERT IGNORE INTO device_usage_watermarks (source, last_id) VALUES (%s, 0)', (SOURCE,))
+    cursor.execute('SELECT last_id FROM device_usage_watermarks WHERE source = %s FOR UPDATE', (SOURCE,))
+    return int(cursor.fetchall()[0][0])
+
+
+def process_chunk(conn, chunk_rows: int = CHUNK_ROWS, create: bool = True) -> Tuple[int, int]:
+    """
+    Fold the next chunk of device_status_history into the states (one
+    transaction; commits)
+
+    Args:
+        create: Insert the maintenance entries triggered (False when rebuilding)
+
+    Returns:
+        (rows read, 0 when caught up; maintenance entries created)
+    """
+    cursor = conn.cursor()
+    try:
+        last_id = _lock_watermark(cursor)
+        cursor.execute(HISTORY, (last_id, chunk_rows))
+        rows = cursor.fetchall()
+        if not rows:
+            conn.commit()
+            return 0, 0
+
+        device_ids = {row[1] for row in rows}
+        states = _load_states(cursor, device_ids)
+        open_types = _open_types(cursor, device_ids) if create else {}
+        changed = set()
+        entries = []
+        for history_id, device_id, device_name, created_at, uptime_seconds, error_count in rows:
+            if device_id is None or created_at is None:
+                continue
+            device_open = open_types.setdefault(device_id, set())
+            state, triggered = advance(states.get(device_id), device_id, _as_datetime(created_at),
+                                       device_name, uptime_seconds, error_count, device_open)
+            if state is states.get(device_id):
+                continue
+            states[device_id] = state
+            changed.add(device_id)
+            entries.extend(triggered)
+            device_open.update(entry[2] for entry in triggered)
+
+        if changed:
+            cursor.executemany(UPSERT_STATE, [tuple(states[d][c] for c in STATE_COLUMNS) for d in sorted(changed)])
+        if entries and create:
+            cursor.executemany(INSERT_MAINTENANCE, entries)
+        cursor.execute('''
+            UPDATE device_usage_watermarks SET last_id = %s, updated_at = NOW()
+            WHERE source = %s
+        ''', (rows[-1][0], SOURCE))
+        conn.commit()
+        created = len(entries) if create else 0
+        if created:
+            logger.info("maintenance_triggered entries=%s", created)
+        return len(rows), created
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+def process(conn, chunk_rows: int = CHUNK_ROWS, create: bool = True) -> Dict[str, int]:
+    """Process device_status_history up to its newest row; returns rows read and entries created"""
+    cursor = conn.cursor()
+    schema.create_device_usage(cursor)
+    conn.commit()
+    cursor.execute('SHOW TABLES LIKE %s', (SOURCE,))
+    exists = bool(cursor.fetchall())
+    cursor.close()
+    stats = {'rows': 0, 'created': 0}
+    while exists:
+        read, created = process_chunk(conn, chunk_rows, create)
+        stats['rows'] += read
+        stats['created'] += created
+        if read < chunk_rows:
+            break
+    return stats
+
+
+def rebuild(conn, chunk_rows: int = CHUNK_ROWS) -> Dict[str, int]:
+    """
+    Recompute the states from all history (commits); creates no entries,
+    and a device's runtime since its last service restarts from now
+    """
+    cursor = conn.cursor()
+    schema.create_device_usage(cursor)
+    for table in ('device_usage_state', 'device_usage_watermarks'):
+        cursor.execute(f'DELETE FROM {table}')
+    conn.commit()
+    cursor.close()
+    stats = process(conn, chunk_rows, create=False)
+    cursor = conn.cursor()
+    cursor.execute('UPDATE device_usage_state SET runtime_at_service = runtime_seconds')
+    conn.commit()
+    cursor.close()
+    return stats
+
+
+def complete(conn, maintenance_id: int) -> Optional[Dict]:
+    """
+    Mark a maintenance entry COMPLETED and restart the count it answers:
+    runtime since the service (RUNTIME_SERVICE) or the recent errors
+    (ERROR_INSPECTION); other types leave the usage alone (commits)
+
+    Returns:
+        {maintenance_id, device_id, maintenance_type}, or None if there is no such entry
+    """
+    cursor = conn.cursor()
+    try:
+        # Tables created by /api/maintenance/init or the first evaluation
+        cursor.execute('SHOW TABLES LIKE %s', ('device_usage_state',))
+        tracked = bool(cursor.fetchall())
+        if tracked:
+            # Under the watermark lock, so a chunk in flight cannot write back the old counts
+            _lock_watermark(cursor)
+        cursor.execute(ENTRY, (maintenance_id,))
+        rows = cursor.fetchall()
+        if not rows:
+            conn.commit()
+            return None
+        device_id, maintenance_type, status = rows[0]
+        cursor.execute('''
+            UPDATE maintenance_schedules SET status = 'COMPLETED', last_maintenance_date = %s
+            WHERE maintenance_id = %s
+        ''', (date.today(), maintenance_id))
+        if tracked and status != 'COMPLETED':
+            if maintenance_type == ERROR_INSPECTION:
+                cursor.execute('UPDATE device_usage_state SET recent_errors = 0 WHERE device_id = %s', (device_id,))
+            elif maintenance_type == RUNTIME_SERVICE:
+                cursor.execute('UPDATE device_usage_state SET runtime_at_service = runtime_seconds WHERE device_id = %s',
+                               (device_id,))
+        conn.commit()
+        return {'maintenance_id': maintenance_id, 'device_id': device_id, 'maintenance_type': maintenance_type}
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+# READING
+
+def usage(cursor, device_id: Optional[int] = None, now: Optional[datetime] = None) -> List[Dict]:
+    """
+    Usage per device (one row per device, by device_id)
+
+    Returns:
+        [{device_id, device_name, last_at, hours_run, hours_since_service,
+          service_due_in_hours, error_total, recent_errors}, ...]
+        (recent_errors decayed to now; empty before the first evaluation)
+    """
+    now = now or datetime.now()
+    cursor.execute('SHOW TABLES LIKE %s', ('device_usage_state',))
+    if not cursor.fetchall():
+        return []
+    if device_id is None:
+        cursor.execute(USAGE)
+    else:
+        cursor.execute(USAGE_FOR_DEVICE, (device_id,))
+    devices = []
+    for row in cursor.fetchall():
+        state = _row_dict(row)
+        hours_since_service = (int(state['runtime_seconds']) - int(state['runtime_at_service'])) / 3600
+        since_last = (now - state['last_at']).total_seconds() / 3600 if state['last_at'] else 0.0
+        devices.append({
+            'device_id': state['device_id'],
+            'device_name': state['device_name'],
+            'last_at': state['last_at'],
+            'hours_run': round(int(state['runtime_seconds']) / 3600, 2),
+            'hours_since_service': round(hours_since_service, 2),
+            'service_due_in_hours': round(max(RUNTIME_HOURS - hours_since_service, 0.0), 2),
+            'error_total': int(state['error_total']),
+            'recent_errors': round(_decayed(state['recent_errors'], since_last), 2),
+        })
+    return devices
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Fold new device status history into usage and schedule maintenance')
+    parser.add_argument('--every', type=float, default=0, help='repeat every N seconds')
+    parser.add_argument('--rebuild', action='store_true', help='recompute the counters from all history')
+    parser.add_argument('--chunk-rows', type=int, default=CHUNK_ROWS)
+    args = parser.parse_args()
+
+    import api_server  # DB_CONFIG and the MAINTENANCE_* settings
+
+    rebuild_first = args.rebuild
+    while True:
+        conn = database.connect(api_server.DB_CONFIG, instrument=False)
+        try:
+            start = time.perf_counter()
+            stats = (rebuild if rebuild_first else process)(conn, args.chunk_rows)
+            rebuild_first = False
+            print(f"{stats['rows']:>12} rows{stats['created']:>8} entries{time.perf_counter() - start:>8.1f}s")
+        finally:
+            conn.close()
+        if not args.every:
+            return
+        time.sleep(args.every)
+
+
+if __name__ == '__main__':
+    main()
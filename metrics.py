@@ -0,0 +1,339 @@
+"""
+Metrics for Smart Farm API
+Prometheus text-format counters, gauges and histograms
+Writes go to per-thread shards, so the hot path never takes a shared lock
+"""
+
+import glob
+import os
+import pickle
+import threading
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Dead-thread shards are folded once this many accumulate (threaded servers
+# start a thread per request, so shards must not grow without bound)
+MAX_SHARDS = 256
+
+INF_LABEL = 'le="+Inf"'
+
+
+def _escape(value) -> str:
+    """Escape a label value for the text exposition format"""
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Tuple, extra: str = '') -> str:
+    """Render {a="1",b="2"} (empty string when there are no labels)"""
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+
+class _ShardedMetric:
+    """
+    Base for metrics whose state lives in per-thread dicts
+
+    Only the owning thread writes to a shard, so updates need no lock.
+    Readers merge all shards; shards of finished threads are folded into
+    a base dict under the registration lock.
+    """
+
+    kind = 'untyped'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._shards: List[Tuple[threading.Thread, Dict]] = []
+        self._base: Dict = {}
+
+    def _shard(self) -> Dict:
+        """Return (creating on first use) this thread's shard"""
+        try:
+            return self._local.values
+        except AttributeError:
+            values = {}
+            self._local.values = values
+            with self._lock:
+                self._shards.append((threading.current_thread(), values))
+                if len(self._shards) > MAX_SHARDS:
+                    self._fold_dead()
+            return values
+
+    def _fold_dead(self):
+        """Merge shards of finished threads into the base (lock held)"""
+        alive = []
+        for thread, values in self._shards:
+            if thread.is_alive():
+                alive.append((thread, values))
+            else:
+                for key, value in values.items():
+                    self._merge(self._base, key, value)
+        self._shards = alive
+
+    def _merge(self, into: Dict, key, value):
+        raise NotImplementedError
+
+    def snapshot(self) -> Dict:
+        """Merged view of every shard"""
+        with self._lock:
+            self._fold_dead()
+            merged = {}
+            for key, value in self._base.items():
+                self._merge(merged, key, value)
+            for _, values in self._shards:
+                for key, value in list(values.items()):
+                    self._merge(merged, key, value)
+        return merged
+
+    def merged(self, others: Iterable[Dict] = ()) -> Dict:
+        """Own snapshot plus snapshots taken in other processes"""
+        merged = self.snapshot()
+        for other in others:
+            for key, value in other.items():
+                self._merge(merged, key, value)
+        return merged
+
+    def reset(self):
+        """Drop all recorded values (used in forked workers)"""
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._shards = []
+        self._base = {}
+
+    def render(self, others: Iterable[Dict] = ()) -> Iterable[str]:
+        raise NotImplementedError
+
+
+class Counter(_ShardedMetric):
+    """Monotonic counter"""
+
+    kind = 'counter'
+
+    def inc(self, labels: Tuple = (), amount: float = 1.0):
+        values = self._shard()
+        values[labels] = values.get(labels, 0.0) + amount
+
+    def _merge(self, into, key, value):
+        into[key] = into.get(key, 0.0) + value
+
+    def value(self, labels: Tuple = ()) -> float:
+        return self.snapshot().get(labels, 0.0)
+
+    def render(self, others=()):
+        for labels, value in sorted(self.merged(others).items()):
+            yield f"{self.name}{_format_labels(self.labelnames, labels)} {value:g}"
+
+
+class Histogram(_ShardedMetric):
+    """Bucketed distribution with _bucket/_sum/_count series"""
+
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, labels: Tuple = ()):
+        values = self._shard()
+        state = values.get(labels)
+        if state is None:
+            # [per-bucket counts..., +Inf count, sum]
+            state = values[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+        state[bisect_left(self.buckets, value)] += 1
+        state[-1] += value
+
+    def _merge(self, into, key, value):
+        current = into.get(key)
+        if current is None:
+            into[key] = list(value)
+        else:
+            for i, v in enumerate(value):
+                current[i] += v
+
+    def render(self, others=()):
+        for labels, state in sorted(self.merged(others).items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, state):
+                cumulative += count
+                le = f'le="{bound:g}"'
+                yield f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}"
+            cumulative += state[len(self.buckets)]
+            yield f"{self.name}_bucket{_format_labels(self.labelnames, labels, INF_LABEL)} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(self.labelnames, labels)} {state[-1]:g}"
+            yield f"{self.name}_count{_format_labels(self.labelnames, labels)} {cumulative}"
+
+
+class Gauge:
+    """
+    Gauge whose value is read from a callback at scrape time
+
+    With labelnames the callback returns {label values tuple: value}.
+    """
+
+    kind = 'gauge'
+
+    def __init__(self, name: str, documentation: str, callback: Callable, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.callback = callback
+        self.labelnames = tuple(labelnames)
+
+    def render(self, others=()):
+        # Gauges describe this process only
+        try:
+            values = self.callback()
+            if not self.labelnames:
+                values = {(): values}
+            values = {labels: float(value) for labels, value in values.items()}
+        except Exception:
+            return
+        for labels, value in values.items():
+            yield f"{self.name}{_format_labels(self.labelnames, labels)} {value:g}"
+
+
+class Registry:
+    """Collection of metrics rendered together by /metrics"""
+
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+        self._lock = threading.Lock()
+        self._multiprocess_dir: Optional[str] = None
+        self._flush_interval = 5.0
+
+    def _register(self, metric):
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def gauge(self, name: str, documentation: str, callback: Callable,
+              labelnames: Sequence[str] = ()) -> Gauge:
+        with self._lock:
+            # Callbacks are replaced so re-registration picks up the new source
+            metric = self._metrics[name] = Gauge(name, documentation, callback, labelnames)
+        return metric
+
+    def _sharded(self) -> List[_ShardedMetric]:
+        with self._lock:
+            return [m for m in self._metrics.values() if isinstance(m, _ShardedMetric)]
+
+    # ---------------- multi-process (pre-fork) support ----------------
+
+    def enable_multiprocess(self, directory: str, flush_interval: float = 5.0):
+        """
+        Share metrics between pre-forked workers through snapshot files
+
+        Call in the master before forking. Each worker writes its snapshot
+        to <directory>/<pid>.pkl every flush_interval seconds; /metrics on
+        any worker merges all files, so every scrape sees the whole server.
+
+        Args:
+            directory: Writable directory (cleared here)
+            flush_interval: Seconds between snapshot writes in each worker
+        """
+        os.makedirs(directory, exist_ok=True)
+        for path in glob.glob(os.path.join(directory, '*.pkl')):
+            os.remove(path)
+        self._multiprocess_dir = directory
+        self._flush_interval = flush_interval
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._after_fork_in_child)
+
+    def _after_fork_in_child(self):
+        """Start each worker from zero and begin writing snapshots"""
+        self._lock = threading.Lock()
+        for metric in self._sharded():
+            metric.reset()
+        thread = threading.Thread(target=self._flush_loop, name='metrics-flush', daemon=True)
+        thread.start()
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self._flush_interval)
+            self.dump()
+
+    def dump(self):
+        """Write this process's snapshot atomically"""
+        if not self._multiprocess_dir:
+            return
+        path = os.path.join(self._multiprocess_dir, f"{os.getpid()}.pkl")
+        data = {metric.name: metric.snapshot() for metric in self._sharded()}
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+
+    def fold_worker(self, pid: int):
+        """
+        Merge an exited worker's snapshot into archive.pkl (run in the master)
+        so counters stay monotonic across worker recycling
+        """
+        if not self._multiprocess_dir:
+            return
+        path = os.path.join(self._multiprocess_dir, f"{pid}.pkl")
+        archive_path = os.path.join(self._multiprocess_dir, 'archive.pkl')
+        worker = self._load(path)
+        if worker is None:
+            return
+        archive = self._load(archive_path) or {}
+        for metric in self._sharded():
+            merged = metric.merged([archive.get(metric.name, {}), worker.get(metric.name, {})])
+            archive[metric.name] = merged
+        tmp_path = f"{archive_path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(archive, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, archive_path)
+        os.remove(path)
+
+    @staticmethod
+    def _load(path: str) -> Optional[Dict]:
+        try:
+            with open(path, 'rb') as f:
+                return pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+
+    def _other_snapshots(self) -> List[Dict]:
+        """Snapshots written by the other workers (and exited ones)"""
+        if not self._multiprocess_dir:
+            return []
+        own = os.path.join(self._multiprocess_dir, f"{os.getpid()}.pkl")
+        snapshots = []
+        for path in glob.glob(os.path.join(self._multiprocess_dir, '*.pkl')):
+            if path != own:
+                data = self._load(path)
+                if data:
+                    snapshots.append(data)
+        return snapshots
+
+    def render(self) -> str:
+        """Prometheus text exposition format (version 0.0.4)"""
+        lines = []
+        with self._lock:
+            metrics = list(self._metrics.values())
+        others = self._other_snapshots()
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.render([o.get(metric.name, {}) for o in others]))
+        return '\n'.join(lines) + '\n'
+
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Process-wide registry
+REGISTRY = Registry()
@@ -0,0 +1,218 @@
+"""
+Password Hashing Service for Smart Farm
+Runs bcrypt in a dedicated process pool so logins never burn request threads
+Supports transparent upgrade of legacy plaintext passwords
+"""
+
+import bcrypt
+import hmac
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+BCRYPT_PREFIXES = ('$2a$', '$2b$', '$2y$')
+
+
+class HasherSaturated(Exception):
+    """Raised when the hashing pool is full or restarting (callers should return 503)"""
+
+
+def _bcrypt_hash(password: bytes, rounds: int) -> str:
+    """Worker-side bcrypt hash"""
+    return bcrypt.hashpw(password, bcrypt.gensalt(rounds=rounds)).decode('utf-8')
+
+
+def _bcrypt_check(password: bytes, hashed: bytes) -> bool:
+    """Worker-side bcrypt verification"""
+    try:
+        return bcrypt.checkpw(password, hashed)
+    except ValueError:
+        return False
+
+
+def is_bcrypt_hash(value: str) -> bool:
+    """Check whether a stored password looks like a bcrypt hash"""
+    return bool(value) and len(value) == 60 and value.startswith(BCRYPT_PREFIXES)
+
+
+def hash_rounds(hashed: str) -> int:
+    """Extract the cost factor from a bcrypt hash ($2b$12$... -> 12)"""
+    try:
+        return int(hashed.split('$')[2])
+    except (IndexError, ValueError):
+        return 0
+
+
+class PasswordHasher:
+    """
+    Bounded process pool for bcrypt work
+    Pool is created lazily on first use and recreated after fork.
+    Workers use the spawn start method, so entry scripts need the usual
+    `if __name__ == '__main__':` guard. A pool broken by a dead worker is
+    replaced on the next job; the jobs it failed get HasherSaturated.
+    """
+
+    def __init__(self, workers: Optional[int] = None, queue_limit: Optional[int] = None,
+                 rounds: int = 12, timeout: float = 10.0):
+        """
+        Args:
+            workers: Number of hashing processes (defaults to CPU count)
+            queue_limit: Jobs allowed to wait beyond the running ones
+            rounds: bcrypt cost factor for new hashes
+            timeout: Seconds to wait for a result before giving up
+        """
+        self.workers = workers or os.cpu_count() or 1
+        self.queue_limit = self.workers * 4 if queue_limit is None else queue_limit
+        self.rounds = rounds
+        self.timeout = timeout
+
+        self._executor = None
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(self.workers + self.queue_limit)
+
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._reset_after_fork)
+
+    def _reset_after_fork(self):
+        """Forked children must not reuse the parent's executor"""
+        self._executor = None
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(self.workers + self.queue_limit)
+
+    def resize(self, workers: int):
+        """Change the pool size (takes effect when the pool is next created)"""
+        self.shutdown()
+        self.workers = max(1, workers)
+        self._slots = threading.BoundedSemaphore(self.workers + self.queue_limit)
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        """Create the process pool on first use"""
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    # spawn: forking a multi-threaded server is unsafe
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self.workers,
+                        mp_context=multiprocessing.get_context('spawn')
+                    )
+                    logger.info("password_pool_started workers=%s queue_limit=%s", self.workers, self.queue_limit)
+        return self._executor
+
+    def _discard_broken(self, executor: ProcessPoolExecutor):
+        """Drop a pool whose worker died; the next job starts a new one"""
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+                logger.warning("password_pool_broken reason=worker_died action=restart")
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def _submit(self, fn, *args):
+        """Submit a job, failing fast when the pool is saturated"""
+        if not self._slots.acquire(blocking=False):
+            raise HasherSaturated('Password hashing pool is saturated')
+
+        executor = self._get_executor()
+        try:
+            future = executor.submit(fn, *args)
+        except BrokenProcessPool:
+            self._slots.release()
+            self._discard_broken(executor)
+            raise HasherSaturated('Password hashing pool is restarting')
+        except Exception:
+            self._slots.release()
+            raise
+
+        future.add_done_callback(lambda _: self._slots.release())
+        return executor, future
+
+    def _run(self, fn, *args):
+        """Run a job in the pool and wait for its result"""
+        executor, future = self._submit(fn, *args)
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            future.cancel()
+            raise HasherSaturated('Password hashing timed out')
+        except BrokenProcessPool:
+            self._discard_broken(executor)
+            raise HasherSaturated('Password hashing pool is restarting')
+
+    def hash(self, password: str) -> str:
+        """
+        Hash a password with bcrypt in the pool
+
+        Args:
+            password: Plaintext password
+
+        Returns:
+            bcrypt hash string
+        """
+        return self._run(_bcrypt_hash, password.encode('utf-8'), self.rounds)
+
+    def hash_later(self, password: str, callback: Callable[[str], None]) -> bool:
+        """
+        Hash a password in the pool without waiting for it
+
+        Args:
+            password: Plaintext password
+            callback: Called with the hash when done (on a pool thread);
+                not called if hashing fails
+
+        Returns:
+            False if the pool is saturated (nothing was submitted)
+        """
+        try:
+            executor, future = self._submit(_bcrypt_hash, password.encode('utf-8'), self.rounds)
+        except HasherSaturated:
+            return False
+
+        def done(f):
+            try:
+                hashed = f.result()
+            except BrokenProcessPool:
+                self._discard_broken(executor)
+                return
+            except Exception as e:
+                logger.warning("password_rehash_failed error=%s", e)
+                return
+            callback(hashed)
+
+        future.add_done_callback(done)
+        return True
+
+    def verify(self, password: str, hashed: str) -> Tuple[bool, bool]:
+        """
+        Verify a password against the stored value
+
+        Args:
+            password: Plaintext password from the client
+            hashed: Stored password (bcrypt hash or legacy plaintext)
+
+        Returns:
+            (matched, needs_rehash) - needs_rehash is True for legacy plaintext
+            passwords and for hashes weaker than the configured cost
+        """
+        if not hashed:
+            return False, False
+
+        if not is_bcrypt_hash(hashed):
+            # Legacy plaintext (migration support) - no bcrypt work needed
+            matched = hmac.compare_digest(password.encode('utf-8'), hashed.encode('utf-8'))
+            return matched, matched
+
+        matched = self._run(_bcrypt_check, password.encode('utf-8'), hashed.encode('utf-8'))
+        return matched, matched and hash_rounds(hashed) < self.rounds
+
+    def shutdown(self):
+        """Stop the worker processes"""
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
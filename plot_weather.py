@@ -0,0 +1,247 @@
+"""
+Plot Weather Interpolation for Smart Farm
+Estimates the current temperature, humidity, wind speed and rainfall at
+every plot from the latest reading of nearby weather stations, by inverse
+distance weighting computed with NumPy for all plots at once
+
+Inputs are two queries: plots with a latitude/longitude, and the stations
+in weather_stations (weather_stations.py) that reported within
+STATION_MAX_AGE_HOURS, joined with their latest reading by primary key.
+Each plot uses its NEIGHBOURS nearest stations within RADIUS_KM, weighted
+by 1 / distance ** POWER; a station missing a variable is left out of that
+variable only. Plots with no station in range get nulls.
+
+Results are cached per BUCKET_SECONDS time bucket (per process): the first
+request of a bucket computes, concurrent ones wait for it.
+
+Requires numpy (optional: without it the endpoint answers 503).
+
+Usage:
+    python plot_weather.py                  # every plot, with timing
+    python plot_weather.py --plot-id 3
+"""
+
+import argparse
+import logging
+import math
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+import database
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+logger = logging.getLogger(__name__)
+
+VARIABLES = ('temperature', 'humidity', 'wind_speed', 'rainfall')
+
+POWER = 2.0
+NEIGHBOURS = 8
+RADIUS_KM = 50.0
+STATION_MAX_AGE_HOURS = 6.0
+BUCKET_SECONDS = 600
+
+EARTH_RADIUS_KM = 6371.0088
+# Closer than this counts as at the station
+MIN_DISTANCE_KM = 0.001
+# Plots per distance matrix (CHUNK_PLOTS x stations in their latitude band)
+CHUNK_PLOTS = 256
+
+PLOTS = '''
+    SELECT plot_id, latitude, longitude
+    FROM plots
+    WHERE latitude IS NOT NULL AND longitude IS NOT NULL
+'''
+
+STATIONS = '''
+    SELECT s.latitude, s.longitude, w.temperature, w.humidity, w.wind_speed, w.rainfall
+    FROM weather_stations s
+    JOIN weather_logs w ON w.weather_id = s.last_weather_id
+    WHERE s.last_seen >= %s
+'''
+
+
+def configure(power: float = 2.0, neighbours: int = 8, radius_km: float = 50.0,
+              station_max_age_hours: float = 6.0, bucket_seconds: int = 600):
+    """Set the weighting, the station selection and the cache bucket"""
+    global POWER, NEIGHBOURS, RADIUS_KM, STATION_MAX_AGE_HOURS, BUCKET_SECONDS
+    POWER = power
+    NEIGHBOURS = max(1, neighbours)
+    RADIUS_KM = radius_km
+    STATION_MAX_AGE_HOURS = station_max_age_hours
+    BUCKET_SECONDS = max(1, bucket_seconds)
+
+
+def _require_numpy():
+    if np is None:
+        raise RuntimeError('numpy is required for plot weather interpolation (pip install numpy)')
+
+
+def _unit_vectors(lat, lon):
+    lat, lon = np.radians(lat), np.radians(lon)
+    cos_lat = np.cos(lat)
+    return np.column_stack((cos_lat * np.cos(lon), cos_lat * np.sin(lon), np.sin(lat)))
+
+
+def interpolate(plot_lat, plot_lon, station_lat, station_lon, values):
+    """
+    Inverse distance weighting of station values onto plots
+
+    Plots are taken in latitude order, CHUNK_PLOTS at a time, against only
+    the stations in the chunk's latitude band widened by RADIUS_KM (a slice
+    of the latitude-sorted stations), so the distance matrices stay small.
+
+    Args:
+        plot_lat, plot_lon: Plot positions (degrees), shape (plots,)
+        station_lat, station_lon: Station positions, shape (stations,)
+        values: Station readings, shape (stations, variables); NaN = missing
+
+    Returns:
+        (estimates (plots, variables) with NaN where no station is in range,
+         stations used per plot, km to the nearest station used (NaN if none))
+    """
+    _require_numpy()
+    plots, stations = len(plot_lat), len(station_lat)
+    values = np.asarray(values, dtype=float).reshape(stations, -1)
+    estimates = np.full((plots, values.shape[1]), np.nan)
+    used = np.zeros(plots, dtype=int)
+    nearest_km = np.full(plots, np.nan)
+    if not plots or not stations:
+        return estimates, used, nearest_km
+
+    plot_lat, plot_lon = np.asarray(plot_lat, dtype=float), np.asarray(plot_lon, dtype=float)
+    station_lat, station_lon = np.asarray(station_lat, dtype=float), np.asarray(station_lon, dtype=float)
+    plot_order = np.argsort(plot_lat, kind='stable')
+    station_order = np.argsort(station_lat, kind='stable')
+    sorted_lat = station_lat[station_order]
+    plot_xyz = _unit_vectors(plot_lat, plot_lon)
+    station_xyz = _unit_vectors(station_lat, station_lon)[station_order]
+    valid = ~np.isnan(values[station_order])
+    filled = np.where(valid, values[station_order], 0.0)
+    band = math.degrees(RADIUS_KM / EARTH_RADIUS_KM)
+    for start in range(0, plots, CHUNK_PLOTS):
+        rows = plot_order[start:start + CHUNK_PLOTS]
+        first = np.searchsorted(sorted_lat, plot_lat[rows[0]] - band, side='left')
+        last = np.searchsorted(sorted_lat, plot_lat[rows[-1]] + band, side='right')
+        if first == last:
+            continue
+        # Largest dot product = nearest: select neighbours before any trigonometry
+        dot = plot_xyz[rows] @ station_xyz[first:last].T
+        k = min(NEIGHBOURS, last - first)
+        if k < last - first:
+            index = np.argpartition(-dot, k - 1, axis=1)[:, :k]
+            dot = np.take_along_axis(dot, index, axis=1)
+        else:
+            index = np.broadcast_to(np.arange(last - first), dot.shape)
+        index = index + first
+        km = EARTH_RADIUS_KM * np.arccos(np.clip(dot, -1.0, 1.0))
+        within = km <= RADIUS_KM
+        weights = np.where(within, np.maximum(km, MIN_DISTANCE_KM) ** -POWER, 0.0)[:, :, None] * valid[index]
+        total = weights.sum(axis=1)
+        weighted = (weights * filled[index]).sum(axis=1)
+        estimates[rows] = np.divide(weighted, total, out=np.full_like(total, np.nan), where=total > 0)
+        used[rows] = within.sum(axis=1)
+        nearest_km[rows] = np.where(within, km, np.inf).min(axis=1)
+    nearest_km[np.isinf(nearest_km)] = np.nan
+    return estimates, used, nearest_km
+
+
+def _float(value) -> float:
+    return math.nan if value is None else float(value)
+
+
+def compute(conn, as_of: Optional[datetime] = None) -> Dict:
+    """
+    Weather of every plot with a position
+
+    Returns:
+        {'as_of': datetime, 'stations': n, 'plots': [{plot_id, temperature,
+         humidity, wind_speed, rainfall, stations, nearest_station_km}, ...]}
+    """
+    _require_numpy()
+    as_of = as_of or datetime.now()
+    cursor = conn.cursor()
+    try:
+        cursor.execute(PLOTS)
+        plot_rows = cursor.fetchall()
+        cursor.execute(STATIONS, (as_of - timedelta(hours=STATION_MAX_AGE_HOURS),))
+        station_rows = cursor.fetchall()
+    finally:
+        cursor.close()
+
+    plot_ids = [row[0] for row in plot_rows]
+    plot_pos = np.array([(float(row[1]), float(row[2])) for row in plot_rows], dtype=float).reshape(-1, 2)
+    station_data = np.array([[_float(v) for v in row] for row in station_rows], dtype=float)
+    station_data = station_data.reshape(-1, 2 + len(VARIABLES))
+    estimates, used, nearest_km = interpolate(plot_pos[:, 0], plot_pos[:, 1], station_data[:, 0],
+                                              station_data[:, 1], station_data[:, 2:])
+
+    plots = []
+    for i, plot_id in enumerate(plot_ids):
+        entry = {'plot_id': plot_id}
+        for j, name in enumerate(VARIABLES):
+            value = estimates[i, j]
+            entry[name] = None if math.isnan(value) else round(float(value), 2)
+        entry['stations'] = int(used[i])
+        entry['nearest_station_km'] = None if math.isnan(nearest_km[i]) else round(float(nearest_km[i]), 3)
+        plots.append(entry)
+    return {'as_of': as_of, 'stations': len(station_rows), 'plots': plots}
+
+
+_cache: Dict = {'bucket': None, 'result': None}
+_cache_lock = threading.Lock()
+
+
+def current(connect) -> Dict:
+    """
+    compute() for the current time bucket, cached per process
+
+    Args:
+        connect: Callable returning a DB connection (or None)
+    """
+    bucket = int(time.time() // BUCKET_SECONDS)
+    with _cache_lock:
+        if _cache['bucket'] != bucket:
+            conn = connect()
+            if not conn:
+                raise database.Error('Database connection failed')
+            try:
+                result = compute(conn)
+            finally:
+                conn.close()
+            _cache.update(bucket=bucket, result=result)
+        return _cache['result']
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Interpolated weather of every plot')
+    parser.add_argument('--plot-id', type=int, default=None)
+    args = parser.parse_args()
+
+    import api_server  # DB_CONFIG and the WEATHER_IDW_* settings
+
+    conn = database.connect(api_server.DB_CONFIG, instrument=False)
+    try:
+        started = time.perf_counter()
+        result = compute(conn)
+        elapsed = time.perf_counter() - started
+    finally:
+        conn.close()
+    plots: List[Dict] = result['plots']
+    if args.plot_id is not None:
+        plots = [p for p in plots if p['plot_id'] == args.plot_id]
+    print(f"{len(result['plots'])} plots from {result['stations']} stations in {elapsed * 1e3:.1f} ms")
+    print(f"{'plot':>8}{'temp':>8}{'humidity':>10}{'wind':>8}{'rain':>8}{'stations':>10}{'nearest km':>12}")
+    for p in plots:
+        cells = [('' if p[name] is None else f"{p[name]:.1f}") for name in VARIABLES]
+        nearest = '' if p['nearest_station_km'] is None else f"{p['nearest_station_km']:.2f}"
+        print(f"{p['plot_id']:>8}{cells[0]:>8}{cells[1]:>10}{cells[2]:>8}{cells[3]:>8}{p['stations']:>10}{nearest:>12}")
+
+
+if __name__ == '__main__':
+    main()
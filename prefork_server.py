@@ -0,0 +1,116 @@
+"""
+Pre-fork Production Server for Smart Farm API
+Runs api_server.app under gunicorn with API_WORKERS processes (Linux/macOS)
+
+The app is imported once in the master (preload) and forked into workers.
+Workers are recycled after API_MAX_REQUESTS requests (+ jitter) and killed
+if a request exceeds API_TIMEOUT seconds.
+
+Usage:
+    python prefork_server.py                     # API_WORKERS from environment
+    python prefork_server.py --workers 8 --bind 0.0.0.0:5000
+
+Signals (sent to the master pid):
+    HUP          graceful restart of all workers (config reload)
+    USR2, QUIT   zero-downtime code reload: USR2 starts a new master with
+                 the new code, then QUIT the old master once it is serving
+    TTIN / TTOU  add / remove one worker
+"""
+
+import argparse
+import logging
+
+import production_config as config
+
+logger = logging.getLogger(__name__)
+
+
+def build_options(workers: int, bind: str, threads: int) -> dict:
+    """Gunicorn settings derived from production_config"""
+    return {
+        'bind': bind,
+        'workers': workers,
+        'worker_class': 'gthread',
+        'threads': threads,
+        'preload_app': True,
+        'timeout': config.API_TIMEOUT,
+        'graceful_timeout': config.API_GRACEFUL_TIMEOUT,
+        'max_requests': config.API_MAX_REQUESTS,
+        'max_requests_jitter': config.API_MAX_REQUESTS_JITTER,
+        'keepalive': 5,
+        'accesslog': None,
+        'worker_exit': _worker_exit,
+        'child_exit': _child_exit,
+    }
+
+
+def _worker_exit(server, worker):
+    """Runs in the worker: write a final metrics snapshot"""
+    import metrics
+    metrics.REGISTRY.dump()
+
+
+def _child_exit(server, worker):
+    """Runs in the master: keep counters of recycled workers"""
+    import metrics
+    metrics.REGISTRY.fold_worker(worker.pid)
+
+
+def run(workers: int = None, bind: str = None, threads: int = None):
+    """
+    Start the pre-fork server (blocks until the master exits)
+
+    Args:
+        workers: Worker processes (defaults to API_WORKERS)
+        bind: host:port (defaults to API_HOST:API_PORT)
+        threads: Threads per worker (defaults to API_THREADS)
+    """
+    try:
+        from gunicorn.app.base import BaseApplication
+    except ImportError:
+        raise SystemExit("gunicorn is required for pre-fork mode (pip install gunicorn); "
+                         "on Windows run `python api_server.py` instead")
+
+    workers = workers or config.API_WORKERS
+    bind = bind or f"{config.API_HOST}:{config.API_PORT}"
+    threads = threads or config.API_THREADS
+
+    import metrics
+    if config.ENABLE_METRICS:
+        # Before the app import so every worker inherits the shared directory
+        metrics.REGISTRY.enable_multiprocess(config.METRICS_MULTIPROC_DIR)
+
+    # Preload: import the app once in the master, workers inherit it
+    import api_server
+    api_server.configure_for_workers(workers)
+
+    class SmartFarmApplication(BaseApplication):
+        def __init__(self, application, options):
+            self.application = application
+            self.options = options
+            super().__init__()
+
+        def load_config(self):
+            for key, value in self.options.items():
+                if key in self.cfg.settings and value is not None:
+                    self.cfg.set(key, value)
+
+        def load(self):
+            return self.application
+
+    logger.info(f"Starting pre-fork server on {bind}: {workers} workers x {threads} threads, "
+                f"recycle after {config.API_MAX_REQUESTS} requests, timeout {config.API_TIMEOUT}s")
+    SmartFarmApplication(api_server.app, build_options(workers, bind, threads)).run()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Smart Farm API pre-fork server')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--bind', default=None)
+    parser.add_argument('--threads', type=int, default=None)
+    args = parser.parse_args()
+    run(args.workers, args.bind, args.threads)
+
+
+if __name__ == '__main__':
+    main()
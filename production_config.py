@@ -4,8 +4,12 @@ Handles logging, monitoring, and environment setup
 """
 
 import os
+import atexit
+import queue
+import random
+import socket
 import logging
-from logging.handlers import RotatingFileHandler
+from logging.handlers import RotatingFileHandler, QueueHandler, QueueListener
 from datetime import timedelta
 
 # ============================================================
@@ -35,6 +39,17 @@ DB_CONFIG = {
     'use_pure': False,
 }
 
+# Embedded SQLite instead of MySQL on single-greenhouse gateways
+DB_BACKEND = os.getenv('DB_BACKEND', 'mysql').lower()
+SQLITE_PATH = os.getenv('SQLITE_PATH', 'smart_farm.db')
+
+# Read replicas for dashboard reads (see replica_router.py)
+DB_REPLICAS = os.getenv('DB_REPLICAS', '')  # "host[:port],..." with the primary's credentials
+DB_READ_ROUTE_CLASSES = os.getenv('DB_READ_ROUTE_CLASSES', 'dashboard').split(',')
+DB_REPLICA_MAX_LAG = float(os.getenv('DB_REPLICA_MAX_LAG', 5))  # seconds; staler replicas are skipped
+DB_READ_YOUR_WRITES_SECONDS = float(os.getenv('DB_READ_YOUR_WRITES_SECONDS', 10))  # reads stay on the primary after a write
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', 0))  # connections per target and worker; 0 connects per request
+
 # ============================================================
 # FIREBASE CONFIGURATION
 # ============================================================
@@ -48,6 +63,17 @@ API_HOST = os.getenv('API_HOST', '0.0.0.0')
 API_PORT = int(os.getenv('API_PORT', 5000))
 API_WORKERS = int(os.getenv('API_WORKERS', 4))
 API_TIMEOUT = int(os.getenv('API_TIMEOUT', 120))
+API_THREADS = int(os.getenv('API_THREADS', 4))  # threads per worker process
+API_MAX_REQUESTS = int(os.getenv('API_MAX_REQUESTS', 10000))  # recycle a worker after N requests
+API_MAX_REQUESTS_JITTER = int(os.getenv('API_MAX_REQUESTS_JITTER', 1000))
+API_GRACEFUL_TIMEOUT = int(os.getenv('API_GRACEFUL_TIMEOUT', 30))
+
+# asyncio server for the hot ESP32/dashboard endpoints (see async_server.py)
+ASYNC_HOST = os.getenv('ASYNC_HOST', '0.0.0.0')
+ASYNC_PORT = int(os.getenv('ASYNC_PORT', 5001))
+ASYNC_DB_POOL_SIZE = int(os.getenv('ASYNC_DB_POOL_SIZE', 20))  # aiomysql connections per process
+ASYNC_SQLITE_THREADS = int(os.getenv('ASYNC_SQLITE_THREADS', 4))  # statement threads with DB_BACKEND=sqlite
+ASYNC_KEEPALIVE = float(os.getenv('ASYNC_KEEPALIVE', 75))  # idle keep-alive seconds per client
 
 # ============================================================
 # JWT TOKEN CONFIGURATION
@@ -63,6 +89,11 @@ LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
 LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 LOG_MAX_BYTES = int(os.getenv('LOG_MAX_BYTES', 10485760))  # 10MB
 LOG_BACKUP_COUNT = int(os.getenv('LOG_BACKUP_COUNT', 10))
+LOG_QUEUE_SIZE = int(os.getenv('LOG_QUEUE_SIZE', 10000))  # records buffered for the writer thread
+LOG_SAMPLE_RATE = float(os.getenv('LOG_SAMPLE_RATE', 1.0))  # fraction of sampled success logs kept
+
+# Pass as extra= on high-volume success logs so LOG_SAMPLE_RATE applies
+SAMPLED = {'sampled': True}
 
 # ============================================================
 # CORS CONFIGURATION
@@ -76,17 +107,55 @@ CORS_ORIGINS = [
 ]
 CORS_ORIGINS = [origin for origin in CORS_ORIGINS if origin]
 
+# ============================================================
+# PASSWORD HASHING (password_hashing.py)
+# ============================================================
+BCRYPT_ROUNDS = int(os.getenv('BCRYPT_ROUNDS', 12))
+BCRYPT_WORKERS = int(os.getenv('BCRYPT_WORKERS', os.cpu_count() or 1))  # hashing processes per API worker
+BCRYPT_QUEUE_LIMIT = int(os.getenv('BCRYPT_QUEUE_LIMIT', BCRYPT_WORKERS * 4))  # queued hashes before 503
+BCRYPT_TIMEOUT = float(os.getenv('BCRYPT_TIMEOUT', 10))  # seconds a request waits for its hash
+
 # ============================================================
 # RATE LIMITING
 # ============================================================
 RATE_LIMIT_ENABLED = os.getenv('RATE_LIMIT_ENABLED', 'True').lower() == 'true'
-RATE_LIMIT_REQUESTS = int(os.getenv('RATE_LIMIT_REQUESTS', 100))
+# Was 100 while nothing enforced it; a dashboard polling every 5s makes 720
+# requests an hour per endpoint, so 7200 leaves room for ~10 polled endpoints
+RATE_LIMIT_REQUESTS = int(os.getenv('RATE_LIMIT_REQUESTS', 7200))
 RATE_LIMIT_WINDOW = int(os.getenv('RATE_LIMIT_WINDOW', 3600))  # 1 hour
+# Per route class overrides (RATE_LIMIT_* above applies to dashboard reads)
+RATE_LIMIT_INGEST_REQUESTS = int(os.getenv('RATE_LIMIT_INGEST_REQUESTS', 720))  # ESP32 every 5s
+RATE_LIMIT_INGEST_WINDOW = int(os.getenv('RATE_LIMIT_INGEST_WINDOW', 3600))
+RATE_LIMIT_AUTH_REQUESTS = int(os.getenv('RATE_LIMIT_AUTH_REQUESTS', 20))
+RATE_LIMIT_AUTH_WINDOW = int(os.getenv('RATE_LIMIT_AUTH_WINDOW', 300))  # 5 minutes
+RATE_LIMIT_REPLICATION_REQUESTS = int(os.getenv('RATE_LIMIT_REPLICATION_REQUESTS', 3600))  # per gateway
+RATE_LIMIT_REPLICATION_WINDOW = int(os.getenv('RATE_LIMIT_REPLICATION_WINDOW', 3600))
+
+# ============================================================
+# GATEWAY REPLICATION (replication_agent.py)
+# ============================================================
+REPLICATION_CENTRAL_URL = os.getenv('REPLICATION_CENTRAL_URL', '')  # e.g. https://farm.example.com
+REPLICATION_GATEWAY_ID = os.getenv('REPLICATION_GATEWAY_ID', socket.gethostname())
+REPLICATION_KEY = os.getenv('REPLICATION_KEY', '')  # required: central refuses replication without it
+REPLICATION_BATCH_ROWS = int(os.getenv('REPLICATION_BATCH_ROWS', 2000))
+REPLICATION_INTERVAL = float(os.getenv('REPLICATION_INTERVAL', 10))  # seconds between syncs
+REPLICATION_MAX_BACKOFF = float(os.getenv('REPLICATION_MAX_BACKOFF', 300))  # while central is down
+
+# ============================================================
+# HTTP CACHING & COMPRESSION
+# ============================================================
+HTTP_CACHE_ENABLED = os.getenv('HTTP_CACHE_ENABLED', 'True').lower() == 'true'
+COMPRESS_ENABLED = os.getenv('COMPRESS_ENABLED', 'True').lower() == 'true'
+COMPRESS_MIN_BYTES = int(os.getenv('COMPRESS_MIN_BYTES', 1024))
+COMPRESS_LEVEL = int(os.getenv('COMPRESS_LEVEL', 6))  # gzip level 1-9
 
 # ============================================================
 # MONITORING & ALERTING
 # ============================================================
 ENABLE_METRICS = os.getenv('ENABLE_METRICS', 'True').lower() == 'true'
+METRICS_MULTIPROC_DIR = os.getenv('METRICS_MULTIPROC_DIR', os.path.join('logs', 'metrics'))
+DB_SLOW_QUERY_MS = float(os.getenv('DB_SLOW_QUERY_MS', 200))  # 0 disables the slow query log
+DB_EXPLAIN_SLOW = os.getenv('DB_EXPLAIN_SLOW', 'True').lower() == 'true'
 ALERT_EMAIL = os.getenv('ALERT_EMAIL', '')
 ALERT_THRESHOLD = {
     'temperature_max': float(os.getenv('ALERT_TEMP_MAX', 40.0)),
@@ -112,13 +181,81 @@ THINGSPEAK_POLL_INTERVAL = int(os.getenv('THINGSPEAK_POLL_INTERVAL', 300))  # 5
 BACKUP_ENABLED = os.getenv('BACKUP_ENABLED', 'True').lower() == 'true'
 BACKUP_DIR = os.getenv('BACKUP_DIR', 'backups')
 BACKUP_INTERVAL = int(os.getenv('BACKUP_INTERVAL', 86400))  # 24 hours
+BACKUP_FULL_INTERVAL = int(os.getenv('BACKUP_FULL_INTERVAL', 7 * 86400))  # incrementals in between
+BACKUP_KEEP_FULL = int(os.getenv('BACKUP_KEEP_FULL', 4))  # full backups (with their incrementals) kept
 ARCHIVE_AFTER_DAYS = int(os.getenv('ARCHIVE_AFTER_DAYS', 90))
+ARCHIVE_DIR = os.getenv('ARCHIVE_DIR', 'archive')  # Parquet files written by archive.py
+ARCHIVE_CHUNK_ROWS = int(os.getenv('ARCHIVE_CHUNK_ROWS', 1000))  # rows per DELETE
+ARCHIVE_READ_MAX_DAYS = int(os.getenv('ARCHIVE_READ_MAX_DAYS', 31))  # day partitions per read without since
+
+# ============================================================
+# TRASH BIN FORECAST
+# ============================================================
+BIN_FULL_DISTANCE_CM = float(os.getenv('BIN_FULL_DISTANCE_CM', 5))  # lid distance that counts as full
+BIN_EMPTY_JUMP_CM = float(os.getenv('BIN_EMPTY_JUMP_CM', 15))  # rise between readings that counts as emptied
+BIN_FILL_HALF_LIFE_HOURS = float(os.getenv('BIN_FILL_HALF_LIFE_HOURS', 24))  # fill-rate regression half-life
+BIN_DEPTH_CM = float(os.getenv('BIN_DEPTH_CM', 100))  # lid distance of an empty bin (0% fill)
+
+# ============================================================
+# PLOT WEATHER INTERPOLATION
+# ============================================================
+WEATHER_IDW_POWER = float(os.getenv('WEATHER_IDW_POWER', 2))  # weight = 1 / distance ** power
+WEATHER_IDW_NEIGHBOURS = int(os.getenv('WEATHER_IDW_NEIGHBOURS', 8))  # nearest stations per plot
+WEATHER_IDW_RADIUS_KM = float(os.getenv('WEATHER_IDW_RADIUS_KM', 50))  # stations further away are ignored
+WEATHER_STATION_MAX_AGE_HOURS = float(os.getenv('WEATHER_STATION_MAX_AGE_HOURS', 6))  # stale stations are ignored
+WEATHER_PLOTS_BUCKET_SECONDS = int(os.getenv('WEATHER_PLOTS_BUCKET_SECONDS', 600))  # cache per worker
+
+# ============================================================
+# DEVICE RUNTIME (duty_cycle.py)
+# ============================================================
+DUTY_CYCLE_INTERVAL = float(os.getenv('DUTY_CYCLE_INTERVAL', 60))  # seconds between folds per worker; 0 disables
+
+# ============================================================
+# USAGE-BASED MAINTENANCE
+# ============================================================
+MAINTENANCE_RUNTIME_HOURS = float(os.getenv('MAINTENANCE_RUNTIME_HOURS', 500))  # hours run between services
+MAINTENANCE_ERROR_SPIKE = float(os.getenv('MAINTENANCE_ERROR_SPIKE', 10))  # recent errors that trigger an inspection
+MAINTENANCE_ERROR_HALF_LIFE_HOURS = float(os.getenv('MAINTENANCE_ERROR_HALF_LIFE_HOURS', 12))  # recent error decay
+MAINTENANCE_LEAD_DAYS = int(os.getenv('MAINTENANCE_LEAD_DAYS', 7))  # runtime services are scheduled this far ahead
 
 # ============================================================
 # SETUP LOGGING SYSTEM
 # ============================================================
+class SamplingFilter(logging.Filter):
+    """Keep only LOG_SAMPLE_RATE of records logged with extra=SAMPLED"""
+
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        if self.rate >= 1.0 or not getattr(record, 'sampled', False):
+            return True
+        return random.random() < self.rate
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """QueueHandler that drops records instead of blocking when the queue is full"""
+
+    dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            NonBlockingQueueHandler.dropped += 1
+
+
+_queue_listener = None
+
+
 def setup_logging():
-    """Initialize production logging system"""
+    """Initialize production logging system
+
+    Request threads only put records on a queue; a QueueListener thread
+    formats them and does the console/file I/O.
+    """
+    global _queue_listener
 
     # Create logs directory
     os.makedirs(LOG_DIR, exist_ok=True)
@@ -127,9 +264,11 @@ def setup_logging():
     logger = logging.getLogger()
     logger.setLevel(getattr(logging, LOG_LEVEL))
 
-    # Remove existing handlers
+    # Remove existing handlers (and stop a previous writer thread)
     for handler in logger.handlers[:]:
         logger.removeHandler(handler)
+    if _queue_listener is not None:
+        _queue_listener.stop()
 
     # Create formatters
     formatter = logging.Formatter(LOG_FORMAT, datefmt='%Y-%m-%d %H:%M:%S')
@@ -138,7 +277,6 @@ def setup_logging():
     console_handler = logging.StreamHandler()
     console_handler.setLevel(getattr(logging, LOG_LEVEL))
     console_handler.setFormatter(formatter)
-    logger.addHandler(console_handler)
 
     # File Handler (rotating)
     log_file = os.path.join(LOG_DIR, 'smartfarm.log')
@@ -149,7 +287,6 @@ def setup_logging():
     )
     file_handler.setLevel(getattr(logging, LOG_LEVEL))
     file_handler.setFormatter(formatter)
-    logger.addHandler(file_handler)
 
     # Error File Handler (rotating)
     error_log_file = os.path.join(LOG_DIR, 'smartfarm_errors.log')
@@ -160,7 +297,20 @@ def setup_logging():
     )
     error_handler.setLevel(logging.ERROR)
     error_handler.setFormatter(formatter)
-    logger.addHandler(error_handler)
+
+    # Queue Handler (the only handler request threads touch)
+    queue_handler = NonBlockingQueueHandler(queue.Queue(LOG_QUEUE_SIZE))
+    queue_handler.addFilter(SamplingFilter(LOG_SAMPLE_RATE))
+    logger.addHandler(queue_handler)
+
+    _queue_listener = QueueListener(
+        queue_handler.queue,
+        console_handler,
+        file_handler,
+        error_handler,
+        respect_handler_level=True
+    )
+    _queue_listener.start()
 
     # Log startup info
     logger.info("=" * 60)
@@ -168,7 +318,10 @@ def setup_logging():
     logger.info("=" * 60)
     logger.info(f"Environment: {ENV}")
     logger.info(f"Debug Mode: {DEBUG}")
-    logger.info(f"Database: {DB_CONFIG['host']}:{DB_CONFIG['port']}/{DB_CONFIG['database']}")
+    if DB_BACKEND == 'sqlite':
+        logger.info(f"Database: sqlite:{SQLITE_PATH}")
+    else:
+        logger.info(f"Database: {DB_CONFIG['host']}:{DB_CONFIG['port']}/{DB_CONFIG['database']}")
     logger.info(f"Firebase: {'Enabled' if FIREBASE_ENABLED else 'Disabled'}")
     logger.info(f"Thingspeak: {'Enabled' if THINGSPEAK_ENABLED else 'Disabled'}")
     logger.info(f"Log Level: {LOG_LEVEL}")
@@ -177,6 +330,42 @@ def setup_logging():
     return logger
 
 
+def _restart_logging_after_fork():
+    """Forked workers get a fresh queue and writer thread
+
+    The parent's listener thread does not survive fork, and its queue lock
+    may have been held at fork time.
+    """
+    global _queue_listener
+    if _queue_listener is None:
+        return
+    fresh_queue = queue.Queue(LOG_QUEUE_SIZE)
+    for handler in logging.getLogger().handlers:
+        if isinstance(handler, QueueHandler):
+            handler.queue = fresh_queue
+    _queue_listener = QueueListener(
+        fresh_queue,
+        *_queue_listener.handlers,
+        respect_handler_level=True
+    )
+    _queue_listener.start()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_restart_logging_after_fork)
+
+
+def stop_logging():
+    """Flush queued records and stop the writer thread"""
+    global _queue_listener
+    if _queue_listener is not None:
+        _queue_listener.stop()
+        _queue_listener = None
+
+
+atexit.register(stop_logging)
+
+
 # Initialize logging on import
 logger = setup_logging()
 
@@ -198,9 +387,12 @@ def validate_config():
     if DEBUG:
         issues.append("⚠️  WARNING: Debug mode is enabled in production!")
 
-    if not DB_CONFIG['password']:
+    if DB_BACKEND != 'sqlite' and not DB_CONFIG['password']:
         issues.append("⚠️  WARNING: Database password is empty!")
 
+    if not REPLICATION_KEY:
+        issues.append("⚠️  WARNING: REPLICATION_KEY is not set, /api/replication/* is disabled")
+
     if FIREBASE_ENABLED and not os.path.exists(FIREBASE_CONFIG_PATH):
         issues.append(f"⚠️  WARNING: Firebase config not found at {FIREBASE_CONFIG_PATH}")
 
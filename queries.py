@@ -0,0 +1,156 @@
+"""
+Hot-Path Queries for Smart Farm
+SQL, request validation and response shapes of the endpoints ESP32 boards
+and dashboards poll most, shared by the threaded server (api_server.py)
+and the asyncio server (async_server.py) so both answer identically
+
+Statements use %s placeholders (mysql.connector, aiomysql and the SQLite
+translation layer all accept them). Templates with {column} or
+{select_list} are filled from a whitelist, never from request values.
+"""
+
+from typing import Dict, Optional, Tuple
+
+# ENVIRONMENT
+
+ENVIRONMENT_LATEST = '''
+    SELECT air_temp, humidity, light_lux as lux, leaf_temp
+    FROM sensor_logs
+    ORDER BY timestamp DESC
+    LIMIT 1
+'''
+
+EMPTY_ENVIRONMENT = {'air_temp': 0, 'humidity': 0, 'lux': 0, 'leaf_temp': 0}
+
+# DEVICES
+
+# SELECT *: the init-db devices table has no mode column (api.py's has)
+DEVICE_STATUS = '''
+    SELECT *
+    FROM devices
+    WHERE device_name = %s
+    LIMIT 1
+'''
+
+
+def device_status(row: Optional[Dict]) -> Dict:
+    """Status payload the ESP32 relay boards poll (unknown devices read as off)"""
+    if not row:
+        return {'status': False, 'online': True, 'auto_mode': False}
+    return {
+        'status': row['status'] == 'ON',
+        'online': True,
+        'auto_mode': row.get('mode', 'MANUAL') == 'AUTO'
+    }
+
+
+# SENSOR LOGS (latest value by type)
+
+LATEST_VALUE_COLUMNS = {
+    'air_temp': 'air_temp',
+    'humidity': 'humidity',
+    'lux': 'light_lux',
+    'leaf_temp': 'leaf_temp',
+    'water_level': 'water_level'
+}
+
+LATEST_VALUE = '''
+    SELECT {column}
+    FROM sensor_logs
+    ORDER BY timestamp DESC
+    LIMIT 1
+'''
+
+
+def latest_value_sql(sensor_type: Optional[str]) -> str:
+    """LATEST_VALUE for ?type= (unknown types read air_temp)"""
+    return LATEST_VALUE.format(column=LATEST_VALUE_COLUMNS.get(sensor_type, 'air_temp'))
+
+
+def latest_value(row: Optional[tuple]) -> Dict:
+    if row and row[0] is not None:
+        return {'value': float(row[0])}
+    return {'value': 0.0}
+
+
+# SENSOR DATA (ESP32 ingest and history)
+
+INSERT_SENSOR_DATA = '''
+    INSERT INTO sensor_data
+    (device_id, temperature_air, temperature_leaf, humidity, water_level, light_lux, soil_moisture)
+    VALUES (%s, %s, %s, %s, %s, %s, %s)
+'''
+
+
+def sensor_data_params(data: Optional[Dict]) -> Tuple:
+    """
+    INSERT_SENSOR_DATA parameters (missing readings are stored as 0)
+
+    Raises:
+        ValueError: No body or not a JSON object (answered with 400)
+    """
+    if not isinstance(data, dict):
+        raise ValueError('No data provided')
+    return (
+        data.get('device_id', 1),
+        data.get('temperature_air', 0),
+        data.get('temperature_leaf', 0),
+        data.get('humidity', 0),
+        data.get('water_level', 0),
+        data.get('light_lux', 0),
+        data.get('soil_moisture', 0)
+    )
+
+
+SENSOR_HISTORY = '''
+    SELECT {select_list} FROM sensor_data
+    WHERE device_id = %s
+    ORDER BY created_at DESC
+    LIMIT %s
+'''
+
+# TRASH BINS (ESP32 ingest)
+
+CREATE_TRASH_BIN_LOGS = '''
+    CREATE TABLE IF NOT EXISTS trash_bin_logs (
+        log_id BIGINT AUTO_INCREMENT PRIMARY KEY,
+        bin_id VARCHAR(50) NOT NULL,
+        distance_cm DECIMAL(6,2) NOT NULL,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        INDEX idx_bin_created (bin_id, created_at)
+    )
+'''
+
+INSERT_BIN_READING = '''
+    INSERT INTO trash_bin_logs (bin_id, distance_cm)
+    VALUES (%s, %s)
+'''
+
+INSERT_BIN_READING_AT = '''
+    INSERT INTO trash_bin_logs (bin_id, distance_cm, created_at)
+    VALUES (%s, %s, %s)
+'''
+
+
+def bin_reading(data: Optional[Dict]) -> Tuple[str, Tuple]:
+    """
+    Insert statement and parameters for a bin reading
+
+    Raises:
+        ValueError: Empty or non-object body, missing bin_id / distance_cm or
+            a distance_cm that is not a number (answered with 400)
+    """
+    if not data or not isinstance(data, dict):
+        raise ValueError('No data provided')
+    bin_id = data.get('bin_id')
+    distance_cm = data.get('distance_cm')
+    timestamp = data.get('timestamp')
+    if not bin_id or distance_cm is None:
+        raise ValueError('Missing required fields: bin_id, distance_cm')
+    try:
+        float(distance_cm)
+    except (TypeError, ValueError):
+        raise ValueError('distance_cm must be a number') from None
+    if timestamp:
+        return INSERT_BIN_READING_AT, (bin_id, distance_cm, timestamp)
+    return INSERT_BIN_READING, (bin_id, distance_cm)
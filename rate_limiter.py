@@ -0,0 +1,113 @@
+"""
+Rate Limiter for Smart Farm API
+In-process token buckets with sharded locks and idle-bucket eviction
+Every check is O(1): one dict lookup and a few float operations under a shard lock
+"""
+
+import math
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Hashable, Tuple
+
+
+class TokenBucketLimiter:
+    """
+    Token bucket per (route class, key)
+
+    Each route class has its own capacity/window. A bucket refills at
+    capacity / window tokens per second, so an idle bucket is full again
+    after one window - at that point it is indistinguishable from a new
+    bucket and can be evicted to bound memory.
+    """
+
+    def __init__(self, limits: Dict[str, Tuple[int, float]], shards: int = 16,
+                 max_buckets_per_shard: int = 100000):
+        """
+        Args:
+            limits: route class -> (requests, window_seconds)
+            shards: Number of independently locked bucket tables
+            max_buckets_per_shard: Hard cap per shard (oldest evicted first)
+        """
+        self.limits = {
+            name: (float(requests), requests / float(window), float(window))
+            for name, (requests, window) in limits.items()
+        }
+        self.max_buckets_per_shard = max_buckets_per_shard
+        self._shards = [(threading.Lock(), OrderedDict()) for _ in range(shards)]
+
+    def check(self, route_class: str, key: Hashable, now: float = None) -> Tuple[bool, float]:
+        """
+        Consume one token
+
+        Args:
+            route_class: Limit class (e.g. 'ingest', 'dashboard', 'auth')
+            key: Client identity (device id, user id or IP)
+            now: Monotonic time override (for tests/benchmarks)
+
+        Returns:
+            (allowed, retry_after_seconds)
+        """
+        limit = self.limits.get(route_class)
+        if limit is None:
+            return True, 0.0
+        capacity, rate, window = limit
+
+        if now is None:
+            now = time.monotonic()
+
+        bucket_key = (route_class, key)
+        lock, buckets = self._shards[hash(bucket_key) % len(self._shards)]
+
+        with lock:
+            bucket = buckets.get(bucket_key)
+            if bucket is None:
+                bucket = [capacity, now]
+                buckets[bucket_key] = bucket
+                self._evict(buckets, now)
+            else:
+                buckets.move_to_end(bucket_key)
+                bucket[0] = min(capacity, bucket[0] + (now - bucket[1]) * rate)
+                bucket[1] = now
+
+            if bucket[0] >= 1.0:
+                bucket[0] -= 1.0
+                return True, 0.0
+            return False, (1.0 - bucket[0]) / rate
+
+    def _evict(self, buckets: OrderedDict, now: float):
+        """Drop buckets idle long enough to have refilled (amortized O(1))"""
+        while buckets:
+            (route_class, _), bucket = next(iter(buckets.items()))
+            idle_window = self.limits[route_class][2]
+            if now - bucket[1] < idle_window and len(buckets) <= self.max_buckets_per_shard:
+                break
+            buckets.popitem(last=False)
+
+    def scale(self, factor: float):
+        """
+        Multiply every limit by factor
+
+        Pre-forked workers each keep their own buckets; with N workers each
+        one enforces 1/N of the limit, which approximates the global limit
+        when the kernel spreads connections evenly.
+        """
+        self.limits = {
+            name: (max(1.0, capacity * factor), rate * factor, window)
+            for name, (capacity, rate, window) in self.limits.items()
+        }
+
+    def bucket_count(self) -> int:
+        """Number of live buckets across all shards"""
+        return sum(len(buckets) for _, buckets in self._shards)
+
+    def reset(self):
+        """Forget all buckets"""
+        for lock, buckets in self._shards:
+            with lock:
+                buckets.clear()
+
+
+def retry_after_header(seconds: float) -> str:
+    """Format Retry-After as whole seconds (never 0)"""
+    return str(max(1, math.ceil(seconds)))
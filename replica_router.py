@@ -0,0 +1,299 @@
+"""
+Read Replica Routing for Smart Farm
+Sends read-only requests of selected route classes (dashboards: history,
+logs, statistics, exports) to MySQL read replicas and everything else,
+ESP32 ingest included, to the primary
+
+- A replica is used only while its lag (SHOW REPLICA STATUS) is within
+  max_lag. Lag is measured every lag_check_interval seconds by a
+  background thread (started on first use in each process), never on a
+  request thread; a replica that cannot be reached or is not replicating
+  is skipped until the next check.
+- Read-your-writes: after a client writes, its reads go to the primary for
+  sticky_seconds. The window is kept per process; endpoints whose reads
+  must always be fresh (device status after a toggle) are sent to the
+  primary by the caller.
+- Each target has its own optional connection pool (pool_size > 0);
+  connections handed out, in use, pool overflows, fallbacks and lag are
+  exported per target. A connection's in-use slot is released by close()
+  (the API also closes what a request left open when it ends) or, as a
+  last resort, when the connection is garbage collected.
+"""
+
+import logging
+import os
+import threading
+import time
+import weakref
+from typing import Dict, List, Optional, Sequence
+
+import mysql.connector
+import mysql.connector.pooling
+
+import database
+from metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+DB_TARGET_CHECKOUTS = REGISTRY.counter(
+    'smartfarm_db_target_checkouts_total',
+    'Connections handed out per database target and route class',
+    ('target', 'route_class')
+)
+DB_TARGET_CONNECT_SECONDS = REGISTRY.histogram(
+    'smartfarm_db_target_connect_duration_seconds',
+    'Time to get a connection from a target (pool or new connection)',
+    ('target',)
+)
+DB_TARGET_ERRORS = REGISTRY.counter(
+    'smartfarm_db_target_errors_total',
+    'Failed connection attempts per target',
+    ('target',)
+)
+DB_POOL_OVERFLOW = REGISTRY.counter(
+    'smartfarm_db_pool_overflow_total',
+    'Connections opened outside an exhausted pool',
+    ('target',)
+)
+DB_ROUTING_FALLBACKS = REGISTRY.counter(
+    'smartfarm_db_routing_fallbacks_total',
+    'Replica-eligible reads sent to the primary',
+    ('reason',)
+)
+
+
+class Target:
+    """One database server (primary or replica) and its optional pool"""
+
+    def __init__(self, name: str, config: Dict, pool_size: int = 0):
+        self.name = name
+        self.config = config
+        self.in_use = 0
+        self.lag: Optional[float] = None
+        self.lag_checked = 0.0
+        self.lag_error: Optional[str] = None
+        self._lock = threading.Lock()
+        self.pool_size = pool_size if config.get('backend') != 'sqlite' else 0
+        self._pool = None
+        self._pool_pid = None
+
+    def _open(self):
+        if self.pool_size:
+            # Created on first use in each process: pooled sockets must not
+            # be shared by pre-forked workers
+            with self._lock:
+                if self._pool_pid != os.getpid():
+                    self._pool = mysql.connector.pooling.MySQLConnectionPool(
+                        pool_name=f'smartfarm_{self.name}_{os.getpid()}', pool_size=self.pool_size,
+                        **self.config)
+                    self._pool_pid = os.getpid()
+            try:
+                return self._pool.get_connection()
+            except mysql.connector.errors.PoolError:
+                DB_POOL_OVERFLOW.inc((self.name,))
+        return database.connect(self.config, instrument=False)
+
+    def acquire(self, route_class: str, instrument: bool = True):
+        """Connection to this target; close() returns it (to the pool)"""
+        start = time.perf_counter()
+        try:
+            conn = self._open()
+        except database.Error:
+            DB_TARGET_ERRORS.inc((self.name,))
+            raise
+        elapsed = time.perf_counter() - start
+        DB_TARGET_CONNECT_SECONDS.observe(elapsed, (self.name,))
+        if instrument:
+            database.DB_CONNECT_SECONDS.observe(elapsed)
+        DB_TARGET_CHECKOUTS.inc((self.name, route_class))
+        with self._lock:
+            self.in_use += 1
+        conn = RoutedConnection(conn, self)
+        return database.InstrumentedConnection(conn, self.config) if instrument else conn
+
+    def release(self):
+        with self._lock:
+            self.in_use -= 1
+
+    def refresh_lag(self):
+        """Re-measure replication lag (lag None while unavailable)"""
+        try:
+            self.lag, self.lag_error = measure_lag(self.config), None
+        except Exception as e:
+            self.lag, self.lag_error = None, str(e)
+            logger.warning("replica_unavailable target=%s error=%s", self.name, e)
+        finally:
+            self.lag_checked = time.monotonic()
+
+    def stats(self) -> Dict:
+        return {'target': self.name, 'host': self.config.get('host', self.config.get('path')),
+                'in_use': self.in_use, 'pool_size': self.pool_size,
+                'lag_seconds': self.lag, 'lag_error': self.lag_error}
+
+
+def _release(conn, target: Target):
+    try:
+        conn.close()
+    except Exception as e:
+        logger.warning("db_close_failed target=%s error=%s", target.name, e)
+    finally:
+        target.release()
+
+
+class RoutedConnection:
+    """
+    Connection wrapper that closes once and then releases its target slot;
+    a connection dropped without close() is closed when collected
+    """
+
+    def __init__(self, conn, target: Target):
+        self._conn = conn
+        self._finalizer = weakref.finalize(self, _release, conn, target)
+
+    @property
+    def closed(self) -> bool:
+        return not self._finalizer.alive
+
+    def cursor(self, *args, **kwargs):
+        return self._conn.cursor(*args, **kwargs)
+
+    def close(self):
+        self._finalizer()
+
+    def __getattr__(self, name):
+        # commit, rollback, is_connected, ...
+        return getattr(self._conn, name)
+
+
+def measure_lag(config: Dict) -> float:
+    """
+    Seconds the replica is behind its source
+
+    Raises:
+        RuntimeError: Not a replica, or replication is stopped (lag NULL)
+    """
+    conn = mysql.connector.connect(**dict(config, connection_timeout=2))
+    try:
+        cursor = conn.cursor(dictionary=True)
+        try:
+            cursor.execute('SHOW REPLICA STATUS')
+        except mysql.connector.Error:
+            cursor.execute('SHOW SLAVE STATUS')  # MySQL < 8.0.22
+        status = cursor.fetchall()
+        cursor.close()
+    finally:
+        conn.close()
+    if not status:
+        raise RuntimeError('not a replica (empty replica status)')
+    lag = status[0].get('Seconds_Behind_Source', status[0].get('Seconds_Behind_Master'))
+    if lag is None:
+        raise RuntimeError('replication is not running')
+    return float(lag)
+
+
+class ReplicaRouter:
+    """Choose the primary or a replica for each request"""
+
+    def __init__(self, primary_config: Dict, replica_configs: Sequence[Dict] = (),
+                 read_route_classes: Sequence[str] = ('dashboard',), max_lag: float = 5.0,
+                 lag_check_interval: float = 2.0, sticky_seconds: float = 10.0, pool_size: int = 0):
+        """
+        Args:
+            primary_config: database.connect config of the primary
+            replica_configs: Configs of the read replicas
+            read_route_classes: Route classes whose reads may use replicas
+            max_lag: Skip replicas further behind than this (seconds)
+            lag_check_interval: Seconds between lag measurements per replica
+            sticky_seconds: Reads after a write from the same client go to the primary this long
+            pool_size: Connections pooled per target (0: connect per request)
+        """
+        self.primary = Target('primary', primary_config, pool_size)
+        self.replicas: List[Target] = [Target(f'replica{i}', config, pool_size)
+                                       for i, config in enumerate(replica_configs, 1)]
+        self.read_route_classes = frozenset(read_route_classes)
+        self.max_lag = max_lag
+        self.lag_check_interval = lag_check_interval
+        self.sticky_seconds = sticky_seconds
+        self._sticky: Dict[str, float] = {}
+        self._next = 0
+        self._lock = threading.Lock()
+        self._refresher_pid = None
+        REGISTRY.gauge('smartfarm_db_target_connections_in_use', 'Connections currently checked out per target',
+                       lambda: {(t.name,): t.in_use for t in self.targets()}, ('target',))
+        REGISTRY.gauge('smartfarm_db_replica_lag_seconds', 'Last measured replication lag (-1: unavailable)',
+                       lambda: {(t.name,): -1 if t.lag is None else t.lag for t in self.replicas}, ('target',))
+
+    def targets(self) -> List[Target]:
+        return [self.primary] + self.replicas
+
+    def _ensure_refresher(self):
+        # One lag thread per process: threads do not survive a pre-fork
+        if self._refresher_pid == os.getpid():
+            return
+        with self._lock:
+            if self._refresher_pid != os.getpid():
+                self._refresher_pid = os.getpid()
+                threading.Thread(target=self._refresh_loop, name='replica-lag', daemon=True).start()
+
+    def _refresh_loop(self):
+        while True:
+            for replica in self.replicas:
+                replica.refresh_lag()
+            time.sleep(self.lag_check_interval)
+
+    def routes(self, route_class: str) -> bool:
+        """True if reads of route_class can go to a replica"""
+        return bool(self.replicas) and route_class in self.read_route_classes
+
+    def note_write(self, client: str):
+        """Send this client's reads to the primary for sticky_seconds"""
+        now = time.monotonic()
+        self._sticky[client] = now + self.sticky_seconds
+        if len(self._sticky) > 10000:
+            self._sticky = {k: v for k, v in self._sticky.items() if v > now}
+
+    def choose(self, route_class: str, read_only: bool, client: Optional[str] = None) -> Target:
+        """Target for one request (callers keep it for the whole request)"""
+        if not read_only or not self.routes(route_class):
+            return self.primary
+        if client is not None and self._sticky.get(client, 0) > time.monotonic():
+            DB_ROUTING_FALLBACKS.inc(('read_your_writes',))
+            return self.primary
+        self._ensure_refresher()
+        usable = [r for r in self.replicas if r.lag is not None and r.lag <= self.max_lag]
+        if not usable:
+            DB_ROUTING_FALLBACKS.inc(('lag' if any(r.lag is not None for r in self.replicas) else 'unavailable',))
+            return self.primary
+        # Fewest connections in use; rotate between equals
+        self._next += 1
+        least = min(r.in_use for r in usable)
+        candidates = [r for r in usable if r.in_use == least]
+        return candidates[self._next % len(candidates)]
+
+    def connect(self, target: Target, route_class: str, instrument: bool = True):
+        """
+        Connection to target; a replica that fails falls back to the primary
+
+        Returns:
+            (connection, target actually used)
+        """
+        try:
+            return target.acquire(route_class, instrument), target
+        except database.Error:
+            if target is self.primary:
+                raise
+            target.lag, target.lag_checked = None, time.monotonic()
+            DB_ROUTING_FALLBACKS.inc(('error',))
+            return self.primary.acquire(route_class, instrument), self.primary
+
+    def stats(self) -> List[Dict]:
+        return [t.stats() for t in self.targets()]
+
+
+def replica_configs(primary_config: Dict, hosts: str) -> List[Dict]:
+    """Replica configs from "host[:port],host[:port]" sharing the primary's credentials"""
+    configs = []
+    for entry in filter(None, (h.strip() for h in hosts.split(','))):
+        host, _, port = entry.partition(':')
+        configs.append(dict(primary_config, host=host, port=int(port or 3306)))
+    return configs
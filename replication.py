@@ -0,0 +1,200 @@
+"""
+Store-and-Forward Replication for Smart Farm
+Batch format shared by replication_agent.py (edge gateway) and the central
+/api/replication endpoints, and the idempotent central apply
+
+A batch carries the rows of one table with ids in (after_id, last_id] of
+one gateway, as gzip-compressed JSON with a SHA-256 of the uncompressed
+payload. The central server keeps a watermark per (gateway, table): the
+last gateway row id applied. Rows and watermark are written in the same
+transaction, so a batch that is resent after a lost response is applied
+exactly once and a gateway resumes from the watermark after any outage.
+The watermark table is created by schema.create_replication_watermarks.
+"""
+
+import gzip
+import hashlib
+import io
+import logging
+from typing import Dict, List, Tuple
+
+import bin_forecast
+import serialization
+import weather_stations
+
+logger = logging.getLogger(__name__)
+
+# Append-only tables shipped from gateways: table -> id column
+REPLICATED_TABLES = {
+    'sensor_data': 'data_id',
+    'sensor_logs': 'log_id',
+    'trash_bin_logs': 'log_id',
+    'weather_logs': 'weather_id',
+    'device_logs': 'log_id',
+    'device_status_history': 'history_id',
+    'crop_health_metrics': 'metric_id',
+}
+
+CHECKSUM_HEADER = 'X-Batch-SHA256'
+GATEWAY_HEADER = 'X-Gateway-Id'
+KEY_HEADER = 'X-Replication-Key'
+
+MAX_BATCH_BYTES = 32 * 1024 * 1024  # decompressed; guards against gzip bombs
+
+
+class BatchError(ValueError):
+    """Malformed, corrupted or unacceptable batch (HTTP 400)"""
+
+
+class WatermarkGap(Exception):
+    """Batch starts after the central watermark: rows in between are missing (HTTP 409)"""
+
+    def __init__(self, last_id: int):
+        super().__init__(f"batch starts after watermark {last_id}")
+        self.last_id = last_id
+
+
+def encode_batch(gateway_id: str, table: str, after_id: int,
+                 columns: List[str], rows: List[tuple], level: int = 6) -> Tuple[bytes, str]:
+    """
+    Serialize one batch
+
+    Args:
+        gateway_id: Sending gateway
+        table: Table in REPLICATED_TABLES
+        after_id: Watermark the batch continues from
+        columns: Column names, the id column first
+        rows: Row tuples in id order
+
+    Returns:
+        (gzip body, hex SHA-256 of the uncompressed JSON)
+    """
+    payload = serialization.dumps_bytes({
+        'gateway_id': gateway_id,
+        'table': table,
+        'after_id': after_id,
+        'last_id': rows[-1][0] if rows else after_id,
+        'columns': columns,
+        'rows': rows,
+    })
+    return gzip.compress(payload, compresslevel=level, mtime=0), hashlib.sha256(payload).hexdigest()
+
+
+def decode_batch(body: bytes, checksum: str) -> Dict:
+    """Decompress, verify and validate a batch (raises BatchError)"""
+    try:
+        with gzip.GzipFile(fileobj=io.BytesIO(body)) as stream:
+            payload = stream.read(MAX_BATCH_BYTES + 1)
+    except (OSError, EOFError) as e:
+        raise BatchError(f"not a gzip body: {e}")
+    if len(payload) > MAX_BATCH_BYTES:
+        raise BatchError("batch too large")
+    if not checksum or hashlib.sha256(payload).hexdigest() != checksum.lower():
+        raise BatchError("checksum mismatch")
+
+    try:
+        batch = serialization.loads(payload)
+    except ValueError as e:
+        raise BatchError(f"invalid JSON: {e}")
+    table = batch.get('table')
+    if table not in REPLICATED_TABLES:
+        raise BatchError(f"table not replicated: {table}")
+    columns = batch.get('columns') or []
+    if not columns or columns[0] != REPLICATED_TABLES[table]:
+        raise BatchError(f"first column must be {REPLICATED_TABLES[table]}")
+    if not all(isinstance(c, str) and c.isidentifier() for c in columns):
+        raise BatchError("invalid column name")
+    if any(len(row) != len(columns) for row in batch.get('rows', ())):
+        raise BatchError("row width does not match columns")
+    return batch
+
+
+def watermarks(cursor, gateway_id: str) -> Dict[str, int]:
+    """Last applied gateway id per table (0 for tables never shipped)"""
+    cursor.execute('''
+        SELECT table_name, last_id FROM replication_watermarks WHERE gateway_id = %s
+    ''', (gateway_id,))
+    found = {name: int(last_id) for name, last_id in cursor.fetchall()}
+    return {table: found.get(table, 0) for table in REPLICATED_TABLES}
+
+
+_central_columns: Dict[str, set] = {}
+
+
+def central_columns(cursor, table: str) -> set:
+    """Columns of the central table (cached; SHOW COLUMNS is not free)"""
+    columns = _central_columns.get(table)
+    if columns is None:
+        cursor.execute(f'SHOW COLUMNS FROM {table}')
+        columns = _central_columns[table] = {row[0] for row in cursor.fetchall()}
+    return columns
+
+
+def apply_batch(conn, gateway_id: str, batch: Dict) -> Dict:
+    """
+    Apply a decoded batch centrally (commits)
+
+    Rows at or below the watermark were applied by an earlier delivery of
+    the same batch and are skipped. Gateway ids are not kept: rows get
+    central ids, and the columns the central table lacks are dropped.
+
+    Raises:
+        WatermarkGap: after_id is above the watermark
+        BatchError: gateway_id does not match the batch
+    """
+    if batch.get('gateway_id') != gateway_id:
+        raise BatchError("gateway_id does not match the batch")
+    table = batch['table']
+    columns = batch['columns']
+    rows = batch.get('rows') or []
+
+    cursor = conn.cursor()
+    try:
+        # Lock the watermark row: concurrent deliveries of one stream serialize here
+        cursor.execute('''
+            INSERT IGNORE INTO replication_watermarks (gateway_id, table_name, last_id)
+            VALUES (%s, %s, 0)
+        ''', (gateway_id, table))
+        cursor.execute('''
+            SELECT last_id FROM replication_watermarks
+            WHERE gateway_id = %s AND table_name = %s FOR UPDATE
+        ''', (gateway_id, table))
+        last_id = int(cursor.fetchone()[0])
+        if int(batch['after_id']) > last_id:
+            raise WatermarkGap(last_id)
+
+        fresh = [row for row in rows if int(row[0]) > last_id]
+        if fresh:
+            available = central_columns(cursor, table)
+            keep = [i for i, name in enumerate(columns) if i and name in available]
+            names = ', '.join(columns[i] for i in keep)
+            placeholders = ', '.join(['%s'] * len(keep))
+            cursor.executemany(
+                f'INSERT INTO {table} ({names}) VALUES ({placeholders})',
+                [tuple(row[i] for i in keep) for row in fresh]
+            )
+            if table == 'trash_bin_logs':
+                index = {name: i for i, name in enumerate(columns)}
+                bin_forecast.observe_or_warn(cursor, [
+                    (row[index['bin_id']], row[index['created_at']], row[index['distance_cm']]) for row in fresh
+                ])
+            elif table == 'weather_logs' and 'location' in columns:
+                location = columns.index('location')
+                weather_stations.refresh(cursor, [row[location] for row in fresh if row[location] is not None])
+            last_id = int(fresh[-1][0])
+            cursor.execute('''
+                UPDATE replication_watermarks
+                SET last_id = %s, rows_applied = rows_applied + %s, updated_at = NOW()
+                WHERE gateway_id = %s AND table_name = %s
+            ''', (last_id, len(fresh), gateway_id, table))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+    if len(fresh) < len(rows):
+        logger.info("replication_duplicate gateway=%s table=%s skipped=%d",
+                    gateway_id, table, len(rows) - len(fresh))
+    return {'table': table, 'applied': len(fresh), 'skipped': len(rows) - len(fresh), 'last_id': last_id}
@@ -0,0 +1,246 @@
+"""
+Replication Agent for Smart Farm Edge Gateways
+Ships new rows from the gateway's local store (usually DB_BACKEND=sqlite)
+to the central api_server in gzip, checksummed batches (see replication.py)
+
+Each table is a stream keyed by (gateway, table, last id). The agent asks
+the central server for its watermarks at start-up and after every failure,
+so it needs no local state: after a disconnect it resumes exactly where
+the central database stopped, and a batch whose response was lost is
+skipped centrally when it is sent again. While a batch is in flight the
+next one is read and compressed.
+
+Usage:
+    python replication_agent.py --central https://farm.example.com
+    python replication_agent.py --once                   # catch up, then exit
+    REPLICATION_CENTRAL_URL=... REPLICATION_GATEWAY_ID=greenhouse-3 python replication_agent.py
+"""
+
+import argparse
+import http.client
+import json
+import logging
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+from urllib.parse import urlsplit
+
+import database
+import production_config as config
+import replication
+
+logger = logging.getLogger(__name__)
+
+
+class CentralError(Exception):
+    """Central server unreachable or failed; retried with backoff"""
+
+
+def local_db_config() -> Dict:
+    """Connection settings of the gateway's own database"""
+    if config.DB_BACKEND == 'sqlite':
+        return {'backend': 'sqlite', 'path': config.SQLITE_PATH}
+    return {k: v for k, v in config.DB_CONFIG.items() if not k.startswith('pool_')}
+
+
+class ReplicationAgent:
+    """Ship local rows above the central watermarks, table by table"""
+
+    def __init__(self, central_url: str, gateway_id: str, db_config: Dict,
+                 key: str = '', batch_rows: int = 2000, timeout: float = 30.0,
+                 tables: Optional[List[str]] = None):
+        """
+        Args:
+            central_url: Base URL of the central api_server
+            gateway_id: Name of this gateway (one watermark set per gateway)
+            db_config: Local database (database.connect config)
+            key: REPLICATION_KEY of the central server
+            batch_rows: Rows per batch
+            timeout: HTTP timeout in seconds
+            tables: Subset of replication.REPLICATED_TABLES
+        """
+        parts = urlsplit(central_url)
+        if parts.scheme not in ('http', 'https') or not parts.netloc:
+            raise ValueError(f"Invalid central URL: {central_url!r}")
+        self._scheme = parts.scheme
+        self._netloc = parts.netloc
+        self._prefix = parts.path.rstrip('/')
+        self.gateway_id = gateway_id
+        self.db_config = db_config
+        self.key = key
+        self.batch_rows = batch_rows
+        self.timeout = timeout
+        self.tables = list(tables or replication.REPLICATED_TABLES)
+        self._http = None
+        self._pipeline = ThreadPoolExecutor(max_workers=1, thread_name_prefix='replication-send')
+        self.stats = {'rows': 0, 'batches': 0, 'bytes': 0, 'duplicates': 0}
+
+    # HTTP
+
+    def _request(self, method: str, path: str, body: bytes = None, headers: Dict = None) -> Dict:
+        """One request on the persistent connection (reconnects once if it went stale)"""
+        all_headers = {replication.GATEWAY_HEADER: self.gateway_id}
+        if self.key:
+            all_headers[replication.KEY_HEADER] = self.key
+        all_headers.update(headers or {})
+        for attempt in (1, 2):
+            if self._http is None:
+                connection_class = (http.client.HTTPSConnection if self._scheme == 'https'
+                                    else http.client.HTTPConnection)
+                self._http = connection_class(self._netloc, timeout=self.timeout)
+            try:
+                self._http.request(method, self._prefix + path, body=body, headers=all_headers)
+                response = self._http.getresponse()
+                data = response.read()
+                break
+            except (OSError, http.client.HTTPException) as e:
+                self._http.close()
+                self._http = None
+                if attempt == 2:
+                    raise CentralError(f"{method} {path}: {e}")
+        try:
+            payload = json.loads(data) if data else {}
+        except ValueError:
+            payload = {'error': data[:200].decode(errors='replace')}
+        if response.status == 409:
+            return {'gap': True, **payload}
+        if response.status >= 400:
+            # 4xx other than 409 means this batch can never be applied
+            if 400 <= response.status < 500 and response.status != 429:
+                raise ValueError(f"{method} {path}: {response.status} {payload.get('error')}")
+            raise CentralError(f"{method} {path}: {response.status} {payload.get('error')}")
+        return payload
+
+    def central_watermarks(self) -> Dict[str, int]:
+        return self._request('GET', '/api/replication/watermarks')['watermarks']
+
+    def _send(self, table: str, after_id: int, body: bytes, checksum: str) -> Dict:
+        result = self._request('POST', '/api/replication/batch', body, {
+            'Content-Type': 'application/json',
+            'Content-Encoding': 'gzip',
+            replication.CHECKSUM_HEADER: checksum,
+        })
+        result['sent_bytes'] = len(body)
+        return result
+
+    # LOCAL STORE
+
+    def _local_tables(self, cursor) -> List[str]:
+        present = []
+        for table in self.tables:
+            cursor.execute('SHOW TABLES LIKE %s', (table,))
+            if cursor.fetchall():
+                present.append(table)
+        return present
+
+    def _read_batch(self, cursor, table: str, after_id: int):
+        """Rows with id > after_id, id column first"""
+        id_column = replication.REPLICATED_TABLES[table]
+        cursor.execute(f'''
+            SELECT * FROM {table} WHERE {id_column} > %s ORDER BY {id_column} LIMIT %s
+        ''', (after_id, self.batch_rows))
+        rows = cursor.fetchall()
+        columns = [d[0] for d in cursor.description]
+        first = columns.index(id_column)
+        order = [first] + [i for i in range(len(columns)) if i != first]
+        return [columns[i] for i in order], [tuple(row[i] for i in order) for row in rows]
+
+    # SYNC
+
+    def _ship_table(self, cursor, table: str, after_id: int) -> int:
+        """Ship everything above after_id; returns the new watermark"""
+        pending = None
+        while True:
+            columns, rows = self._read_batch(cursor, table, after_id)
+            if pending is not None:
+                # Collect the previous batch only after this one was read
+                result = pending.result()
+                pending = None
+                if result.get('gap'):
+                    # Central lost rows (e.g. restored from a backup): ship again from its watermark
+                    logger.warning("replication_rewind table=%s from=%d to=%d",
+                                   table, after_id, result['last_id'])
+                    after_id = int(result['last_id'])
+                    continue
+                self._record(result)
+            if not rows:
+                return after_id
+            body, checksum = replication.encode_batch(self.gateway_id, table, after_id, columns, rows)
+            pending = self._pipeline.submit(self._send, table, after_id, body, checksum)
+            after_id = rows[-1][0]
+
+    def _record(self, result: Dict):
+        self.stats['rows'] += result['applied']
+        self.stats['duplicates'] += result['skipped']
+        self.stats['batches'] += 1
+        self.stats['bytes'] += result['sent_bytes']
+
+    def sync_once(self) -> Dict:
+        """Catch every table up with the central server"""
+        marks = self.central_watermarks()
+        conn = database.connect(self.db_config, instrument=False)
+        try:
+            cursor = conn.cursor()
+            for table in self._local_tables(cursor):
+                self._ship_table(cursor, table, marks.get(table, 0))
+                # Read-only: end the snapshot so the local writer is not held back
+                conn.commit()
+            cursor.close()
+        finally:
+            conn.close()
+        return dict(self.stats)
+
+    def run(self, interval: float, max_backoff: float):
+        """Sync forever, backing off exponentially while central is unreachable"""
+        backoff = interval
+        while True:
+            try:
+                before = self.stats['rows']
+                self.sync_once()
+                shipped = self.stats['rows'] - before
+                if shipped:
+                    logger.info("replication_synced gateway=%s rows=%d", self.gateway_id, shipped)
+                backoff = interval
+                time.sleep(interval)
+            except (CentralError, database.Error) as e:
+                logger.warning("replication_retry gateway=%s in=%.0fs error=%s", self.gateway_id, backoff, e)
+                time.sleep(backoff * random.uniform(0.8, 1.2))
+                backoff = min(max_backoff, backoff * 2)
+
+    def close(self):
+        self._pipeline.shutdown(wait=True)
+        if self._http is not None:
+            self._http.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Smart Farm gateway replication agent')
+    parser.add_argument('--central', default=config.REPLICATION_CENTRAL_URL, help='central api_server URL')
+    parser.add_argument('--gateway-id', default=config.REPLICATION_GATEWAY_ID)
+    parser.add_argument('--batch-rows', type=int, default=config.REPLICATION_BATCH_ROWS)
+    parser.add_argument('--interval', type=float, default=config.REPLICATION_INTERVAL)
+    parser.add_argument('--once', action='store_true', help='catch up once and exit')
+    args = parser.parse_args()
+    if not args.central:
+        parser.error('--central or REPLICATION_CENTRAL_URL is required')
+
+    agent = ReplicationAgent(args.central, args.gateway_id, local_db_config(),
+                             key=config.REPLICATION_KEY, batch_rows=args.batch_rows)
+    try:
+        if args.once:
+            start = time.perf_counter()
+            stats = agent.sync_once()
+            logger.info("replication_caught_up gateway=%s rows=%d batches=%d bytes=%d seconds=%.1f",
+                        args.gateway_id, stats['rows'], stats['batches'], stats['bytes'],
+                        time.perf_counter() - start)
+        else:
+            agent.run(args.interval, config.REPLICATION_MAX_BACKOFF)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        agent.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,422 @@
+"""
+Database Schema for Smart Farm API
+DDL for support tables that handlers depend on but do not create themselves
+"""
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Per-table change counters, bumped by triggers so that writes made outside
+# the API (Flutter app, api.py, manual SQL) also invalidate cached responses
+TABLE_VERSIONS_DDL = '''
+    CREATE TABLE IF NOT EXISTS table_versions (
+        table_name VARCHAR(64) PRIMARY KEY,
+        version BIGINT NOT NULL DEFAULT 0,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+    )
+'''
+
+# Low-volume tables whose rows are updated or deleted in place.
+# Append-only tables (sensor_logs) are versioned by their newest id instead,
+# which avoids a hot counter row on the ingest path.
+VERSIONED_TABLES = ('alerts', 'plots', 'devices')
+
+
+def version_trigger_statements(table: str, dialect: str = 'mysql'):
+    """DROP/CREATE statements for the three change-counter triggers of a table"""
+    statements = []
+    for event in ('INSERT', 'UPDATE', 'DELETE'):
+        name = f"trg_{table}_version_{event.lower()}"
+        statements.append(f"DROP TRIGGER IF EXISTS {name}")
+        if dialect == 'sqlite':
+            # No ON UPDATE CURRENT_TIMESTAMP in SQLite: the trigger bumps updated_at
+            statements.append(f'''
+                CREATE TRIGGER {name} AFTER {event} ON {table}
+                FOR EACH ROW BEGIN
+                    INSERT INTO table_versions (table_name, version) VALUES ('{table}', 1)
+                    ON CONFLICT(table_name) DO UPDATE SET version = version + 1,
+                        updated_at = datetime('now', 'localtime');
+                END
+            ''')
+            continue
+        statements.append(f'''
+            CREATE TRIGGER {name} AFTER {event} ON {table}
+            FOR EACH ROW
+                INSERT INTO table_versions (table_name, version) VALUES ('{table}', 1)
+                ON DUPLICATE KEY UPDATE version = version + 1
+        ''')
+    return statements
+
+
+def create_table_versions(cursor, tables=VERSIONED_TABLES, dialect: str = 'mysql'):
+    """
+    Create table_versions and install change triggers
+
+    Args:
+        cursor: Open cursor (caller commits)
+        tables: Tables to version; missing tables are skipped
+        dialect: 'mysql' or 'sqlite' (trigger syntax differs)
+
+    Returns:
+        List of tables that got triggers
+    """
+    cursor.execute(TABLE_VERSIONS_DDL)
+    installed = []
+    for table in tables:
+        cursor.execute('SHOW TABLES LIKE %s', (table,))
+        if not cursor.fetchall():
+            logger.warning("table_versions_skipped table=%s reason=missing", table)
+            continue
+        for statement in version_trigger_statements(table, dialect):
+            cursor.execute(statement)
+        cursor.execute('''
+            INSERT IGNORE INTO table_versions (table_name, version) VALUES (%s, 0)
+        ''', (table,))
+        installed.append(table)
+    return installed
+
+
+# Central side of gateway replication (replication.py): last gateway row id
+# applied per (gateway, table), updated in the same transaction as the rows
+REPLICATION_WATERMARKS_DDL = '''
+    CREATE TABLE IF NOT EXISTS replication_watermarks (
+        gateway_id VARCHAR(64) NOT NULL,
+        table_name VARCHAR(64) NOT NULL,
+        last_id BIGINT NOT NULL DEFAULT 0,
+        rows_applied BIGINT NOT NULL DEFAULT 0,
+        updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (gateway_id, table_name)
+    )
+'''
+
+
+def create_replication_watermarks(cursor):
+    """Create replication_watermarks (caller commits)"""
+    cursor.execute(REPLICATION_WATERMARKS_DDL)
+
+
+# Daily device runtime folded from ON/OFF logs (duty_cycle.py): the
+# aggregates, each device's current state and the per-source watermark
+DEVICE_RUNTIME_DDL = (
+    '''
+    CREATE TABLE IF NOT EXISTS device_runtime_daily (
+        device_id INT NOT NULL,
+        day DATE NOT NULL,
+        on_seconds INT NOT NULL DEFAULT 0,
+        switch_ons INT NOT NULL DEFAULT 0,
+        PRIMARY KEY (device_id, day),
+        INDEX idx_day (day)
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS device_runtime_state (
+        device_id INT PRIMARY KEY,
+        is_on BOOLEAN NOT NULL DEFAULT FALSE,
+        on_since DATETIME NULL,
+        last_at DATETIME NULL
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS device_runtime_watermarks (
+        source VARCHAR(50) PRIMARY KEY,
+        last_id BIGINT NOT NULL DEFAULT 0,
+        updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+    )
+    ''',
+)
+
+
+def create_device_runtime(cursor):
+    """Create the duty_cycle.py tables (caller commits)"""
+    for ddl in DEVICE_RUNTIME_DDL:
+        cursor.execute(ddl)
+
+
+# Maintenance entries, scheduled by POST /api/maintenance or by usage
+# thresholds (maintenance_triggers.py)
+MAINTENANCE_SCHEDULES_DDL = '''
+    CREATE TABLE IF NOT EXISTS maintenance_schedules (
+        maintenance_id INT AUTO_INCREMENT PRIMARY KEY,
+        device_id INT NOT NULL,
+        device_name VARCHAR(100),
+        maintenance_type VARCHAR(100),
+        scheduled_date DATE,
+        last_maintenance_date DATE,
+        status VARCHAR(50),
+        notes TEXT,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        INDEX idx_device_date (device_id, scheduled_date)
+    )
+'''
+
+# Cumulative usage per device folded from device_status_history
+# (maintenance_triggers.py) and its watermark
+DEVICE_USAGE_DDL = (
+    '''
+    CREATE TABLE IF NOT EXISTS device_usage_state (
+        device_id INT PRIMARY KEY,
+        device_name VARCHAR(100),
+        last_at DATETIME NULL,
+        last_uptime_seconds BIGINT NULL,
+        last_error_count INT NULL,
+        runtime_seconds BIGINT NOT NULL DEFAULT 0,
+        runtime_at_service BIGINT NOT NULL DEFAULT 0,
+        error_total INT NOT NULL DEFAULT 0,
+        recent_errors DOUBLE NOT NULL DEFAULT 0
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS device_usage_watermarks (
+        source VARCHAR(50) PRIMARY KEY,
+        last_id BIGINT NOT NULL DEFAULT 0,
+        updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+    )
+    ''',
+)
+
+
+def create_device_usage(cursor):
+    """Create maintenance_schedules and the maintenance_triggers.py tables (caller commits)"""
+    cursor.execute(MAINTENANCE_SCHEDULES_DDL)
+    for ddl in DEVICE_USAGE_DDL:
+        cursor.execute(ddl)
+
+
+# Weather station positions with a grid cell id (weather_stations.py),
+# updated with every weather reading
+WEATHER_STATIONS_DDL = '''
+    CREATE TABLE IF NOT EXISTS weather_stations (
+        location VARCHAR(100) PRIMARY KEY,
+        latitude DECIMAL(10,8) NOT NULL,
+        longitude DECIMAL(11,8) NOT NULL,
+        cell INT NOT NULL,
+        last_weather_id INT,
+        last_seen DATETIME,
+        INDEX idx_cell (cell)
+    )
+'''
+
+
+def create_weather_stations(cursor):
+    """Create weather_stations (caller commits)"""
+    cursor.execute(WEATHER_STATIONS_DDL)
+
+
+# Per-bin fill-rate estimate (bin_forecast.py), updated with every bin
+# reading; predicted_full_at is indexed for the soonest-full ranking
+BIN_FILL_STATE_DDL = '''
+    CREATE TABLE IF NOT EXISTS bin_fill_state (
+        bin_id VARCHAR(50) PRIMARY KEY,
+        last_at DATETIME NOT NULL,
+        last_distance_cm DECIMAL(6,2) NOT NULL,
+        readings INT NOT NULL DEFAULT 0,
+        sum_w DOUBLE NOT NULL DEFAULT 0,
+        sum_x DOUBLE NOT NULL DEFAULT 0,
+        sum_y DOUBLE NOT NULL DEFAULT 0,
+        sum_xx DOUBLE NOT NULL DEFAULT 0,
+        sum_xy DOUBLE NOT NULL DEFAULT 0,
+        pending_at DATETIME NULL,
+        pending_distance_cm DECIMAL(6,2) NULL,
+        emptied_at DATETIME NULL,
+        fill_rate_cm_per_hour DOUBLE NULL,
+        predicted_full_at DATETIME NULL,
+        updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        INDEX idx_predicted_full (predicted_full_at)
+    )
+'''
+
+
+def create_bin_fill_state(cursor):
+    """Create bin_fill_state (caller commits)"""
+    cursor.execute(BIN_FILL_STATE_DDL)
+
+
+# Maintained row counts for /api/statistics/overview (counters.py), kept by
+# triggers so every writer updates them in its own transaction. Each
+# counter is split over COUNTER_SHARDS rows picked by row id, so concurrent
+# sensor_logs inserts do not queue on a single row lock.
+COUNTER_SHARDS = 16
+
+FARM_COUNTERS_DDL = '''
+    CREATE TABLE IF NOT EXISTS farm_counters (
+        name VARCHAR(64) NOT NULL,
+        shard SMALLINT NOT NULL,
+        value BIGINT NOT NULL DEFAULT 0,
+        PRIMARY KEY (name, shard)
+    )
+'''
+
+# counter -> (table, id column, predicate on {row} or None to count every row)
+FARM_COUNTERS = {
+    'total_sensor_readings': ('sensor_logs', 'log_id', None),
+    'total_plots': ('plots', 'plot_id', None),
+    'active_devices': ('devices', 'device_id', "{row}.status = 'ON'"),
+    'pending_alerts': ('alerts', 'alert_id', "{row}.is_resolved = FALSE"),
+}
+
+
+def _counter_delta(predicate, row):
+    if predicate is None:
+        return '1'
+    return f"COALESCE(({predicate.format(row=row)}), 0)"
+
+
+def _counter_upserts(table: str, event: str, dialect: str):
+    """(upsert statement, change condition or None) per counter of table"""
+    upserts = []
+    for counter, (counted, id_column, predicate) in FARM_COUNTERS.items():
+        if counted != table or (event == 'UPDATE' and predicate is None):
+            continue
+        if event == 'INSERT':
+            row, delta, condition = 'NEW', _counter_delta(predicate, 'NEW'), None
+        elif event == 'DELETE':
+            row, delta, condition = 'OLD', f"-{_counter_delta(predicate, 'OLD')}", None
+        else:
+            # Most device/alert updates do not change the counted state: skip those
+            row = 'NEW'
+            delta = condition = f"{_counter_delta(predicate, 'NEW')} - {_counter_delta(predicate, 'OLD')}"
+        insert = (f"INSERT INTO farm_counters (name, shard, value) "
+                  f"VALUES ('{counter}', {row}.{id_column} % {COUNTER_SHARDS}, {delta})")
+        if dialect == 'sqlite':
+            upserts.append((f"{insert} ON CONFLICT(name, shard) DO UPDATE SET value = value + excluded.value",
+                            condition))
+        else:
+            upserts.append((f"{insert} ON DUPLICATE KEY UPDATE value = value + VALUES(value)", condition))
+    return upserts
+
+
+def counter_trigger_statements(table: str, dialect: str = 'mysql'):
+    """DROP/CREATE statements for the counter triggers of a table"""
+    statements = []
+    for event in ('INSERT', 'UPDATE', 'DELETE'):
+        name = f"trg_{table}_counter_{event.lower()}"
+        upserts = _counter_upserts(table, event, dialect)
+        if dialect == 'sqlite':
+            # No IF in SQLite triggers: one trigger per counter, filtered with WHEN
+            for index, (upsert, condition) in enumerate(upserts):
+                when = f" WHEN ({condition}) <> 0" if condition else ''
+                statements.append(f"DROP TRIGGER IF EXISTS {name}_{index}")
+                statements.append(f'''
+                    CREATE TRIGGER {name}_{index} AFTER {event} ON {table}
+                    FOR EACH ROW{when} BEGIN
+                        {upsert};
+                    END
+                ''')
+        elif upserts:
+            body = ' '.join(f"IF ({condition}) <> 0 THEN {upsert}; END IF;" if condition else f"{upsert};"
+                            for upsert, condition in upserts)
+            statements.append(f"DROP TRIGGER IF EXISTS {name}")
+            statements.append(f'''
+                CREATE TRIGGER {name} AFTER {event} ON {table}
+                FOR EACH ROW BEGIN
+                    {body}
+                END
+            ''')
+    return statements
+
+
+def create_farm_counters(cursor, dialect: str = 'mysql'):
+    """
+    Create farm_counters and install counter triggers (caller commits)
+
+    Counters start at zero: run counters.reconcile(fix=True) afterwards to
+    add the rows that existed before the triggers.
+
+    Returns:
+        List of counters whose table exists
+    """
+    cursor.execute(FARM_COUNTERS_DDL)
+    installed = []
+    for table in dict.fromkeys(table for table, _, _ in FARM_COUNTERS.values()):
+        cursor.execute('SHOW TABLES LIKE %s', (table,))
+        if not cursor.fetchall():
+            logger.warning("farm_counters_skipped table=%s reason=missing", table)
+            continue
+        for statement in counter_trigger_statements(table, dialect):
+            cursor.execute(statement)
+        installed.extend(name for name, (counted, _, _) in FARM_COUNTERS.items() if counted == table)
+    return installed
+
+
+# Secondary indexes the route queries in api_server.py need, beyond the
+# ones the /api/*/init DDL declares (benchmarks/check_query_plans.py
+# fails when a route query scans or sorts a large table without them)
+ROUTE_INDEXES = {
+    # /api/environment, /api/sensor/latest, /api/sensor-logs: ORDER BY timestamp DESC LIMIT n;
+    # overview: timestamp > NOW() - 1 day
+    'sensor_logs': [('idx_timestamp', ('timestamp',))],
+    # /api/device(s)/<device_name>; /api/device-runtime?plot_id=
+    'devices': [('idx_device_name', ('device_name',)), ('idx_plot', ('plot_id',))],
+    # /api/sensor/cleanup: created_at < NOW() - n days
+    'sensor_data': [('idx_created', ('created_at',))],
+    # Unfiltered "latest n" listings
+    'trash_bin_logs': [('idx_created', ('created_at',))],
+    'device_logs': [('idx_created', ('created_at',))],
+    'weather_logs': [('idx_created', ('created_at',))],
+    # /api/alerts without plot_id and the pending count: is_resolved = x ORDER BY created_at
+    'alerts': [('idx_resolved_created', ('is_resolved', 'created_at'))],
+    # /api/maintenance without device_id: status = x ORDER BY scheduled_date
+    'maintenance_schedules': [('idx_status_date', ('status', 'scheduled_date'))],
+}
+
+
+def existing_indexes(cursor, table: str, dialect: str = 'mysql'):
+    """Column tuples of every index on table (primary key included)"""
+    indexes = {}
+    if dialect == 'sqlite':
+        cursor.execute('''
+            SELECT il.name, ii.name FROM pragma_index_list(%s) AS il, pragma_index_info(il.name) AS ii
+            ORDER BY il.name, ii.seqno
+        ''', (table,))
+        for name, column in cursor.fetchall():
+            indexes.setdefault(name, []).append(column)
+        cursor.execute('SELECT name FROM pragma_table_info(%s) WHERE pk > 0 ORDER BY pk', (table,))
+        primary = [row[0] for row in cursor.fetchall()]
+        if primary:
+            indexes['PRIMARY'] = primary
+    else:
+        cursor.execute(f'SHOW INDEX FROM {table}')
+        columns = [d[0] for d in cursor.description]
+        key, column = columns.index('Key_name'), columns.index('Column_name')
+        for row in cursor.fetchall():
+            indexes.setdefault(row[key], []).append(row[column])
+    return [tuple(columns) for columns in indexes.values()]
+
+
+def create_route_indexes(cursor, dialect: str = 'mysql'):
+    """
+    Add missing ROUTE_INDEXES (idempotent)
+
+    An index counts as present when an existing index starts with the same
+    columns, whatever its name. Tables or columns that do not exist (the
+    api.py and /api/*/init variants of a table differ) are skipped.
+
+    Returns:
+        {'created': [...], 'present': [...], 'skipped': [...]} as "table.index"
+    """
+    result = {'created': [], 'present': [], 'skipped': []}
+    for table, indexes in ROUTE_INDEXES.items():
+        cursor.execute('SHOW TABLES LIKE %s', (table,))
+        if not cursor.fetchall():
+            result['skipped'].extend(f"{table}.{name}" for name, _ in indexes)
+            continue
+        cursor.execute(f'SHOW COLUMNS FROM {table}')
+        table_columns = {row[0] for row in cursor.fetchall()}
+        existing = existing_indexes(cursor, table, dialect)
+        for name, columns in indexes:
+            label = f"{table}.{name}"
+            if not set(columns) <= table_columns:
+                logger.warning("route_index_skipped index=%s reason=missing_columns", label)
+                result['skipped'].append(label)
+            elif any(index[:len(columns)] == columns for index in existing):
+                result['present'].append(label)
+            else:
+                statement = f"CREATE INDEX {name} ON {table} ({', '.join(columns)})"
+                if dialect != 'sqlite':
+                    # Online build: ingest keeps writing while the index is created
+                    statement += ' ALGORITHM=INPLACE LOCK=NONE'
+                cursor.execute(statement)
+                logger.info("route_index_created index=%s", label)
+                result['created'].append(label)
+    return result
@@ -0,0 +1,115 @@
+"""
+JSON Serialization for Smart Farm API
+Single-pass encoding of MySQL row values (Decimal, datetime, date, TIME)
+Uses orjson when installed, falls back to the stdlib encoder
+"""
+
+import json
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+from flask.json.provider import JSONProvider
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def encode_value(value):
+    """
+    Convert a value the JSON backend cannot encode itself
+
+    Decimal becomes float, DATETIME/TIMESTAMP become 'YYYY-MM-DD HH:MM:SS'
+    (what the dashboards and DateTime.tryParse expect), DATE becomes
+    'YYYY-MM-DD' and TIME columns (timedelta) become 'H:MM:SS'.
+    """
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (datetime, date, timedelta)):
+        return str(value)
+    if isinstance(value, (bytes, bytearray)):
+        return value.decode('utf-8', 'replace')
+    if isinstance(value, (set, frozenset)):
+        return list(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+if orjson is not None:
+    # Datetimes go through encode_value so both backends emit the same format
+    _ORJSON_OPTIONS = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS
+
+    def dumps_bytes(obj) -> bytes:
+        """Encode obj to UTF-8 JSON bytes"""
+        return orjson.dumps(obj, default=encode_value, option=_ORJSON_OPTIONS)
+
+    def loads(data):
+        return orjson.loads(data)
+else:
+    _encoder = json.JSONEncoder(default=encode_value, ensure_ascii=False,
+                                separators=(',', ':'), sort_keys=True)
+
+    def dumps_bytes(obj) -> bytes:
+        """Encode obj to UTF-8 JSON bytes"""
+        return _encoder.encode(obj).encode('utf-8')
+
+    def loads(data):
+        return json.loads(data)
+
+
+def dumps(obj) -> str:
+    """Encode obj to a JSON string"""
+    return dumps_bytes(obj).decode('utf-8')
+
+
+def _seconds(delta: timedelta):
+    seconds = delta.total_seconds()
+    return int(seconds) if seconds.is_integer() else seconds
+
+
+def columnar(rows, columns, time_column=None):
+    """
+    Column-oriented form of row dicts: {column: [value, ...]}
+
+    Each key is written once instead of once per row. The time column is
+    delta-encoded as {'start': first value, 'deltas': [seconds from the
+    previous row, ...]}, in row order (negative for newest-first results).
+    Rows with a NULL time break the chain and are not delta-encoded.
+    """
+    result = {column: [row[column] for row in rows] for column in columns if column != time_column}
+    if time_column is not None:
+        times = [row[time_column] for row in rows]
+        if None in times:
+            result[time_column] = times
+        else:
+            result[time_column] = {
+                'start': times[0] if times else None,
+                'deltas': [_seconds(current - previous) for previous, current in zip(times, times[1:])],
+            }
+    return result
+
+
+class FastJSONProvider(JSONProvider):
+    """
+    Flask JSON provider backed by dumps_bytes
+
+    Installed as app.json so jsonify() encodes rows straight from the
+    cursor without per-row conversion loops in the handlers.
+    """
+
+    mimetype = 'application/json'
+
+    def dumps(self, obj, **kwargs) -> str:
+        return dumps(obj)
+
+    def loads(self, s, **kwargs):
+        return loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(dumps_bytes(obj) + b'\n', mimetype=self.mimetype)
+
+
+def backend_name() -> str:
+    """Name of the JSON backend in use"""
+    return 'orjson' if orjson is not None else 'json'
@@ -0,0 +1,524 @@
+"""
+SQLite Backend for Smart Farm
+Embedded storage for single-greenhouse gateways: a mysql.connector-shaped
+connection over sqlite3 (WAL, tuned pragmas, pooled connections) and a
+translator for the MySQL dialect used by the route handlers
+"""
+
+import logging
+import os
+import re
+import sqlite3
+import threading
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from typing import Dict, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+PRAGMAS = (
+    'PRAGMA journal_mode = WAL',        # readers never block the writer
+    'PRAGMA synchronous = NORMAL',      # fsync at checkpoints only (safe with WAL)
+    'PRAGMA busy_timeout = 5000',       # wait for the write lock instead of failing
+    'PRAGMA foreign_keys = ON',         # same constraints as InnoDB
+    'PRAGMA temp_store = MEMORY',
+    'PRAGMA cache_size = -16000',       # 16 MB page cache per connection
+    'PRAGMA mmap_size = 268435456',     # 256 MB memory-mapped reads
+)
+
+# Statement cache size of each sqlite3 connection (compiled statements are
+# reused across requests because connections go back to the pool)
+STATEMENT_CACHE_SIZE = 512
+
+# Idle connections kept per database file; more are opened under load and
+# closed when returned to a full pool
+POOL_SIZE = 8
+
+# ON CONFLICT DO UPDATE without a conflict target (ON DUPLICATE KEY UPDATE)
+MIN_SQLITE_VERSION = (3, 35, 0)
+
+LOCAL_NOW = "datetime('now', 'localtime')"
+
+
+# ==================== TYPES ====================
+
+def _adapt_datetime(value):
+    return value.strftime('%Y-%m-%d %H:%M:%S')
+
+
+def _convert_datetime(raw: bytes):
+    text = raw.decode()
+    try:
+        return datetime.fromisoformat(text)
+    except ValueError:
+        return text
+
+
+def _convert_date(raw: bytes):
+    text = raw.decode()
+    try:
+        return date.fromisoformat(text[:10])
+    except ValueError:
+        return text
+
+
+sqlite3.register_adapter(datetime, _adapt_datetime)
+sqlite3.register_adapter(date, lambda value: value.isoformat())
+sqlite3.register_adapter(timedelta, str)
+sqlite3.register_adapter(Decimal, float)
+sqlite3.register_adapter(bool, int)
+sqlite3.register_converter('DATETIME', _convert_datetime)
+sqlite3.register_converter('TIMESTAMP', _convert_datetime)
+sqlite3.register_converter('DATE', _convert_date)
+
+
+# ==================== DIALECT ====================
+
+_INTERVAL_UNITS = {'SECOND': 'seconds', 'MINUTE': 'minutes', 'HOUR': 'hours',
+                   'DAY': 'days', 'MONTH': 'months', 'YEAR': 'years'}
+_DIFF_FACTORS = {'SECOND': 86400, 'MINUTE': 1440, 'HOUR': 24, 'DAY': 1}
+
+_FUNCTION = re.compile(r'\b(DATE_SUB|DATE_ADD|UNIX_TIMESTAMP|FROM_UNIXTIME|TIMESTAMPDIFF|HOUR|'
+                       r'GREATEST|LEAST|IF|CONCAT)\s*\(', re.IGNORECASE)
+_CAST = re.compile(r'\bAS\s+(DECIMAL(?:\s*\(\s*\d+\s*(?:,\s*\d+\s*)?\))?|SIGNED(?:\s+INTEGER)?|'
+                   r'UNSIGNED(?:\s+INTEGER)?|CHAR(?:\s*\(\s*\d+\s*\))?|DATETIME|DATE)\s*\)', re.IGNORECASE)
+_CREATE_TABLE = re.compile(r'^\s*CREATE\s+TABLE\s+(IF\s+NOT\s+EXISTS\s+)?`?(\w+)`?\s*\(', re.IGNORECASE)
+_CREATE_INDEX = re.compile(r'^\s*CREATE\s+(UNIQUE\s+)?INDEX\s+`?(\w+)`?\s+ON\s+`?(\w+)`?', re.IGNORECASE)
+_DROP_INDEX = re.compile(r'^\s*DROP\s+INDEX\s+`?(\w+)`?\s+ON\s+`?(\w+)`?\s*$', re.IGNORECASE)
+_ALTER_ADD_INDEX = re.compile(r'^\s*ALTER\s+TABLE\s+`?(\w+)`?\s+ADD\s+(UNIQUE\s+)?(?:INDEX|KEY)\s+`?(\w+)`?\s*(\(.*\))\s*$',
+                              re.IGNORECASE | re.DOTALL)
+_SHOW_TABLES = re.compile(r'^\s*SHOW\s+TABLES(?:\s+LIKE\s+(.+?))?\s*$', re.IGNORECASE)
+_SHOW_COLUMNS = re.compile(r'^\s*(?:SHOW\s+COLUMNS\s+FROM|DESCRIBE)\s+`?(\w+)`?\s*$', re.IGNORECASE)
+
+
+def _split_top_level(text: str, sep: str = ',') -> List[str]:
+    """Split on sep outside parentheses and quotes"""
+    parts, depth, quote, start = [], 0, None, 0
+    for i, ch in enumerate(text):
+        if quote:
+            if ch == quote:
+                quote = None
+        elif ch in ("'", '"', '`'):
+            quote = ch
+        elif ch == '(':
+            depth += 1
+        elif ch == ')':
+            depth -= 1
+        elif ch == sep and depth == 0:
+            parts.append(text[start:i])
+            start = i + 1
+    parts.append(text[start:])
+    return [p.strip() for p in parts]
+
+
+def _matching_paren(text: str, open_index: int) -> int:
+    """Index of the ')' closing the '(' at open_index"""
+    depth, quote = 0, None
+    for i in range(open_index, len(text)):
+        ch = text[i]
+        if quote:
+            if ch == quote:
+                quote = None
+        elif ch in ("'", '"'):
+            quote = ch
+        elif ch == '(':
+            depth += 1
+        elif ch == ')':
+            depth -= 1
+            if depth == 0:
+                return i
+    raise ValueError(f"Unbalanced parentheses in: {text}")
+
+
+def _interval(sign: str, base: str, interval: str) -> str:
+    match = re.match(r'^\s*INTERVAL\s+(.+?)\s+(\w+)\s*$', interval, re.IGNORECASE | re.DOTALL)
+    if not match or match.group(2).upper() not in _INTERVAL_UNITS:
+        raise ValueError(f"Unsupported interval: {interval}")
+    amount, unit = match.group(1), _INTERVAL_UNITS[match.group(2).upper()]
+    if re.fullmatch(r'\d+(\.\d+)?', amount):
+        return f"datetime({base}, '{sign}{amount} {unit}')"
+    return f"datetime({base}, '{sign}' || ({amount}) || ' {unit}')"
+
+
+def _rewrite_function(name: str, args: List[str]) -> str:
+    name = name.upper()
+    if name in ('DATE_SUB', 'DATE_ADD'):
+        return _interval('-' if name == 'DATE_SUB' else '+', args[0], args[1])
+    if name == 'UNIX_TIMESTAMP':
+        if not args or not args[0]:
+            return "CAST(strftime('%s', 'now') AS INTEGER)"
+        return f"CAST(strftime('%s', {args[0]}, 'utc') AS INTEGER)"
+    if name == 'FROM_UNIXTIME':
+        return f"datetime({args[0]}, 'unixepoch', 'localtime')"
+    if name == 'TIMESTAMPDIFF':
+        unit = args[0].upper()
+        if unit not in _DIFF_FACTORS:
+            raise ValueError(f"Unsupported TIMESTAMPDIFF unit: {unit}")
+        return f"CAST((julianday({args[2]}) - julianday({args[1]})) * {_DIFF_FACTORS[unit]} AS INTEGER)"
+    if name == 'HOUR':
+        return f"CAST(strftime('%H', {args[0]}) AS INTEGER)"
+    if name == 'GREATEST':
+        return f"MAX({', '.join(args)})"
+    if name == 'LEAST':
+        return f"MIN({', '.join(args)})"
+    if name == 'IF':
+        return f"(CASE WHEN {args[0]} THEN {args[1]} ELSE {args[2]} END)"
+    if name == 'CONCAT':
+        return '(' + ' || '.join(f"COALESCE({a}, '')" for a in args) + ')'
+    raise ValueError(name)
+
+
+def _rewrite_functions(sql: str) -> str:
+    """Rewrite MySQL-only function calls, innermost arguments first"""
+    out, pos = [], 0
+    while True:
+        match = _FUNCTION.search(sql, pos)
+        if not match:
+            out.append(sql[pos:])
+            return ''.join(out)
+        open_index = match.end() - 1
+        close_index = _matching_paren(sql, open_index)
+        args = [_rewrite_functions(a) for a in _split_top_level(sql[open_index + 1:close_index])]
+        out.append(sql[pos:match.start()])
+        out.append(_rewrite_function(match.group(1), args))
+        pos = close_index + 1
+
+
+def _column_definition(item: str) -> str:
+    item = re.sub(r"\bENUM\s*\([^)]*\)", 'TEXT', item, flags=re.IGNORECASE)
+    item = re.sub(r'\bUNSIGNED\b', '', item, flags=re.IGNORECASE)
+    item = re.sub(r'\bON\s+UPDATE\s+CURRENT_TIMESTAMP(\(\d*\))?', '', item, flags=re.IGNORECASE)
+    item = re.sub(r'\bDEFAULT\s+(CURRENT_TIMESTAMP(\(\d*\))?|NOW\(\))', f'DEFAULT ({LOCAL_NOW})', item,
+                  flags=re.IGNORECASE)
+    item = re.sub(r"\bCOMMENT\s+'[^']*'", '', item, flags=re.IGNORECASE)
+    item = re.sub(r'\b(CHARACTER\s+SET|COLLATE)\s+\w+', '', item, flags=re.IGNORECASE)
+    if re.search(r'\bAUTO_INCREMENT\b', item, re.IGNORECASE):
+        name = item.split()[0]
+        rest = re.sub(r'^\S+\s+\w+(\s*\(\d+\))?', '', item)
+        rest = re.sub(r'\b(AUTO_INCREMENT|PRIMARY\s+KEY|NOT\s+NULL)\b', '', rest, flags=re.IGNORECASE)
+        item = f"{name} INTEGER PRIMARY KEY AUTOINCREMENT {rest}"
+    return ' '.join(item.split())
+
+
+def _create_table(sql: str, match) -> Tuple[str, List[str]]:
+    table = match.group(2)
+    open_index = match.end() - 1
+    close_index = _matching_paren(sql, open_index)
+    items, extra = [], []
+    auto_column = None
+    for item in _split_top_level(sql[open_index + 1:close_index]):
+        if not item:
+            continue
+        upper = item.upper()
+        index = re.match(r'^(UNIQUE\s+)?(?:INDEX|KEY)\s+`?(\w+)`?\s*(\(.*\))$', item, re.IGNORECASE | re.DOTALL)
+        if re.match(r'^(INDEX|KEY)\b', upper) and index:
+            extra.append(f"CREATE INDEX IF NOT EXISTS {table}_{index.group(2)} ON {table} {index.group(3)}")
+            continue
+        if re.match(r'^UNIQUE\s+(INDEX|KEY)\b', upper) and index:
+            items.append(f"UNIQUE {index.group(3)}")
+            continue
+        if upper.startswith('PRIMARY KEY') and auto_column:
+            # Already declared inline as INTEGER PRIMARY KEY AUTOINCREMENT
+            if re.sub(r'[\s`()]', '', item[len('PRIMARY KEY'):]) == auto_column:
+                continue
+        if re.match(r'^(PRIMARY\s+KEY|FOREIGN\s+KEY|CONSTRAINT|UNIQUE|CHECK)\b', upper):
+            items.append(' '.join(item.split()))
+            continue
+        if re.search(r'\bAUTO_INCREMENT\b', item, re.IGNORECASE):
+            auto_column = item.split()[0].strip('`')
+        items.append(_column_definition(item))
+    create = f"CREATE TABLE {match.group(1) or ''}{table} ({', '.join(items)})"
+    return create, extra
+
+
+def _translate(sql: str, has_params: bool) -> Tuple[str, List[str]]:
+    """MySQL statement -> (SQLite statement, follow-up statements)"""
+    if has_params:
+        sql = re.sub(r'%\((\w+)\)s', r':\1', sql)
+        sql = sql.replace('%s', '?').replace('%%', '%')
+
+    show = _SHOW_TABLES.match(sql)
+    if show:
+        query = "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%'"
+        return (query + (f" AND name LIKE {show.group(1)}" if show.group(1) else '')), []
+    show = _SHOW_COLUMNS.match(sql)
+    if show:
+        return (f"""SELECT name AS Field, type AS Type,
+                       CASE WHEN "notnull" THEN 'NO' ELSE 'YES' END AS "Null",
+                       CASE WHEN pk THEN 'PRI' ELSE '' END AS "Key",
+                       dflt_value AS "Default", '' AS Extra
+                FROM pragma_table_info('{show.group(1)}')"""), []
+    if re.match(r'^\s*SET\s+(SESSION|GLOBAL|NAMES|@@)', sql, re.IGNORECASE):
+        return 'SELECT 1', []
+    if re.match(r'^\s*START\s+TRANSACTION\s*$', sql, re.IGNORECASE):
+        return 'BEGIN IMMEDIATE', []
+
+    match = _CREATE_TABLE.match(sql)
+    if match:
+        return _create_table(sql, match)
+    match = _CREATE_INDEX.match(sql)
+    if match and not re.search(r'\bIF\s+NOT\s+EXISTS\b', sql, re.IGNORECASE):
+        unique, name, table = match.groups()
+        return (f"CREATE {unique or ''}INDEX IF NOT EXISTS {table}_{name} ON {table}"
+                + sql[match.end():]), []
+    match = _DROP_INDEX.match(sql)
+    if match:
+        return f"DROP INDEX IF EXISTS {match.group(2)}_{match.group(1)}", []
+    match = _ALTER_ADD_INDEX.match(sql)
+    if match:
+        table, unique, name, columns = match.groups()
+        return f"CREATE {unique or ''}INDEX IF NOT EXISTS {table}_{name} ON {table} {columns}", []
+    if re.match(r'^\s*ALTER\s+TABLE\b', sql, re.IGNORECASE):
+        sql = re.sub(r'\s+(AFTER\s+`?\w+`?|FIRST)\s*$', '', sql, flags=re.IGNORECASE)
+        sql = re.sub(r'(ADD\s+COLUMN\s+)(.*)$', lambda m: m.group(1) + _column_definition(m.group(2)),
+                     sql, flags=re.IGNORECASE | re.DOTALL)
+        return sql, []
+
+    sql = re.sub(r'^\s*INSERT\s+IGNORE\b', 'INSERT OR IGNORE', sql, flags=re.IGNORECASE)
+    sql = re.sub(r'^\s*REPLACE\s+INTO\b', 'INSERT OR REPLACE INTO', sql, flags=re.IGNORECASE)
+    upsert = re.search(r'\bON\s+DUPLICATE\s+KEY\s+UPDATE\b', sql, re.IGNORECASE)
+    if upsert:
+        assignments = re.sub(r'\bVALUES\s*\(\s*`?(\w+)`?\s*\)', r'excluded.\1', sql[upsert.end():],
+                             flags=re.IGNORECASE)
+        sql = sql[:upsert.start()] + 'ON CONFLICT DO UPDATE SET' + assignments
+    sql = re.sub(r'\bNOW\(\)|\bCURRENT_TIMESTAMP(\(\))?|\bSYSDATE\(\)', LOCAL_NOW, sql, flags=re.IGNORECASE)
+    # NOW() - INTERVAL n DAY (operator form of DATE_SUB)
+    sql = re.sub(re.escape(LOCAL_NOW) + r'\s*([+-])\s*(INTERVAL\s+(?:%s|\?|\d+)\s+\w+)',
+                 lambda m: _interval(m.group(1), LOCAL_NOW, m.group(2)), sql, flags=re.IGNORECASE)
+    sql = re.sub(r'\bUTC_TIMESTAMP\(\)', "datetime('now')", sql, flags=re.IGNORECASE)
+    sql = re.sub(r'\bCURDATE\(\)|\bCURRENT_DATE(\(\))?', "date('now', 'localtime')", sql, flags=re.IGNORECASE)
+    sql = re.sub(r'\bLAST_INSERT_ID\(\)', 'last_insert_rowid()', sql, flags=re.IGNORECASE)
+    sql = re.sub(r'\s+(FOR\s+UPDATE|LOCK\s+IN\s+SHARE\s+MODE)\s*$', '', sql, flags=re.IGNORECASE)
+    sql = _CAST.sub(lambda m: 'AS ' + _cast_type(m.group(1)) + ')', sql)
+    return _rewrite_functions(sql), []
+
+
+def _cast_type(mysql_type: str) -> str:
+    upper = mysql_type.upper()
+    if upper.startswith('DECIMAL'):
+        return 'REAL'
+    if upper.startswith(('SIGNED', 'UNSIGNED')):
+        return 'INTEGER'
+    return 'TEXT'
+
+
+_translations: Dict[Tuple[str, bool], Tuple[str, List[str]]] = {}
+
+
+def translate(sql: str, has_params: bool = True) -> Tuple[str, List[str]]:
+    """
+    Translate a MySQL statement to SQLite (cached per statement text)
+
+    Covers the dialect used by the handlers: %s placeholders, NOW()/
+    DATE_SUB/INTERVAL arithmetic, UNIX_TIMESTAMP, CAST AS DECIMAL,
+    AUTO_INCREMENT and inline INDEX clauses in CREATE TABLE, INSERT IGNORE,
+    ON DUPLICATE KEY UPDATE and SHOW TABLES/COLUMNS. Index names are
+    prefixed with their table because SQLite index names are global.
+
+    Returns:
+        (statement, extra statements to run after it without parameters)
+    """
+    key = (sql, has_params)
+    result = _translations.get(key)
+    if result is None:
+        result = _translate(sql, has_params)
+        if len(_translations) < 10000:
+            _translations[key] = result
+    return result
+
+
+# ==================== CONNECTION ====================
+
+class SQLiteCursor:
+    """mysql.connector-style cursor: %s parameters, optional dict rows"""
+
+    def __init__(self, cursor, dictionary: bool = False):
+        self._cursor = cursor
+        self._dictionary = dictionary
+
+    def execute(self, operation, params=None, *args, **kwargs):
+        statement, extra = translate(operation, params is not None)
+        if extra and self._table_exists(operation):
+            # CREATE TABLE IF NOT EXISTS was a no-op: so are its inline indexes
+            extra = ()
+        self._cursor.execute(statement, self._params(params))
+        for follow_up in extra:
+            self._cursor.execute(follow_up)
+        return None
+
+    def executemany(self, operation, seq_params, *args, **kwargs):
+        statement, _ = translate(operation, True)
+        self._cursor.executemany(statement, (self._params(p) for p in seq_params))
+        return None
+
+    def _table_exists(self, operation) -> bool:
+        match = _CREATE_TABLE.match(operation)
+        if not match:
+            return False
+        self._cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?",
+                             (match.group(2),))
+        return self._cursor.fetchone() is not None
+
+    @staticmethod
+    def _params(params):
+        if params is None:
+            return ()
+        if isinstance(params, dict):
+            return params
+        return tuple(params)
+
+    def _row(self, row):
+        if row is None or not self._dictionary:
+            return row
+        return dict(zip([d[0] for d in self._cursor.description], row))
+
+    def fetchone(self):
+        return self._row(self._cursor.fetchone())
+
+    def fetchall(self):
+        rows = self._cursor.fetchall()
+        if not self._dictionary or not rows:
+            return rows
+        columns = [d[0] for d in self._cursor.description]
+        return [dict(zip(columns, row)) for row in rows]
+
+    def fetchmany(self, size=1):
+        rows = self._cursor.fetchmany(size)
+        if not self._dictionary or not rows:
+            return rows
+        columns = [d[0] for d in self._cursor.description]
+        return [dict(zip(columns, row)) for row in rows]
+
+    def __iter__(self):
+        return iter(self.fetchone, None)
+
+    @property
+    def lastrowid(self):
+        return self._cursor.lastrowid
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    @property
+    def description(self):
+        return self._cursor.description
+
+    @property
+    def column_names(self):
+        return tuple(d[0] for d in self._cursor.description or ())
+
+    def close(self):
+        self._cursor.close()
+
+
+class SQLiteConnection:
+    """
+    Per-request handle on a pooled sqlite3 connection
+
+    Handlers open and close a connection per request; opening a SQLite
+    file, applying pragmas and recompiling statements each time would cost
+    more than the queries, so close() ends the transaction and returns the
+    underlying connection (with its statement cache) to the pool.
+    """
+
+    def __init__(self, conn: sqlite3.Connection, path: str):
+        self._conn = conn
+        self._path = path
+
+    def cursor(self, dictionary: bool = False, **kwargs):
+        return SQLiteCursor(self._conn.cursor(), dictionary)
+
+    def commit(self):
+        self._conn.commit()
+
+    def rollback(self):
+        self._conn.rollback()
+
+    def is_connected(self):
+        return self._conn is not None
+
+    def close(self):
+        if self._conn is None:
+            return
+        conn, self._conn = self._conn, None
+        # Uncommitted work is discarded, as when a MySQL connection closes
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            conn.close()
+            return
+        _release(self._path, conn)
+
+
+_pools: Dict[str, List[sqlite3.Connection]] = {}
+_pools_lock = threading.Lock()
+
+
+def _open(path: str) -> sqlite3.Connection:
+    if sqlite3.sqlite_version_info < MIN_SQLITE_VERSION:
+        raise sqlite3.NotSupportedError(
+            f"SQLite {sqlite3.sqlite_version} is too old, need "
+            f"{'.'.join(map(str, MIN_SQLITE_VERSION))}+ (upsert without conflict target)")
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    conn = sqlite3.connect(
+        path,
+        detect_types=sqlite3.PARSE_DECLTYPES,
+        # BEGIN IMMEDIATE takes the write lock up front, so a transaction
+        # never fails halfway on a lock upgrade; busy_timeout queues writers
+        isolation_level='IMMEDIATE',
+        check_same_thread=False,
+        cached_statements=STATEMENT_CACHE_SIZE,
+        timeout=5.0,
+    )
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+
+def _release(path: str, conn: sqlite3.Connection):
+    with _pools_lock:
+        pool = _pools.setdefault(path, [])
+        if len(pool) < POOL_SIZE:
+            pool.append(conn)
+            return
+    conn.close()
+
+
+def connect(path: str) -> SQLiteConnection:
+    """
+    Connection from the pool of path (opened when none is idle); close()
+    returns it
+
+    Args:
+        path: Database file (created with its directory if missing)
+    """
+    with _pools_lock:
+        pool = _pools.get(path)
+        conn = pool.pop() if pool else None
+    return SQLiteConnection(conn or _open(path), path)
+
+
+def explain(path: str, sql: str, params=None) -> List[Dict]:
+    """EXPLAIN QUERY PLAN for a MySQL-dialect statement"""
+    statement, _ = translate(sql, params is not None)
+    conn = connect(path)
+    try:
+        cursor = conn._conn.execute('EXPLAIN QUERY PLAN ' + statement, SQLiteCursor._params(params))
+        columns = [d[0] for d in cursor.description]
+        return [dict(zip(columns, row)) for row in cursor.fetchall()]
+    finally:
+        conn.close()
+
+
+def _reset_after_fork():
+    # sqlite3 connections must not be shared across processes
+    global _pools, _pools_lock
+    _pools = {}
+    _pools_lock = threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
@@ -0,0 +1,244 @@
+"""
+Weather Station Index for Smart Farm
+Positions of the stations reporting to weather_logs, kept in
+weather_stations with a grid cell id so nearest-station, radius and
+bounding-box lookups read a few index ranges instead of scanning readings
+
+A station is a weather_logs location; its row holds the position and the
+id of its latest reading, updated on every ingest (and for replicated
+batches). The grid is GRID_DEGREES square: a box is covered by one cell id
+range per grid row, fetched with an index range scan, and exact distances
+(haversine) are computed on the few rows returned. Nearest-station search
+widens the radius until enough stations are found.
+
+Usage:
+    python weather_stations.py --lat 13.75 --lon 100.50           # nearest stations
+    python weather_stations.py --lat 13.75 --lon 100.50 --radius 50
+    python weather_stations.py --rebuild                          # recompute from weather_logs
+"""
+
+import argparse
+import logging
+import math
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import database
+import schema
+
+logger = logging.getLogger(__name__)
+
+# Changing the grid needs a --rebuild (cell ids are stored)
+GRID_DEGREES = 0.25
+LAT_CELLS = int(180 / GRID_DEGREES)
+LON_CELLS = int(360 / GRID_DEGREES)
+
+# Boxes needing more ranges than this read whole grid rows instead
+MAX_RANGES = 64
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+HALF_CIRCUMFERENCE_KM = math.pi * EARTH_RADIUS_KM
+
+UPSERT_STATION = '''
+    INSERT INTO weather_stations (location, latitude, longitude, cell, last_weather_id, last_seen)
+    VALUES (%s, %s, %s, %s, %s, %s)
+    ON DUPLICATE KEY UPDATE
+    latitude = VALUES(latitude), longitude = VALUES(longitude), cell = VALUES(cell),
+    last_weather_id = VALUES(last_weather_id), last_seen = VALUES(last_seen)
+'''
+
+LATEST_READING = '''
+    SELECT weather_id, latitude, longitude, created_at
+    FROM weather_logs
+    WHERE location = %s
+    ORDER BY created_at DESC
+    LIMIT 1
+'''
+
+# {cells}: 's.cell BETWEEN %s AND %s' once per range, joined with OR
+STATIONS_IN_CELLS = '''
+    SELECT s.location, s.latitude, s.longitude, s.last_seen,
+           w.temperature, w.humidity, w.wind_speed, w.rainfall, w.weather_condition
+    FROM weather_stations s
+    LEFT JOIN weather_logs w ON w.weather_id = s.last_weather_id
+    WHERE {cells}
+'''
+
+
+# GRID
+
+def _row(lat: float) -> int:
+    return min(max(int((lat + 90) // GRID_DEGREES), 0), LAT_CELLS - 1)
+
+
+def _column(lon: float) -> int:
+    return int(((lon + 180) % 360) // GRID_DEGREES) % LON_CELLS
+
+
+def cell(lat: float, lon: float) -> int:
+    """Grid cell id of a position"""
+    return _row(float(lat)) * LON_CELLS + _column(float(lon))
+
+
+def cell_ranges(lat_min: float, lat_max: float, lon_min: float, lon_max: float) -> List[Tuple[int, int]]:
+    """
+    Cell id ranges covering a box (lon_min > lon_max: the box crosses the
+    antimeridian; a span of 360 degrees or more covers every longitude)
+    """
+    rows = range(_row(lat_min), _row(lat_max) + 1)
+    if lon_max - lon_min >= 360:
+        spans = [(0, LON_CELLS - 1)]
+    else:
+        first, last = _column(lon_min), _column(lon_max)
+        spans = [(first, last)] if first <= last else [(first, LON_CELLS - 1), (0, last)]
+    if spans == [(0, LON_CELLS - 1)] or len(rows) * len(spans) > MAX_RANGES:
+        # Whole grid rows are contiguous ids
+        return [(rows[0] * LON_CELLS, rows[-1] * LON_CELLS + LON_CELLS - 1)]
+    return [(r * LON_CELLS + a, r * LON_CELLS + b) for r in rows for a, b in spans]
+
+
+def distance_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Great-circle distance (haversine)"""
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    a = (math.sin((p2 - p1) / 2) ** 2
+         + math.cos(p1) * math.cos(p2) * math.sin(math.radians(lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def radius_box(lat: float, lon: float, km: float) -> Tuple[float, float, float, float]:
+    """Bounding box of a circle: (lat_min, lat_max, lon_min, lon_max)"""
+    dlat = km / KM_PER_DEGREE
+    lat_min, lat_max = max(lat - dlat, -90.0), min(lat + dlat, 90.0)
+    widest = math.cos(math.radians(max(abs(lat_min), abs(lat_max))))
+    if lat_max >= 90 or lat_min <= -90 or km / (KM_PER_DEGREE * max(widest, 1e-9)) >= 180:
+        return lat_min, lat_max, -180.0, 180.0
+    dlon = km / (KM_PER_DEGREE * widest)
+    return lat_min, lat_max, (lon - dlon + 180) % 360 - 180, (lon + dlon + 180) % 360 - 180
+
+
+# STORAGE
+
+def upsert(cursor, location: str, lat, lon, weather_id: int, seen_at):
+    """Record a station's position and latest reading (caller commits)"""
+    cursor.execute(UPSERT_STATION, (location, lat, lon, cell(lat, lon), weather_id, seen_at))
+
+
+def refresh(cursor, locations: Iterable[str]) -> int:
+    """
+    Point stations at their latest weather_logs row (one index lookup per
+    location; caller commits). Readings without a position are skipped.
+
+    Returns:
+        Stations written
+    """
+    written = 0
+    for location in sorted(set(locations)):
+        cursor.execute(LATEST_READING, (location,))
+        rows = cursor.fetchall()
+        if not rows:
+            continue
+        weather_id, lat, lon, created_at = rows[0]
+        if lat is None or lon is None:
+            continue
+        upsert(cursor, location, lat, lon, weather_id, created_at)
+        written += 1
+    return written
+
+
+def _fetch(cursor, ranges: Sequence[Tuple[int, int]]) -> List[Dict]:
+    cells = ' OR '.join(['s.cell BETWEEN %s AND %s'] * len(ranges))
+    cursor.execute(STATIONS_IN_CELLS.format(cells=cells), [bound for r in ranges for bound in r])
+    columns = [d[0] for d in cursor.description]
+    return [row if isinstance(row, dict) else dict(zip(columns, row)) for row in cursor.fetchall()]
+
+
+def within_box(cursor, lat_min: float, lat_max: float, lon_min: float, lon_max: float) -> List[Dict]:
+    """Stations inside a box, by location (lon_min > lon_max crosses the antimeridian)"""
+    stations = []
+    for station in _fetch(cursor, cell_ranges(lat_min, lat_max, lon_min, lon_max)):
+        lat, lon = float(station['latitude']), float(station['longitude'])
+        in_lon = lon_min <= lon <= lon_max if lon_min <= lon_max else (lon >= lon_min or lon <= lon_max)
+        if lat_min <= lat <= lat_max and in_lon:
+            stations.append(station)
+    return sorted(stations, key=lambda s: s['location'])
+
+
+def within_radius(cursor, lat: float, lon: float, km: float, limit: Optional[int] = None) -> List[Dict]:
+    """Stations within km of a position, nearest first, with distance_km"""
+    stations = []
+    for station in _fetch(cursor, cell_ranges(*radius_box(lat, lon, km))):
+        distance = distance_km(lat, lon, float(station['latitude']), float(station['longitude']))
+        if distance <= km:
+            station['distance_km'] = round(distance, 3)
+            stations.append(station)
+    stations.sort(key=lambda s: s['distance_km'])
+    return stations[:limit] if limit else stations
+
+
+def nearest(cursor, lat: float, lon: float, k: int = 1) -> List[Dict]:
+    """The k stations nearest a position (radius grows 4x per probe from one grid cell)"""
+    km = GRID_DEGREES * KM_PER_DEGREE
+    while True:
+        stations = within_radius(cursor, lat, lon, km, k)
+        if len(stations) >= k or km >= HALF_CIRCUMFERENCE_KM:
+            return stations
+        km = min(km * 4, HALF_CIRCUMFERENCE_KM)
+
+
+def rebuild(conn) -> int:
+    """Recompute weather_stations from weather_logs (commits); returns stations"""
+    cursor = conn.cursor()
+    try:
+        cursor.execute('SELECT DISTINCT location FROM weather_logs WHERE location IS NOT NULL')
+        locations = [row[0] for row in cursor.fetchall()]
+        cursor.execute('DELETE FROM weather_stations')
+        written = refresh(cursor, locations)
+        conn.commit()
+        return written
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Weather stations near a position')
+    parser.add_argument('--lat', type=float)
+    parser.add_argument('--lon', type=float)
+    parser.add_argument('--radius', type=float, default=None, help='all stations within N km')
+    parser.add_argument('-k', type=int, default=5, help='nearest stations (without --radius)')
+    parser.add_argument('--rebuild', action='store_true', help='recompute weather_stations from weather_logs')
+    args = parser.parse_args()
+    if not args.rebuild and (args.lat is None or args.lon is None):
+        parser.error('--lat and --lon are required')
+
+    import api_server  # DB_CONFIG
+
+    conn = database.connect(api_server.DB_CONFIG, instrument=False)
+    try:
+        cursor = conn.cursor()
+        schema.create_weather_stations(cursor)
+        conn.commit()
+        cursor.close()
+        if args.rebuild:
+            print(f"rebuilt {rebuild(conn)} stations")
+        if args.lat is None or args.lon is None:
+            return
+        cursor = conn.cursor(dictionary=True)
+        if args.radius is not None:
+            stations = within_radius(cursor, args.lat, args.lon, args.radius)
+        else:
+            stations = nearest(cursor, args.lat, args.lon, args.k)
+        cursor.close()
+    finally:
+        conn.close()
+    print(f"{'station':<24}{'km':>10}{'lat':>12}{'lon':>13}{'temp':>8}  last seen")
+    for s in stations:
+        temperature = '' if s['temperature'] is None else f"{float(s['temperature']):.1f}"
+        print(f"{s['location']:<24}{s['distance_km']:>10.2f}{float(s['latitude']):>12.5f}"
+              f"{float(s['longitude']):>13.5f}{temperature:>8}  {s['last_seen']}")
+
+
+if __name__ == '__main__':
+    main()